@@ -0,0 +1,157 @@
+"""
+Drop-in replacements for Django's per-site cache middleware, whose cache keys include
+the cacheVersion of the model a page shows (see common.cacheVersions).
+
+Saving a JsonConfig or an election page therefore invalidates just the pages showing it,
+on every web server, without clearing the rest of the cache.
+Pages which aren't about a single model simply expire after CACHE_MIDDLEWARE_SECONDS.
+Views which cache their own responses skip it altogether, by setting usePageCache = False.
+
+On a cache miss, only one process on the host renders the page (see common.singleFlight).
+Meanwhile, requests without cookies are served the previously-cached version of the page,
+if it is still in the cache; other requests wait for the render, then use its result.
+"""
+
+import copy
+
+from django.middleware.cache import FetchFromCacheMiddleware, UpdateCacheMiddleware
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_cache_key
+
+from common.cacheVersions import hash_key
+from common.conditional import LOOKUP_KWARGS, get_cache_validators
+from common.singleFlight import SingleFlight
+
+# How long to wait for another process to render a page before rendering it anyway
+RENDER_WAIT_SECONDS = 30
+
+
+def get_model_for_view(func):
+    """ The model a view shows, if it's a class-based view with one """
+    viewClass = getattr(func, 'view_class', None) or getattr(func, 'cls', None)
+    model = getattr(viewClass, 'model', None)
+    if model is None:
+        # Django REST framework viewsets
+        model = getattr(getattr(viewClass, 'queryset', None), 'model', None)
+    return model
+
+
+def uses_page_cache(request):
+    """ Views which cache their own responses opt out of the page cache with usePageCache """
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return True
+    viewClass = getattr(match.func, 'view_class', None)
+    return getattr(viewClass, 'usePageCache', True)
+
+
+def get_versioned_key_prefix(request, keyPrefix):
+    """
+    Appends the cacheVersion of the model shown at the requested path to the key prefix.
+    The cacheVersion is read from the database, so it's the same on every web server.
+    """
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return keyPrefix
+
+    model = get_model_for_view(match.func)
+    lookup = {key: value for key, value in match.kwargs.items() if key in LOOKUP_KWARGS}
+    if not lookup or not hasattr(model, 'get_cache_validators'):
+        return keyPrefix
+
+    # The view reuses these for its ETag. See common.conditional.
+    validators = get_cache_validators(request, model, lookup)
+    stamp = None if validators is None else validators[0]
+    return f'{keyPrefix}.{hash_key(model._meta.label_lower, *sorted(lookup.items()), stamp)}'
+
+
+def get_stale_key(request, keyPrefix):
+    """
+    Where the cache key of the latest cached version of the page is stored. Unlike the cache
+    key, it's the same for every version of the page, so it survives saving the model.
+    """
+    return f'{keyPrefix}.stale.{hash_key(request.build_absolute_uri())}'
+
+
+def get_render_lock(request):
+    """ The lock for rendering the requested page, for the current version of its model """
+    keyPrefix = request._cache_key_prefix  # pylint: disable=protected-access
+    return SingleFlight(f'render.{keyPrefix}.{request.build_absolute_uri()}',
+                        timeout=RENDER_WAIT_SECONDS)
+
+
+# pylint: disable=too-few-public-methods
+class VersionedUpdateCacheMiddleware(UpdateCacheMiddleware):
+    """ Caches the response under the key prefix computed when the request was fetched """
+
+    def process_response(self, request, response):
+        middleware = copy.copy(self)
+        middleware.key_prefix = getattr(request, '_cache_key_prefix', self.key_prefix)
+        try:
+            response = UpdateCacheMiddleware.process_response(middleware, request, response)
+
+            # Remember the latest version, to serve while the next version renders. Only
+            # for requests without cookies: other pages may be specific to the user.
+            if self._should_update_cache(request, response) and not request.COOKIES and \
+                    response.status_code == 200:
+                cacheKey = get_cache_key(request, middleware.key_prefix, 'GET', cache=self.cache)
+                if cacheKey is not None:
+                    self.cache.set(get_stale_key(request, self.key_prefix), cacheKey,
+                                   self.cache_timeout)
+        finally:
+            renderLock = getattr(request, '_cache_render_lock', None)
+            if renderLock is not None:
+                renderLock.release()
+        return response
+
+
+class VersionedFetchFromCacheMiddleware(FetchFromCacheMiddleware):
+    """ Looks up the response under a key prefix which includes the model's cacheVersion """
+
+    def _fetch(self, request):
+        middleware = copy.copy(self)
+        middleware.key_prefix = request._cache_key_prefix  # pylint: disable=protected-access
+        return FetchFromCacheMiddleware.process_request(middleware, request)
+
+    def _fetch_stale(self, request):
+        """ The previously-cached version of the page, if it is safe to serve and still cached """
+        if request.COOKIES:
+            return None
+        staleCacheKey = self.cache.get(get_stale_key(request, self.key_prefix))
+        if staleCacheKey is None:
+            return None
+        return self.cache.get(staleCacheKey)
+
+    def process_request(self, request):
+        if not uses_page_cache(request):
+            request._cache_update_cache = False  # pylint: disable=protected-access
+            return None
+
+        # Stored on the request so the response is cached under the same version,
+        # even if the model is saved while the response is rendering
+        request._cache_key_prefix = get_versioned_key_prefix(  # pylint: disable=protected-access
+            request, self.key_prefix)
+
+        response = self._fetch(request)
+        if response is not None or not request._cache_update_cache:  # pylint: disable=protected-access
+            return response
+
+        # A miss: render it, unless another process already is
+        renderLock = get_render_lock(request)
+        if not renderLock.acquire(blocking=False):
+            staleResponse = self._fetch_stale(request)
+            if staleResponse is not None:
+                request._cache_update_cache = False  # pylint: disable=protected-access
+                return staleResponse
+
+            # Wait for the other render. If it timed out, render anyway.
+            if renderLock.acquire():
+                response = self._fetch(request)
+                if response is not None:
+                    renderLock.release()
+                    return response
+
+        request._cache_render_lock = renderLock  # pylint: disable=protected-access
+        return None
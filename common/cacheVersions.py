@@ -0,0 +1,41 @@
+"""
+Versioned cache keys.
+
+Every JsonConfig (and every election page) stores a cacheVersion in the database, which
+changes whenever it is updated. Everything cached for it - rendered pages, loaded graphs,
+data payloads - includes that version in its cache key. Invalidating is then a single
+write to the database which every web server sees immediately: stale entries are simply
+never read again, and expire on their own. Nothing but the clearCache management command
+should need to clear the whole cache.
+
+The cacheVersion is also the basis of the ETags of the pages (see common.conditional),
+and an updatedAt timestamp, which changes along with it, of their Last-Modified.
+"""
+
+import hashlib
+import uuid
+
+from django.utils import timezone
+
+
+def new_cache_version():
+    """ A new, unique value for a cacheVersion field """
+    return uuid.uuid4().hex
+
+
+def bump_cache_versions(queryset):
+    """ Invalidates everything cached for each model in the queryset, in a single query """
+    queryset.update(cacheVersion=new_cache_version(), updatedAt=timezone.now())
+
+
+def hash_key(*parts):
+    """ Combines the parts into a short string which is safe to use in any cache key """
+    return hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def versioned_key(model, *parts):
+    """
+    The cache key for data derived from the given model, e.g. a JsonConfig,
+    which changes whenever the model's cacheVersion does.
+    """
+    return f'{model._meta.label_lower}.{model.pk}.{hash_key(model.cacheVersion, *parts)}'
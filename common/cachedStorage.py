@@ -0,0 +1,264 @@
+"""
+A read-through cache on local disk in front of a slow file storage, i.e. S3.
+
+Every uncached render reads the jsonFile (or its standardized version) and the
+candidateSidecarFile, as do the movie pipeline and checkUploads. With S3, each read is a
+GET of the whole file. Through LocalCacheStorage, a file this host has read recently is
+read from local disk instead, without a request to S3 at all.
+
+That's safe because files saved through LocalCacheStorage never reuse a name, even one
+whose file has been deleted: a name always refers to the same content. Still, in case a
+file is changed behind its back, entries are revalidated against the backend's version of
+the file - its ETag on S3, its modification time elsewhere - once they are older than
+STORAGE_CACHE_REVALIDATE_SECONDS. Files are stored by the hash of their content, so
+identical uploads share one copy, and the least recently used ones are evicted once the
+cache outgrows STORAGE_CACHE_MAX_BYTES.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage, get_storage_class
+
+from common.cacheVersions import hash_key
+
+logger = logging.getLogger(__name__)
+
+# After evicting, the cache is this fraction of its maximum size, so it doesn't evict
+# again on the very next miss
+EVICT_TO_FRACTION = 0.9
+
+
+class LocalCacheStorage(Storage):
+    """
+    Wraps another storage, caching the files read from it on local disk.
+    Everything but reading is passed straight through to the backend.
+
+    The counters in stats are per process: hits, misses, revalidations, evictions,
+    and uncacheable reads.
+    """
+
+    def __init__(self, backend=None, cacheDir=None, maxBytes=None, revalidateSeconds=None):
+        if backend is None:
+            backend = get_storage_class(settings.STORAGE_CACHE_BACKEND)()
+        self.backend = backend
+        self.cacheDir = cacheDir or settings.STORAGE_CACHE_DIR
+        self.maxBytes = settings.STORAGE_CACHE_MAX_BYTES if maxBytes is None else maxBytes
+        self.revalidateSeconds = settings.STORAGE_CACHE_REVALIDATE_SECONDS \
+            if revalidateSeconds is None else revalidateSeconds
+        self.stats = Counter()
+        self._statsLock = threading.Lock()
+        # Bytes cached on disk, as last counted by this process. Other processes
+        # add to it too, so it's only recounted when it looks like it's too big.
+        self._approxBytes = None
+
+    def __getattr__(self, name):
+        # Anything specific to the backend, e.g. the S3 bucket
+        if name == 'backend':
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+    def _count(self, stat, amount=1):
+        with self._statsLock:
+            self.stats[stat] += amount
+
+    def _object_path(self, contentHash):
+        return os.path.join(self.cacheDir, 'objects', contentHash[:2], contentHash)
+
+    def _index_path(self, name):
+        return os.path.join(self.cacheDir, 'index', hash_key(name))
+
+    def get_version(self, name):
+        """ Changes whenever the file does. Reading it is a round trip, but not a download. """
+        bucket = getattr(self.backend, 'bucket', None)
+        if bucket is not None:
+            # pylint: disable=protected-access
+            key = self.backend._normalize_name(self.backend._clean_name(name))
+            return bucket.Object(key).e_tag
+        return self.backend.get_modified_time(name).isoformat()
+
+    def _read_index(self, name):
+        """ The index entry for the name, or None """
+        try:
+            with open(self._index_path(name), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_atomically(path, content):
+        """ Writes the bytes to the path, so that other processes never see part of them """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fileDescriptor, tmpPath = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+        try:
+            with os.fdopen(fileDescriptor, 'wb') as f:
+                f.write(content)
+            os.replace(tmpPath, path)
+        except BaseException:
+            os.unlink(tmpPath)
+            raise
+
+    def _write_index(self, name, version, contentHash):
+        entry = {'name': name, 'version': version, 'hash': contentHash,
+                 'validatedAt': time.time()}
+        self._write_atomically(self._index_path(name), json.dumps(entry).encode('utf-8'))
+
+    def _open_cached(self, name, mode):
+        """ The cached file, if it's cached and still valid, or None """
+        entry = self._read_index(name)
+        if entry is None or entry['name'] != name:
+            return None
+
+        if time.time() - entry['validatedAt'] >= self.revalidateSeconds:
+            self._count('revalidations')
+            if self._get_version_or_none(name) != entry['version']:
+                return None
+            self._write_index(name, entry['version'], entry['hash'])
+
+        path = self._object_path(entry['hash'])
+        try:
+            cachedFile = open(path, mode)  # pylint: disable=consider-using-with
+        except FileNotFoundError:
+            # Evicted
+            return None
+        # Recently used: see _evict
+        os.utime(path)
+        return File(cachedFile, name)
+
+    def _add_to_cache(self, name, version, content):
+        """ Stores the content of this version of the file. Returns the path it's stored at. """
+        contentHash = hashlib.sha256(content).hexdigest()
+        path = self._object_path(contentHash)
+        if not os.path.exists(path):
+            self._write_atomically(path, content)
+            self._approxBytes = None if self._approxBytes is None \
+                else self._approxBytes + len(content)
+        self._write_index(name, version, contentHash)
+
+        if self._approxBytes is None or self._approxBytes > self.maxBytes:
+            self._evict()
+        return path
+
+    def _evict(self):
+        """ Deletes the least recently used files until the cache is small enough """
+        objects = []
+        objectsDir = os.path.join(self.cacheDir, 'objects')
+        for dirPath, _, filenames in os.walk(objectsDir):
+            for filename in filenames:
+                try:
+                    stat = os.stat(os.path.join(dirPath, filename))
+                except FileNotFoundError:
+                    continue
+                objects.append((stat.st_mtime, stat.st_size, os.path.join(dirPath, filename)))
+
+        totalBytes = sum(size for _, size, _ in objects)
+        if totalBytes > self.maxBytes:
+            objects.sort()
+            for _, size, path in objects:
+                if totalBytes <= self.maxBytes * EVICT_TO_FRACTION:
+                    break
+                try:
+                    os.unlink(path)
+                    self._count('evictions')
+                except FileNotFoundError:
+                    pass
+                totalBytes -= size
+        self._approxBytes = totalBytes
+
+    def _get_version_or_none(self, name):
+        """ The version, or None if the file is missing or the backend can't say """
+        try:
+            return self.get_version(name)
+        except Exception:  # pylint: disable=broad-except
+            return None
+
+    def _open(self, name, mode='rb'):
+        if any(c in mode for c in 'wa+'):
+            return self.backend.open(name, mode)
+
+        cachedFile = self._open_cached(name, mode)
+        if cachedFile is not None:
+            self._count('hits')
+            return cachedFile
+
+        version = self._get_version_or_none(name)
+        if version is None:
+            # Let the backend raise its usual error, if any
+            self._count('uncacheable')
+            return self.backend.open(name, mode)
+
+        self._count('misses')
+        with self.backend.open(name, 'rb') as f:
+            content = f.read()
+        try:
+            path = self._add_to_cache(name, version, content)
+            return File(open(path, mode), name)  # pylint: disable=consider-using-with
+        except OSError as exc:
+            # e.g. the disk is full: still serve the file
+            logger.warning("Could not cache %s: %s", name, exc)
+        if 'b' in mode:
+            return ContentFile(content, name)
+        return self.backend.open(name, mode)
+
+    def _save(self, name, content):
+        return self.backend._save(name, content)  # pylint: disable=protected-access
+
+    def delete(self, name):
+        self.backend.delete(name)
+        try:
+            os.unlink(self._index_path(name))
+        except FileNotFoundError:
+            pass
+
+    def get_valid_name(self, name):
+        return self.backend.get_valid_name(name)
+
+    def get_alternative_name(self, file_root, file_ext):
+        return self.backend.get_alternative_name(file_root, file_ext)
+
+    def get_available_name(self, name, max_length=None):
+        """ Never a name which was used before, even by a deleted file. See the docstring above. """
+        dirName, fileName = os.path.split(name)
+        fileRoot, fileExt = os.path.splitext(fileName)
+        if fileExt == '.gz':
+            # Keep e.g. .json.gz together, so the content type can still be guessed from it
+            fileRoot, innerExt = os.path.splitext(fileRoot)
+            fileExt = innerExt + fileExt
+        name = os.path.join(dirName, self.get_alternative_name(fileRoot, fileExt))
+        return self.backend.get_available_name(name, max_length=max_length)
+
+    def generate_filename(self, filename):
+        return self.backend.generate_filename(filename)
+
+    def path(self, name):
+        return self.backend.path(name)
+
+    def exists(self, name):
+        return self.backend.exists(name)
+
+    def listdir(self, path):
+        return self.backend.listdir(path)
+
+    def size(self, name):
+        return self.backend.size(name)
+
+    def url(self, name, *args, **kwargs):  # pylint: disable=arguments-differ
+        return self.backend.url(name, *args, **kwargs)
+
+    def get_accessed_time(self, name):
+        return self.backend.get_accessed_time(name)
+
+    def get_created_time(self, name):
+        return self.backend.get_created_time(name)
+
+    def get_modified_time(self, name):
+        return self.backend.get_modified_time(name)
@@ -1,16 +1,53 @@
-""" Cloudflare API connection, used to clear cloudflare cache when a model updates """
+"""
+Cloudflare API connection, used to clear cloudflare cache when a model updates.
+
+Purging is asynchronous: saving a model only queues its paths in the database, in the same
+transaction as the save. After the transaction commits, a background thread dedupes the
+queued paths and purges them in as few API calls as possible, retrying failures with
+exponential backoff. Requests never wait on Cloudflare.
+
+Paths left in the queue - for example, if the process restarted before they were purged -
+are purged by the processCloudflarePurges management command.
+"""
 
 import logging
 import json
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
 import requests
 
+from django.apps import apps
 from django.conf import settings
-from django.core.cache import cache
 from django.contrib.sites.models import Site
+from django.db import connection, transaction
+from django.http import JsonResponse
 from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
 logger = logging.getLogger(__name__)
 
+# Cloudflare purges at most this many URLs per API call
+PURGE_BATCH_SIZE = 30
+
+# The most queued rows read at once
+PURGE_QUEUE_CHUNK_SIZE = 1000
+
+# Failed purges are retried after 5s, 10s, 20s, ... up to an hour, then dropped
+RETRY_BACKOFF_SECONDS = 5
+MAX_RETRY_BACKOFF_SECONDS = 60 * 60
+MAX_ATTEMPTS = 12
+
+REQUEST_TIMEOUT_SECONDS = 30
+
+
+def _get_queue_model():
+    """ Looked up lazily: visualizer.models depends on this module """
+    return apps.get_model('visualizer', 'PendingCloudflarePurge')
+
 
 # pylint: disable=too-few-public-methods
 class CloudflareAPI():
@@ -32,32 +69,46 @@ class CloudflareAPI():
     @classmethod
     def purge_vis_cache(cls, slug):
         """ Purges most canonical URLs for the visualization with the given slug. """
-        paths = [
-            reverse('visualize', args=(slug,)),
-            reverse('visualizeEmbedded', args=(slug,)),
-            reverse('visualizeEmbedlyDefault', args=(slug,)),
-            reverse('visualizeEmbedly', args=(slug, 'bar')),
-            reverse('visualizeEmbedly', args=(slug, 'barchart-interactive')),
-            reverse('visualizeEmbedly', args=(slug, 'sankey')),
-            reverse('visualizeEmbedly', args=(slug, 'table')),
-            reverse('visualizeBallotpedia', args=(slug,))
-        ]
+        cls.purge_vis_caches([slug])
+
+    @classmethod
+    def purge_vis_caches(cls, slugs):
+        """ Purges most canonical URLs for each visualization, all in one batch """
+        paths = []
+        for slug in slugs:
+            paths.extend([
+                reverse('visualize', args=(slug,)),
+                reverse('visualizeEmbedded', args=(slug,)),
+                reverse('visualizeEmbedlyDefault', args=(slug,)),
+                reverse('visualizeEmbedly', args=(slug, 'bar')),
+                reverse('visualizeEmbedly', args=(slug, 'barchart-interactive')),
+                reverse('visualizeEmbedly', args=(slug, 'sankey')),
+                reverse('visualizeEmbedly', args=(slug, 'table')),
+                reverse('visualizeBallotpedia', args=(slug,))
+            ])
         cls.purge_paths_cache(paths)
 
     @classmethod
     def purge_paths_cache(cls, paths):
-        """ Purges the URLs (paths, not URLs) """
-        # We also want to purge the file-based cache, but unfortunately
-        # we don't have a way of doing this per-URL.
-        # It's overkill, but here we purge everything.
-        cache.clear()
-
+        """
+        Queues the URLs (paths, not URLs) to be purged once the current transaction commits.
+        The local cache doesn't need purging: its keys include the cacheVersion
+        of the model, which changes when it's saved. See common.cacheVersions.
+        """
         # If we're on local/dev/staging/etc, we're done.
         if not cls._is_api_enabled():
             return
 
+        model = _get_queue_model()
+        model.objects.bulk_create([model(path=path) for path in paths])
+        if settings.CLOUDFLARE_PURGE_IN_BACKGROUND:
+            transaction.on_commit(BackgroundPurger.wake)
+
+    @classmethod
+    def _send_purge_request(cls, paths):
+        """ Purges at most PURGE_BATCH_SIZE paths right away. Returns whether it succeeded. """
         zoneId = settings.CLOUDFLARE_ZONE_ID
-        apiUrl = f"https://api.cloudflare.com/client/v4/zones/{zoneId}/purge_cache"
+        apiUrl = f"{settings.CLOUDFLARE_API_URL}/zones/{zoneId}/purge_cache"
 
         # Absolute URLs
         domain = Site.objects.get_current().domain
@@ -65,10 +116,135 @@ class CloudflareAPI():
         data = {'files': rcvisUrls}
 
         # Send it off
-        response = requests.post(apiUrl, headers=cls._get_auth_headers(), data=json.dumps(data))
-
         info = f"{len(paths)} starting with {paths[0]}"
+        try:
+            response = requests.post(apiUrl, headers=cls._get_auth_headers(),
+                                     data=json.dumps(data), timeout=REQUEST_TIMEOUT_SECONDS)
+        except requests.RequestException as exc:
+            logger.error("Could not connect to cloudflare for %s: %s", info, exc)
+            return False
+
         if response.status_code == 200:
             logger.info("Cleared cloudflare cache for %s: %s", info, response.json())
-        else:
-            logger.error("Received bad response from cloudflare for %s: %s", info, response.json())
+            return True
+        logger.error("Received bad response from cloudflare for %s: %s", info, response.json())
+        return False
+
+    @classmethod
+    def _retry_later(cls, queuedPurges):
+        """ Backs off exponentially, or gives up after MAX_ATTEMPTS """
+        now = timezone.now()
+        for queuedPurge in queuedPurges:
+            queuedPurge.numFailedAttempts += 1
+            backoff = RETRY_BACKOFF_SECONDS * 2 ** (queuedPurge.numFailedAttempts - 1)
+            backoff = min(backoff, MAX_RETRY_BACKOFF_SECONDS)
+            queuedPurge.nextAttemptAt = now + timedelta(seconds=backoff)
+
+        model = _get_queue_model()
+        model.objects.bulk_update(queuedPurges, ['numFailedAttempts', 'nextAttemptAt'])
+
+        expired = [p.pk for p in queuedPurges if p.numFailedAttempts >= MAX_ATTEMPTS]
+        if expired:
+            logger.error("Giving up on purging %d paths from cloudflare", len(expired))
+            model.objects.filter(pk__in=expired).delete()
+
+    @classmethod
+    def process_purge_queue(cls):
+        """
+        Purges every queued path which is due, in batches, deduping paths queued more than once.
+        Returns the number of distinct paths purged.
+        """
+        model = _get_queue_model()
+        numPurged = 0
+        while True:
+            due = model.objects.filter(nextAttemptAt__lte=timezone.now()).order_by('id')
+            queuedPurges = list(due[:PURGE_QUEUE_CHUNK_SIZE])
+            if not queuedPurges:
+                return numPurged
+
+            # Each path is purged once, no matter how many times it was queued
+            queuedByPath = OrderedDict()
+            for queuedPurge in queuedPurges:
+                queuedByPath.setdefault(queuedPurge.path, []).append(queuedPurge)
+            paths = list(queuedByPath.keys())
+
+            for i in range(0, len(paths), PURGE_BATCH_SIZE):
+                batch = paths[i:i + PURGE_BATCH_SIZE]
+                batchPurges = [p for path in batch for p in queuedByPath[path]]
+                if cls._send_purge_request(batch):
+                    # Only delete what was read: a path queued since then must be purged again
+                    model.objects.filter(pk__in=[p.pk for p in batchPurges]).delete()
+                    numPurged += len(batch)
+                else:
+                    cls._retry_later(batchPurges)
+
+    @classmethod
+    def get_next_attempt_time(cls):
+        """ When the next queued path is due, or None if the queue is empty """
+        model = _get_queue_model()
+        return model.objects.order_by('nextAttemptAt').values_list(
+            'nextAttemptAt', flat=True).first()
+
+
+class BackgroundPurger:
+    """
+    A daemon thread which processes the purge queue whenever it is woken,
+    and sleeps until any retries are due. At most one runs per process.
+    """
+    _lock = threading.Lock()
+    _thread = None
+    _wakeEvent = threading.Event()
+
+    @classmethod
+    def wake(cls):
+        """ Processes the queue soon, without blocking the caller """
+        with cls._lock:
+            cls._wakeEvent.set()
+            if cls._thread is None or not cls._thread.is_alive():
+                cls._thread = threading.Thread(target=cls._run, name='cloudflarePurger',
+                                               daemon=True)
+                cls._thread.start()
+
+    @classmethod
+    def _run(cls):
+        try:
+            while True:
+                cls._wakeEvent.clear()
+                CloudflareAPI.process_purge_queue()
+
+                nextAttemptAt = CloudflareAPI.get_next_attempt_time()
+                with cls._lock:
+                    if nextAttemptAt is None and not cls._wakeEvent.is_set():
+                        cls._thread = None
+                        return
+                if nextAttemptAt is not None:
+                    waitSeconds = (nextAttemptAt - timezone.now()).total_seconds()
+                    cls._wakeEvent.wait(timeout=max(waitSeconds, 0))
+        except Exception:  # pylint: disable=broad-except
+            # The processCloudflarePurges command will pick up anything left over
+            logger.exception("Cloudflare purge worker failed")
+        finally:
+            connection.close()
+
+
+@csrf_exempt
+@require_POST
+def fake_purge_cache(request, zoneId):
+    """
+    A stand-in for the Cloudflare purge_cache API, only served in OFFLINE_MODE.
+    Set CLOUDFLARE_API_URL to http://<host>/fakeCloudflare to purge against it.
+    """
+    if not request.headers.get('Authorization', '').startswith('Bearer '):
+        return JsonResponse({'success': False, 'errors': [{'code': 10000,
+                                                          'message': 'Authentication error'}]},
+                            status=403)
+
+    files = json.loads(request.body).get('files', [])
+    if len(files) > PURGE_BATCH_SIZE:
+        return JsonResponse({'success': False, 'errors': [{'code': 1015,
+                                                          'message': 'Too many files'}]},
+                            status=400)
+
+    logger.info("Fake cloudflare purged %d files in zone %s", len(files), zoneId)
+    return JsonResponse({'success': True, 'errors': [], 'messages': [],
+                         'result': {'id': zoneId}})
@@ -0,0 +1,186 @@
+"""
+Uploaded election files are stored gzipped: summary JSONs compress 10-20x, which saves
+storage, S3 reads and egress.
+
+A compressed file's name ends in .gz, e.g. results.json.gz. From that, S3 and Django's
+static file server both send it with Content-Encoding: gzip, so a browser downloading
+it gets the original bytes. Readers don't rely on the name, though: open_decompressed
+recognizes gzipped content by its magic number, so it accepts uploads, stored files and
+local files alike.
+
+A CompressedFileField may also be addressed by content: given a hashField, it records the
+hash of the original content of each file it saves, and a file identical to one already
+stored reuses that file rather than uploading a copy. Several rows may then refer to the
+same file, so it's only deleted along with the last of them.
+"""
+
+import gzip
+import hashlib
+import os
+
+from django.core.files.base import ContentFile
+from django.db import models
+from django.db.models.fields.files import FieldFile
+
+GZIP_MAGIC = b'\x1f\x8b'
+GZIP_SUFFIX = '.gz'
+
+# Compressed once per upload, so favor size over speed
+GZIP_LEVEL = 9
+
+# Some uploads, e.g. spreadsheets, are compressed already: keep them as they are unless
+# compressing saves at least this fraction of their size
+MIN_SAVINGS = 0.1
+
+
+def is_compressed_name(name):
+    """ Is the file with this name stored compressed? """
+    return bool(name) and name.endswith(GZIP_SUFFIX)
+
+
+def get_original_name(name):
+    """ The name of the file before it was compressed """
+    return name[:-len(GZIP_SUFFIX)] if is_compressed_name(name) else name
+
+
+def get_download_url(fieldFile):
+    """
+    A URL to download the original content of the stored file. Browsers decode a file
+    sent with Content-Encoding: gzip, unless they're saving it with a .gz name - so on S3,
+    the URL names the download after the original.
+    """
+    if not is_compressed_name(fieldFile.name) or not hasattr(fieldFile.storage, 'bucket'):
+        return fieldFile.url
+    filename = os.path.basename(get_original_name(fieldFile.name))
+    disposition = f'attachment; filename="{filename}"'
+    return fieldFile.storage.url(fieldFile.name,
+                                 parameters={'ResponseContentDisposition': disposition})
+
+
+def compress_file(fileObject):
+    """
+    Returns a ContentFile with the gzipped content of the file, named like it plus .gz,
+    or None if compressing it isn't worthwhile.
+    """
+    fileObject.seek(0)
+    content = fileObject.read()
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    if content.startswith(GZIP_MAGIC):
+        return None
+
+    compressed = gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0)
+    if len(compressed) > len(content) * (1 - MIN_SAVINGS):
+        return None
+    name = getattr(fileObject, 'name', None) or 'file'
+    return ContentFile(compressed, name + GZIP_SUFFIX)
+
+
+def read_original(fileObject):
+    """ The whole original content of the file, as bytes, whether or not it was compressed """
+    fileObject.seek(0)
+    content = open_decompressed(fileObject).read()
+    fileObject.seek(0)
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return content
+
+
+def hash_content(content):
+    """ The hash a content-addressed CompressedFileField records for the original content """
+    return hashlib.sha256(content).hexdigest()
+
+
+def is_referenced(model, fieldName, name, excludePk=None):
+    """ Does any row of the model, other than the excluded one, refer to the file by this field? """
+    rows = model._default_manager.filter(**{fieldName: name})  # pylint: disable=protected-access
+    if excludePk is not None:
+        rows = rows.exclude(pk=excludePk)
+    return rows.exists()
+
+
+def delete_unless_referenced(model, fieldName, storage, name):
+    """ Deletes the stored file, unless a row of the model still refers to it by this field """
+    if not is_referenced(model, fieldName, name):
+        storage.delete(name)
+
+
+def open_decompressed(fileObject):
+    """
+    A file object which reads the original content of the file, from its current position,
+    whether or not it was compressed. Decompresses as it's read, rather than all at once.
+    Seekable, as long as the file is.
+    """
+    position = fileObject.tell()
+    magic = fileObject.read(len(GZIP_MAGIC))
+    fileObject.seek(position)
+    if magic != GZIP_MAGIC:
+        return fileObject
+    return gzip.GzipFile(fileobj=fileObject, mode='rb')
+
+
+class CompressedFieldFile(FieldFile):
+    """ A FieldFile which compresses the content it saves, and adds .gz to its name """
+
+    def _find_identical(self, contentHash):
+        """ The name of a stored file with the same original content, or None """
+        attname = self.field.attname
+        # pylint: disable=protected-access
+        rows = self.field.model._default_manager.filter(**{self.field.hashField: contentHash})
+        rows = rows.exclude(**{attname: ''}).exclude(**{f'{attname}__isnull': True})
+        return rows.values_list(attname, flat=True).first()
+
+    def save(self, name, content, save=True):
+        if self.field.hashField is not None:
+            contentHash = hash_content(read_original(content))
+            setattr(self.instance, self.field.hashField, contentHash)
+            identicalName = self._find_identical(contentHash)
+            if identicalName is not None:
+                self.name = identicalName
+                setattr(self.instance, self.field.attname, self.name)
+                self._committed = True
+                if save:
+                    self.instance.save()
+                return
+
+        compressed = compress_file(content)
+        if compressed is not None:
+            name, content = name + GZIP_SUFFIX, compressed
+        super().save(name, content, save)
+
+    def delete(self, save=True):
+        """ Deletes the stored file, unless another row shares it """
+        # django_cleanup replaces the instance with one without a pk, once the row is gone
+        if not self or not is_referenced(self.field.model, self.field.attname, self.name,
+                                         getattr(self.instance, 'pk', None)):
+            super().delete(save)
+            return
+
+        # Shared with another row: only forget it
+        if hasattr(self, '_file'):
+            self.close()
+            del self.file
+        self.name = None
+        setattr(self.instance, self.field.attname, self.name)
+        self._committed = False
+        if save:
+            self.instance.save()
+
+
+class CompressedFileField(models.FileField):
+    """
+    A FileField whose files are compressed as they're saved, however they're saved.
+    Given a hashField - the name of a CharField of the model - it's content-addressed.
+    """
+    attr_class = CompressedFieldFile
+
+    def __init__(self, *args, hashField=None, **kwargs):
+        self.hashField = hashField
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        """ So migrations keep the hashField """
+        name, path, args, kwargs = super().deconstruct()
+        if self.hashField is not None:
+            kwargs['hashField'] = self.hashField
+        return name, path, args, kwargs
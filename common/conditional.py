@@ -0,0 +1,72 @@
+"""
+Conditional GETs and Cache-Control for pages which browsers, embedly and Cloudflare
+revisit often.
+
+A page about a single model gets its ETag from the model's cache stamp (see
+common.cacheVersions) and its Last-Modified from when that stamp last changed. Both are
+read in a single query, which the page cache middleware has usually made already, so
+revalidating an unchanged page is answered with a 304 before anything is rendered.
+"""
+
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from common.cacheVersions import hash_key
+
+# The URL kwargs which identify a model
+LOOKUP_KWARGS = ('slug', 'pk')
+
+
+def get_cache_validators(request, model, kwargs):
+    """
+    A tuple of (stamp, lastModified) for the model the URL kwargs identify, or None if
+    there is none. Read at most once per request.
+    """
+    # pylint: disable=protected-access
+    if not hasattr(request, '_cache_validators'):
+        lookup = {key: value for key, value in kwargs.items() if key in LOOKUP_KWARGS}
+        request._cache_validators = model.get_cache_validators(**lookup) if lookup else None
+    return request._cache_validators
+
+
+def make_etag(request, stamp=''):
+    """ Unique to the URL, the release, and the stamp of what the page shows """
+    return hash_key(settings.RELEASE_VERSION, request.build_absolute_uri(), stamp)
+
+
+def conditional_page(model=None):
+    """
+    Decorates a view with an ETag and a Last-Modified, so that conditional GETs are
+    answered with a 304 before the view runs, and with the PAGE_CACHE_CONTROL policy.
+
+    With a model, which must have get_cache_validators, the validators come from the
+    instance the URL identifies. Without one, the response must depend on nothing but the
+    URL: its ETag is computed without reading anything.
+    """
+    def etag_func(request, *args, **kwargs):  # pylint: disable=unused-argument
+        if model is None:
+            return make_etag(request)
+        validators = get_cache_validators(request, model, kwargs)
+        return None if validators is None else make_etag(request, validators[0])
+
+    def last_modified_func(request, *args, **kwargs):  # pylint: disable=unused-argument
+        if model is None:
+            return None
+        validators = get_cache_validators(request, model, kwargs)
+        return None if validators is None else validators[1]
+
+    def decorator(viewFunc):
+        conditionalView = condition(etag_func=etag_func,
+                                    last_modified_func=last_modified_func)(viewFunc)
+
+        @wraps(viewFunc)
+        def wrapper(request, *args, **kwargs):
+            response = conditionalView(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                patch_cache_control(response, **settings.PAGE_CACHE_CONTROL)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,91 @@
+"""
+Response bodies which are compressed once, when they are created, rather than on every
+request. Each is stored along with a strong ETag, so a request whose If-None-Match
+matches is answered with a 304 without reading, let alone compressing, the body.
+"""
+
+import gzip
+import hashlib
+
+import brotli
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+
+# Compressed once per body, so use the slowest, smallest settings
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+
+def parse_accept_encoding(header):
+    """ The content codings the Accept-Encoding header allows, e.g. {'gzip', 'br'} """
+    encodings = set()
+    for coding in header.split(','):
+        name, _, params = coding.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        params = params.replace(' ', '')
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(name)
+    return encodings
+
+
+class PrecompressedBody:
+    """
+    The uncompressed, gzipped and brotli-compressed content. Picklable, so it can be cached.
+
+    The ETag is a hash of the uncompressed content: it only changes when the content does.
+    Each encoding has its own strong ETag, as required for different content-codings.
+    """
+
+    def __init__(self, content, contentType):
+        self.contentType = contentType
+        self.contentHash = hashlib.sha256(content).hexdigest()[:32]
+        self.bodies = {
+            'br': brotli.compress(content, quality=BROTLI_QUALITY),
+            'gzip': gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0),
+            None: content,
+        }
+
+    def get_etag(self, encoding):
+        """ The quoted, strong ETag of the body with the given content coding """
+        if encoding is None:
+            return f'"{self.contentHash}"'
+        return f'"{self.contentHash}-{encoding}"'
+
+    @staticmethod
+    def choose_encoding(request):
+        """ The smallest content coding the request accepts, or None for no compression """
+        accepted = parse_accept_encoding(request.headers.get('Accept-Encoding', ''))
+        for encoding in ('br', 'gzip'):
+            if encoding in accepted:
+                return encoding
+        return None
+
+    def _is_not_modified(self, request):
+        """ Does the client already have this content, in any encoding? """
+        etags = parse_etags(request.headers.get('If-None-Match', ''))
+        return '*' in etags or any(self.get_etag(e) in etags for e in self.bodies)
+
+    def make_response(self, request):
+        """ The response to a GET or HEAD request: a 304 if the client's copy is current """
+        encoding = self.choose_encoding(request)
+        if self._is_not_modified(request):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(self.bodies[encoding], content_type=self.contentType)
+            response['Content-Length'] = len(self.bodies[encoding])
+            if encoding is not None:
+                response['Content-Encoding'] = encoding
+
+        response['ETag'] = self.get_etag(encoding)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        # Shared caches may store it, but everyone must revalidate: a 304 is cheap
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
@@ -0,0 +1,95 @@
+"""
+Locks shared by every process on this host, so that when many gunicorn workers need the
+same expensive result at once - typically right after it was invalidated - only one of them
+computes it while the others wait for, or work around, that one.
+
+Each lock is an flock on a file in SINGLE_FLIGHT_LOCK_DIR. The operating system releases it
+if the process holding it dies, so a crashed render never leaves a page locked.
+"""
+
+import errno
+import fcntl
+import os
+import time
+
+from django.conf import settings
+
+from common.cacheVersions import hash_key
+
+# How often to retry a lock held by another process
+POLL_INTERVAL_SECONDS = 0.05
+
+
+class SingleFlight:
+    """
+    A lock for the given key, e.g. a versioned cache key. Use as a context manager to wait
+    up to `timeout` seconds for it. If it's still held after that, the block runs anyway:
+    computing a result twice beats failing the request.
+    """
+
+    def __init__(self, key, timeout=30):
+        self.path = os.path.join(settings.SINGLE_FLIGHT_LOCK_DIR, hash_key(key) + '.lock')
+        self.timeout = timeout
+        self.waited = False
+        self._file = None
+
+    @property
+    def isHeld(self):
+        """ Does this object hold the lock? """
+        return self._file is not None
+
+    def _try_lock(self):
+        """ A single attempt to take the lock, without waiting """
+        os.makedirs(settings.SINGLE_FLIGHT_LOCK_DIR, exist_ok=True)
+        lockFile = open(self.path, 'a+')  # pylint: disable=consider-using-with
+        try:
+            fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as exc:
+            lockFile.close()
+            if exc.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            return False
+
+        # The holder deletes the file when it releases the lock. If that happened between
+        # opening and locking, this lock is on a file nobody else will ever open.
+        try:
+            isCurrentFile = os.stat(self.path).st_ino == os.fstat(lockFile.fileno()).st_ino
+        except FileNotFoundError:
+            isCurrentFile = False
+        if not isCurrentFile:
+            lockFile.close()
+            return False
+
+        self._file = lockFile
+        return True
+
+    def acquire(self, blocking=True, timeout=None):
+        """ Takes the lock, waiting up to timeout seconds if blocking. Returns if it was taken """
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.monotonic() + timeout
+        while not self._try_lock():
+            self.waited = True
+            if not blocking or time.monotonic() >= deadline:
+                return False
+            time.sleep(POLL_INTERVAL_SECONDS)
+        return True
+
+    def release(self):
+        """ Releases the lock, if held """
+        if self._file is None:
+            return
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
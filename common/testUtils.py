@@ -2,17 +2,28 @@
 Helper functions for unit and integration tests
 """
 
+import datetime
+import gzip
+import hashlib
 import logging
 import json
+import shutil
 import tempfile
+import threading
+import time
 import uuid
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from urllib.parse import urlparse
 from mock import patch
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
 
 from selenium import webdriver
+from electionpage.models import ElectionPage
 from scraper.models import MultiScraper, Scraper
 from visualizer.models import JsonConfig
 from visualizer.tests import filenames
@@ -61,6 +72,19 @@ class TestHelpers():
             response = client.post('/upload.html', {'jsonFile': f})
         return response
 
+    @classmethod
+    def setup_multiwinner_upload(cls, testClass):
+        """
+        For tests of what visitors see: clears the cache, and uploads the multiwinner json
+        file, then logs out. Returns the uploaded JsonConfig.
+        """
+        cache.clear()
+        cls.setup_host_mocks(testClass)
+        cls.login(testClass.client)
+        cls.get_multiwinner_upload_response(testClass.client)
+        cls.logout(testClass.client)
+        return cls.get_latest_upload()
+
     @classmethod
     def get_headless_browser(cls):
         """ Returns a headless browser """
@@ -219,6 +243,17 @@ class TestHelpers():
         return MultiScraper.objects.create(
             scrapableURL="mock://multiscrape", sourceURL="mock://source")
 
+    @classmethod
+    def make_election_page(cls, *jsonConfigs):
+        """ Creates an election page, listing the given json configs """
+        page = ElectionPage.objects.create(
+            title="Test Election",
+            description="Test Description",
+            slug="test-slug",
+            date=datetime.datetime.utcnow())
+        page.listOfElections.add(*jsonConfigs)
+        return page
+
     @classmethod
     def mock_scraper_url_with_file(
             cls,
@@ -237,5 +272,167 @@ class TestHelpers():
         return TestHelpers.give_auth(user, ['add_scraper', 'change_scraper'])
 
 
+class SimulatedLatencyStorage(FileSystemStorage):
+    """
+    A FileSystemStorage where each request takes at least latencySeconds, like a request
+    to S3 would. Counts the requests, so tests can tell what was and wasn't fetched.
+    """
+
+    def __init__(self, latencySeconds=0.03, **kwargs):
+        super().__init__(**kwargs)
+        self.latencySeconds = latencySeconds
+        self.numRequests = 0
+
+    def _request(self):
+        self.numRequests += 1
+        time.sleep(self.latencySeconds)
+
+    def _open(self, name, mode='rb'):
+        self._request()
+        return super()._open(name, mode)
+
+    def _save(self, name, content):
+        self._request()
+        return super()._save(name, content)
+
+    def delete(self, name):
+        self._request()
+        super().delete(name)
+
+    def exists(self, name):
+        self._request()
+        return super().exists(name)
+
+    def size(self, name):
+        self._request()
+        return super().size(name)
+
+    def get_modified_time(self, name):
+        self._request()
+        return super().get_modified_time(name)
+
+
+class FakeElectionSource:
+    """
+    A stand-in for the server a scraper scrapes, on localhost: serves the content at
+    every path, supports conditional requests and gzip, and records each request it answers.
+    Use it as a context manager.
+    """
+
+    def __init__(self, content, supportsConditionalRequests=True):
+        self.supportsConditionalRequests = supportsConditionalRequests
+        self.requests = []  # (status, request headers, whether the body was gzipped)
+        self.set_content(content)
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler(self))
+        self._thread = None
+
+    def set_content(self, content):
+        """ Changes what's served, as a new version """
+        self.content = content
+        self.etag = '"%s"' % hashlib.sha256(content).hexdigest()[:16]
+        self.lastModified = formatdate(time.time(), usegmt=True)
+
+    def url(self, path='/results.json'):
+        """ The URL of the path on this server """
+        return 'http://127.0.0.1:%d%s' % (self._server.server_address[1], path)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    @staticmethod
+    def _make_handler(source):
+        """ A request handler class serving what the source currently serves """
+
+        class Handler(BaseHTTPRequestHandler):
+            """ Answers GETs for the FakeElectionSource """
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """ Answers every GET """
+                # If-Modified-Since is ignored along with If-None-Match, like RFC 7232 says
+                if 'If-None-Match' in self.headers:
+                    isNotModified = self.headers['If-None-Match'] == source.etag
+                else:
+                    isNotModified = self.headers.get('If-Modified-Since') == source.lastModified
+                if isNotModified and source.supportsConditionalRequests:
+                    self._respond(304, b'', False)
+                    return
+
+                body = source.content
+                isGzipped = 'gzip' in self.headers.get('Accept-Encoding', '')
+                if isGzipped:
+                    body = gzip.compress(body)
+                self._respond(200, body, isGzipped)
+
+            def _respond(self, status, body, isGzipped):
+                source.requests.append((status, dict(self.headers), isGzipped))
+                self.send_response(status)
+                if source.supportsConditionalRequests:
+                    self.send_header('ETag', source.etag)
+                    self.send_header('Last-Modified', source.lastModified)
+                if isGzipped:
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        return Handler
+
+
+class FakeSpeechSynthesis:
+    """
+    A stand-in for both the Polly and S3 clients of TextToSpeechFactory: each synthesis task
+    completes synthesisSeconds after it starts, and downloads copy the audio file. Records
+    the texts synthesized, the keys downloaded, and the most tasks that were ever in progress.
+    """
+
+    def __init__(self, audioFilename='testData/audio.mp3', synthesisSeconds=0.2):
+        self.audioFilename = audioFilename
+        self.synthesisSeconds = synthesisSeconds
+        self.texts = []
+        self.downloadedKeys = []
+        self.maxTasksInProgress = 0
+        self._completionTimes = []
+        self._lock = threading.Lock()
+
+    def _num_tasks_in_progress(self):
+        now = time.monotonic()
+        return sum(1 for completionTime in self._completionTimes if completionTime > now)
+
+    def start_speech_synthesis_task(self, **kwargs):
+        """ As Polly's: starts synthesizing kwargs['Text'] """
+        with self._lock:
+            taskId = len(self.texts)
+            self.texts.append(kwargs['Text'])
+            self._completionTimes.append(time.monotonic() + self.synthesisSeconds)
+            self.maxTasksInProgress = max(self.maxTasksInProgress, self._num_tasks_in_progress())
+        return {'SynthesisTask': {'TaskId': taskId}}
+
+    def get_speech_synthesis_task(self, TaskId):  # pylint: disable=invalid-name
+        """ As Polly's: the status of the task """
+        with self._lock:
+            isComplete = time.monotonic() >= self._completionTimes[TaskId]
+        if not isComplete:
+            return {'SynthesisTask': {'TaskStatus': 'inProgress'}}
+        return {'SynthesisTask': {
+            'TaskStatus': 'completed',
+            'OutputUri': f'https://s3.amazonaws.com/bucket/generated_speech.{TaskId}.mp3'}}
+
+    def download_file(self, Key, Bucket, Filename):  # pylint: disable=invalid-name,unused-argument
+        """ As S3's: downloads the audio of the key """
+        with self._lock:
+            self.downloadedKeys.append(Key)
+        shutil.copy(self.audioFilename, Filename)
+
+
 # Silence logging spam for any test that includes this
 TestHelpers.silence_logging_spam()
@@ -1,19 +1,36 @@
 """ Utility functions shared across views, in either movie or visualizer apps """
 
 import json
+import logging
 
 from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from common.cacheVersions import versioned_key
+from common.compressedFiles import delete_unless_referenced, open_decompressed
+from common.precompressed import PrecompressedBody
+from common.singleFlight import SingleFlight
 from visualizer.bargraph.graphToD3 import D3Bargraph
+from visualizer.bargraph.graphToSvg import SvgBargraph
 from visualizer.descriptors.faq import FAQGenerator
 from visualizer.descriptors.roundDescriber import Describer
-from visualizer.graph.graphCreator import make_graph_with_file
-from visualizer.models import TextForWinner
+from visualizer.graph import graphArtifact
+from visualizer.graph.graphCreator import make_graph_with_file, load_as_universal_tabulator, \
+    serialize_universal_tabulator
+from visualizer.models import JsonConfig, TextForWinner
 from visualizer.sankey.graphToD3 import D3Sankey
+from visualizer.sankey.graphToSvg import SvgSankey
+from visualizer.sankey.sankeyLayout import SankeyLayout
 from visualizer.tabular.tabular import TabulateByRoundInteractive,\
     TabulateByRound,\
     TabulateByCandidate,\
     SingleTableSummary
 
+logger = logging.getLogger(__name__)
+
 
 class DefaultConfig():  # pylint: disable=too-few-public-methods
     """
@@ -26,6 +43,7 @@ class DefaultConfig():  # pylint: disable=too-few-public-methods
         self.onlyShowWinnersTabular = False
         self.textForWinner = TextForWinner.ELECTED
         self.isPreferentialBlock = False
+        self.horizontalSankey = True
 
 
 def get_embed_html(embedlyUrl, maxwidth, maxheight):
@@ -40,78 +58,395 @@ def get_embed_html(embedlyUrl, maxwidth, maxheight):
     return html
 
 
-def get_data_for_graph(graph, config):
+class LazyValue:  # pylint: disable=too-few-public-methods
+    """
+    A value which is only computed the first time it is needed.
+    Django templates call callables when rendering them, so a LazyValue in a template's
+    context is computed when - and only if - the template first uses it.
+    """
+
+    def __init__(self, func, *args):
+        self._func = func
+        self._args = args
+        self._isComputed = False
+        self._value = None
+
+    def __call__(self):
+        if not self._isComputed:
+            self._value = self._func(*self._args)
+            self._isComputed = True
+        return self._value
+
+
+def resolve_lazy_data(data):
+    """ Returns a copy of the data with every LazyValue computed """
+    return {key: value() if isinstance(value, LazyValue) else value
+            for key, value in data.items()}
+
+
+# The data used by each vistype of the embedded visualization, beyond the title,
+# config and graph. The data the javascript needs is fetched from the visualizationData
+# endpoint instead: see get_chart_data.
+DATA_FOR_VISTYPE = {
+    'barchart-interactive': {'tabularByRoundInteractive'},
+    'barchart-fixed': {'tabularByRoundInteractive'},
+    'sankey': set(),
+    'tabular-by-candidate': {'tabularByCandidate'},
+    'tabular-by-round': {'tabularByRound'},
+    'tabular-by-round-interactive': {'tabularByRoundInteractive'},
+    'tabular-candidate-by-round': {'singleTableSummary'},
+}
+
+# The data from get_data_for_graph which the javascript needs
+CHART_DATA_KEYS = ('bargraphData', 'sankeyData', 'sankeyLayout', 'humanFriendlyEventsPerRound',
+                   'humanFriendlySummary', 'faqsPerRound')
+
+
+def get_data_for_graph(graph, config, vistype=None):
     """
     Helper function for get_data_for_view:
     convert the graph to data to be passed on to JS.
+
+    Each visualization is a LazyValue, computed the first time a template uses it.
+    Use resolve_lazy_data to compute them all. If a vistype is given, data
+    which that vistype of the embedded visualization doesn't use is left out.
     """
-    d3Bargraph = D3Bargraph(graph)
-    d3Sankey = D3Sankey(graph)
-    tabularByCandidate = TabulateByCandidate(graph, config)
-    singleTableSummary = SingleTableSummary(graph)
-    tabularByRound = TabulateByRound(graph)
-    tabularByRoundInteractive = TabulateByRoundInteractive(graph, config)
+    describer = LazyValue(lambda: Describer(graph, config, summarizeAsParagraph=False))
+    sankeyData = LazyValue(lambda: D3Sankey(graph).data)
     graphData = {
         'title': graph.title,
         'date': graph.dateString,
-        'bargraphjs': d3Bargraph.js,
-        'sankeyjs': d3Sankey.js,
-        'tabularByCandidate': tabularByCandidate,
-        'singleTableSummary': singleTableSummary,
-        'tabularByRound': tabularByRound,
-        'tabularByRoundInteractive': tabularByRoundInteractive,
+        'bargraphData': LazyValue(lambda: D3Bargraph(graph).data),
+        'sankeyData': sankeyData,
+        'sankeyLayout': LazyValue(lambda: SankeyLayout(sankeyData(), config.horizontalSankey).data),
+        'tabularByCandidate': LazyValue(TabulateByCandidate, graph, config),
+        'singleTableSummary': LazyValue(SingleTableSummary, graph),
+        'tabularByRound': LazyValue(TabulateByRound, graph),
+        'tabularByRoundInteractive': LazyValue(TabulateByRoundInteractive, graph, config),
+        'humanFriendlyEventsPerRound': LazyValue(lambda: describer().describe_all_rounds()),
+        'humanFriendlySummary': LazyValue(
+            lambda: describer().describe_initial_summary(isForVideo=False)),
+        'faqsPerRound': LazyValue(lambda: FAQGenerator(graph, config).describe_all_rounds()),
         'graph': graph
     }
-    roundDescriberData = get_data_for_round_describer(graph, config)
-    graphData.update(roundDescriberData)
+
+    if vistype is not None:
+        dataForVistype = DATA_FOR_VISTYPE.get(vistype, set())
+        for key in list(graphData.keys()):
+            if isinstance(graphData[key], LazyValue) and key not in dataForVistype:
+                del graphData[key]
+
     return graphData
 
 
-def get_data_for_round_describer(graph, config):
+def get_chart_data(data):
     """
-    Helper function for get_data_for_view:
-    convert the round describer to data to be passed on to JS
+    Given the data from get_data_for_view, without a vistype, returns
+    everything the javascript of any visualization needs, as JSON-serializable objects.
+    """
+    chartData = {key: data[key]() for key in CHART_DATA_KEYS}
+    chartData['candidateSidecarData'] = data['candidateSidecarDataPyObj']
+    return chartData
+
+
+def make_graph_for_config(config):
+    """
+    Fully parses the standardizedJsonFile (or, if it has not been created yet, the jsonFile)
+    and candidateSidecarFile of the given config.
+    Returns a tuple of (graph, candidateSidecarDataPyObj).
+    Prefer load_graph_for_config, which avoids the parsing when it can.
     """
-    roundDescriber = Describer(graph, config, summarizeAsParagraph=False)
-    humanFriendlyEventsPerRound = roundDescriber.describe_all_rounds()
-    humanFriendlySummary = roundDescriber.describe_initial_summary(isForVideo=False)
-    faqsPerRound = json.dumps(FAQGenerator(graph, config).describe_all_rounds())
+    if config.standardizedJsonFile:
+        jsonFile = config.standardizedJsonFile
+    else:
+        jsonFile = config.jsonFile
+    if config.candidateSidecarFile:
+        config.candidateSidecarFile.seek(0)
+        candidateSidecarDataPyObj = json.load(open_decompressed(config.candidateSidecarFile))
+        candidateOrder = candidateSidecarDataPyObj['order']
+    else:
+        candidateSidecarDataPyObj = None
+        candidateOrder = None
+
+    jsonFile.seek(0)
+    graph = make_graph_with_file(jsonFile, config.excludeFinalWinnerAndEliminatedCandidate,
+                                 candidateOrder)
+    return graph, candidateSidecarDataPyObj
+
 
+PRECOMPUTED_FIELDS = ('standardizedJsonFile', 'graphArtifact')
+
+
+def get_artifact_source_key(config):
+    """ Everything the graph artifact of this config depends on, other than the pipeline """
     return {
-        'humanFriendlyEventsPerRound': json.dumps(humanFriendlyEventsPerRound),
-        'humanFriendlySummary': json.dumps(humanFriendlySummary),
-        'faqsPerRound': faqsPerRound
+        'jsonFile': config.jsonFile.name,
+        'candidateSidecarFile': config.candidateSidecarFile.name or None,
+        'excludeFinalWinnerAndEliminatedCandidate': config.excludeFinalWinnerAndEliminatedCandidate
     }
 
 
-def get_data_for_view(config):
-    """ All data needed to pass on to the visualize or visualizeembedded view """
-    graph = make_graph_with_file(config.jsonFile,
-                                 config.excludeFinalWinnerAndEliminatedCandidate)
-    if config.candidateSidecarFile:
-        candidateSidecarDataPyObj = json.load(config.candidateSidecarFile)
+def _replace_precomputed_file(config, fieldName, filename, content):
+    """
+    Saves the content to the given FileField of a saved config,
+    deleting the old file unless another config shares it
+    """
+    fieldFile = getattr(config, fieldName)
+    oldName = fieldFile.name
+    fieldFile.save(filename, ContentFile(content, filename), save=False)
+
+    # Don't call config.save(): nothing visible has changed, so there's nothing to purge
+    JsonConfig.objects.filter(pk=config.pk).update(**{fieldName: fieldFile.name})
+    if oldName:
+        delete_unless_referenced(JsonConfig, fieldName, fieldFile.storage, oldName)
 
-        # TODO this doesn't feel good - the graph should load this natively,
-        # not have it snuck here.
-        orderedItems = graph.get_items_for_names(candidateSidecarDataPyObj['order'])
-        graph.set_elimination_order(orderedItems)
+
+def _reuse_precomputed_files(config):
+    """
+    Points a saved config at the precomputed files of another config with the same
+    source key, if there is one - identical uploads share their files, so have the same key.
+    Returns whether there was one.
+    """
+    sourceKey = get_artifact_source_key(config)
+    others = JsonConfig.objects.exclude(pk=config.pk).filter(
+        jsonFile=sourceKey['jsonFile'],
+        excludeFinalWinnerAndEliminatedCandidate=sourceKey[
+            'excludeFinalWinnerAndEliminatedCandidate'])
+    if sourceKey['candidateSidecarFile'] is None:
+        others = others.filter(Q(candidateSidecarFile='') | Q(candidateSidecarFile__isnull=True))
     else:
-        candidateSidecarDataPyObj = None
-    candidateSidecarData = json.dumps(candidateSidecarDataPyObj)
+        others = others.filter(candidateSidecarFile=sourceKey['candidateSidecarFile'])
+    for fieldName in PRECOMPUTED_FIELDS:
+        others = others.exclude(**{fieldName: ''}).exclude(**{f'{fieldName}__isnull': True})
+    names = others.values_list(*PRECOMPUTED_FIELDS).first()
+    if names is None:
+        return False
+
+    oldNames = [getattr(config, fieldName).name for fieldName in PRECOMPUTED_FIELDS]
+    JsonConfig.objects.filter(pk=config.pk).update(**dict(zip(PRECOMPUTED_FIELDS, names)))
+    for fieldName, name, oldName in zip(PRECOMPUTED_FIELDS, names, oldNames):
+        setattr(config, fieldName, name)
+        if oldName and oldName != name:
+            storage = getattr(config, fieldName).storage
+            delete_unless_referenced(JsonConfig, fieldName, storage, oldName)
+    return True
+
+
+def _make_graph_artifact_content(config, graph, candidateSidecarDataPyObj):
+    artifact = graphArtifact.graph_to_artifact(graph,
+                                               get_artifact_source_key(config),
+                                               candidateSidecarDataPyObj)
+    return json.dumps(artifact, separators=(',', ':')).encode('utf-8')
+
+
+def save_graph_artifact(config, graph, candidateSidecarDataPyObj):
+    """
+    Stores the graph artifact for a saved config, replacing any previous artifact.
+    Must be called before the graph is passed to get_data_for_graph.
+    """
+    content = _make_graph_artifact_content(config, graph, candidateSidecarDataPyObj)
+    _replace_precomputed_file(config, 'graphArtifact', f'{config.slug}.json', content)
+
+
+def standardize_json(fileObject):
+    """ The content of the file, converted to the Universal Tabulator format """
+    fileObject.seek(0)
+    return serialize_universal_tabulator(load_as_universal_tabulator(fileObject))
+
+
+def save_standardized_json(config):
+    """
+    Converts the jsonFile of a saved config to the Universal Tabulator format
+    and stores it in standardizedJsonFile, so it never needs to be converted again.
+    """
+    content = standardize_json(config.jsonFile)
+    _replace_precomputed_file(config, 'standardizedJsonFile', f'{config.slug}.json', content)
+
+
+def store_precomputed_files(config, standardizedContent, graph):
+    """
+    For writing configs in bulk: stores the precomputed files of a config, from the output
+    of standardize_json and the graph parsed from it, without saving the config.
+    The config needs a slug and a stored jsonFile. Write PRECOMPUTED_FIELDS along with it.
+    Returns a list of (fieldName, name) of the files it replaced, to delete_unless_referenced
+    once written.
+    """
+    oldNames = [getattr(config, fieldName).name for fieldName in PRECOMPUTED_FIELDS]
+    filename = f'{config.slug}.json'
+    config.standardizedJsonFile.save(filename, ContentFile(standardizedContent, filename),
+                                     save=False)
+
+    candidateSidecarDataPyObj = None
+    if config.candidateSidecarFile or config.excludeFinalWinnerAndEliminatedCandidate:
+        # The graph depends on those too
+        graph, candidateSidecarDataPyObj = make_graph_for_config(config)
+    content = _make_graph_artifact_content(config, graph, candidateSidecarDataPyObj)
+    config.graphArtifact.save(filename, ContentFile(content, filename), save=False)
+    return [(fieldName, name) for fieldName, name in zip(PRECOMPUTED_FIELDS, oldNames) if name]
+
+
+def refresh_precomputed_files(config, parsedUpload=None):
+    """
+    Call after saving a config whose files may have changed:
+    recreates the standardizedJsonFile and the graph artifact,
+    or shares them with a config made from identical files.
+    Pass the validators.parse_upload of the config's files, if there is one, so that
+    they are not parsed again.
+    """
+    if _reuse_precomputed_files(config):
+        return
+    # The graph depends on these too: parse again if they weren't parsed with the files
+    isParsedLikeConfig = parsedUpload is not None and \
+        parsedUpload.excludeFinalWinnerAndEliminatedCandidate == \
+        config.excludeFinalWinnerAndEliminatedCandidate and \
+        (parsedUpload.candidateSidecarDataPyObj is not None) == bool(config.candidateSidecarFile)
+    if not isParsedLikeConfig:
+        save_standardized_json(config)
+        graph, candidateSidecarDataPyObj = make_graph_for_config(config)
+    else:
+        _replace_precomputed_file(config, 'standardizedJsonFile', f'{config.slug}.json',
+                                  parsedUpload.standardizedContent)
+        graph = parsedUpload.artifactGraph
+        candidateSidecarDataPyObj = parsedUpload.candidateSidecarDataPyObj
+    save_graph_artifact(config, graph, candidateSidecarDataPyObj)
+
+
+def load_graph_artifact(config):
+    """
+    Returns a tuple of (graph, candidateSidecarDataPyObj) from the graph artifact,
+    or None if there is no up-to-date artifact. Unlike load_graph_for_config,
+    it never touches the database.
+    """
+    if not config.graphArtifact:
+        return None
+
+    # Saves a round trip to the storage backend; invalidated when the config is saved
+    cacheKey = versioned_key(config, 'graphArtifact', config.graphArtifact.name)
+    try:
+        artifact = cache.get(cacheKey)
+        if artifact is None:
+            with config.graphArtifact.open('rb') as f:
+                artifact = json.load(open_decompressed(f))
+            cache.set(cacheKey, artifact)
+        return graphArtifact.artifact_to_graph(artifact, get_artifact_source_key(config))
+    except graphArtifact.StaleArtifactError as exc:
+        logger.info("Rebuilding graph artifact for %s: %s", config.slug, exc)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Could not read graph artifact for %s", config.slug)
+    return None
+
+
+def load_graph_for_config(config):
+    """
+    Returns a tuple of (graph, candidateSidecarDataPyObj), loaded from the graph artifact
+    if it is up-to-date. Otherwise, parses the files and stores a new artifact.
+    Only one process on this host builds the artifact of a config at once.
+    """
+    loaded = load_graph_artifact(config)
+    if loaded is not None:
+        return loaded
+
+    if config.pk is None:
+        return make_graph_for_config(config)
+
+    with SingleFlight(versioned_key(config, 'buildGraphArtifact')) as buildLock:
+        if buildLock.waited:
+            # Another process was building the artifact: use it
+            config.refresh_from_db(fields=['graphArtifact'])
+            loaded = load_graph_artifact(config)
+            if loaded is not None:
+                return loaded
+
+        graph, candidateSidecarDataPyObj = make_graph_for_config(config)
+        try:
+            save_graph_artifact(config, graph, candidateSidecarDataPyObj)
+        except Exception:  # pylint: disable=broad-except
+            # Not fatal: we'll try again next time
+            logger.exception("Could not save graph artifact for %s", config.slug)
+
+    return graph, candidateSidecarDataPyObj
+
+
+def get_data_for_view(config, vistype=None):
+    """
+    All data needed to pass on to the visualize or visualizeembedded view.
+    See get_data_for_graph for the vistype.
+    """
+    graph, candidateSidecarDataPyObj = load_graph_for_config(config)
 
     offlineMode = settings.OFFLINE_MODE
 
-    graphData = get_data_for_graph(graph, config)
+    graphData = get_data_for_graph(graph, config, vistype)
     additionalData = {
         'config': config,
         'offlineMode': offlineMode,
         'candidateSidecarDataPyObj': candidateSidecarDataPyObj,
-        'candidateSidecarData': candidateSidecarData
     }
     graphData.update(additionalData)
+
+    # For pages which don't fetch it from the visualizationData endpoint
+    if vistype is None:
+        graphData['visualizationData'] = LazyValue(get_chart_data, graphData)
     return graphData
 
 
+def get_cached_body(cacheKey, makeContent, contentType):
+    """
+    The PrecompressedBody of the content makeContent returns, made once per cacheKey
+    on each host. The key must change when the content would, so it never expires.
+    """
+    body = cache.get(cacheKey)
+    if body is not None:
+        return body
+
+    with SingleFlight(cacheKey) as buildLock:
+        if buildLock.waited:
+            body = cache.get(cacheKey)
+            if body is not None:
+                return body
+
+        body = PrecompressedBody(makeContent(), contentType)
+        cache.set(cacheKey, body, None)
+    return body
+
+
+def get_visualization_data_body(config):
+    """
+    The body of the visualizationData endpoint for a saved config: its chart data as JSON,
+    precompressed. It's computed and compressed once per version of the config on each host,
+    then cached until the config is saved.
+    """
+    def make_content():
+        chartData = get_chart_data(get_data_for_view(config))
+        content = json.dumps(chartData, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return content.encode('utf-8')
+
+    return get_cached_body(versioned_key(config, 'visualizationData'), make_content,
+                           'application/json')
+
+
+# The vistypes which can be drawn on the server, and how: see get_svg_body
+SVG_RENDERERS = {
+    'barchart-fixed': lambda graph, config: SvgBargraph(D3Bargraph(graph).data, config,
+                                                        graph.title).svg,
+    'sankey': lambda graph, config: SvgSankey(D3Sankey(graph).data, config, graph.title).svg,
+}
+
+
+def get_svg_body(config, vistype):
+    """
+    The vistype of a saved config, drawn as a static SVG on the server, precompressed.
+    Like the visualizationData, it's drawn once per version of the config on each host.
+    The vistype must be one of SVG_RENDERERS.
+    """
+    def make_content():
+        graph, _ = load_graph_for_config(config)
+        return SVG_RENDERERS[vistype](graph, config).encode('utf-8')
+
+    return get_cached_body(versioned_key(config, 'svg', vistype), make_content,
+                           'image/svg+xml')
+
+
 def get_script_to_disable_animations():
     """ Disables transitions on the current page """
     return "var animDisabler = document.createElement('style');\
@@ -0,0 +1,106 @@
+"""
+The results of every contest on an election page, in one bundle: enough to show each contest
+inline, so that the page only opens a contest's iframes - each a full render of
+VisualizeEmbedded - when they're asked for.
+
+Contests are summarized from their graph artifacts on a thread pool shared by everything in the
+process, and each summary is cached per version of its JsonConfig. Only reading artifacts
+happens on the pool: a contest without an up-to-date artifact is loaded on the calling thread,
+which rebuilds it, so all database access stays on one connection.
+"""
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+
+from common import viewUtils
+from common.cacheVersions import hash_key, versioned_key
+from visualizer.common import INACTIVE_TEXT, RESIDUAL_SURPLUS_TEXT
+
+
+def make_contest_summary(config, graph):
+    """
+    The compact summary of a contest: its candidates, most successful first, with their votes
+    in the first round and in the last round they were in, and who won
+    """
+    summary = graph.summarize()
+    winnerNames = set(summary.winnerNames)
+    candidates = [candidate for item, candidate in summary.candidates.items()
+                  if item.name not in (INACTIVE_TEXT, RESIDUAL_SURPLUS_TEXT)]
+    ranks = {item.name: rank for rank, item in enumerate(graph.eliminationOrder)}
+    candidates.sort(key=lambda candidate: -ranks[candidate.name])
+
+    return {
+        'slug': config.slug,
+        'title': config.title,
+        'numRounds': graph.numRounds,
+        'iframeHeight': viewUtils.default_iframe_height(config.numCandidates),
+        'threshold': graph.threshold,
+        'candidates': [str(candidate.name) for candidate in candidates],
+        'firstRoundVotes': [candidate.totalVotesPerRound[0] for candidate in candidates],
+        'lastRoundVotes': [candidate.totalVotesPerRound[-1] for candidate in candidates],
+        'lastRounds': [candidate.numRounds for candidate in candidates],
+        'isWinner': [int(candidate.name in winnerNames) for candidate in candidates],
+    }
+
+
+class ContestBundle:
+    """ The thread pool which summarizes contests, shared by every election page """
+    _lock = threading.Lock()
+    _pool = None
+
+    @classmethod
+    def _get_pool(cls):
+        with cls._lock:
+            if cls._pool is None:
+                cls._pool = ThreadPoolExecutor(
+                    max_workers=settings.ELECTION_PAGE_BUNDLE_MAX_WORKERS,
+                    thread_name_prefix='contestBundle')
+            return cls._pool
+
+    @classmethod
+    def _summarize_from_artifact(cls, config):
+        """ The summary of the contest, or None if its graph artifact is missing or stale """
+        loaded = viewUtils.load_graph_artifact(config)
+        if loaded is None:
+            return None
+        return make_contest_summary(config, loaded[0])
+
+    @classmethod
+    def get_summaries(cls, configs):
+        """ The summary of each of the JsonConfigs, in order """
+        keys = [versioned_key(config, 'contestSummary') for config in configs]
+        cached = cache.get_many(keys)
+        futures = {i: cls._get_pool().submit(cls._summarize_from_artifact, config)
+                   for i, (config, key) in enumerate(zip(configs, keys)) if key not in cached}
+
+        summaries = [cached.get(key) for key in keys]
+        toCache = {}
+        for i, future in futures.items():
+            summary = future.result()
+            if summary is None:
+                graph, _ = viewUtils.load_graph_for_config(configs[i])
+                summary = make_contest_summary(configs[i], graph)
+            summaries[i] = toCache[keys[i]] = summary
+
+        # Keys change when the configs are saved, so they never need to expire
+        cache.set_many(toCache, None)
+        return summaries
+
+    @classmethod
+    def get_body(cls, page):
+        """
+        The bundle of the election page as precompressed JSON, made once per version of the
+        page and its contests
+        """
+        stamp = type(page).get_cache_stamp(pk=page.pk)
+        cacheKey = f'{page._meta.label_lower}.{page.pk}.{hash_key(stamp, "contestBundle")}'
+
+        def make_content():
+            bundle = {'title': page.title, 'contests': cls.get_summaries(page.get_contests())}
+            return json.dumps(bundle, separators=(',', ':')).encode('utf-8')
+
+        return viewUtils.get_cached_body(cacheKey, make_content, 'application/json')
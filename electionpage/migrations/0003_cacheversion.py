@@ -0,0 +1,38 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:24
+
+import common.cacheVersions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electionpage', '0002_singlesourceelectionpage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='electionpage',
+            name='cacheVersion',
+            field=models.CharField(
+                default=common.cacheVersions.new_cache_version,
+                editable=False,
+                max_length=32),
+        ),
+        migrations.AddField(
+            model_name='scrapableelectionpage',
+            name='cacheVersion',
+            field=models.CharField(
+                default=common.cacheVersions.new_cache_version,
+                editable=False,
+                max_length=32),
+        ),
+        migrations.AddField(
+            model_name='singlesourceelectionpage',
+            name='cacheVersion',
+            field=models.CharField(
+                default=common.cacheVersions.new_cache_version,
+                editable=False,
+                max_length=32),
+        ),
+    ]
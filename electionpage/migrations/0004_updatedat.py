@@ -0,0 +1,29 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:48
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('electionpage', '0003_cacheversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='electionpage',
+            name='updatedAt',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='scrapableelectionpage',
+            name='updatedAt',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='singlesourceelectionpage',
+            name='updatedAt',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('scraper', '0002_multiscraper'),
+        ('electionpage', '0004_updatedat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeJob',
+            fields=[
+                ('id',
+                 models.AutoField(
+                     auto_created=True,
+                     primary_key=True,
+                     serialize=False,
+                     verbose_name='ID')),
+                ('createdAt',
+                 models.DateTimeField(
+                     auto_now_add=True)),
+                ('finishedAt',
+                 models.DateTimeField(
+                     blank=True,
+                     null=True)),
+                ('electionPage',
+                 models.ForeignKey(
+                     on_delete=django.db.models.deletion.CASCADE,
+                     related_name='scrapeJobs',
+                     to='electionpage.scrapableelectionpage')),
+                ('owner',
+                 models.ForeignKey(
+                     on_delete=django.db.models.deletion.CASCADE,
+                     related_name='+',
+                     to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ScrapeJobItem',
+            fields=[
+                ('id',
+                 models.AutoField(
+                     auto_created=True,
+                     primary_key=True,
+                     serialize=False,
+                     verbose_name='ID')),
+                ('order',
+                 models.IntegerField()),
+                ('status',
+                 models.IntegerField(
+                     choices=[
+                         (0,
+                          'Waiting to be scraped'),
+                         (1,
+                          'Scrape succeeded'),
+                         (2,
+                          'Scrape succeeded, but nothing had changed'),
+                         (3,
+                          'Scrape failed')],
+                     default=0)),
+                ('error',
+                 models.CharField(
+                     blank=True,
+                     max_length=512)),
+                ('finishedAt',
+                 models.DateTimeField(
+                     blank=True,
+                     null=True)),
+                ('job',
+                 models.ForeignKey(
+                     on_delete=django.db.models.deletion.CASCADE,
+                     related_name='items',
+                     to='electionpage.scrapejob')),
+                ('scraper',
+                 models.ForeignKey(
+                     on_delete=django.db.models.deletion.CASCADE,
+                     related_name='+',
+                     to='scraper.scraper')),
+            ],
+            options={
+                'ordering': ['order'],
+            },
+        ),
+    ]
@@ -1,10 +1,17 @@
 """ ElectionPage models """
 
+import abc
+
+from django.conf import settings
 from django.db import models
+from django.db.models import Prefetch
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import ugettext as _
 
 from sortedm2m.fields import SortedManyToManyField
 
+from common.cacheVersions import hash_key, new_cache_version
 from common.cloudflare import CloudflareAPI
 from visualizer.models import JsonConfig
 from scraper.models import MultiScraper, Scraper
@@ -28,9 +35,62 @@ class BaseElectionPage(models.Model):
     # Date of the election
     date = models.DateField()
 
+    # Part of the key of everything cached for this page. See common.cacheVersions.
+    cacheVersion = models.CharField(max_length=32, default=new_cache_version, editable=False)
+    # When the cacheVersion last changed
+    updatedAt = models.DateTimeField(default=timezone.now, editable=False)
+
     def __str__(self):
         return str(self.title)
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.cacheVersion = new_cache_version()
+            self.updatedAt = timezone.now()
+
+        super().save(*args, **kwargs)
+
+    @abc.abstractmethod
+    def get_json_configs(self):
+        """ A queryset of all JsonConfigs shown on this page """
+
+    def get_contests(self):
+        """
+        The JsonConfigs shown on this page, in the order they're shown. Fetch the page
+        with_contests to load them along with it.
+        """
+        return list(self.get_json_configs())
+
+    @classmethod
+    def with_contests(cls):
+        """ A queryset of the pages, which fetches their contests in a few queries in all """
+        return cls.objects.all()
+
+    @classmethod
+    def get_cache_validators(cls, **lookup):
+        """
+        A tuple of (stamp, lastModified), or None if there is no page for the lookup.
+        The stamp changes whenever the page, or any JsonConfig on it, is updated,
+        and lastModified is when the latest of them was.
+        """
+        page = cls.objects.filter(**lookup).first()
+        if page is None:
+            return None
+        configs = page.get_json_configs().order_by('pk').values_list('pk', 'cacheVersion',
+                                                                     'updatedAt')
+        stamp = hash_key(page.cacheVersion, *[(pk, version) for pk, version, _ in configs])
+        lastModified = max([page.updatedAt] + [updatedAt for _, _, updatedAt in configs])
+        return stamp, lastModified
+
+    @classmethod
+    def get_cache_stamp(cls, **lookup):
+        """
+        Changes whenever the page, or any JsonConfig on it, is updated.
+        Returns None if there is no page for the lookup.
+        """
+        validators = cls.get_cache_validators(**lookup)
+        return None if validators is None else validators[0]
+
 
 class ElectionPage(BaseElectionPage):
     """ An election page consisting of several JsonConfigs """
@@ -38,10 +98,17 @@ class ElectionPage(BaseElectionPage):
     listOfElections = SortedManyToManyField(JsonConfig)
 
     def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+
         urlToPurge = reverse('electionPage', args=(self.slug,))
         CloudflareAPI.purge_paths_cache([urlToPurge])
 
-        super().save(*args, **kwargs)
+    def get_json_configs(self):
+        return self.listOfElections.all()
+
+    @classmethod
+    def with_contests(cls):
+        return cls.objects.prefetch_related('listOfElections')
 
     def get_absolute_url(self):
         """ Used in the admin panel to have a "Visit Site" link """
@@ -71,11 +138,24 @@ class ScrapableElectionPage(BaseElectionPage):
                     scraper.areResultsCertified = self.areResultsCertified
                     scraper.save()
 
+        super().save(*args, **kwargs)
+
         # Purge cache
         urlToPurge = reverse('electionPageScrapable', args=(self.slug,))
         CloudflareAPI.purge_paths_cache([urlToPurge])
 
-        super().save(*args, **kwargs)
+    def get_json_configs(self):
+        return JsonConfig.objects.filter(pk__in=self.listOfScrapers.values('jsonConfig'))
+
+    def get_contests(self):
+        # Scrapers which haven't been scraped yet have nothing to show
+        return [scraper.jsonConfig for scraper in self.listOfScrapers.all()
+                if scraper.jsonConfig is not None]
+
+    @classmethod
+    def with_contests(cls):
+        return cls.objects.prefetch_related(
+            Prefetch('listOfScrapers', queryset=Scraper.objects.select_related('jsonConfig')))
 
     def get_absolute_url(self):
         """ Used in the admin panel to have a "Visit Site" link """
@@ -99,12 +179,74 @@ class SingleSourceElectionPage(BaseElectionPage):
     areResultsCertified = models.BooleanField(default=False)
 
     def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+
         # Purge cache
         urlToPurge = reverse('electionPageSingleSource', args=(self.slug,))
         CloudflareAPI.purge_paths_cache([urlToPurge])
 
-        super().save(*args, **kwargs)
+    def get_json_configs(self):
+        return self.scraper.listOfElections.all()
+
+    @classmethod
+    def with_contests(cls):
+        return cls.objects.select_related('scraper').prefetch_related('scraper__listOfElections')
 
     def get_absolute_url(self):
         """ Used in the admin panel to have a "Visit Site" link """
         return reverse('electionPageSingleSource', args=(self.slug,))
+
+
+class ScrapeJobStatuses(models.IntegerChoices):
+    """ Describes the progress of a single scraper in a ScrapeJob """
+    PENDING = 0, _('Waiting to be scraped')
+    SUCCEEDED = 1, _('Scrape succeeded')
+    UNCHANGED = 2, _('Scrape succeeded, but nothing had changed')
+    FAILED = 3, _('Scrape failed')
+
+
+class ScrapeJob(models.Model):
+    """
+    A ScrapeAll of a ScrapableElectionPage, run in the background.
+    See electionpage.scrapeJobs.
+    """
+    electionPage = models.ForeignKey(ScrapableElectionPage,
+                                     related_name='scrapeJobs',
+                                     on_delete=models.CASCADE)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL,
+                              related_name='+',
+                              on_delete=models.CASCADE)
+    createdAt = models.DateTimeField(auto_now_add=True)
+
+    # Null until every scraper has been scraped
+    finishedAt = models.DateTimeField(null=True, blank=True)
+
+    def get_absolute_url(self):
+        """ The progress page """
+        return reverse('scrapeJob', args=(self.pk,))
+
+    def __str__(self):
+        return f'{self.electionPage.slug} at {self.createdAt}'
+
+
+class ScrapeJobItem(models.Model):
+    """ The progress of a single scraper in a ScrapeJob """
+    job = models.ForeignKey(ScrapeJob, related_name='items', on_delete=models.CASCADE)
+    scraper = models.ForeignKey(Scraper, related_name='+', on_delete=models.CASCADE)
+
+    # Items are shown in the order of the scrapers on the page
+    order = models.IntegerField()
+
+    status = models.IntegerField(choices=ScrapeJobStatuses.choices,
+                                 default=ScrapeJobStatuses.PENDING)
+    error = models.CharField(max_length=512, blank=True)
+    finishedAt = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        """ Meta-controls: the default ordering """
+        ordering = ["order"]
+
+    @property
+    def succeeded(self):
+        """ Did the scrape succeed, whether or not anything had changed? """
+        return self.status in (ScrapeJobStatuses.SUCCEEDED, ScrapeJobStatuses.UNCHANGED)
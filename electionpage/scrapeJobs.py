@@ -0,0 +1,103 @@
+"""
+ScrapeAll, run as a background job: scraping every election on a page takes about as long as
+the slowest source rather than all of them in turn, and no request waits on it.
+
+Downloads are the slow part, so they run concurrently, on the thread pool of
+scraper.downloader - which limits how hard each host is hit, so that a page of contests from
+the same county doesn't hammer its server. As each download completes, the job's own thread
+validates and saves it, so all database access stays on one connection.
+
+The progress of each scraper is stored in a ScrapeJobItem, for the progress page.
+A job interrupted by a restart is never finished: start another.
+"""
+
+import logging
+import threading
+from concurrent.futures import as_completed
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from common.cloudflare import CloudflareAPI
+from electionpage.models import ScrapeJob, ScrapeJobItem, ScrapeJobStatuses
+from scraper.downloader import Downloader
+from scraper.scrapeWorker import ScrapeInProgressException, ScrapeWorker
+
+logger = logging.getLogger(__name__)
+
+
+def start_scrape_job(electionPage, user):
+    """
+    Creates a job to scrape every scraper of the ScrapableElectionPage, and returns it.
+    The job starts in the background once the current transaction commits - or, unless
+    SCRAPE_JOBS_IN_BACKGROUND, runs before this returns.
+    """
+    job = ScrapeJob.objects.create(electionPage=electionPage, owner=user)
+    ScrapeJobItem.objects.bulk_create([
+        ScrapeJobItem(job=job, scraper=scraper, order=i)
+        for i, scraper in enumerate(electionPage.listOfScrapers.all())])
+
+    if settings.SCRAPE_JOBS_IN_BACKGROUND:
+        thread = threading.Thread(target=_run_in_background, args=(job.pk,),
+                                  name=f'scrapeJob{job.pk}', daemon=True)
+        transaction.on_commit(thread.start)
+    else:
+        run_scrape_job(job)
+    return job
+
+
+def _run_in_background(jobPk):
+    try:
+        run_scrape_job(ScrapeJob.objects.get(pk=jobPk))
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Scrape job %d failed", jobPk)
+    finally:
+        connection.close()
+
+
+def _finish_item(item, status, exc=None):
+    """ Records the outcome of scraping the item, and the exception if it failed """
+    item.status = status
+    if exc is not None:
+        maxErrorLength = ScrapeJobItem._meta.get_field('error').max_length
+        item.error = (str(exc) or type(exc).__name__)[:maxErrorLength]
+    item.finishedAt = timezone.now()
+    item.save(update_fields=['status', 'error', 'finishedAt'])
+
+
+def run_scrape_job(job):
+    """ Scrapes everything in the job, recording the outcome for each scraper as it finishes """
+    futures = {}
+    for item in job.items.select_related('scraper'):
+        # Leased before downloading, so nothing else downloads it meanwhile
+        try:
+            ScrapeWorker.acquire_lease(item.scraper)
+        except ScrapeInProgressException as exc:
+            _finish_item(item, ScrapeJobStatuses.FAILED, exc)
+            continue
+        try:
+            headers = ScrapeWorker.get_conditional_headers(item.scraper)
+            futures[Downloader.submit(item.scraper.scrapableURL, headers)] = item
+        except Exception as exc:  # pylint: disable=broad-except
+            # Nothing will scrape it, so nothing else would release the lease
+            ScrapeWorker.release_lease(item.scraper)
+            _finish_item(item, ScrapeJobStatuses.FAILED, exc)
+
+    for future in as_completed(futures):
+        item = futures[future]
+        try:
+            wasUpdated = ScrapeWorker.scrape(item.scraper, job.owner, download=future.result,
+                                             isLeased=True)
+            _finish_item(item, ScrapeJobStatuses.SUCCEEDED if wasUpdated
+                         else ScrapeJobStatuses.UNCHANGED)
+        except Exception as exc:  # pylint: disable=broad-except
+            _finish_item(item, ScrapeJobStatuses.FAILED, exc)
+
+    job.finishedAt = timezone.now()
+    job.save(update_fields=['finishedAt'])
+
+    # Queue the cloudflare purge. The local cache was invalidated when each JsonConfig saved.
+    urlToPurge = reverse('electionPageScrapable', args=(job.electionPage.slug,))
+    CloudflareAPI.purge_paths_cache([urlToPurge])
@@ -18,15 +18,32 @@ as well as actually populate data.
 """
 
 import datetime
+import io
+import json
+import threading
+import time
+from collections import Counter
 from urllib.parse import urlparse
 
+from django.core.cache import cache
 from django.core.files import File
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from mock import patch
 from requests_mock import Mocker
 from selenium.common.exceptions import NoSuchElementException
 
+from common import viewUtils
+from common.compressedFiles import hash_content
 from common.testUtils import TestHelpers
-from electionpage.models import ElectionPage, ScrapableElectionPage, SingleSourceElectionPage
+from electionpage.contestBundle import ContestBundle, make_contest_summary
+from electionpage.models import ScrapableElectionPage, ScrapeJob, \
+    ScrapeJobStatuses, SingleSourceElectionPage
+from scraper.downloader import Downloader
+from scraper.models import Scraper
+from scraper.scrapeWorker import ScrapedFile, ScrapeWorker
 from visualizer.models import JsonConfig
 from visualizer.tests import filenames
 from visualizer.tests import liveServerTestBaseClass
@@ -45,14 +62,8 @@ class ElectionPageTests(liveServerTestBaseClass.LiveServerTestBaseClass):
 
     @classmethod
     def _create_election_page(cls, numElections):
-        epModel = ElectionPage.objects.create(
-            title="Test Election",
-            description="Test Description",
-            slug="test-slug",
-            date=datetime.datetime.utcnow())
-        for _ in range(numElections):
-            epModel.listOfElections.add(cls._create_json_config())
-        return epModel
+        return TestHelpers.make_election_page(
+            *[cls._create_json_config() for _ in range(numElections)])
 
     @classmethod
     def _create_single_source_election_page(cls):
@@ -116,6 +127,7 @@ class ElectionPageTests(liveServerTestBaseClass.LiveServerTestBaseClass):
         self.assertIn('?vistype=barchart-inte', bargraphIframe.get_attribute('src'))
         self.assertEqual(bargraphButton.get_attribute('class'), 'btn btn-primary')
 
+    @override_settings(SCRAPE_JOBS_IN_BACKGROUND=False)
     @Mocker()
     def test_scrape_all(self, requestMock):
         """
@@ -241,6 +253,7 @@ class ElectionPageTests(liveServerTestBaseClass.LiveServerTestBaseClass):
         self.open(reverse('createScrapableElection'), expectedErrorCount=1)
         self.assertIn('403', self.browser.page_source)
 
+    @override_settings(SCRAPE_JOBS_IN_BACKGROUND=False)
     @Mocker()
     def test_populate(self, requestMock):
         """ Test populate page, and ensure ScrapeAll works """
@@ -292,6 +305,7 @@ class ElectionPageTests(liveServerTestBaseClass.LiveServerTestBaseClass):
         for scraper in ScrapableElectionPage.objects.get(slug='cuteslug').listOfScrapers.all():
             self.assertTrue(scraper.areResultsCertified)
 
+    @override_settings(SCRAPE_JOBS_IN_BACKGROUND=False)
     @Mocker()
     def test_are_results_certified_updates_correctly(self, requestMock):
         """ When areResultsCertified updates, it propagates to all scrapers """
@@ -309,3 +323,253 @@ class ElectionPageTests(liveServerTestBaseClass.LiveServerTestBaseClass):
         self.open(reverse('scrapeAll', args=(epModel.slug,)))
         for scraper in epModel.listOfScrapers.all():
             self.assertTrue(scraper.jsonConfig.areResultsCertified)
+
+
+@override_settings(SCRAPE_JOBS_IN_BACKGROUND=False)
+class ScrapeJobTests(TestCase):
+    """ ScrapeAll jobs, run in the request rather than in the background """
+
+    def setUp(self):
+        TestHelpers.silence_logging_spam()
+        self.user = TestHelpers.login_with_scrape_permissions(self.client)
+
+    @classmethod
+    def _create_scrapable_election_page(cls, urls):
+        epModel = ScrapableElectionPage.objects.create(
+            title="Test Scrapable Election",
+            description="Test Description",
+            slug="test-slug",
+            date=datetime.datetime.utcnow())
+        for url in urls:
+            epModel.listOfScrapers.add(Scraper.objects.create(scrapableURL=url,
+                                                              sourceURL="mock://source"))
+        return epModel
+
+    @Mocker()
+    def test_progress(self, requestMock):
+        """ The job records the outcome of each scraper, and redirects to its progress """
+        TestHelpers.mock_scraper_url_with_file(requestMock)
+        TestHelpers.mock_scraper_url_with_file(requestMock, "mock://bad-url", filenames.BAD_DATA)
+        epModel = self._create_scrapable_election_page(
+            ["mock://scrape", "mock://bad-url", "mock://scrape"])
+
+        response = self.client.get(reverse('scrapeAll', args=(epModel.slug,)))
+        job = ScrapeJob.objects.get()
+        self.assertRedirects(response, reverse('scrapeJob', args=(job.pk,)))
+        self.assertIsNotNone(job.finishedAt)
+        self.assertEqual([item.status for item in job.items.all()],
+                         [ScrapeJobStatuses.SUCCEEDED, ScrapeJobStatuses.FAILED,
+                          ScrapeJobStatuses.SUCCEEDED])
+        self.assertTrue(job.items.all()[1].error)
+
+        response = self.client.get(reverse('scrapeJob', args=(job.pk,)))
+        self.assertContains(response, 'alert-primary', count=2)
+        self.assertContains(response, 'alert-warning', count=1)
+        self.assertNotContains(response, 'http-equiv="refresh"')
+
+        # Nothing has changed the second time
+        self.client.get(reverse('scrapeAll', args=(epModel.slug,)))
+        job = ScrapeJob.objects.latest('pk')
+        self.assertEqual(job.items.filter(status=ScrapeJobStatuses.UNCHANGED).count(), 2)
+
+    def test_concurrency_limits(self):
+        """ Downloads run concurrently, but only a few at once from each host """
+        running = Counter()
+        maxRunning = Counter()
+        lock = threading.Lock()
+
+        def download(url, maxSizeBytes, session, headers):  # pylint: disable=unused-argument
+            host = urlparse(url).netloc
+            with lock:
+                running[host] += 1
+                running['total'] += 1
+                for key in (host, 'total'):
+                    maxRunning[key] = max(maxRunning[key], running[key])
+            time.sleep(0.1)
+            with lock:
+                running[host] -= 1
+                running['total'] -= 1
+            with open(filenames.ONE_ROUND, 'rb') as f:
+                content = f.read()
+            return ScrapedFile(io.BytesIO(content), hash_content(content), '', '')
+
+        urls = [f"mock://limited-host/{i}" for i in range(4)] + \
+            [f"mock://other-host-{i}/results.json" for i in range(4)]
+        epModel = self._create_scrapable_election_page(urls)
+        with override_settings(SCRAPE_MAX_CONCURRENT_PER_HOST=2,
+                               SCRAPE_MIN_SECONDS_BETWEEN_HOST_REQUESTS=0), \
+                patch('scraper.scrapeWorker.ScrapeWorker.download_limited_size',
+                      side_effect=download):
+            self.client.get(reverse('scrapeAll', args=(epModel.slug,)))
+
+        self.assertEqual(maxRunning['limited-host'], 2)
+        self.assertGreater(maxRunning['total'], 2)
+        job = ScrapeJob.objects.get()
+        self.assertEqual(job.items.filter(status=ScrapeJobStatuses.SUCCEEDED).count(), 8)
+
+    @Mocker()
+    def test_leases_before_downloading(self, requestMock):
+        """ A scraper being scraped elsewhere isn't downloaded again, nor saved over """
+        TestHelpers.mock_scraper_url_with_file(requestMock)
+        epModel = self._create_scrapable_election_page(["mock://scrape", "mock://scrape"])
+        busyScraper, scraper = epModel.listOfScrapers.order_by('pk')
+        ScrapeWorker.acquire_lease(busyScraper)
+
+        def reschedule(*args):
+            # The scheduler reschedules the scraper while it's being scraped
+            Scraper.objects.filter(pk=scraper.pk).update(pollSeconds=123)
+            return recordSuccess(*args)
+        recordSuccess = ScrapeWorker._record_success  # pylint: disable=protected-access
+        with patch('scraper.scrapeWorker.ScrapeWorker._record_success', side_effect=reschedule), \
+                patch('scraper.scrapeWorker.ScrapeWorker.download_limited_size',
+                      wraps=ScrapeWorker.download_limited_size) as mockDownload:
+            self.client.get(reverse('scrapeAll', args=(epModel.slug,)))
+
+        self.assertEqual(mockDownload.call_count, 1)
+        self.assertEqual([item.status for item in ScrapeJob.objects.get().items.all()],
+                         [ScrapeJobStatuses.FAILED, ScrapeJobStatuses.SUCCEEDED])
+        scraper.refresh_from_db()
+        self.assertEqual(scraper.pollSeconds, 123)
+        self.assertIsNotNone(scraper.jsonConfig)
+        self.assertIsNone(scraper.scrapeLeaseExpiresAt)
+
+    @Mocker()
+    def test_download_fails_to_start(self, requestMock):
+        """ If a download can't even start, its scraper fails and is released, and the rest run """
+        TestHelpers.mock_scraper_url_with_file(requestMock)
+        epModel = self._create_scrapable_election_page(["mock://scrape", "mock://scrape"])
+        submit = Downloader.submit
+        with patch('electionpage.scrapeJobs.Downloader.submit',
+                   side_effect=[RuntimeError("No threads left"), submit('mock://scrape', {})]):
+            self.client.get(reverse('scrapeAll', args=(epModel.slug,)))
+
+        job = ScrapeJob.objects.get()
+        self.assertIsNotNone(job.finishedAt)
+        self.assertEqual([item.status for item in job.items.all()],
+                         [ScrapeJobStatuses.FAILED, ScrapeJobStatuses.SUCCEEDED])
+        self.assertEqual(job.items.all()[0].error, "No threads left")
+        self.assertFalse(Scraper.objects.filter(scrapeLeaseExpiresAt__isnull=False).exists())
+
+    @override_settings(SCRAPE_JOBS_IN_BACKGROUND=True)
+    def test_starts_in_background(self):
+        """ In the background, the job only starts once the request's transaction commits """
+        epModel = self._create_scrapable_election_page(["mock://scrape"])
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.get(reverse('scrapeAll', args=(epModel.slug,)))
+        job = ScrapeJob.objects.get()
+        self.assertEqual(len(callbacks), 1)
+        self.assertIsNone(job.finishedAt)
+
+        response = self.client.get(reverse('scrapeJob', args=(job.pk,)))
+        self.assertContains(response, 'http-equiv="refresh"')
+        self.assertContains(response, '0 of 1')
+
+
+class ContestBundleTests(TestCase):
+    """ The contests of an election page are summarized in one pass, and shown inline """
+
+    def setUp(self):
+        cache.clear()
+        TestHelpers.setup_host_mocks(self)
+
+    @classmethod
+    def _create_json_config(cls, filename, slug):
+        with open(filename, 'rb') as f:
+            config = JsonConfig.objects.create(jsonFile=File(f), slug=slug, title=slug,
+                                               numRounds=1, numCandidates=1)
+        viewUtils.refresh_precomputed_files(config)
+        return config
+
+    @classmethod
+    def _create_scrapable_election_page(cls, numElections):
+        epModel = ScrapableElectionPage.objects.create(
+            title="Test Scrapable Election",
+            description="Test Description",
+            slug="test-slug",
+            date=datetime.datetime.utcnow())
+        for i in range(numElections):
+            scraper = TestHelpers.make_scraper()
+            scraper.jsonConfig = cls._create_json_config(filenames.THREE_ROUND, f'contest-{i}')
+            scraper.save()
+            epModel.listOfScrapers.add(scraper)
+
+        # Not yet scraped, so not shown
+        epModel.listOfScrapers.add(TestHelpers.make_scraper())
+        return epModel
+
+    def test_bundle(self):
+        """ The bundle summarizes each contest in order, and is revalidated with its ETag """
+        epModel = self._create_scrapable_election_page(numElections=3)
+        url = reverse('electionPageScrapableBundle', args=(epModel.slug,))
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        bundle = json.loads(response.content)
+        self.assertEqual(bundle['title'], epModel.title)
+        self.assertEqual([contest['slug'] for contest in bundle['contests']],
+                         ['contest-0', 'contest-1', 'contest-2'])
+
+        contest = bundle['contests'][0]
+        self.assertEqual(contest['numRounds'], 3)
+        self.assertEqual(contest['isWinner'][0], 1)
+        self.assertEqual(sum(contest['isWinner']), 1)
+        self.assertEqual(len(contest['candidates']), len(contest['firstRoundVotes']))
+        self.assertEqual(contest['lastRounds'][0], 3)
+
+        pageResponse = self.client.get(reverse('electionPageScrapable', args=(epModel.slug,)))
+        self.assertContains(pageResponse, 'eliminated in round 1', count=3)
+        self.assertContains(pageResponse, 'eliminated in round 2', count=3)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        # Saving a contest changes its page's bundle
+        config = JsonConfig.objects.get(slug='contest-1')
+        config.title = 'New Title'
+        config.save()
+        bundle = json.loads(self.client.get(url).content)
+        self.assertEqual(bundle['contests'][1]['title'], 'New Title')
+
+    def test_queries_per_page(self):
+        """ However many contests there are, they're fetched in the same number of queries """
+        epModel = self._create_scrapable_election_page(numElections=2)
+        url = reverse('electionPageScrapable', args=(epModel.slug,))
+        with CaptureQueriesContext(connection) as fewContests:
+            response = self.client.get(url)
+        self.assertContains(response, 'contest-summary', count=2)
+
+        for i in range(2, 6):
+            scraper = TestHelpers.make_scraper()
+            scraper.jsonConfig = self._create_json_config(filenames.ONE_ROUND, f'contest-{i}')
+            scraper.save()
+            epModel.listOfScrapers.add(scraper)
+        cache.clear()
+        with CaptureQueriesContext(connection) as manyContests:
+            response = self.client.get(url)
+        self.assertContains(response, 'contest-summary', count=6)
+        self.assertEqual(len(manyContests), len(fewContests))
+
+    def test_summarized_once(self):
+        """ Summaries are made from the artifacts on the pool, and cached per config version """
+        epModel = self._create_scrapable_election_page(numElections=2)
+        configs = epModel.get_contests()
+
+        # Without an up-to-date artifact, the graph is rebuilt on this thread
+        JsonConfig.objects.filter(pk=configs[1].pk).update(graphArtifact='')
+        configs[1].graphArtifact = ''
+        threadNames = set()
+
+        def record_thread(config, graph):
+            threadNames.add(threading.current_thread().name)
+            return make_contest_summary(config, graph)
+
+        with patch('electionpage.contestBundle.make_contest_summary',
+                   side_effect=record_thread) as mockSummarize:
+            ContestBundle.get_summaries(configs)
+            self.assertEqual(mockSummarize.call_count, 2)
+            self.assertIn(threading.current_thread().name, threadNames)
+            self.assertTrue(any(name.startswith('contestBundle') for name in threadNames))
+            self.assertTrue(JsonConfig.objects.get(pk=configs[1].pk).graphArtifact)
+
+            summaries = ContestBundle.get_summaries(configs)
+            self.assertEqual(mockSummarize.call_count, 2)
+        self.assertEqual([summary['slug'] for summary in summaries], ['contest-0', 'contest-1'])
@@ -4,6 +4,7 @@ from django.urls import path
 from django.views.decorators.cache import never_cache
 
 from electionpage import views
+from electionpage.models import ElectionPage, ScrapableElectionPage, SingleSourceElectionPage
 
 urlpatterns = [
     path(
@@ -18,6 +19,18 @@ urlpatterns = [
         'p/<slug>',
         views.ElectionPageView.as_view(),
         name='electionPage'),
+    path(
+        'pv/<slug>/bundle',
+        views.ElectionPageBundle.as_view(model=ScrapableElectionPage),
+        name='electionPageScrapableBundle'),
+    path(
+        'ps/<slug>/bundle',
+        views.ElectionPageBundle.as_view(model=SingleSourceElectionPage),
+        name='electionPageSingleSourceBundle'),
+    path(
+        'p/<slug>/bundle',
+        views.ElectionPageBundle.as_view(model=ElectionPage),
+        name='electionPageBundle'),
     path(
         'pPopulate/<slug>',
         never_cache(views.PopulateScrapers.as_view()),
@@ -30,6 +43,10 @@ urlpatterns = [
         'pScrapeAll/<slug>',
         never_cache(views.ScrapeAll.as_view()),
         name='scrapeAll'),
+    path(
+        'pScrapeJob/<pk>',
+        never_cache(views.ScrapeJobProgress.as_view()),
+        name='scrapeJob'),
     path(
         'pCreate.html',
         never_cache(views.ScrapableElectionPageCreator.as_view()),
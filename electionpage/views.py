@@ -8,106 +8,126 @@ created in an admin page I suppose - though eventually we want to give that acce
 so they can aggregate any of their uploads into a single page.
 """
 from django.contrib.auth.mixins import PermissionRequiredMixin
+from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse
-from django.views.generic.base import TemplateView
+from django.utils.decorators import method_decorator
+from django.views.generic.base import TemplateView, View
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import FormView
 from extra_views import ModelFormSetView
 
-from common import viewUtils
-from common.cloudflare import CloudflareAPI
+from common.conditional import conditional_page
+from electionpage.contestBundle import ContestBundle
 from electionpage.forms import ScrapableElectionPageForm
-from electionpage.models import ElectionPage, ScrapableElectionPage, SingleSourceElectionPage
+from electionpage.models import ElectionPage, ScrapableElectionPage, ScrapeJob, \
+    SingleSourceElectionPage
+from electionpage.scrapeJobs import start_scrape_job
 from scraper.forms import ScraperForm
 from scraper.models import Scraper
-from scraper.scrapeWorker import ScrapeWorker
 
 
 def populate_election_context_data(context, jsonConfigs):
-    """ Populates context with data needed for each election """
+    """
+    Populates context with data needed for each election: its summary from the ContestBundle,
+    shown inline until its iframes are opened
+    """
     context['elections'] = []
-    for jsonConfig in jsonConfigs:
+    for jsonConfig, summary in zip(jsonConfigs, ContestBundle.get_summaries(jsonConfigs)):
         context['elections'].append({
             'jsonConfig': jsonConfig,
-            'iframeHeight': viewUtils.default_iframe_height(jsonConfig.numCandidates)
+            'iframeHeight': summary['iframeHeight'],
+            'candidates': [{'name': name, 'firstRoundVotes': firstRoundVotes,
+                            'lastRoundVotes': lastRoundVotes, 'lastRound': lastRound,
+                            'isWinner': isWinner}
+                           for name, firstRoundVotes, lastRoundVotes, lastRound, isWinner
+                           in zip(summary['candidates'], summary['firstRoundVotes'],
+                                  summary['lastRoundVotes'], summary['lastRounds'],
+                                  summary['isWinner'])],
+            'numRounds': summary['numRounds'],
         })
 
 
-class ElectionPageView(DetailView):
-    """ Visualizing all elections in an election page """
-    model = ElectionPage
+class ElectionPageMixin:
+    """ Fetches the page along with its contests """
     template_name = 'electionpage/electionPage.html'
 
+    def get_queryset(self):
+        """ The pages, with their contests """
+        return self.model.with_contests()
+
     def get_context_data(self, **kwargs):
+        """ The page, and each of its contests """
         context = super().get_context_data(**kwargs)
-        context['elections'] = self.object.listOfElections.all()
-        populate_election_context_data(context, self.object.listOfElections.all())
+        context['electionpage'] = self.object
+        populate_election_context_data(context, self.object.get_contests())
         return context
 
 
-class ScrapableElectionPageView(DetailView):
+@method_decorator(conditional_page(ElectionPage), name='dispatch')
+class ElectionPageView(ElectionPageMixin, DetailView):
+    """ Visualizing all elections in an election page """
+    model = ElectionPage
+
+
+@method_decorator(conditional_page(ScrapableElectionPage), name='dispatch')
+class ScrapableElectionPageView(ElectionPageMixin, DetailView):
     """
     Visualizing all elections in a ScrapableElectionPage,
     if they exist- and hiding any election that doesn't exist yet.
     """
     model = ScrapableElectionPage
-    template_name = 'electionpage/electionPage.html'
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['electionpage'] = context['scrapableelectionpage']
-
-        jsonConfigs = [s.jsonConfig for s in self.object.listOfScrapers.all()]
-        jsonConfigs = [j for j in jsonConfigs if j is not None]
-        populate_election_context_data(context, jsonConfigs)
-
-        return context
 
 
-class SingleSourceElectionPageView(DetailView):
+@method_decorator(conditional_page(SingleSourceElectionPage), name='dispatch')
+class SingleSourceElectionPageView(ElectionPageMixin, DetailView):
     """
     Visualizing all elections in a SingleSourceElectionPage,
     if they exist- and hiding any election that doesn't exist yet.
     """
     model = SingleSourceElectionPage
-    template_name = 'electionpage/electionPage.html'
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['electionpage'] = context['singlesourceelectionpage']
-        populate_election_context_data(context, self.object.scraper.listOfElections.all())
 
-        return context
+class ElectionPageBundle(View):
+    """
+    The ContestBundle of an election page, as JSON: a summary of each of its contests.
+    Pass the model of the page to as_view.
+    """
+    model = None
+
+    # It caches its own, precompressed responses
+    usePageCache = False
+
+    def get(self, request, slug):
+        """ The precompressed bundle, or a 304 if the client has it already """
+        page = get_object_or_404(self.model.with_contests(), slug=slug)
+        return ContestBundle.get_body(page).make_response(request)
 
 
 class ScrapeAll(PermissionRequiredMixin, DetailView):
     """
-    Scrapes everything we can in this election
+    Starts scraping everything we can in this election, then shows the progress
     """
     model = ScrapableElectionPage
-    template_name = 'electionpage/scrapeAllResults.html'
     permission_required = ['scraper.add_scraper', 'scraper.change_scraper']
 
-    def get_context_data(self, **kwargs):
-        results = []
-        for scraper in self.object.listOfScrapers.all():
-            try:
-                ScrapeWorker.scrape(scraper, self.request.user)
-                succeeded = True
-            except BaseException:  # pylint: disable=broad-except
-                succeeded = False
-
-            results.append({'scraper': scraper, 'succeeded': succeeded})
+    def get(self, request, *args, **kwargs):
+        job = start_scrape_job(self.get_object(), request.user)
+        return redirect(job.get_absolute_url())
 
-        context = super().get_context_data(**kwargs)
-        context['title'] = self.object.title
-        context['slug'] = self.object.slug
-        context['results'] = results
 
-        # Purge all local cache and the specific cloudflare cache
-        urlToPurge = reverse('electionPageScrapable', args=(self.object.slug,))
-        CloudflareAPI.purge_paths_cache([urlToPurge])
+class ScrapeJobProgress(PermissionRequiredMixin, DetailView):
+    """ The progress of a ScrapeAll: reloads itself until every scraper is done """
+    model = ScrapeJob
+    template_name = 'electionpage/scrapeAllResults.html'
+    permission_required = ['scraper.add_scraper', 'scraper.change_scraper']
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        items = list(self.object.items.select_related('scraper__jsonConfig'))
+        context['title'] = self.object.electionPage.title
+        context['slug'] = self.object.electionPage.slug
+        context['results'] = items
+        context['numFinished'] = sum(1 for item in items if item.finishedAt is not None)
         return context
 
 
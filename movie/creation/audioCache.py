@@ -0,0 +1,122 @@
+"""
+Text-to-speech audio cached on this worker's disk, so that captions every movie shares - the
+closing card, or a re-made movie's - are downloaded from S3 once, not once per movie.
+
+Files are named by a hash of the text, voice and engine, in MOVIE_AUDIO_CACHE_DIR. Using a file
+updates its modification time, so the least recently used files are the first evicted once the
+cache is over MOVIE_AUDIO_CACHE_MAX_BYTES - as TextToSpeechCachedFile.lastUsed orders the
+bucket. Files are written to a temporary name and renamed into place, so every thread and
+process on the host can share the cache without locks.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+
+# Partial files younger than this may still be being written by another thread or process,
+# so they aren't evicted. Older ones were abandoned by processes that died while writing them.
+PARTIAL_FILE_GRACE_SECONDS = 10 * 60
+
+
+def audio_key(text, voiceId, engine):
+    """ The name of the audio of the text, as spoken by the voice and engine """
+    return hashlib.sha256(f'{voiceId}:{engine}:{text}'.encode('utf-8')).hexdigest()
+
+
+class LocalAudioCache:
+    """ A size-bounded, least-recently-used cache of audio files in a directory """
+
+    def __init__(self, directory, maxBytes):
+        self.directory = directory
+        self.maxBytes = maxBytes
+
+    @classmethod
+    def from_settings(cls):
+        """ The cache configured in settings """
+        return cls(settings.MOVIE_AUDIO_CACHE_DIR, settings.MOVIE_AUDIO_CACHE_MAX_BYTES)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.mp3')
+
+    def has(self, key):
+        """ Is the audio cached? """
+        return os.path.exists(self._path(key))
+
+    def get(self, key, toFilename):
+        """ Copies the cached audio to toFilename. Returns whether it was cached. """
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, toFilename)
+            os.utime(path)  # Most recently used
+        except FileNotFoundError:
+            # Not cached, or evicted meanwhile
+            return False
+        return True
+
+    def put(self, key, fromFilename):
+        """ Caches a copy of the audio in fromFilename, evicting others if that's too much """
+        os.makedirs(self.directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.partial',
+                                         delete=False) as tf:
+            with open(fromFilename, 'rb') as f:
+                shutil.copyfileobj(f, tf)
+        try:
+            os.replace(tf.name, self._path(key))
+        except FileNotFoundError:
+            # Removed by another process as it was written: it just isn't cached
+            return
+        self.evict()
+
+    def _list_files(self):
+        """ (last used, size, path) of each cached file, least recently used first """
+        files = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return files
+        partialCutoff = time.time() - PARTIAL_FILE_GRACE_SECONDS
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith('.partial') and stat.st_mtime > partialCutoff:
+                # Still being written
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        return files
+
+    @classmethod
+    def _remove(cls, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """ Removes the least recently used files until the cache fits. Returns how many. """
+        files = self._list_files()
+        totalBytes = sum(size for _, size, _ in files)
+        numRemoved = 0
+        for _, size, path in files:
+            if totalBytes <= self.maxBytes:
+                break
+            self._remove(path)
+            totalBytes -= size
+            numRemoved += 1
+        return numRemoved
+
+    def prune(self, maxAgeSeconds, dryRun=False):
+        """ Removes the files not used in maxAgeSeconds, then evicts. Returns how many. """
+        cutoff = time.time() - maxAgeSeconds
+        stale = [path for lastUsed, _, path in self._list_files() if lastUsed < cutoff]
+        if dryRun:
+            return len(stale)
+        for path in stale:
+            self._remove(path)
+        return len(stale) + self.evict()
@@ -0,0 +1,375 @@
+"""
+Movie frames drawn in Python, without a browser.
+
+Each frame is what the movie generation view shows in headless Chrome once
+transitionEachBarForRound has finished: the heading, the interactive bar chart at one round,
+the caption, and for GIFs, the logo. Frames are drawn from a bar chart of plain data, made once
+per movie, so the frames of every round can be drawn at once on a process pool.
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from visualizer.bargraph.graphToSvg import votes_and_percent_text
+from visualizer.colors import get_colors, hex_to_rgb, interpolate_color, rgb_to_hex
+from visualizer.common import INACTIVE_TEXT, RESIDUAL_SURPLUS_TEXT, intify
+from visualizer.models import EliminationBarColor
+
+# As static/movie/style.css
+HEADING_FONT_SIZE = 45
+CAPTION_FONT_SIZE = 25
+LABEL_FONT_SIZE = 16
+LOGO_FILENAME = 'static/visualizer/logo-dark.png'
+LOGO_WIDTH = 180
+MARGIN = 20
+
+# As barchart.js, scaled from its 500-wide viewbox to the 750px of the movie generation view
+MAX_CHART_WIDTH = 750
+MAX_BAR_SIZE = 105
+BAND_PADDING = 0.2
+THRESHOLD_COLOR = '#AAAAAA'
+SURPLUS_COLOR = '#888888'
+WINNER_COLOR = '#28a745'
+TEXT_COLOR = '#212529'
+
+
+def make_bar_chart(graph, config):
+    """ Everything needed to draw the bar chart of the graph, as picklable data """
+    summary = graph.summarize()
+    numRounds = len(summary.rounds)
+
+    winRounds = {}
+    for roundInfo in summary.rounds:
+        for name in roundInfo.winnerNames:
+            winRounds.setdefault(name, roundInfo.round_i)
+
+    # Residual surplus isn't shown: see hideResidualSurplus in barchart.js
+    candidates = [{'name': str(candidate.name),
+                   'votesAddedPerRound': candidate.votesAddedPerRound,
+                   'winRound': winRounds.get(candidate.name)}
+                  for item, candidate in summary.candidates.items()
+                  if item.name != RESIDUAL_SURPLUS_TEXT]
+
+    return {
+        'candidates': candidates,
+        'numRounds': numRounds,
+        'totalVotesPerRound': [roundInfo.totalActiveVotes for roundInfo in summary.rounds],
+        'threshold': graph.threshold,
+        'colors': get_colors(config.colorTheme, numRounds),
+        'isVertical': not config.doUseHorizontalBarGraph,
+        'doDimPrevRoundColors': config.doDimPrevRoundColors,
+        'eliminationBarColor': config.eliminationBarColor,
+        'fontFile': settings.MOVIE_FONT_FILE,
+    }
+
+
+def make_frame(roundNum, heading, caption, showLogo=False):
+    """ What one frame shows: the chart at roundNum, under the heading, above the caption """
+    return {'roundNum': roundNum, 'heading': heading, 'caption': caption, 'showLogo': showLogo}
+
+
+def draw_frame(chart, size, frame):
+    """ The frame, drawn at size (width, height), as an RGB array moviepy can use as a clip """
+    return _FrameDrawer(chart, size).draw(frame)
+
+
+def _load_font(fontFile, size):
+    """
+    The font at the given size. There's no fallback: Pillow's default font is a small
+    latin-1 bitmap, which can't draw many candidate names, nor the ellipsis.
+    """
+    try:
+        return ImageFont.truetype(fontFile, size)
+    except OSError as exc:
+        raise OSError(f"Could not load the movie font {fontFile}: "
+                      "check settings.MOVIE_FONT_FILE") from exc
+
+
+def _line_height(font):
+    return int(font.getbbox('Ag')[3] * 1.3)
+
+
+def _wrap(text, font, width):
+    """ The lines of the text, broken between words to fit the width """
+    lines = []
+    for paragraph in text.replace('<br/>', '\n').split('\n'):
+        line = ''
+        for word in paragraph.split(' '):
+            extended = f'{line} {word}' if line else word
+            if line and font.getlength(extended) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = extended
+        lines.append(line)
+    return lines
+
+
+def _truncate(text, font, width):
+    """ The text, cut short with an ellipsis if it doesn't fit the width """
+    if font.getlength(text) <= width:
+        return text
+    while text and font.getlength(text + '…') > width:
+        text = text[:-1]
+    return text + '…'
+
+
+class _FrameDrawer:  # pylint: disable=too-few-public-methods
+    """ Draws one frame onto a fresh image """
+
+    def __init__(self, chart, size):
+        self.chart = chart
+        self.width, self.height = size
+        self.image = Image.new('RGB', size, 'white')
+        self.canvas = ImageDraw.Draw(self.image)
+        self.labelFont = _load_font(chart['fontFile'], LABEL_FONT_SIZE)
+
+    def draw(self, frame):
+        """ Draws the frame, returning it as an array """
+        headingBottom = self._draw_heading(frame['heading'])
+        captionTop = self._draw_caption(frame['caption'])
+        self._draw_chart(frame['roundNum'], headingBottom + MARGIN, captionTop - MARGIN)
+        if frame['showLogo']:
+            self._draw_logo()
+        return np.asarray(self.image)
+
+    def _draw_centered_lines(self, lines, font, top):
+        lineHeight = _line_height(font)
+        for i, line in enumerate(lines):
+            x = (self.width - font.getlength(line)) / 2
+            self.canvas.text((x, top + i * lineHeight), line, font=font, fill=TEXT_COLOR)
+        return top + len(lines) * lineHeight
+
+    def _draw_heading(self, heading):
+        """ Draws the round number or title, leaving room for the logo on either side """
+        font = _load_font(self.chart['fontFile'], HEADING_FONT_SIZE)
+        headingWidth = self.width - 2 * (LOGO_WIDTH + MARGIN)
+        return self._draw_centered_lines([_truncate(heading, font, headingWidth)], font, 5)
+
+    def _draw_caption(self, caption):
+        """ Draws the caption at the bottom of the frame, returning where it starts """
+        font = _load_font(self.chart['fontFile'], CAPTION_FONT_SIZE)
+        lines = _wrap(caption, font, self.width - 2 * MARGIN)
+        top = self.height - len(lines) * _line_height(font) - MARGIN / 2
+        self._draw_centered_lines(lines, font, top)
+        return top
+
+    def _draw_logo(self):
+        with Image.open(LOGO_FILENAME) as logo:
+            height = round(logo.height * LOGO_WIDTH / logo.width)
+            resized = logo.convert('RGBA').resize((LOGO_WIDTH, height))
+        self.image.paste(resized, (MARGIN, 5), resized)
+
+    def _bar_color(self, roundIndex, roundNum, candidate):
+        """ As barColorFn in barchart.js """
+        lastRound = len(candidate['votesAddedPerRound']) - 1
+        colors = self.chart['colors']
+        if lastRound < roundNum:
+            if self.chart['eliminationBarColor'] == EliminationBarColor.HIDDEN:
+                return 'white'
+            if self.chart['eliminationBarColor'] == EliminationBarColor.LAST_ROUND_COLOR:
+                return rgb_to_hex(interpolate_color(hex_to_rgb(colors[lastRound + 1]),
+                                                    hex_to_rgb('#f0f0f0'), 0.9))
+            return '#cccccc'
+        if candidate['name'] == INACTIVE_TEXT:
+            return 'white'
+        if self.chart['doDimPrevRoundColors'] and roundIndex != roundNum:
+            return rgb_to_hex(interpolate_color(hex_to_rgb(colors[roundIndex]),
+                                                hex_to_rgb('#ffffff'), 0.8))
+        return colors[roundIndex]
+
+    def _max_votes(self):
+        """ The most votes on the axis: the axis doesn't change from round to round """
+        maxVotes = max(self.chart['threshold'] or 0, 1)
+        for candidate in self.chart['candidates']:
+            maxVotes = max(maxVotes, np.cumsum(candidate['votesAddedPerRound']).max(initial=0))
+        return maxVotes
+
+    def _draw_chart(self, roundNum, top, bottom):  # pylint: disable=too-many-locals
+        """ Draws the bar chart, as it is at roundNum, between top and bottom """
+        chartWidth = min(MAX_CHART_WIDTH, self.width - 2 * MARGIN)
+        left = (self.width - chartWidth) / 2
+        right = left + chartWidth
+        labelHeight = _line_height(self.labelFont)
+        if bottom - top < 3 * labelHeight:
+            # A long caption on a small frame leaves no room for the chart
+            return
+        if self.chart['isVertical']:
+            # Vote labels above the bars, names below
+            chartLayout = _VerticalLayout(left, right, top + labelHeight, bottom - labelHeight)
+        else:
+            chartLayout = _HorizontalLayout(left, right, top, bottom)
+
+        numCandidates = len(self.chart['candidates'])
+        step = chartLayout.bandsLength / max(numCandidates, 1)
+        bandwidth = min(step * (1 - BAND_PADDING), MAX_BAR_SIZE)
+        chartLayout.set_votes_scale(self._max_votes())
+
+        for i, candidate in enumerate(self.chart['candidates']):
+            bandStart = chartLayout.bandsStart + step * i + (step - bandwidth) / 2
+            self._draw_bar(chartLayout, candidate, roundNum, bandStart, bandwidth)
+
+        threshold = self.chart['threshold']
+        if threshold is not None:
+            self._draw_dashed_line(chartLayout.box(threshold, threshold, chartLayout.bandsStart,
+                                                   chartLayout.bandsEnd))
+
+    def _draw_bar(self, chartLayout, candidate, roundNum, bandStart, bandwidth):
+        # pylint: disable=too-many-arguments,too-many-locals
+        """ Draws the candidate's bar, one segment per round so far, and its labels """
+        votesAdded = candidate['votesAddedPerRound'][:roundNum + 1]
+        total = 0
+        for roundIndex, votes in enumerate(votesAdded):
+            box = chartLayout.box(total, total + votes, bandStart, bandStart + bandwidth)
+            if votes < 0:
+                # A surplus transferred away
+                self._draw_hatched(box)
+            elif votes > 0:
+                outline = '#cccccc' if candidate['name'] == INACTIVE_TEXT else None
+                self.canvas.rectangle(box, fill=self._bar_color(roundIndex, roundNum, candidate),
+                                      outline=outline)
+            total += votes
+
+        isEliminated = len(candidate['votesAddedPerRound']) - 1 < roundNum
+        isWinner = candidate['winRound'] is not None and candidate['winRound'] <= roundNum
+        if isEliminated:
+            label = 'eliminated'
+        elif chartLayout.isVertical:
+            label = intify(total)
+        else:
+            label = votes_and_percent_text(candidate['name'], total,
+                                           self.chart['totalVotesPerRound'][roundNum])
+        bandCenter = bandStart + bandwidth / 2
+        font = self.labelFont
+        for text, position in chartLayout.label_positions(candidate['name'], label, total,
+                                                          bandCenter, bandwidth, font):
+            self.canvas.text(position, text, font=font, fill=TEXT_COLOR)
+            if text == label and isWinner:
+                self._draw_check(position, font)
+
+    def _draw_check(self, labelPosition, font):
+        """ A check mark just before the label of a winner, as ✔️ in barchart.js """
+        size = font.getbbox('A')[3]
+        x, y = labelPosition[0] - size - 4, labelPosition[1]
+        self.canvas.line([(x, y + size * 0.55), (x + size * 0.35, y + size * 0.9),
+                          (x + size, y + size * 0.1)], fill=WINNER_COLOR, width=3)
+
+    def _draw_hatched(self, box):
+        """ A transferred surplus: hatched, as the surplus pattern in barchart.js """
+        left, top, right, bottom = box
+        width, height = right - left, bottom - top
+        self.canvas.rectangle(box, outline=SURPLUS_COLOR)
+        for offset in np.arange(0, width + height, 6):
+            start = (left + max(0, offset - height), bottom - min(offset, height))
+            end = (left + min(offset, width), bottom - max(0, offset - width))
+            self.canvas.line([start, end], fill=SURPLUS_COLOR)
+
+    def _draw_dashed_line(self, box):
+        left, top, right, bottom = box
+        isAcross = right - left >= bottom - top
+        length = max(right - left, bottom - top)
+        for dash in np.arange(0, length, 10):
+            end = min(dash + 5, length)
+            if isAcross:
+                points = [(left + dash, top), (left + end, top)]
+            else:
+                points = [(left, top + dash), (left, top + end)]
+            self.canvas.line(points, fill=THRESHOLD_COLOR, width=2)
+
+
+class _HorizontalLayout:
+    """ Bars from left to right, one candidate under another """
+    isVertical = False
+
+    def __init__(self, left, right, top, bottom):
+        self.votesStart, self.votesEnd = left + 5, right - 10
+        self.bandsStart, self.bandsEnd = top, bottom
+        self.bandsLength = bottom - top
+        self.votesScale = 0
+
+    def set_votes_scale(self, maxVotes):
+        """ Sets the number of pixels per vote """
+        self.votesScale = (self.votesEnd - self.votesStart) / maxVotes
+
+    def box(self, fromVotes, toVotes, bandStart, bandEnd):
+        """ The (x0, y0, x1, y1) of the votes, across the band """
+        votesStart = self.votesStart + min(fromVotes, toVotes) * self.votesScale
+        votesEnd = self.votesStart + max(fromVotes, toVotes) * self.votesScale
+        return (votesStart, bandStart, votesEnd, bandEnd)
+
+    def label_positions(self, name, label, total, bandCenter, bandwidth, font):
+        # pylint: disable=too-many-arguments,unused-argument
+        """ The name over the start of the bar, the label at the end of the chart """
+        top = bandCenter - font.getbbox('Ag')[3] / 2
+        labelX = self.votesEnd + 10 - font.getlength(label)
+        name = _truncate(name, font, labelX - self.votesStart - 30)
+        return [(name, (self.votesStart + 4, top)), (label, (labelX, top))]
+
+
+class _VerticalLayout:
+    """ Bars from bottom to top, one candidate beside another """
+    isVertical = True
+
+    def __init__(self, left, right, top, bottom):
+        self.votesStart, self.votesEnd = bottom, top
+        self.bandsStart, self.bandsEnd = left, right
+        self.bandsLength = right - left
+        self.votesScale = 0
+
+    def set_votes_scale(self, maxVotes):
+        """ Sets the number of pixels per vote """
+        self.votesScale = (self.votesStart - self.votesEnd) / maxVotes
+
+    def box(self, fromVotes, toVotes, bandStart, bandEnd):
+        """ The (x0, y0, x1, y1) of the votes, across the band """
+        votesTop = self.votesStart - max(fromVotes, toVotes) * self.votesScale
+        votesBottom = self.votesStart - min(fromVotes, toVotes) * self.votesScale
+        return (bandStart, votesTop, bandEnd, votesBottom)
+
+    def label_positions(self, name, label, total, bandCenter, bandwidth, font):
+        # pylint: disable=too-many-arguments
+        """ The label above the bar, the name below the chart """
+        name = _truncate(name, font, bandwidth)
+        labelTop = self.votesStart - total * self.votesScale - _line_height(font)
+        return [(name, (bandCenter - font.getlength(name) / 2, self.votesStart + 4)),
+                (label, (bandCenter - font.getlength(label) / 2, labelTop))]
+
+
+class FrameRasterizer:  # pylint: disable=too-few-public-methods
+    """ The process pool which draws frames, shared by every movie made in this process """
+    _lock = threading.Lock()
+    _pool = None
+
+    @classmethod
+    def _get_pool(cls):
+        """ The process pool, or None for no pool """
+        with cls._lock:
+            if cls._pool is None and settings.MOVIE_FRAME_MAX_PROCESSES > 1:
+                # Spawned, not forked: forking a process with threads and connections is unsafe
+                cls._pool = ProcessPoolExecutor(
+                    max_workers=settings.MOVIE_FRAME_MAX_PROCESSES,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=django.setup)
+            return cls._pool
+
+    @classmethod
+    def draw_frames(cls, chart, size, frames):
+        """ Draws each of the frames, on the process pool if there is one """
+        pool = cls._get_pool()
+        if pool is None:
+            return [draw_frame(chart, size, frame) for frame in frames]
+        try:
+            return list(pool.map(draw_frame, [chart] * len(frames), [size] * len(frames),
+                                 frames))
+        except BrokenProcessPool:
+            # A worker died: start a new pool next time
+            with cls._lock:
+                cls._pool = None
+            raise
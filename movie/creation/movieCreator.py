@@ -1,6 +1,10 @@
 """
 Movie generation entry point.
 Allows creation of movies from a jsonConfig at various resolutions.
+
+The frame of each round is rasterized in Python (see frameRasterizer) unless a browser is given,
+in which case it's a screenshot of the movie generation view - slower, and much heavier, but
+exactly the javascript chart.
 """
 
 import os
@@ -15,34 +19,46 @@ from moviepy.editor import AudioFileClip, CompositeVideoClip, ImageClip, TextCli
     concatenate_videoclips
 import selenium
 
-from common.viewUtils import get_script_to_disable_animations
+from common.viewUtils import get_script_to_disable_animations, load_graph_for_config
 from visualizer.descriptors.roundDescriber import Describer
-from visualizer.graph.graphCreator import make_graph_with_file
 from movie import models
+from movie.creation.frameRasterizer import FrameRasterizer, draw_frame, make_bar_chart, \
+    make_frame
 from movie.creation.textToSpeech import TextToSpeechFactory
 
 
 change_settings({"FFMPEG_BINARY": os.environ.get("IMAGEIO_FFMPEG_EXE", "/usr/bin/ffmpeg")})
 
+CLOSING_WRITTEN_TEXT = "See more details at rcvis.com"
+CLOSING_SPOKEN_TEXT = "See more details at R C Vis dot com"
+
 
 class ProbablyFailedToLaunchBrowser(Exception):
     """ A common error when the browser has an issue. """
 
 
-class SingleMovieCreator():
+class SingleMovieCreator():  # pylint: disable=too-many-instance-attributes
     """ Class for creation of a single movie at a single resolution. """
 
     def __init__(self, browser, textToSpeechFactory, jsonconfig, size):
-        """ Initialize all class data. """
+        """ Initialize all class data. With no browser, frames are rasterized. """
         self.browser = browser
         self.textToSpeechFactory = textToSpeechFactory
-        self.graph = make_graph_with_file(jsonconfig.jsonFile,
-                                          jsonconfig.excludeFinalWinnerAndEliminatedCandidate)
+        self.graph, _ = load_graph_for_config(jsonconfig)
         self.config = jsonconfig
         self.size = size
 
         self.fontName = settings.MOVIE_FONT_NAME
 
+        # When rasterizing: the chart, the frame the captions are set to, and frames drawn ahead
+        self.barChart = make_bar_chart(self.graph, jsonconfig) if browser is None else None
+        self.currentFrame = None
+        self.isShowingLogo = False
+        self.drawnFrames = {}
+
+        # Audio being generated ahead of time, by caption
+        self.prefetchedAudio = {}
+
         self.toDelete = []
 
     def _delete_intermediate_clips(self):
@@ -51,6 +67,12 @@ class SingleMovieCreator():
             del clip
         self.toDelete = []
 
+    def _resize(self, clip):
+        """ The clip at the movie's size: rasterized frames are already, so aren't resampled """
+        if tuple(clip.size) == tuple(self.size):
+            return clip.copy()
+        return clip.resize(self.size)
+
     def _text_on_background(self, writtenText, spokenText, backgroundImageFn):
         """
         Writes writtenText on the given background image,
@@ -83,18 +105,20 @@ class SingleMovieCreator():
 
         return combined
 
+    def _get_title_card_text(self):
+        return "Ranked Choice Voting Election Results\n\n\n" + self.graph.title
+
     def _make_title_card(self):
         """ Creates the introduction / title card. """
-        text = "Ranked Choice Voting Election Results\n\n\n" + self.graph.title
+        text = self._get_title_card_text()
         backgroundImageFn = "static/movie/bg-horizontal.png"
         return self._text_on_background(text, text, backgroundImageFn)
 
     def _make_closing_card(self):
         """ Creates the credits / closing card. """
-        writtenText = "See more details at rcvis.com"
-        spokenText = "See more details at R C Vis dot com"
         backgroundImageFn = "static/movie/bg-horizontal.png"
-        primary = self._text_on_background(writtenText, spokenText, backgroundImageFn)
+        primary = self._text_on_background(CLOSING_WRITTEN_TEXT, CLOSING_SPOKEN_TEXT,
+                                           backgroundImageFn)
 
         url = f"rcvis.com/v/{self.config.slug}\n\n\n"
         urlText0 = TextClip(url,
@@ -111,22 +135,59 @@ class SingleMovieCreator():
 
         return combined
 
+    def _prefetch_audio(self, captions):
+        """ Starts generating the audio of all of the captions at once """
+        self.prefetchedAudio = self.textToSpeechFactory.prefetch(captions)
+
     def _spawn_audio_creation_with_caption(self, caption):
         """ Returns a GeneratedAudioWrapper which you should poll for completion """
-        return self.textToSpeechFactory.text_to_speech(caption)
+        generatedAudioWrapper = self.prefetchedAudio.pop(caption, None)
+        if generatedAudioWrapper is None:
+            generatedAudioWrapper = self.textToSpeechFactory.text_to_speech(caption)
+        return generatedAudioWrapper
 
-    def _set_captions_on_page(self, roundNum, caption, showGraphTitleInsteadOfRoundNum):
+    def _get_heading(self, roundNum, showGraphTitleInsteadOfRoundNum):
         if showGraphTitleInsteadOfRoundNum:
-            roundText = self.graph.title
-        else:
-            roundText = "Round " + str(roundNum + 1)
+            return self.graph.title
+        return "Round " + str(roundNum + 1)
+
+    def _set_captions_on_page(self, roundNum, caption, showGraphTitleInsteadOfRoundNum):
+        roundText = self._get_heading(roundNum, showGraphTitleInsteadOfRoundNum)
+        if self.browser is None:
+            self.currentFrame = make_frame(roundNum, roundText, caption, self.isShowingLogo)
+            return
         captionText = caption.replace("'", "\\'")
         roundScript = f"document.getElementById('movieRoundNum').innerHTML = '{roundText}';"
         captionScript = f"document.getElementById('caption').innerHTML = '{captionText}';"
         self.browser.execute_script(roundScript)
         self.browser.execute_script(captionScript)
 
+    def _draw_frames_ahead(self, frames):
+        """ Rasterizes the frames all at once, for _generate_image_for_round_synchronously """
+        if self.browser is not None:
+            return
+        images = FrameRasterizer.draw_frames(self.barChart, self.size, frames)
+        self.drawnFrames = {self._frame_key(frame): image for frame, image in zip(frames, images)}
+
+    @classmethod
+    def _frame_key(cls, frame):
+        return tuple(sorted(frame.items()))
+
+    def _rasterize_image_for_round(self, roundNum):
+        """ The frame the captions were set to, drawn ahead if it was, or now if not """
+        frame = self.currentFrame
+        assert frame['roundNum'] == roundNum
+        image = self.drawnFrames.pop(self._frame_key(frame), None)
+        if image is None:
+            image = draw_frame(self.barChart, self.size, frame)
+        imageClip = ImageClip(image)
+        self.toDelete.append(imageClip)
+        return imageClip
+
     def _generate_image_for_round_synchronously(self, roundNum):
+        if self.browser is None:
+            return self._rasterize_image_for_round(roundNum)
+
         try:
             self.browser.execute_script(f'transitionEachBarForRound({roundNum});')
         except selenium.common.exceptions.JavascriptException as exception:
@@ -154,6 +215,9 @@ class SingleMovieCreator():
 
         return self._generate_clip_with_caption(roundNum, caption)
 
+    def _get_gif_caption(self):
+        return f"Ranked-Choice Voting results for<br/>{self.graph.title}"
+
     def _generate_gif_for_round(self, caption, duration, roundNum):
         # First update the HTML to match the caption & round num
         self._set_captions_on_page(roundNum, caption, False)
@@ -163,7 +227,7 @@ class SingleMovieCreator():
 
         # 1s
         imageClip1 = imageClip0.set_duration(duration)
-        imageClip = imageClip1.resize(self.size)
+        imageClip = self._resize(imageClip1)
 
         self.toDelete.extend([imageClip0, imageClip1, imageClip])
 
@@ -200,7 +264,7 @@ class SingleMovieCreator():
         combined0 = CompositeVideoClip([imageClip])
         combined1 = combined0.set_duration(audioDuration)
         combined2 = combined1.set_audio(audioClip)
-        combined = combined2.resize(self.size)
+        combined = self._resize(combined2)
 
         self.toDelete.extend([audioClip,
                               combined0, combined1, combined2, combined,
@@ -216,6 +280,17 @@ class SingleMovieCreator():
         """ Create a movie at a specific resolution """
         roundDescriber = Describer(self.graph, self.config, summarizeAsParagraph=True)
 
+        # Every caption is known up front: generate their audio while the frames are drawn
+        numRounds = self._get_num_rounds()
+        summaryCaption = roundDescriber.describe_initial_summary(isForVideo=True)
+        roundCaptions = [roundDescriber.describe_round(i) for i in range(numRounds)]
+        self._prefetch_audio([self._get_title_card_text(), summaryCaption, *roundCaptions,
+                              CLOSING_SPOKEN_TEXT])
+        self._draw_frames_ahead(
+            [make_frame(numRounds - 1, self.graph.title, summaryCaption)] +
+            [make_frame(i, self._get_heading(i, False), caption)
+             for i, caption in enumerate(roundCaptions)])
+
         imageClips = []
 
         # Title card
@@ -250,25 +325,33 @@ class SingleMovieCreator():
         self.toDelete.append(composite)
         self._delete_intermediate_clips()
 
+    def _show_logo(self, isShown):
+        if self.browser is None:
+            self.isShowingLogo = isShown
+            return
+        display = 'block' if isShown else 'none'
+        logoScript = f"document.getElementById('logo').style.display = '{display}';"
+        self.browser.execute_script(logoScript)
+
     def make_gif(self, gifFilename):
         """ Creates a gif without titles or captions, just the rounds """
         imageClips = []
 
-        showLogoScript = "document.getElementById('logo').style.display = 'block';"
-        self.browser.execute_script(showLogoScript)
+        self._show_logo(True)
+        self._draw_frames_ahead(
+            [make_frame(i, self._get_heading(i, False), self._get_gif_caption(), True)
+             for i in range(self._get_num_rounds())])
 
         # Each round
         for i in range(self._get_num_rounds()):
             duration = 1 if i != self._get_num_rounds() - 1 else 5
-            clip = self._generate_gif_for_round(
-                f"Ranked-Choice Voting results for<br/>{self.graph.title}", duration, i)
+            clip = self._generate_gif_for_round(self._get_gif_caption(), duration, i)
             imageClips.append(clip)
 
         composite = concatenate_videoclips(imageClips)
         composite.write_gif(gifFilename, fps=1)
 
-        hideLogoScript = "document.getElementById('logo').style.display = 'none';"
-        self.browser.execute_script(hideLogoScript)
+        self._show_logo(False)
 
         self.toDelete.extend(imageClips)
         self.toDelete.append(composite)
@@ -280,12 +363,16 @@ class MovieCreationFactory():
 
     def __init__(self, browser, domain, jsonconfig):
         """
-        Initializes the factory, accessing the movie-generation view for the given jsonconfig
+        Initializes the factory. With a browser, accesses the movie-generation view for the
+        given jsonconfig; without one, frames are rasterized and the domain is unused.
         """
         self.browser = browser
         self.jsonconfig = jsonconfig
         self.textToSpeechFactory = TextToSpeechFactory()
 
+        if browser is None:
+            return
+
         path = reverse('movieGenerationView', args=(jsonconfig.slug,))
         url = "%s%s" % (domain, path)
 
@@ -310,7 +397,8 @@ class MovieCreationFactory():
 
     def make_one_movie_at_resolution(self, width, height):
         """ Create a movie at a specific resolution """
-        self.browser.set_window_size(width, height)
+        if self.browser is not None:
+            self.browser.set_window_size(width, height)
 
         creator = SingleMovieCreator(
             browser=self.browser,
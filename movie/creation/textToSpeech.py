@@ -1,17 +1,29 @@
 """
 Text-to-speech via Amazon Polly.
+
+A movie's captions can be prefetched all at once: their cached files are looked up in one query,
+then a thread pool starts the missing synthesis tasks and waits on them and the downloads
+concurrently. Only the pool talks to AWS - caching the new files happens on the calling thread,
+so all database access stays on one connection.
+
+Audio is also cached on this worker's disk (see audioCache): audio found there is neither
+synthesized nor downloaded.
 """
 
 import os
 import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db.utils import DataError
+from django.utils import timezone
 
 import boto3
 from botocore.exceptions import ClientError
+from movie.creation.audioCache import LocalAudioCache, audio_key
 from movie.models import TextToSpeechCachedFile
 
 
@@ -23,56 +35,80 @@ class AudioGenerationTimedOutException(Exception):
     """ Waited too long without a response """
 
 
-class GeneratedAudioWrapper():  # pylint: disable=too-few-public-methods
+# For GeneratedAudioWrapper: the cached file hasn't been looked up yet
+_LOOK_UP = object()
+
+
+# pylint: disable=too-few-public-methods,too-many-instance-attributes
+class GeneratedAudioWrapper():
     """
     To facilitate asynchronous waiting for Polly audio generation.
     Initializaton spawns the AWS job, and there are various methods to poll for the result.
-    Always checks TextToSpeechCachedFile first.
+    Always checks TextToSpeechCachedFile and the local audio cache first.
     """
     prefix = 'generated_speech'
     region = os.environ.get('AWS_S3_REGION_NAME')
+    voiceId = 'Joanna'
+    engine = 'neural'
+    pollIntervalSeconds = 1
 
-    def __init__(self, pollyClient, s3Client, text):
+    def __init__(self, pollyClient, s3Client, text, cachedObject=_LOOK_UP):
         """
         Either spawns an AWS task to generate the audio,
         or reaches into the database for cached audio.
+        If the TextToSpeechCachedFile of the text was already looked up, pass it as cachedObject
+        (None if there is none): then this doesn't touch the database.
         """
         self.pollyClient = pollyClient
         self.s3Client = s3Client
         self.text = text
+        self.audioCache = LocalAudioCache.from_settings()
+        self.audioKey = audio_key(text, self.voiceId, self.engine)
+        self.taskId = None
 
-        try:
-            cachedObject = TextToSpeechCachedFile.objects.get(text=text)
+        if cachedObject is _LOOK_UP:
+            cachedObject = TextToSpeechCachedFile.objects.filter(text=text).first()
+            if cachedObject is not None:
+                cachedObject.save()  # Update lastUsed
+
+        if cachedObject is not None:
             self.isCached = True
             self.uri = cachedObject.audioFile.name
-            cachedObject.save()  # Update lastUsed
-        except TextToSpeechCachedFile.DoesNotExist:
+        else:
             self.isCached = False
-            response = self._spawn_task(text)
-            self.taskId = response['SynthesisTask']['TaskId']
+            if not self.audioCache.has(self.audioKey):
+                self._start_task()
 
         self.alreadyDownloaded = False
+        self.pendingDownload = None
 
     def _spawn_task(self, text):
         """ Spawns the AWS job """
         return self.pollyClient.start_speech_synthesis_task(
-            VoiceId='Joanna',
+            VoiceId=self.voiceId,
             OutputS3BucketName=settings.AWS_POLLY_STORAGE_BUCKET_NAME,
             OutputS3KeyPrefix=self.prefix,
             OutputFormat='mp3',
             Text=text,
-            Engine="neural")
+            Engine=self.engine)
+
+    def _start_task(self):
+        response = self._spawn_task(self.text)
+        self.taskId = response['SynthesisTask']['TaskId']
 
     def _get_task_status(self):
         """ Poll Polly for the task status """
         assert not self.isCached
+        if self.taskId is None:
+            # It was only cached locally, but has been evicted since
+            self._start_task()
         return self.pollyClient.get_speech_synthesis_task(TaskId=self.taskId)
 
     def _key_from_uri(self, uri):
         return self.prefix + uri.split(self.prefix)[1]
 
     def _download(self, uri, toFilename):
-        """ Downloads the file at the S3 URI """
+        """ Downloads the file at the S3 URI, and caches it locally """
         key = self._key_from_uri(uri)
 
         try:
@@ -87,6 +123,8 @@ class GeneratedAudioWrapper():  # pylint: disable=too-few-public-methods
             print(text)
             raise exception
 
+        self.audioCache.put(self.audioKey, toFilename)
+
     def _cache_file(self, uri):
         cached = TextToSpeechCachedFile()
         cached.text = self.text
@@ -106,25 +144,36 @@ class GeneratedAudioWrapper():  # pylint: disable=too-few-public-methods
             # I think this happens when the filename is too long?
             print("Failed to cache file. Error: ", exception)
 
+    def _get_uri_if_ready(self):
+        """ The URI of the audio if it's ready, or None. Doesn't touch the database. """
+        if self.isCached:
+            return self.uri
+
+        taskStatus = self._get_task_status()
+
+        if taskStatus['SynthesisTask']['TaskStatus'] == 'failed':
+            reason = taskStatus['SynthesisTask']["TaskStatusReason"]
+            raise AudioGenerationFailedException(reason)
+
+        if taskStatus['SynthesisTask']['TaskStatus'] != 'completed':
+            return None
+
+        return taskStatus['SynthesisTask']['OutputUri']
+
     def download_if_ready(self, toFilename):
         """
         Download the result if it's ready.
         Can only be called once, then deletes the result from S3.
         """
         assert not self.alreadyDownloaded
-        if self.isCached:
-            uri = self.uri
-        else:
-            taskStatus = self._get_task_status()
-
-            if taskStatus['SynthesisTask']['TaskStatus'] == 'failed':
-                reason = taskStatus['SynthesisTask']["TaskStatusReason"]
-                raise AudioGenerationFailedException(reason)
-
-            if taskStatus['SynthesisTask']['TaskStatus'] != 'completed':
-                return False
-
-            uri = taskStatus['SynthesisTask']['OutputUri']
+        if self.audioCache.get(self.audioKey, toFilename):
+            self.alreadyDownloaded = True
+            return True
+
+        uri = self._get_uri_if_ready()
+        if uri is None:
+            return False
+        if not self.isCached:
             self._cache_file(uri)
 
         self._download(uri, toFilename)
@@ -132,31 +181,91 @@ class GeneratedAudioWrapper():  # pylint: disable=too-few-public-methods
 
         return True
 
-    def download_synchronously(self, timeoutSeconds=20):
-        """ Wait up to timeoutSeconds, waiting for the task to complete.
-            @return a tempfile object: the file will be deleted once the object is destructed. """
-        pollIntervalSeconds = 1
-        numPolls = int(timeoutSeconds / pollIntervalSeconds + 0.5)
+    def _download_when_ready(self, timeoutSeconds):
+        """ Polls until the audio is ready, then downloads it. Run on the thread pool:
+            returns the tempfile and the URI - None if it was cached locally - and leaves
+            caching it in the database to the calling thread. """
+        numPolls = int(timeoutSeconds / self.pollIntervalSeconds + 0.5)
 
         tf = tempfile.NamedTemporaryFile(suffix=".mp3")
+        if self.audioCache.get(self.audioKey, tf.name):
+            return tf, None
 
         for _ in range(numPolls):
-            wasDownloaded = self.download_if_ready(tf.name)
-            if wasDownloaded:
-                return tf
-            time.sleep(pollIntervalSeconds)
+            uri = self._get_uri_if_ready()
+            if uri is not None:
+                self._download(uri, tf.name)
+                return tf, uri
+            time.sleep(self.pollIntervalSeconds)
         raise AudioGenerationTimedOutException()
 
+    def start_download(self, pool, timeoutSeconds=20):
+        """ Starts waiting for the audio and downloading it on the pool, so that
+            download_synchronously only has to wait for that """
+        assert self.pendingDownload is None and not self.alreadyDownloaded
+        self.pendingDownload = pool.submit(self._download_when_ready, timeoutSeconds)
+
+    def download_synchronously(self, timeoutSeconds=20):
+        """ Wait up to timeoutSeconds, waiting for the task to complete.
+            @return a tempfile object: the file will be deleted once the object is destructed. """
+        assert not self.alreadyDownloaded
+        if self.pendingDownload is None:
+            tf, uri = self._download_when_ready(timeoutSeconds)
+        else:
+            # Already started, and timed out on its own
+            tf, uri = self.pendingDownload.result()
 
-class TextToSpeechFactory():  # pylint: disable=too-few-public-methods
+        if not self.isCached and uri is not None:
+            self._cache_file(uri)
+        self.alreadyDownloaded = True
+
+        return tf
+
+
+class TextToSpeechFactory():
     """ Holds on to boto clients, initializing an AWS session once and allowing reuses
-        of that session for text-to-speech. """
+        of that session for text-to-speech. The clients can be given instead, e.g. fakes. """
+    _lock = threading.Lock()
+    _pool = None
+
+    def __init__(self, pollyClient=None, s3Client=None):
+        if pollyClient is None:
+            pollyClient = boto3.Session(
+                region_name=os.environ.get('AWS_S3_REGION_NAME')).client('polly')
+        if s3Client is None:
+            s3Client = boto3.client('s3')
+        self.pollyClient = pollyClient
+        self.s3Client = s3Client
 
-    def __init__(self):
-        self.pollyClient = boto3.Session(
-            region_name=os.environ.get('AWS_S3_REGION_NAME')).client('polly')
-        self.s3Client = boto3.client('s3')
+    @classmethod
+    def _get_pool(cls):
+        """ The thread pool which talks to AWS, shared by every movie made in this process """
+        with cls._lock:
+            if cls._pool is None:
+                cls._pool = ThreadPoolExecutor(
+                    max_workers=settings.MOVIE_TEXT_TO_SPEECH_MAX_WORKERS,
+                    thread_name_prefix='textToSpeech')
+            return cls._pool
 
     def text_to_speech(self, text):
         """ Returns a GeneratedAudioWrapper which you can poll for the result. """
         return GeneratedAudioWrapper(self.pollyClient, self.s3Client, text)
+
+    def prefetch(self, texts):
+        """
+        Starts generating and downloading the audio of all of the texts at once.
+        Returns a dict from each text to its GeneratedAudioWrapper, already downloading.
+        """
+        texts = list(dict.fromkeys(texts))
+        cachedObjects = TextToSpeechCachedFile.objects.in_bulk(texts)
+        TextToSpeechCachedFile.objects.filter(pk__in=list(cachedObjects)).update(
+            lastUsed=timezone.now())
+
+        pool = self._get_pool()
+        futures = {text: pool.submit(GeneratedAudioWrapper, self.pollyClient, self.s3Client,
+                                     text, cachedObjects.get(text))
+                   for text in texts}
+        wrappers = {text: future.result() for text, future in futures.items()}
+        for wrapper in wrappers.values():
+            wrapper.start_download(pool)
+        return wrappers
@@ -0,0 +1,57 @@
+"""
+Management command to prune text-to-speech audio which hasn't been used in a while: the
+TextToSpeechCachedFile rows, the objects in the speech synthesis bucket - including those no
+row refers to, e.g. captions too long to cache - and this worker's local audio cache.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from movie.creation.audioCache import LocalAudioCache
+from movie.creation.textToSpeech import GeneratedAudioWrapper
+from movie.models import TextToSpeechCachedFile
+
+
+class Command(BaseCommand):
+    """ The command itself """
+    help = 'Deletes text-to-speech audio which has not been used in the given number of days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90,
+                            help='Prune audio which has not been used in this many days')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count what would be pruned')
+
+    @classmethod
+    def _get_stale_objects(cls, storage, cutoff):
+        """ The names of the generated audio in the bucket older than cutoff which no
+            recently-used TextToSpeechCachedFile refers to """
+        keptNames = set(TextToSpeechCachedFile.objects.filter(lastUsed__gte=cutoff)
+                        .values_list('audioFile', flat=True))
+        _, fileNames = storage.listdir('')
+        return [name for name in fileNames
+                if name.startswith(GeneratedAudioWrapper.prefix) and name not in keptNames and
+                storage.get_modified_time(name) < cutoff]
+
+    def handle(self, *args, **options):
+        isDryRun = options['dry_run']
+        maxAge = timedelta(days=options['days'])
+        cutoff = timezone.now() - maxAge
+
+        staleRows = TextToSpeechCachedFile.objects.filter(lastUsed__lt=cutoff)
+        storage = TextToSpeechCachedFile._meta.get_field('audioFile').storage
+        staleObjects = self._get_stale_objects(storage, cutoff)
+        numLocal = LocalAudioCache.from_settings().prune(maxAge.total_seconds(), isDryRun)
+
+        if isDryRun:
+            self.stdout.write(f'Would prune {staleRows.count()} cached files, '
+                              f'{len(staleObjects)} bucket objects and {numLocal} local files\n')
+            return
+
+        numRows, _ = staleRows.delete()
+        for name in staleObjects:
+            storage.delete(name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Pruned {numRows} cached files, {len(staleObjects)} bucket objects '
+            f'and {numLocal} local files'))
@@ -1,14 +1,17 @@
 """ Models for storing data about a movie """
 from django.conf import settings
 from django.contrib import admin
-from django.core.cache import cache
 from django.core.files.storage import get_storage_class
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Q
 
+from common.cacheVersions import bump_cache_versions
 
+
+# The default storage may be the local cache in front of S3: the bucket is the backend's.
 # pylint:disable=abstract-method,too-few-public-methods
-class SpeechSynthStorage(get_storage_class()):
+class SpeechSynthStorage(get_storage_class(getattr(settings, 'STORAGE_CACHE_BACKEND', None))):
     """ Speech synth is stored in a separate bucket. No-op when using offline mode."""
 
     def __init__(self, *args, **kwargs):
@@ -37,9 +40,12 @@ class Movie(models.Model):
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
 
-        # Clear the cache. Otherwise, you'll continue to get the cached result
-        # of the old model.
-        cache.clear()
+        # Invalidate the cache of the visualizations showing this movie.
+        # Otherwise, you'll continue to get the cached result of the old model.
+        # pylint: disable=import-outside-toplevel
+        from visualizer.models import JsonConfig
+        bump_cache_versions(JsonConfig.objects.filter(Q(movieHorizontal=self) |
+                                                      Q(movieVertical=self)))
 
 
 class TextToSpeechCachedFile(models.Model):
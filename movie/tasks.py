@@ -46,16 +46,10 @@ def launch_big_dynos(pk, domain):
 
 def create_movie_task(pk, domain):
     """ Create a movie for the config with the given primary key, using
-        a live server at the given domain. Turned into a @shared_task below,
-        but doesn't work in readthedocs so it's conditional. """
+        a live server at the given domain if MOVIE_FRAME_RENDERER is 'browser'.
+        Turned into a @shared_task below, but doesn't work in readthedocs so it's conditional. """
 
-    chromeOptions = webdriver.chrome.options.Options()
-    chromeOptions.add_argument("--headless")
-    chromeOptions.add_argument("--disable-dev-shm-usage")
-    chromeOptions.add_argument("--shm-size=512m")
-
-    browser = webdriver.Chrome(options=chromeOptions)
-    browser.implicitly_wait(10)
+    browser = _launch_browser() if settings.MOVIE_FRAME_RENDERER == 'browser' else None
 
     try:
         jsonconfig = JsonConfig.objects.get(pk=pk)
@@ -66,7 +60,20 @@ def create_movie_task(pk, domain):
         print("Movie generation failed: ", exception)
         traceback.print_exc()
     finally:
-        browser.quit()
+        if browser is not None:
+            browser.quit()
+
+
+def _launch_browser():
+    """ Headless Chrome, to screenshot the movie generation view """
+    chromeOptions = webdriver.chrome.options.Options()
+    chromeOptions.add_argument("--headless")
+    chromeOptions.add_argument("--disable-dev-shm-usage")
+    chromeOptions.add_argument("--shm-size=512m")
+
+    browser = webdriver.Chrome(options=chromeOptions)
+    browser.implicitly_wait(10)
+    return browser
 
 
 is_read_the_docs_env = os.environ.get('READTHEDOCS') == 'True'
@@ -75,7 +82,7 @@ if not is_read_the_docs_env:
 
 
 def _make_movies_for_config(browser, domain, jsonconfig):
-    """ Create a movie, this time given a JsonConfig and selenium browser """
+    """ Create a movie, this time given a JsonConfig and selenium browser, or None """
     movieCreator = MovieCreationFactory(browser, domain, jsonconfig)
 
     jsonconfig.movieGenerationStatus = MovieGenerationStatuses.PICKED_UP_BY_TASK
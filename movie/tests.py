@@ -5,18 +5,28 @@ Unit and integration tests for automatic movie creation
 import os
 import shutil
 import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
 
 from django.contrib.auth import get_user_model
 from django.contrib.staticfiles.testing import StaticLiveServerTestCase
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from mock import patch
 import mock
 import moviepy
+import numpy as np
 
-from common.testUtils import TestHelpers
+from common.testUtils import FakeSpeechSynthesis, TestHelpers
+from movie.creation.audioCache import LocalAudioCache, audio_key
+from movie.creation.frameRasterizer import draw_frame, make_frame
 from movie.creation.movieCreator import MovieCreationFactory, SingleMovieCreator
 from movie.creation.textToSpeech import GeneratedAudioWrapper, TextToSpeechFactory
 from movie.models import Movie, TextToSpeechCachedFile
 from movie.tasks import create_movie_task
+from visualizer.colors import hex_to_rgb
 from visualizer.models import MovieGenerationStatuses
 
 FILENAME_AUDIO = 'testData/audio.mp3'
@@ -234,6 +244,7 @@ class MovieCreationTestsMocked(StaticLiveServerTestCase):
         multiplier = 2 if isVerticalEnabled else 1
         mockSpawnAudio.assert_has_calls(callsForOneVideo * multiplier)
 
+    @override_settings(MOVIE_FRAME_RENDERER='browser')
     @mock.patch('traceback.print_exc')
     def test_failure_status(self, mockTraceback):
         """ Test that the failure status is accurately set """
@@ -247,6 +258,256 @@ class MovieCreationTestsMocked(StaticLiveServerTestCase):
         assert jsonConfig.movieGenerationStatus == MovieGenerationStatuses.FAILED
 
 
+class FrameRasterizerTests(TestCase):
+    """ Frames rasterized in Python, without a browser """
+
+    def setUp(self):
+        TestHelpers.setup_host_mocks(self)
+        TestHelpers.login(self.client)
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        self.creator = SingleMovieCreator(
+            browser=None,
+            textToSpeechFactory=None,
+            jsonconfig=TestHelpers.get_latest_upload(),
+            size=(640, 360))
+
+    def _rasterize(self, roundNum, caption):
+        # pylint: disable=protected-access
+        self.creator._set_captions_on_page(roundNum, caption, False)
+        return self.creator._generate_image_for_round_synchronously(roundNum)
+
+    def test_frames_without_browser(self):
+        """ Each round is drawn at the movie's size, in the colors of its round """
+        numRounds = self.creator._get_num_rounds()  # pylint: disable=protected-access
+        colors = self.creator.barChart['colors']
+        firstFrame = self._rasterize(0, 'The first round').get_frame(0)
+        lastFrame = self._rasterize(numRounds - 1, 'The last round').get_frame(0)
+        self.assertEqual(firstFrame.shape, (360, 640, 3))
+        self.assertFalse(np.array_equal(firstFrame, lastFrame))
+
+        def has_color(frame, color):
+            return np.all(frame == hex_to_rgb(color), axis=-1).any()
+        self.assertTrue(has_color(firstFrame, colors[0]))
+        self.assertFalse(has_color(firstFrame, colors[numRounds - 1]))
+        self.assertTrue(has_color(lastFrame, colors[numRounds - 1]))
+
+    def test_unicode_text(self):
+        """ Text outside latin-1 is drawn, and text too long for the frame is cut short """
+        chart = dict(self.creator.barChart)
+        chart['candidates'] = [dict(candidate, name='Đặng Thị Ngọc Thịnh ' * 5)
+                               for candidate in chart['candidates']]
+        frame = make_frame(0, 'Thành phố Hồ Chí Minh ' * 10, 'Vòng một — «ελληνικά»', True)
+        self.assertEqual(draw_frame(chart, (640, 360), frame).shape, (360, 640, 3))
+
+    def test_missing_font(self):
+        """ A missing font fails loudly rather than drawing in Pillow's latin-1 default """
+        chart = dict(self.creator.barChart, fontFile='missing-font.ttf')
+        with self.assertRaisesRegex(OSError, 'missing-font.ttf'):
+            draw_frame(chart, (640, 360), make_frame(0, 'Heading', 'Caption'))
+
+    @override_settings(MOVIE_FRAME_MAX_PROCESSES=2)
+    @mock.patch('moviepy.video.VideoClip.VideoClip.write_gif')
+    def test_frames_drawn_ahead_in_parallel(self, mockWriteGif):
+        """ The frames of every round are drawn at once on a process pool, not one by one """
+        with patch('movie.creation.movieCreator.draw_frame', wraps=draw_frame) as mockDrawFrame:
+            self.creator.make_gif('unused.gif')
+        mockDrawFrame.assert_not_called()
+        mockWriteGif.assert_called_once()
+
+        # Frames which weren't drawn ahead are drawn when they're needed
+        with patch('movie.creation.movieCreator.draw_frame', wraps=draw_frame) as mockDrawFrame:
+            self._rasterize(0, 'Not drawn ahead')
+        mockDrawFrame.assert_called_once()
+
+
+@patch('movie.creation.textToSpeech.GeneratedAudioWrapper.pollIntervalSeconds', 0.05)
+def _use_temporary_audio_cache(testCase):
+    """ Points the local audio cache at an empty directory for the duration of the test """
+    cacheDir = tempfile.mkdtemp()
+    testCase.addCleanup(shutil.rmtree, cacheDir, ignore_errors=True)
+    overrider = override_settings(MOVIE_AUDIO_CACHE_DIR=cacheDir)
+    overrider.enable()
+    testCase.addCleanup(overrider.disable)
+    return cacheDir
+
+
+class TextToSpeechPrefetchTests(TestCase):
+    """ Captions' audio is generated all at once, against a fake Polly and S3 """
+
+    def setUp(self):
+        _use_temporary_audio_cache(self)
+        self.fake = FakeSpeechSynthesis(synthesisSeconds=0.3)
+        self.textToSpeechFactory = TextToSpeechFactory(self.fake, self.fake)
+
+    def test_prefetch(self):
+        """ One query finds the cached captions, and the rest are synthesized concurrently """
+        cached = TextToSpeechCachedFile(text='cached')
+        cached.audioFile.name = 'generated_speech.cached.mp3'
+        cached.save()
+        lastUsed = TextToSpeechCachedFile.objects.get(text='cached').lastUsed
+
+        captions = [f'caption {i}' for i in range(8)]
+        start = time.monotonic()
+        with self.assertNumQueries(2):
+            wrappers = self.textToSpeechFactory.prefetch(['cached', *captions, captions[0]])
+        self.assertEqual(sorted(self.fake.texts), captions)
+        self.assertEqual(self.fake.maxTasksInProgress, len(captions))
+
+        for wrapper in wrappers.values():
+            wrapper.download_synchronously()
+        self.assertLess(time.monotonic() - start, len(captions) * self.fake.synthesisSeconds)
+        self.assertIn('generated_speech.cached.mp3', self.fake.downloadedKeys)
+        self.assertEqual(TextToSpeechCachedFile.objects.count(), len(captions) + 1)
+        self.assertGreater(TextToSpeechCachedFile.objects.get(text='cached').lastUsed, lastUsed)
+
+    def test_movie_prefetches_every_caption(self):
+        """ Every caption of a movie is requested before the first clip needs its audio """
+        TestHelpers.setup_host_mocks(self)
+        TestHelpers.login(self.client)
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        creator = SingleMovieCreator(
+            browser=None,
+            textToSpeechFactory=self.textToSpeechFactory,
+            jsonconfig=TestHelpers.get_latest_upload(),
+            size=(640, 360))
+
+        numTextsWhenFirstNeeded = []
+
+        def download_audio(movieCreator, caption):
+            numTextsWhenFirstNeeded.append(len(self.fake.texts))
+            # pylint: disable=protected-access
+            movieCreator._spawn_audio_creation_with_caption(caption).download_synchronously()
+            return mock.MagicMock()
+
+        with patch(MOVIE_PATCH_PREFIX + '_text_on_background', autospec=True) as mockCard, \
+                patch(MOVIE_PATCH_PREFIX + '_generate_clip_with_caption',
+                      autospec=True) as mockClip, \
+                patch('movie.creation.movieCreator.TextClip'), \
+                patch('movie.creation.movieCreator.CompositeVideoClip'), \
+                patch('movie.creation.movieCreator.concatenate_videoclips'):
+            mockCard.side_effect = lambda movieCreator, _, spoken, __: \
+                download_audio(movieCreator, spoken)
+            mockClip.side_effect = lambda movieCreator, _, caption, **kwargs: \
+                download_audio(movieCreator, caption)
+            creator.make_movie('unused.mp4', 'unused.png')
+
+        numRounds = creator._get_num_rounds()  # pylint: disable=protected-access
+        self.assertEqual(len(self.fake.texts), numRounds + 3)
+        self.assertEqual(numTextsWhenFirstNeeded[0], numRounds + 3)
+        self.assertEqual(self.fake.maxTasksInProgress, numRounds + 3)
+        self.assertEqual(creator.prefetchedAudio, {})
+
+
+class SpeechCacheTests(TestCase):
+    """ Audio cached on local disk, and pruning audio which is no longer used """
+
+    def setUp(self):
+        self.cacheDir = _use_temporary_audio_cache(self)
+        self.fake = FakeSpeechSynthesis(synthesisSeconds=0)
+        self.textToSpeechFactory = TextToSpeechFactory(self.fake, self.fake)
+
+    @classmethod
+    def _make_old(cls, path, days):
+        oldTime = time.time() - days * 24 * 60 * 60
+        os.utime(path, (oldTime, oldTime))
+
+    def test_local_cache_hit(self):
+        """ Audio already on this worker is neither synthesized nor downloaded again """
+        self.textToSpeechFactory.text_to_speech('See more details').download_synchronously()
+        self.assertEqual(len(self.fake.texts), 1)
+        self.assertEqual(len(self.fake.downloadedKeys), 1)
+
+        # Whether or not the bucket still has it
+        for _ in range(2):
+            wrapper = self.textToSpeechFactory.text_to_speech('See more details')
+            tf = wrapper.download_synchronously()
+            self.assertGreater(os.path.getsize(tf.name), 0)
+            TextToSpeechCachedFile.objects.all().delete()
+        self.assertEqual(len(self.fake.texts), 1)
+        self.assertEqual(len(self.fake.downloadedKeys), 1)
+
+    def test_least_recently_used_evicted(self):
+        """ Once the cache is too large, the files used longest ago are removed first """
+        # pylint: disable=protected-access
+        audioCache = LocalAudioCache(self.cacheDir, maxBytes=3 * 100)
+        keys = [audio_key(f'text {i}', 'Joanna', 'neural') for i in range(4)]
+        with tempfile.NamedTemporaryFile(suffix='.mp3') as tf:
+            tf.write(b'0' * 100)
+            tf.flush()
+            for i, key in enumerate(keys[:3]):
+                audioCache.put(key, tf.name)
+                self._make_old(audioCache._path(key), days=3 - i)
+            self.assertTrue(audioCache.get(keys[0], tf.name))
+            audioCache.put(keys[3], tf.name)
+
+        self.assertEqual([audioCache.has(key) for key in keys], [True, False, True, True])
+        self.assertNotEqual(keys[0], audio_key('text 0', 'Matthew', 'neural'))
+
+    def test_partial_files(self):
+        """ Files still being written aren't evicted, but abandoned ones are """
+        audioCache = LocalAudioCache(self.cacheDir, maxBytes=0)
+        os.makedirs(self.cacheDir, exist_ok=True)
+        partialPaths = []
+        for days in (0, 1):
+            with tempfile.NamedTemporaryFile(dir=self.cacheDir, suffix='.partial',
+                                             delete=False) as tf:
+                tf.write(b'0' * 100)
+            self._make_old(tf.name, days)
+            partialPaths.append(tf.name)
+        self.assertEqual(audioCache.evict(), 1)
+        self.assertEqual([os.path.exists(path) for path in partialPaths], [True, False])
+
+        # Nor does writing fail if another process removes the partial file meanwhile
+        key = audio_key('text', 'Joanna', 'neural')
+        with patch('os.replace', side_effect=FileNotFoundError):
+            audioCache.put(key, self.fake.audioFilename)
+        self.assertFalse(audioCache.has(key))
+
+    def test_prune_command(self):
+        """ Stale rows, unreferenced bucket objects and local files are pruned """
+        mediaRoot = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, mediaRoot, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=mediaRoot):
+            for name in ('generated_speech.stale.mp3', 'generated_speech.orphan.mp3',
+                         'generated_speech.kept.mp3', 'generated_speech.new.mp3', 'other.mp3'):
+                path = os.path.join(mediaRoot, name)
+                shutil.copyfile(self.fake.audioFilename, path)
+                if name != 'generated_speech.new.mp3':
+                    self._make_old(path, days=100)
+            for text in ('stale', 'kept'):
+                cachedFile = TextToSpeechCachedFile(text=text)
+                cachedFile.audioFile.name = f'generated_speech.{text}.mp3'
+                cachedFile.save()
+            TextToSpeechCachedFile.objects.filter(text='stale').update(
+                lastUsed=timezone.now() - timedelta(days=100))
+
+            audioCache = LocalAudioCache.from_settings()
+            for text, days in (('old', 100), ('recent', 1)):
+                key = audio_key(text, 'Joanna', 'neural')
+                audioCache.put(key, self.fake.audioFilename)
+                self._make_old(audioCache._path(key), days)  # pylint: disable=protected-access
+
+            out = StringIO()
+            call_command('pruneSpeechCache', dry_run=True, stdout=out)
+            self.assertIn('Would prune 1 cached files, 2 bucket objects and 1 local files',
+                          out.getvalue())
+            self.assertEqual(len(os.listdir(mediaRoot)), 5)
+            self.assertEqual(TextToSpeechCachedFile.objects.count(), 2)
+
+            out = StringIO()
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('pruneSpeechCache', stdout=out)
+            self.assertIn('Pruned 1 cached files, 2 bucket objects and 1 local files',
+                          out.getvalue())
+            self.assertEqual(sorted(os.listdir(mediaRoot)),
+                             ['generated_speech.kept.mp3', 'generated_speech.new.mp3',
+                              'other.mp3'])
+            self.assertEqual(list(TextToSpeechCachedFile.objects.values_list('text', flat=True)),
+                             ['kept'])
+            self.assertFalse(audioCache.has(audio_key('old', 'Joanna', 'neural')))
+            self.assertTrue(audioCache.has(audio_key('recent', 'Joanna', 'neural')))
+
+
 class MovieCreationTestsIntegration(StaticLiveServerTestCase):
     """ Integration tests - no mocking here to test everything above
         that was mocked, but with short text """
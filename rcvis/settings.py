@@ -82,10 +82,13 @@ MIDDLEWARE = [
 
     'django.contrib.sessions.middleware.SessionMiddleware',
 
+    # Answers conditional GETs for pages served from the cache, too
+    'django.middleware.http.ConditionalGetMiddleware',
+
     # Order of the next 3 is important
-    'django.middleware.cache.UpdateCacheMiddleware',
+    'common.cacheMiddleware.VersionedUpdateCacheMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.cache.FetchFromCacheMiddleware',
+    'common.cacheMiddleware.VersionedFetchFromCacheMiddleware',
 
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -252,7 +255,9 @@ LOGGING = {
 
 # Uploaded media
 if not OFFLINE_MODE:
-    DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+    # S3, with a cache of recently-read files on local disk. See common.cachedStorage.
+    DEFAULT_FILE_STORAGE = 'common.cachedStorage.LocalCacheStorage'
+    STORAGE_CACHE_BACKEND = 'storages.backends.s3boto3.S3Boto3Storage'
     AWS_STORAGE_BUCKET_NAME = os.environ['AWS_STORAGE_BUCKET_NAME']
     AWS_S3_REGION_NAME = os.environ['AWS_S3_REGION_NAME']
     AWS_ACCESS_KEY_ID = os.environ['AWS_ACCESS_KEY_ID']
@@ -266,6 +271,11 @@ else:
         os.path.join(BASE_DIR, "media"),
     ]
 
+# The local cache of uploaded media, when DEFAULT_FILE_STORAGE is LocalCacheStorage
+STORAGE_CACHE_DIR = os.environ.get('STORAGE_CACHE_DIR', '/tmp/django_rcvis_storage_cache/')
+STORAGE_CACHE_MAX_BYTES = int(os.environ.get('STORAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+STORAGE_CACHE_REVALIDATE_SECONDS = int(os.environ.get('STORAGE_CACHE_REVALIDATE_SECONDS', 86400))
+
 # For scaling heroku workers up if needed
 HEROKU_API_KEY = os.environ.get('HEROKU_API_KEY')
 HEROKU_APP_NAME = os.environ.get('HEROKU_APP_NAME')
@@ -277,9 +287,45 @@ AWS_POLLY_STORAGE_BUCKET_NAME = os.environ.get('AWS_POLLY_STORAGE_BUCKET_NAME')
 # Cloudflare API
 CLOUDFLARE_ZONE_ID = os.environ.get('CLOUDFLARE_ZONE_ID')
 CLOUDFLARE_AUTH_TOKEN = os.environ.get('CLOUDFLARE_AUTH_TOKEN')
+# In OFFLINE_MODE, set to http://<host>/fakeCloudflare to purge against a fake endpoint
+CLOUDFLARE_API_URL = os.environ.get('CLOUDFLARE_API_URL', 'https://api.cloudflare.com/client/v4')
+# Purge in a background thread after each save. Otherwise, run processCloudflarePurges.
+CLOUDFLARE_PURGE_IN_BACKGROUND = os.environ.get('CLOUDFLARE_PURGE_IN_BACKGROUND') != 'False'
+
+# Scraping in the background: at most this many downloads run at once in each process, at most
+# this many of them from any single host, and requests to a host start at least this many
+# seconds apart. See scraper.downloader.
+SCRAPE_MAX_CONCURRENT_DOWNLOADS = int(os.environ.get('SCRAPE_MAX_CONCURRENT_DOWNLOADS', 16))
+SCRAPE_MAX_CONCURRENT_PER_HOST = int(os.environ.get('SCRAPE_MAX_CONCURRENT_PER_HOST', 4))
+SCRAPE_MIN_SECONDS_BETWEEN_HOST_REQUESTS = float(
+    os.environ.get('SCRAPE_MIN_SECONDS_BETWEEN_HOST_REQUESTS', 0.2))
+# Scrape in a background thread, rather than in the request which started the scrape
+SCRAPE_JOBS_IN_BACKGROUND = os.environ.get('SCRAPE_JOBS_IN_BACKGROUND') != 'False'
+# How many processes parse the contests of a multi-scraper at once. 1 parses them in-process.
+MULTI_SCRAPE_MAX_PROCESSES = int(os.environ.get('MULTI_SCRAPE_MAX_PROCESSES',
+                                                os.cpu_count() or 1))
+# How many threads load the contests of an election page at once. See electionpage.contestBundle.
+ELECTION_PAGE_BUNDLE_MAX_WORKERS = int(os.environ.get('ELECTION_PAGE_BUNDLE_MAX_WORKERS', 8))
 
 AWS_DEFAULT_ACL = None
 
+# Locks which stop processes on the same host from rendering the same page at once
+SINGLE_FLIGHT_LOCK_DIR = '/tmp/django_rcvis_locks/'
+
+# Cache-Control of the visualization, oEmbed and election pages. They have ETags, so once
+# max-age has passed, browsers and CDNs revalidate cheaply - and may keep showing the
+# stale page meanwhile, for up to stale-while-revalidate seconds. See common.conditional.
+# Note that max-age is also how long the page cache keeps them.
+PAGE_CACHE_CONTROL = {
+    'public': True,
+    'max_age': int(os.environ.get('PAGE_CACHE_MAX_AGE', 600)),
+    'stale_while_revalidate': int(os.environ.get('PAGE_CACHE_STALE_WHILE_REVALIDATE', 86400)),
+}
+
+# Part of every page's ETag, so a release invalidates the pages browsers have cached.
+# Set by Heroku when dyno metadata is enabled.
+RELEASE_VERSION = os.environ.get('HEROKU_RELEASE_VERSION', '')
+
 if os.environ.get('DISABLE_CACHE') != 'True':
     CACHES = {
         'default': {
@@ -319,6 +365,23 @@ REST_FRAMEWORK = {
 }
 
 MOVIE_FONT_NAME = os.environ.get("MOVIE_FONT_NAME", "Roboto")
+# The font the movie frames are drawn with, when they're rasterized: a TrueType font with
+# glyphs for any candidate's name. DejaVu Sans is shipped in static/movie/fonts.
+MOVIE_FONT_FILE = os.environ.get("MOVIE_FONT_FILE",
+                                 os.path.join(BASE_DIR, 'static', 'movie', 'fonts',
+                                              'DejaVuSans.ttf'))
+# How the frame of each round is drawn: 'raster' draws it in Python, 'browser' screenshots
+# the movie generation view in headless Chrome, for the full fidelity of the javascript chart.
+MOVIE_FRAME_RENDERER = os.environ.get("MOVIE_FRAME_RENDERER", "raster")
+# How many processes rasterize the frames of a movie at once. 1 draws them in-process.
+MOVIE_FRAME_MAX_PROCESSES = int(os.environ.get('MOVIE_FRAME_MAX_PROCESSES',
+                                               os.cpu_count() or 1))
+# How many threads start speech synthesis tasks and download their audio at once, per process
+MOVIE_TEXT_TO_SPEECH_MAX_WORKERS = int(os.environ.get('MOVIE_TEXT_TO_SPEECH_MAX_WORKERS', 16))
+# Text-to-speech audio is cached on each worker's disk, evicting the least recently used audio
+# past this many bytes. See movie.creation.audioCache.
+MOVIE_AUDIO_CACHE_DIR = os.environ.get('MOVIE_AUDIO_CACHE_DIR', '/tmp/rcvis_audio_cache/')
+MOVIE_AUDIO_CACHE_MAX_BYTES = int(os.environ.get('MOVIE_AUDIO_CACHE_MAX_BYTES', 256 * 1024 * 1024))
 
 MAILCHIMP_API_KEY = os.environ.get("MAILCHIMP_API_KEY")
 MAILCHIMP_LIST_ID = os.environ.get("MAILCHIMP_LIST_ID")
@@ -5,6 +5,8 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from common import cloudflare
+
 urlpatterns = [
     path('', include('accounts.urls')),
     path('', include('visualizer.urls')),
@@ -16,3 +18,7 @@ urlpatterns = [
 if settings.OFFLINE_MODE:
     # Offline files have locally-served media files
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+    # So purging the CDN can be tested offline. See CLOUDFLARE_API_URL.
+    urlpatterns.append(path('fakeCloudflare/zones/<zoneId>/purge_cache',
+                            cloudflare.fake_purge_cache, name='fakeCloudflarePurge'))
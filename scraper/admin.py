@@ -3,7 +3,7 @@ Admin page to edit a scraper
 """
 from django.contrib import admin
 
-from scraper.models import MultiScraper, Scraper
+from scraper.models import MultiScraper, Scraper, ScrapeRun
 
 
 @admin.register(Scraper)
@@ -16,3 +16,10 @@ class ScraperAdmin(admin.ModelAdmin):
 class MultiScraperAdmin(admin.ModelAdmin):
     """ Creates a scraper """
     view_on_site = True
+
+
+@admin.register(ScrapeRun)
+class ScrapeRunAdmin(admin.ModelAdmin):
+    """ The history of scheduled scrapes """
+    list_display = ('startedAt', 'scraper', 'multiScraper', 'outcome', 'latencySeconds')
+    list_filter = ('outcome',)
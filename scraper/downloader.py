@@ -0,0 +1,72 @@
+"""
+Downloads for scrapers which run in the background - ScrapeAll jobs and the scheduler -
+on a thread pool shared by everything in the process, through one pooled requests.Session.
+
+Sources are usually county election sites, so requests to each host are limited: at most
+SCRAPE_MAX_CONCURRENT_PER_HOST at once, and they start at least
+SCRAPE_MIN_SECONDS_BETWEEN_HOST_REQUESTS apart. At most SCRAPE_MAX_CONCURRENT_DOWNLOADS run
+at once overall. The limits are per process.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from scraper.scrapeWorker import MAX_SIZE_BYTES, ScrapeWorker
+
+
+class Downloader:  # pylint: disable=too-few-public-methods
+    """ The thread pool, session and per-host limits shared by every download in this process """
+    _lock = threading.Lock()
+    _pool = None
+    _session = None
+    _hostSemaphores = {}
+    _hostNextRequestAt = {}
+
+    @classmethod
+    def _get_pool(cls):
+        with cls._lock:
+            if cls._pool is None:
+                size = settings.SCRAPE_MAX_CONCURRENT_DOWNLOADS
+                cls._session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+                cls._session.mount('http://', adapter)
+                cls._session.mount('https://', adapter)
+                cls._pool = ThreadPoolExecutor(max_workers=size,
+                                               thread_name_prefix='scrapeDownloader')
+            return cls._pool
+
+    @classmethod
+    def _get_host_semaphore(cls, host):
+        with cls._lock:
+            if host not in cls._hostSemaphores:
+                cls._hostSemaphores[host] = threading.BoundedSemaphore(
+                    settings.SCRAPE_MAX_CONCURRENT_PER_HOST)
+            return cls._hostSemaphores[host]
+
+    @classmethod
+    def _reserve_request(cls, host):
+        """ Returns how long to wait before requesting from the host, to keep to its rate limit """
+        with cls._lock:
+            now = time.monotonic()
+            requestAt = max(now, cls._hostNextRequestAt.get(host, now))
+            cls._hostNextRequestAt[host] = \
+                requestAt + settings.SCRAPE_MIN_SECONDS_BETWEEN_HOST_REQUESTS
+        return requestAt - now
+
+    @classmethod
+    def _download(cls, url, headers, maxSizeBytes):
+        host = urlparse(url).netloc
+        with cls._get_host_semaphore(host):
+            time.sleep(cls._reserve_request(host))
+            return ScrapeWorker.download_limited_size(url, maxSizeBytes, cls._session, headers)
+
+    @classmethod
+    def submit(cls, url, headers, maxSizeBytes=MAX_SIZE_BYTES):
+        """ Starts downloading the URL. Returns a Future of the ScrapedFile. """
+        return cls._get_pool().submit(cls._download, url, headers, maxSizeBytes)
@@ -0,0 +1,43 @@
+"""
+Management command to poll every scraper with isPolling set, on its own schedule, until
+stopped. See scraper.scheduler. Run only one per deployment: though a scraper is never scraped
+twice at once, each process keeps to the per-host limits on its own.
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from scraper.scheduler import ScrapeScheduler
+
+
+class Command(BaseCommand):
+    """ The command itself """
+    help = 'Scrapes each polling scraper whenever it is due, until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True,
+                            help='The user to scrape as, who needs permission to change scrapers')
+        parser.add_argument('--once', action='store_true',
+                            help='Scrape whatever is due now, then exit')
+        parser.add_argument('--tick-seconds', type=float, default=5,
+                            help='How often to check for scrapers which are due')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist as exc:
+            raise CommandError(f"No user named {options['username']}") from exc
+        if not user.has_perm('scraper.change_scraper'):
+            raise CommandError(f"{user.username} does not have permission to scrape")
+
+        scheduler = ScrapeScheduler(user)
+        while True:
+            close_old_connections()
+            for run in scheduler.tick():
+                self.stdout.write(f"{run}: {run.get_outcome_display()}, "
+                                  f"{run.latencySeconds:.1f}s")
+            if options['once']:
+                break
+            time.sleep(options['tick_seconds'])
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0002_multiscraper'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='multiscraper',
+            name='contentHash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='multiscraper',
+            name='etag',
+            field=models.CharField(blank=True, editable=False, max_length=256),
+        ),
+        migrations.AddField(
+            model_name='multiscraper',
+            name='lastModified',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='scraper',
+            name='contentHash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='scraper',
+            name='etag',
+            field=models.CharField(blank=True, editable=False, max_length=256),
+        ),
+        migrations.AddField(
+            model_name='scraper',
+            name='lastModified',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
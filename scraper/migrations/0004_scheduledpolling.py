@@ -0,0 +1,86 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0003_conditionalscraping'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='multiscraper',
+            name='isPolling',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='multiscraper',
+            name='maxPollSeconds',
+            field=models.PositiveIntegerField(default=1800),
+        ),
+        migrations.AddField(
+            model_name='multiscraper',
+            name='minPollSeconds',
+            field=models.PositiveIntegerField(default=60),
+        ),
+        migrations.AddField(
+            model_name='multiscraper',
+            name='nextScrapeAt',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='multiscraper',
+            name='pollSeconds',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='multiscraper',
+            name='scrapeLeaseExpiresAt',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='scraper',
+            name='isPolling',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='scraper',
+            name='maxPollSeconds',
+            field=models.PositiveIntegerField(default=1800),
+        ),
+        migrations.AddField(
+            model_name='scraper',
+            name='minPollSeconds',
+            field=models.PositiveIntegerField(default=60),
+        ),
+        migrations.AddField(
+            model_name='scraper',
+            name='nextScrapeAt',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='scraper',
+            name='pollSeconds',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='scraper',
+            name='scrapeLeaseExpiresAt',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='ScrapeRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('startedAt', models.DateTimeField(db_index=True)),
+                ('latencySeconds', models.FloatField()),
+                ('outcome', models.IntegerField(choices=[(0, 'The visualizations were updated'), (1, 'Nothing had changed'), (2, 'The scrape failed'), (3, 'It was already being scraped')])),
+                ('error', models.CharField(blank=True, max_length=512)),
+                ('multiScraper', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='scraper.multiscraper')),
+                ('scraper', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='scraper.scraper')),
+            ],
+        ),
+    ]
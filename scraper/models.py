@@ -6,6 +6,7 @@ Models for a Scraper, which has:
 """
 from django.db import models
 from django.urls import reverse
+from django.utils.translation import ugettext as _
 
 from sortedm2m.fields import SortedManyToManyField
 
@@ -36,6 +37,24 @@ class BaseScraper(models.Model):
     # Are the results certified at this URL?
     areResultsCertified = models.BooleanField(default=False)
 
+    # As of the last successful scrape: the source's ETag and Last-Modified headers, to make
+    # the next request conditional, and the sha256 of what it sent. See scraper.scrapeWorker.
+    etag = models.CharField(max_length=256, blank=True, editable=False)
+    lastModified = models.CharField(max_length=64, blank=True, editable=False)
+    contentHash = models.CharField(max_length=64, blank=True, editable=False)
+
+    # Scheduled polling, see scraper.scheduler: scraped every pollSeconds, which starts at
+    # minPollSeconds and backs off towards maxPollSeconds for as long as nothing changes
+    isPolling = models.BooleanField(default=False)
+    minPollSeconds = models.PositiveIntegerField(default=60)
+    maxPollSeconds = models.PositiveIntegerField(default=30 * 60)
+    pollSeconds = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    nextScrapeAt = models.DateTimeField(null=True, blank=True, editable=False, db_index=True)
+
+    # Held while it's being scraped, so it's never scraped twice at once.
+    # Expires in case the process scraping it dies. See ScrapeWorker.
+    scrapeLeaseExpiresAt = models.DateTimeField(null=True, blank=True, editable=False)
+
     # This is only optional because it may have failed to generate
     jsonConfig = models.OneToOneField(
         JsonConfig,
@@ -66,3 +85,28 @@ class MultiScraper(BaseScraper):
     def get_absolute_url(self):
         """ Used in the admin panel to have a "Visit Site" link """
         return reverse('viewMultiScraper', args=(self.pk,))
+
+
+class ScrapeOutcomes(models.IntegerChoices):
+    """ Describes how a single scheduled scrape went """
+    UPDATED = 0, _('The visualizations were updated')
+    UNCHANGED = 1, _('Nothing had changed')
+    FAILED = 2, _('The scrape failed')
+    BUSY = 3, _('It was already being scraped')
+
+
+class ScrapeRun(models.Model):
+    """ A record of a single scheduled scrape, of either a Scraper or a MultiScraper """
+    scraper = models.ForeignKey(Scraper, related_name='runs', on_delete=models.CASCADE,
+                                null=True, blank=True)
+    multiScraper = models.ForeignKey(MultiScraper, related_name='runs',
+                                     on_delete=models.CASCADE, null=True, blank=True)
+
+    startedAt = models.DateTimeField(db_index=True)
+    # From scheduling the download to saving the results
+    latencySeconds = models.FloatField()
+    outcome = models.IntegerField(choices=ScrapeOutcomes.choices)
+    error = models.CharField(max_length=512, blank=True)
+
+    def __str__(self):
+        return f'{self.scraper or self.multiScraper} at {self.startedAt}'
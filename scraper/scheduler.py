@@ -0,0 +1,117 @@
+"""
+Polls scrapers on their own schedules, for election night: each Scraper and MultiScraper with
+isPolling set is scraped every pollSeconds. For as long as its source is unchanged, that
+interval doubles after each scrape, up to maxPollSeconds. As soon as the source changes, it
+drops back to minPollSeconds.
+
+Run it with the runScrapeScheduler management command. Downloads go through
+scraper.downloader, so they run concurrently but keep to each host's limits, while the
+results are saved on the scheduler's own thread. Each scrape is recorded in a ScrapeRun.
+"""
+
+import time
+from concurrent.futures import as_completed
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from scraper.downloader import Downloader
+from scraper.models import MultiScraper, Scraper, ScrapeOutcomes, ScrapeRun
+from scraper.scrapeWorker import MAX_MULTI_SIZE_BYTES, MAX_SIZE_BYTES, \
+    ScrapeInProgressException, ScrapeWorker
+
+# How much longer to wait before the next scrape, each time nothing has changed
+BACKOFF_FACTOR = 2
+
+
+class ScrapeScheduler:
+    """ Scrapes, as the given user, whatever is due each time it ticks """
+
+    def __init__(self, user):
+        self.user = user
+
+    @classmethod
+    def get_due(cls, model, now):
+        """ The polling scrapers of the model which are due, and not being scraped already """
+        return model.objects.filter(isPolling=True) \
+            .filter(Q(nextScrapeAt__isnull=True) | Q(nextScrapeAt__lte=now)) \
+            .exclude(scrapeLeaseExpiresAt__gt=now)
+
+    @classmethod
+    def get_next_poll_seconds(cls, scraperObject, outcome):
+        """ How long to wait before scraping again, after a scrape with this outcome """
+        minPollSeconds = scraperObject.minPollSeconds
+        pollSeconds = scraperObject.pollSeconds or minPollSeconds
+        if outcome == ScrapeOutcomes.UPDATED:
+            return minPollSeconds
+        if outcome == ScrapeOutcomes.BUSY:
+            return pollSeconds
+        return max(minPollSeconds, min(pollSeconds * BACKOFF_FACTOR, scraperObject.maxPollSeconds))
+
+    def tick(self):
+        """ Scrapes everything that's due, and returns a ScrapeRun for each """
+        now = timezone.now()
+        runs = []
+        futures = {}
+        for model, maxSizeBytes in ((Scraper, MAX_SIZE_BYTES),
+                                    (MultiScraper, MAX_MULTI_SIZE_BYTES)):
+            for scraperObject in self.get_due(model, now):
+                # Leased before downloading, so nothing else downloads it meanwhile
+                startedAt = timezone.now()
+                try:
+                    ScrapeWorker.acquire_lease(scraperObject)
+                except ScrapeInProgressException:
+                    runs.append(self._record_run(scraperObject, startedAt=startedAt,
+                                                 latencySeconds=0, outcome=ScrapeOutcomes.BUSY))
+                    continue
+                try:
+                    headers = ScrapeWorker.get_conditional_headers(scraperObject)
+                    future = Downloader.submit(scraperObject.scrapableURL, headers, maxSizeBytes)
+                except Exception as exc:  # pylint: disable=broad-except
+                    # Nothing will scrape it, so nothing else would release the lease
+                    ScrapeWorker.release_lease(scraperObject)
+                    runs.append(self._record_run(scraperObject, startedAt=startedAt,
+                                                 latencySeconds=0, outcome=ScrapeOutcomes.FAILED,
+                                                 error=self._error_text(exc)))
+                    continue
+                futures[future] = (scraperObject, startedAt, time.monotonic())
+
+        return runs + [self._scrape(future, *futures[future]) for future in as_completed(futures)]
+
+    def _scrape(self, future, scraperObject, startedAt, submittedAt):
+        """ Scrapes from the finished download, which holds the lease, and records the run """
+        error = ''
+        try:
+            if isinstance(scraperObject, MultiScraper):
+                wasUpdated = ScrapeWorker.multi_scrape(scraperObject, self.user,
+                                                       download=future.result, isLeased=True)
+            else:
+                wasUpdated = ScrapeWorker.scrape(scraperObject, self.user,
+                                                 download=future.result, isLeased=True)
+            outcome = ScrapeOutcomes.UPDATED if wasUpdated else ScrapeOutcomes.UNCHANGED
+        except Exception as exc:  # pylint: disable=broad-except
+            outcome = ScrapeOutcomes.FAILED
+            error = self._error_text(exc)
+        return self._record_run(scraperObject, startedAt=startedAt,
+                                latencySeconds=time.monotonic() - submittedAt,
+                                outcome=outcome, error=error)
+
+    @classmethod
+    def _error_text(cls, exc):
+        """ The exception, as the error of a ScrapeRun """
+        maxErrorLength = ScrapeRun._meta.get_field('error').max_length
+        return (str(exc) or type(exc).__name__)[:maxErrorLength]
+
+    @classmethod
+    def _record_run(cls, scraperObject, **runFields):
+        """ Schedules the next scrape, after a run with this outcome, and records the run """
+        # Updated directly, so as not to overwrite anything the scrape saved
+        scraperObject.pollSeconds = cls.get_next_poll_seconds(scraperObject, runFields['outcome'])
+        scraperObject.nextScrapeAt = timezone.now() + timedelta(seconds=scraperObject.pollSeconds)
+        type(scraperObject).objects.filter(pk=scraperObject.pk).update(
+            pollSeconds=scraperObject.pollSeconds, nextScrapeAt=scraperObject.nextScrapeAt)
+
+        isMultiScraper = isinstance(scraperObject, MultiScraper)
+        return ScrapeRun.objects.create(
+            **{'multiScraper' if isMultiScraper else 'scraper': scraperObject}, **runFields)
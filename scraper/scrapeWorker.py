@@ -2,24 +2,54 @@
 A helper class that takes a Scraper model and actually scrapes the files
 to create or update a JsonConfig.
 
+Requests are conditional: a scraper remembers the ETag and Last-Modified headers the source
+last sent, and the hash of what it sent. If the source answers 304 Not Modified, or sends
+the same bytes again, nothing is parsed, stored, saved or purged - only lastSuccessfulScrape
+is updated. That's only safe while the visualizations are up-to-date with the scraper's own
+settings, so the request isn't made conditional otherwise.
+
+A scraper is never scraped twice at once, even by different processes: scraping holds a lease
+on it, in the database.
+
+A multi-scraper parses its changed contests on a pool of MULTI_SCRAPE_MAX_PROCESSES processes,
+so that county-wide files scale with the number of cores, then writes them all with a few bulk
+queries and purges them in one batch.
+
 Be warned: only admins or highly trusted users should be able to access this.
 There are both security issues (we can't trust the external source), and
-DOS issues (this could take a while to run, and we haven't made this async.)
-
-TODO - make it async.
+DOS issues (this could take a while to run.) To scrape many at once without
+waiting on them, see electionpage.scrapeJobs.
 """
+import hashlib
+import io
 import logging
+import multiprocessing
 import os
 import tempfile
+import threading
 import traceback
-
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import timedelta
+
+import django
+from django.conf import settings
 from django.core.files import File
-from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
+from django.core.files.base import ContentFile
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 from django.utils.text import slugify
 from rcvformats.conversions.dominion_multi_converter import DominionMultiConverter as DMC
 import requests
 
+from common import viewUtils
+from common.cloudflare import CloudflareAPI
+from common.compressedFiles import delete_unless_referenced
+from scraper.models import MultiScraper
 from visualizer import validators
 from visualizer.models import JsonConfig
 from visualizer.serializers import BaseVisualizationSerializer
@@ -27,52 +57,181 @@ from visualizer.serializers import BaseVisualizationSerializer
 logger = logging.getLogger(__name__)
 
 
+# Maximum size of a single election, and of a multi-election source
+MAX_SIZE_BYTES = 1024 * 1024
+MAX_MULTI_SIZE_BYTES = 1024 * 1024 * 5
+
+# (connect, read) timeouts: the read timeout applies to each chunk, not the whole download
+DOWNLOAD_TIMEOUT_SECONDS = (5, 30)
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Long enough for any scrape to finish: it only expires if the process scraping dies
+SCRAPE_LEASE_DURATION = timedelta(minutes=10)
+
+# The fields of a scraper which a scrape sets - and the only ones it saves, so it never
+# overwrites what the scheduler or an admin changes meanwhile. See _record_success.
+SCRAPE_RESULT_FIELDS = ['lastSuccessfulScrape', 'etag', 'lastModified', 'contentHash']
+
+# The result of a download. fileObject is None if the source was not modified.
+ScrapedFile = namedtuple('ScrapedFile', ['fileObject', 'contentHash', 'etag', 'lastModified'])
+
+# Everything _write_contests changes on an existing config
+BULK_UPDATED_FIELDS = ('jsonFile', 'jsonFileHash', *viewUtils.PRECOMPUTED_FIELDS, 'title',
+                       'numRounds', 'numCandidates', 'dataSourceURL', 'areResultsCertified',
+                       'cacheVersion', 'updatedAt')
+
+
 class FileTooLargeException(Exception):
     """ We don't present friendly error messages to the user, we just 500 here and die """
 
 
+class ScrapeInProgressException(Exception):
+    """ The scraper is already being scraped, by this process or another """
+
+
+def parse_contest(content):
+    """
+    Everything CPU-bound about scraping one contest of a multi-contest file, without
+    the database, so it can run on another process. Validates the content, and converts
+    and parses it as viewUtils.refresh_precomputed_files would. Returns a
+    validators.ParsedUpload.
+    """
+    return validators.parse_upload(io.BytesIO(content), None)
+
+
 class ScrapeWorker():
     """
     Helper class which takes a Scraper model and downloads the file,
     then uploads the scraped data if it's valid and updates the jsonConfig appropriately.
     """
+    _contestPoolLock = threading.Lock()
+    _contestPool = None
+
     @classmethod
-    def download_limited_size(cls, url, maxSizeBytes):
+    def download_limited_size(cls, url, maxSizeBytes, session=None, headers=None):
         """
-        Downloads URL, limited to maxSizeBytes, and returns a tempfile
-        file object of the resulting data
+        Downloads URL, limited to maxSizeBytes, and returns a ScrapedFile: the data,
+        in memory, along with its hash and what's needed to make the next request conditional.
+        Pass a requests.Session to reuse its connections, and the headers of
+        get_conditional_headers to skip the download if the source hasn't changed.
         """
-        r = requests.get(url, stream=True)
+        # requests decodes gzip and deflate as it streams. The size limit applies after that.
+        headers = {'Accept-Encoding': 'gzip, deflate', **(headers or {})}
+        # Closed on every path, so a pooled connection is never held until garbage collection
+        with (session or requests).get(url, stream=True, timeout=DOWNLOAD_TIMEOUT_SECONDS,
+                                       headers=headers) as r:
+            etag = r.headers.get('ETag', '')
+            lastModified = r.headers.get('Last-Modified', '')
+            if r.status_code == requests.codes.not_modified:  # pylint: disable=no-member
+                return ScrapedFile(None, None, etag, lastModified)
+            r.raise_for_status()
+
+            # Safety: check the headers
+            contentLengthFromHeader = int(r.headers.get('Content-Length', 0))
+            if contentLengthFromHeader > maxSizeBytes:
+                logger.error("Content length was too large: %d", contentLengthFromHeader)
+                raise FileTooLargeException("Headers say it's too large")
+
+            length = 0
+            contentHash = hashlib.sha256()
+
+            # Never larger than maxSizeBytes, so never written to disk
+            # pylint: disable=consider-using-with
+            tf = tempfile.SpooledTemporaryFile(max_size=maxSizeBytes)
+
+            for chunk in r.iter_content(DOWNLOAD_CHUNK_SIZE):
+                tf.write(chunk)
+                contentHash.update(chunk)
+                length += len(chunk)
+                # In case the headers lied
+                if length > maxSizeBytes:
+                    logger.error("Headers were fine, but we've now pulled %d", length)
+                    raise FileTooLargeException("Actual data too large")
+
+            tf.seek(0)
+            return ScrapedFile(tf, contentHash.hexdigest(), etag, lastModified)
 
-        # Safety: check the headers
-        contentLengthFromHeader = int(r.headers.get('Content-Length', 0))
-        if contentLengthFromHeader > maxSizeBytes:
-            logger.error("Content length was too large: %d", contentLengthFromHeader)
-            raise FileTooLargeException("Headers say it's too large")
+    @classmethod
+    def _get_scraped_configs(cls, scraperObject):
+        """ A queryset of the JsonConfigs the scraper has created """
+        if isinstance(scraperObject, MultiScraper):
+            return scraperObject.listOfElections.all()
+        return JsonConfig.objects.filter(pk=scraperObject.jsonConfig_id)
 
-        length = 0
+    @classmethod
+    def _has_current_settings(cls, scraperObject, jsonConfigs):
+        """ Were all the configs - and there are some - scraped with the scraper as it is now? """
+        outdated = jsonConfigs.exclude(dataSourceURL=scraperObject.sourceURL,
+                                       areResultsCertified=scraperObject.areResultsCertified)
+        return jsonConfigs.exists() and not outdated.exists()
 
-        tf = tempfile.NamedTemporaryFile(delete=True)
+    @classmethod
+    def get_conditional_headers(cls, scraperObject):
+        """
+        Headers which make the request conditional on the source having changed since the
+        last scrape - if nothing else needs updating, i.e. if the scraper's settings are too
+        """
+        headers = {}
+        if not cls._has_current_settings(scraperObject, cls._get_scraped_configs(scraperObject)):
+            return headers
+        if scraperObject.etag:
+            headers['If-None-Match'] = scraperObject.etag
+        if scraperObject.lastModified:
+            headers['If-Modified-Since'] = scraperObject.lastModified
+        return headers
+
+    @classmethod
+    def _is_unchanged(cls, scraperObject, scrapedFile):
+        """ Would scraping this file change nothing since the last scrape? """
+        if scrapedFile.fileObject is None:
+            # Not modified - and the request was only conditional if the settings are current
+            return True
+        return scrapedFile.contentHash == scraperObject.contentHash and \
+            cls._has_current_settings(scraperObject, cls._get_scraped_configs(scraperObject))
+
+    @classmethod
+    def _find_unchanged(cls, scraperObject, jsonConfigs, contentHash):
+        """
+        Returns the config among jsonConfigs which is already up-to-date with the scraped file
+        and the scraper's settings, or None. Updating it again would change nothing visible,
+        but would still purge its caches.
+        """
+        return jsonConfigs.filter(jsonFileHash=contentHash,
+                                  dataSourceURL=scraperObject.sourceURL,
+                                  areResultsCertified=scraperObject.areResultsCertified).first()
 
-        for chunk in r.iter_content(1024):
-            tf.write(chunk)
-            length += len(chunk)
-            # In case the headers lied
-            if length > maxSizeBytes:
-                logger.error("Headers were fine, but we've now pulled %d", length)
-                raise FileTooLargeException("Actual data too large")
+    @classmethod
+    def _record_success(cls, scraperObject, scrapedFile):
+        """ Sets lastSuccessfulScrape, and what's needed to make the next request conditional """
+        scraperObject.lastSuccessfulScrape = timezone.now()
+        if scrapedFile.fileObject is None:
+            # A 304 need not repeat the headers
+            scraperObject.etag = scrapedFile.etag or scraperObject.etag
+            scraperObject.lastModified = scrapedFile.lastModified or scraperObject.lastModified
+        else:
+            scraperObject.etag = scrapedFile.etag
+            scraperObject.lastModified = scrapedFile.lastModified
+            scraperObject.contentHash = scrapedFile.contentHash
 
-        tf.seek(0)
-        tf.flush()
-        return tf
+    @classmethod
+    def _record_unchanged(cls, scraperObject, scrapedFile):
+        """ Records a successful scrape, in a single query, without saving anything else """
+        logger.info("Unchanged since the last scrape: %s", scraperObject.scrapableURL)
+        cls._record_success(scraperObject, scrapedFile)
+        type(scraperObject).objects.filter(pk=scraperObject.pk).update(
+            lastSuccessfulScrape=scraperObject.lastSuccessfulScrape,
+            etag=scraperObject.etag,
+            lastModified=scraperObject.lastModified,
+            contentHash=scraperObject.contentHash)
 
     @classmethod
-    def _log_and_rethrow_exception(cls, scraperObject, exc):
+    def _log_failure(cls, scraperObject):
+        """ Logs the exception being handled, and records that the scrape failed """
         logger.warning("Failed to parse URL: %s", scraperObject.scrapableURL)
         logger.info(traceback.format_exc())
         scraperObject.lastFailedScrape = timezone.now()
-        scraperObject.save()
-        raise exc
+        scraperObject.save(update_fields=['lastFailedScrape'])
 
     @classmethod
     def _assert_permissions(cls, user):
@@ -81,6 +240,77 @@ class ScrapeWorker():
             logger.error("This should not be possible to get here without having permissions!")
             raise PermissionDenied()
 
+    @classmethod
+    def acquire_lease(cls, scraperObject):
+        """
+        Takes the lease on the scraper, or raises ScrapeInProgressException if it's held.
+        Take it before downloading, so a scraper is never downloaded twice at once either,
+        then pass isLeased to scrape or multi_scrape, which release it.
+        """
+        model = type(scraperObject)
+        now = timezone.now()
+        expiresAt = now + SCRAPE_LEASE_DURATION
+        isAvailable = Q(scrapeLeaseExpiresAt__isnull=True) | Q(scrapeLeaseExpiresAt__lte=now)
+        if not model.objects.filter(isAvailable, pk=scraperObject.pk).update(
+                scrapeLeaseExpiresAt=expiresAt):
+            raise ScrapeInProgressException(f"Already scraping {scraperObject.scrapableURL}")
+        scraperObject.scrapeLeaseExpiresAt = expiresAt
+
+    @classmethod
+    def release_lease(cls, scraperObject):
+        """ Releases the lease taken by acquire_lease """
+        type(scraperObject).objects.filter(pk=scraperObject.pk).update(scrapeLeaseExpiresAt=None)
+        scraperObject.scrapeLeaseExpiresAt = None
+
+    @classmethod
+    @contextmanager
+    def _lease(cls, scraperObject, isLeased=False):
+        """ Holds the lease on the scraper - taking it first, unless isLeased - then releases it """
+        if not isLeased:
+            cls.acquire_lease(scraperObject)
+        try:
+            yield
+        finally:
+            cls.release_lease(scraperObject)
+
+    @classmethod
+    def _write_contests(cls, multiScraperObject, contests):
+        """
+        Creates and updates the configs of the contests, each a tuple of
+        (jsonConfig, desiredFilename, content, validators.ParsedUpload), with a few bulk
+        queries, then purges them all at once. New configs are added to the multi-scraper.
+        """
+        newConfigs = []
+        updatedConfigs = []
+        replacedFiles = []
+        for jsonConfig, desiredFilename, content, parsedContest in contests:
+            if jsonConfig.pk is None:
+                newConfigs.append(jsonConfig)
+            else:
+                updatedConfigs.append(jsonConfig)
+                jsonConfig.mark_updated()
+                replacedFiles.append(('jsonFile', jsonConfig.jsonFile.name))
+            cls._populate_jsonconfig(multiScraperObject, jsonConfig, parsedContest.graph)
+            jsonConfig.jsonFile.save(desiredFilename, ContentFile(content), save=False)
+
+        JsonConfig.assign_unique_slugs(newConfigs)
+        for jsonConfig, _, _, parsedContest in contests:
+            replacedFiles.extend(viewUtils.store_precomputed_files(
+                jsonConfig, parsedContest.standardizedContent, parsedContest.artifactGraph))
+
+        with transaction.atomic():
+            JsonConfig.objects.bulk_create(newConfigs)
+            # Not every database sets the pks in bulk_create
+            pks = dict(JsonConfig.objects.filter(slug__in=[c.slug for c in newConfigs])
+                       .values_list('slug', 'pk'))
+            multiScraperObject.listOfElections.add(*[pks[c.slug] for c in newConfigs])
+            JsonConfig.objects.bulk_update(updatedConfigs, BULK_UPDATED_FIELDS)
+
+        for fieldName, name in replacedFiles:
+            storage = getattr(JsonConfig, fieldName).field.storage
+            delete_unless_referenced(JsonConfig, fieldName, storage, name)
+        CloudflareAPI.purge_vis_caches([jsonConfig.slug for jsonConfig in updatedConfigs])
+
     @classmethod
     def _populate_jsonconfig(cls, scraperObject, jsonConfig, graph):
         """ Populates an existing jsonconfig with metadata from scraperObject """
@@ -89,20 +319,44 @@ class ScrapeWorker():
         BaseVisualizationSerializer.populate_model_with_json_data(jsonConfig, graph)
 
     @classmethod
-    def scrape(cls, scraperObject, user):
+    def scrape(cls, scraperObject, user, download=None, isLeased=False):
         """
         Scrape for a single election
         May throw errors - be ready to handle them.
+        download, if given, is called instead of downloading the file here, e.g. to wait
+        on a download in progress elsewhere. It must return the ScrapedFile, or raise.
+        isLeased: the caller has already taken the lease, with acquire_lease.
+        Returns whether the jsonConfig was updated: False if nothing had changed.
         """
-        cls._assert_permissions(user)
+        with cls._lease(scraperObject, isLeased):
+            cls._assert_permissions(user)
+            return cls._scrape_leased(scraperObject, user, download)
 
+    @classmethod
+    def _scrape_leased(cls, scraperObject, user, download):
         try:
             fromUrl = scraperObject.scrapableURL
 
-            fileObject = cls.download_limited_size(fromUrl, 1024 * 1024)
-            assert fileObject is not None
-
-            graph = validators.try_to_load_jsons(fileObject, None)
+            if download is None:
+                scrapedFile = cls.download_limited_size(
+                    fromUrl, MAX_SIZE_BYTES, headers=cls.get_conditional_headers(scraperObject))
+            else:
+                scrapedFile = download()
+            assert scrapedFile is not None
+
+            # Also compares to the jsonConfig, for scrapers which predate contentHash
+            jsonConfigs = cls._get_scraped_configs(scraperObject)
+            if cls._is_unchanged(scraperObject, scrapedFile) or \
+                    cls._find_unchanged(scraperObject, jsonConfigs,
+                                        scrapedFile.contentHash) is not None:
+                cls._record_unchanged(scraperObject, scrapedFile)
+                return False
+
+            fileObject = scrapedFile.fileObject
+            excludeFinalWinnerAndEliminatedCandidate = scraperObject.jsonConfig is not None and \
+                scraperObject.jsonConfig.excludeFinalWinnerAndEliminatedCandidate
+            parsedUpload = validators.parse_upload(fileObject, None,
+                                                   excludeFinalWinnerAndEliminatedCandidate)
 
             fileObject.seek(0)
             desiredFilename = os.path.basename(fromUrl)
@@ -113,60 +367,114 @@ class ScrapeWorker():
                 jsonConfig = scraperObject.jsonConfig
                 jsonConfig.jsonFile = File(fileObject, desiredFilename)
 
-            cls._populate_jsonconfig(scraperObject, jsonConfig, graph)
+            cls._populate_jsonconfig(scraperObject, jsonConfig, parsedUpload.graph)
             jsonConfig.save()
+            viewUtils.refresh_precomputed_files(jsonConfig, parsedUpload)
 
             scraperObject.jsonConfig = jsonConfig
-            scraperObject.lastSuccessfulScrape = timezone.now()
-            scraperObject.save()
-        except Exception as exc:  # pylint: disable=broad-except
-            cls._log_and_rethrow_exception(scraperObject, exc)
+            cls._record_success(scraperObject, scrapedFile)
+            scraperObject.save(update_fields=['jsonConfig'] + SCRAPE_RESULT_FIELDS)
+            return True
+        except Exception:
+            cls._log_failure(scraperObject)
+            raise
 
     @classmethod
-    def multi_scrape(cls, multiScraperObject, user):
+    def multi_scrape(cls, multiScraperObject, user, download=None, isLeased=False):
         """
         May throw errors - be ready to handle them.
         Scrapes the source for a list of elections, then updates and creates any visualization
         that doesn't match the list. Will not delete outdated visualizations, in case there's
         a parsing error - we don't want to release those URLs.
+        download and isLeased are as for scrape.
+        Returns whether any visualization was updated or created.
         """
-        cls._assert_permissions(user)
+        with cls._lease(multiScraperObject, isLeased):
+            cls._assert_permissions(user)
+            return cls._multi_scrape_leased(multiScraperObject, user, download)
+
+    @classmethod
+    def _get_contest_pool(cls):
+        """ The process pool shared by every multi-scrape in this process, or None for no pool """
+        with cls._contestPoolLock:
+            if cls._contestPool is None and settings.MULTI_SCRAPE_MAX_PROCESSES > 1:
+                # Spawned, not forked: forking a process with threads and connections is unsafe
+                cls._contestPool = ProcessPoolExecutor(
+                    max_workers=settings.MULTI_SCRAPE_MAX_PROCESSES,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=django.setup)
+            return cls._contestPool
+
+    @classmethod
+    def _parse_contests(cls, contents):
+        """ Runs parse_contest on each content, on the process pool if there is one """
+        pool = cls._get_contest_pool()
+        if pool is None:
+            return [parse_contest(content) for content in contents]
+        try:
+            return list(pool.map(parse_contest, contents))
+        except BrokenProcessPool:
+            # A worker died: start a new pool next time
+            with cls._contestPoolLock:
+                cls._contestPool = None
+            raise
+
+    @classmethod
+    def _explode_changed_contests(cls, multiScraperObject, fileObject, jsonConfigs):
+        """
+        Explodes the multi-contest file, and returns a list of (content, contentHash) of each
+        contest, except those which one of the jsonConfigs is already up-to-date with
+        """
+        upToDateHashes = {jsonConfig.jsonFileHash for jsonConfig in jsonConfigs
+                          if jsonConfig.dataSourceURL == multiScraperObject.sourceURL and
+                          jsonConfig.areResultsCertified == multiScraperObject.areResultsCertified}
+        contests = []
+        for namedTempFile in DMC.explode_to_files(fileObject).values():
+            # boto forces us to open this as rb, and it won't fail local tests
+            # since locally we don't use boto :(
+            with open(namedTempFile.name, 'rb') as f:
+                content = f.read()
+            contentHash = hashlib.sha256(content).hexdigest()
+            if contentHash not in upToDateHashes:
+                contests.append((content, contentHash))
+        return contests
+
+    @classmethod
+    def _multi_scrape_leased(cls, multiScraperObject, user, download):  # pylint: disable=too-many-locals
         try:
             fromUrl = multiScraperObject.scrapableURL
-            multiFileObject = cls.download_limited_size(fromUrl, 1024 * 1024 * 5)
-            assert multiFileObject is not None
-
-            titlesToNamedTempFiles = DMC.explode_to_files(multiFileObject)
-
-            for title, namedTempFile in titlesToNamedTempFiles.items():
-                # boto forces us to open this as rb, and it won't fail local tests
-                # since locally we don't use boto :(
-                with open(namedTempFile.name, 'rb') as f:
-                    graph = validators.try_to_load_jsons(namedTempFile, None)
-
-                    desiredFilename = f'{os.path.basename(fromUrl)}-{slugify(title)}.json'
-
-                    try:
-                        # Note: make sure you use graph.title, as it trims, to find in the db
-                        jsonConfig = multiScraperObject.listOfElections.get(title=graph.title)
-                        jsonConfig.jsonFile = File(f, desiredFilename)
-                        wasAdded = False
-                    except ObjectDoesNotExist:
-                        jsonConfig = JsonConfig(jsonFile=File(f, desiredFilename))
-                        jsonConfig.owner = user
-                        wasAdded = True
-
-                    jsonConfig.dataSourceURL = multiScraperObject.sourceURL
-                    jsonConfig.areResultsCertified = multiScraperObject.areResultsCertified
-
-                    BaseVisualizationSerializer.populate_model_with_json_data(jsonConfig, graph)
-                    cls._populate_jsonconfig(multiScraperObject, jsonConfig, graph)
-                    jsonConfig.save()
-
-                    if wasAdded:
-                        multiScraperObject.listOfElections.add(jsonConfig)
-
-            multiScraperObject.lastSuccessfulScrape = timezone.now()
-            multiScraperObject.save()
-        except Exception as exc:  # pylint: disable=broad-except
-            cls._log_and_rethrow_exception(multiScraperObject, exc)
+            if download is None:
+                scrapedFile = cls.download_limited_size(
+                    fromUrl, MAX_MULTI_SIZE_BYTES,
+                    headers=cls.get_conditional_headers(multiScraperObject))
+            else:
+                scrapedFile = download()
+            assert scrapedFile is not None
+            if cls._is_unchanged(multiScraperObject, scrapedFile):
+                cls._record_unchanged(multiScraperObject, scrapedFile)
+                return False
+
+            jsonConfigs = list(multiScraperObject.listOfElections.all())
+            contests = cls._explode_changed_contests(multiScraperObject, scrapedFile.fileObject,
+                                                     jsonConfigs)
+            parsedContests = cls._parse_contests([content for content, _ in contests])
+
+            # Note: make sure you use graph.title, as it trims, to find in the db
+            configsByTitle = {jsonConfig.title: jsonConfig for jsonConfig in jsonConfigs}
+            toWrite = {}
+            for (content, _), parsedContest in zip(contests, parsedContests):
+                graph = parsedContest.graph
+                jsonConfig = configsByTitle.get(graph.title)
+                if jsonConfig is None:
+                    jsonConfig = JsonConfig(owner=user)
+                    configsByTitle[graph.title] = jsonConfig
+                desiredFilename = f'{os.path.basename(fromUrl)}-{slugify(graph.title)}.json'
+                toWrite[graph.title] = (jsonConfig, desiredFilename, content, parsedContest)
+
+            cls._write_contests(multiScraperObject, toWrite.values())
+            cls._record_success(multiScraperObject, scrapedFile)
+            multiScraperObject.save(update_fields=SCRAPE_RESULT_FIELDS)
+            return bool(toWrite)
+        except Exception:
+            cls._log_failure(multiScraperObject)
+            raise
@@ -5,15 +5,25 @@ and if somehow ScrapeWorker.scrape is called without hitting a permission check,
 an error is raised (to future-proof that dangerous function).
 """
 
+import time
+from io import StringIO
+
 from django.core.exceptions import PermissionDenied
-from django.test import TestCase
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from mock import patch
+import requests
 from requests_mock import Mocker
 from rest_framework import status
 
-from common.testUtils import TestHelpers
-from scraper.models import MultiScraper, Scraper
-from scraper.scrapeWorker import ScrapeWorker, FileTooLargeException
+from common.compressedFiles import open_decompressed
+from common.testUtils import FakeElectionSource, TestHelpers
+from scraper.downloader import Downloader
+from scraper.models import MultiScraper, Scraper, ScrapeOutcomes, ScrapeRun
+from scraper.scheduler import ScrapeScheduler
+from scraper.scrapeWorker import ScrapeWorker, FileTooLargeException, ScrapeInProgressException
 from visualizer.graph.graphCreator import BadJSONError
 from visualizer.models import JsonConfig
 from visualizer.tests import filenames
@@ -157,6 +167,27 @@ class ScraperTests(TestCase):
         self.assertNotEqual(lastSuccessfulScrape, scraper.lastSuccessfulScrape)
         self.assertEqual(3, scraper.jsonConfig.numRounds)
 
+    @Mocker()
+    def test_unchanged_scrape_does_nothing(self, requestMock):
+        """ Scraping the same file again doesn't revalidate, save or purge the jsonConfig """
+        TestHelpers.login_with_scrape_permissions(self.client)
+        scraper = TestHelpers.make_scraper()
+        TestHelpers.mock_scraper_url_with_file(requestMock, filename=filenames.ONE_ROUND)
+        self.client.get(reverse('scrapeNow', args=(scraper.pk,)))
+        scraper = Scraper.objects.get(pk=scraper.pk)
+        cacheVersion = scraper.jsonConfig.cacheVersion
+        lastSuccessfulScrape = scraper.lastSuccessfulScrape
+
+        with patch('visualizer.validators.parse_upload') as mockValidate, \
+                patch('visualizer.models.CloudflareAPI.purge_vis_cache') as mockPurge:
+            self.client.get(reverse('scrapeNow', args=(scraper.pk,)))
+        mockValidate.assert_not_called()
+        mockPurge.assert_not_called()
+
+        scraper = Scraper.objects.get(pk=scraper.pk)
+        self.assertEqual(scraper.jsonConfig.cacheVersion, cacheVersion)
+        self.assertNotEqual(scraper.lastSuccessfulScrape, lastSuccessfulScrape)
+
     @Mocker()
     def test_fails_when_file_too_large(self, requestMock):
         """ Don't allow streaming giant files """
@@ -172,6 +203,18 @@ class ScraperTests(TestCase):
         with self.assertRaises(FileTooLargeException):
             self.client.get(reverse('scrapeNow', args=(scraper.pk,)))
 
+    @Mocker()
+    def test_response_closed_on_failure(self, requestMock):
+        """ Failed downloads don't hold on to their pooled connection """
+        requestMock.get('mock://error', status_code=500)
+        requestMock.get('mock://too-large', content=b'{}', headers={'Content-Length': '100'})
+        for url, exception in (('mock://error', requests.HTTPError),
+                               ('mock://too-large', FileTooLargeException)):
+            with patch.object(requests.Response, 'close', autospec=True) as mockClose, \
+                    self.assertRaises(exception):
+                ScrapeWorker.download_limited_size(url, maxSizeBytes=10)
+            mockClose.assert_called()
+
     @Mocker()
     def test_multi_scraper(self, requestMock):
         """ Don't allow streaming giant files """
@@ -195,6 +238,269 @@ class ScraperTests(TestCase):
         self.assertIsNone(scraper.lastFailedScrape)
         self.assertIsNotNone(scraper.lastSuccessfulScrape)
 
-        # When scraping again, it updates instead of adding
+        # When scraping again, it updates instead of adding - here, nothing has changed
+        cacheVersions = set(JsonConfig.objects.values_list('cacheVersion', flat=True))
         self.client.get(reverse('multiScrapeNow', args=(scraper.pk,)))
         self.assertEqual(JsonConfig.objects.count(), 25)
+        self.assertEqual(set(JsonConfig.objects.values_list('cacheVersion', flat=True)),
+                         cacheVersions)
+
+
+class ConditionalScrapeTests(TestCase):
+    """ Scraping a local stand-in for the source, which supports conditional requests """
+
+    def setUp(self):
+        self.user = TestHelpers.login_with_scrape_permissions(self.client)
+
+    @classmethod
+    def _read(cls, filename):
+        with open(filename, 'rb') as f:
+            return f.read()
+
+    def _scrape(self, scraper):
+        """ Scrapes as if in a new request, returning whether anything was updated """
+        return ScrapeWorker.scrape(Scraper.objects.get(pk=scraper.pk), self.user)
+
+    def test_not_modified(self):
+        """ A 304 updates nothing but lastSuccessfulScrape, and a new version is scraped """
+        with FakeElectionSource(self._read(filenames.ONE_ROUND)) as source:
+            scraper = Scraper.objects.create(scrapableURL=source.url(), sourceURL='mock://source')
+            self.assertTrue(self._scrape(scraper))
+            scraper = Scraper.objects.get(pk=scraper.pk)
+            self.assertEqual(scraper.etag, source.etag)
+            self.assertEqual(scraper.lastModified, source.lastModified)
+            cacheVersion = scraper.jsonConfig.cacheVersion
+
+            with patch('visualizer.validators.parse_upload') as mockValidate, \
+                    patch('visualizer.models.CloudflareAPI.purge_vis_cache') as mockPurge:
+                self.assertFalse(self._scrape(scraper))
+            mockValidate.assert_not_called()
+            mockPurge.assert_not_called()
+            statusCode, headers, _ = source.requests[-1]
+            self.assertEqual(statusCode, 304)
+            self.assertEqual(headers['If-None-Match'], source.etag)
+            newScraper = Scraper.objects.get(pk=scraper.pk)
+            self.assertEqual(newScraper.jsonConfig.cacheVersion, cacheVersion)
+            self.assertGreater(newScraper.lastSuccessfulScrape, scraper.lastSuccessfulScrape)
+
+            source.set_content(self._read(filenames.THREE_ROUND))
+            self.assertTrue(self._scrape(scraper))
+            self.assertEqual(source.requests[-1][0], 200)
+            self.assertEqual(Scraper.objects.get(pk=scraper.pk).jsonConfig.numRounds, 3)
+
+    def test_same_content(self):
+        """ Without conditional requests, the same content is recognized by its hash """
+        content = self._read(filenames.ONE_ROUND)
+        with FakeElectionSource(content, supportsConditionalRequests=False) as source:
+            scraper = Scraper.objects.create(scrapableURL=source.url(), sourceURL='mock://source')
+            self.assertTrue(self._scrape(scraper))
+
+            # The transfer was gzipped, but the original is stored
+            self.assertTrue(source.requests[-1][2])
+            jsonFile = Scraper.objects.get(pk=scraper.pk).jsonConfig.jsonFile
+            with jsonFile.open('rb') as f:
+                self.assertEqual(open_decompressed(f).read(), content)
+
+            with patch('visualizer.models.CloudflareAPI.purge_vis_cache') as mockPurge:
+                self.assertFalse(self._scrape(scraper))
+            mockPurge.assert_not_called()
+            self.assertEqual([statusCode for statusCode, _, _ in source.requests], [200, 200])
+
+    def test_changed_settings(self):
+        """ Once the scraper's settings change, requests aren't conditional until it's scraped """
+        with FakeElectionSource(self._read(filenames.ONE_ROUND)) as source:
+            scraper = Scraper.objects.create(scrapableURL=source.url(), sourceURL='mock://source')
+            self._scrape(scraper)
+            Scraper.objects.filter(pk=scraper.pk).update(areResultsCertified=True)
+
+            self.assertTrue(self._scrape(scraper))
+            statusCode, headers, _ = source.requests[-1]
+            self.assertEqual(statusCode, 200)
+            self.assertNotIn('If-None-Match', headers)
+            self.assertTrue(Scraper.objects.get(pk=scraper.pk).jsonConfig.areResultsCertified)
+
+    def test_multi_scraper_not_modified(self):
+        """ A multi-scraper doesn't even parse a source which answers 304 """
+        with FakeElectionSource(self._read(filenames.MULTI_SCRAPE)) as source:
+            scraper = MultiScraper.objects.create(scrapableURL=source.url('/multi.xml'),
+                                                  sourceURL='mock://source')
+            ScrapeWorker.multi_scrape(scraper, self.user)
+            self.assertEqual(scraper.listOfElections.count(), 25)
+
+            with patch('scraper.scrapeWorker.DMC.explode_to_files') as mockExplode:
+                ScrapeWorker.multi_scrape(MultiScraper.objects.get(pk=scraper.pk), self.user)
+            mockExplode.assert_not_called()
+            self.assertEqual(source.requests[-1][0], 304)
+
+    @override_settings(MULTI_SCRAPE_MAX_PROCESSES=2)
+    def test_multi_scraper_in_parallel(self):
+        """ Contests are parsed on a process pool, then written and purged in bulk """
+        TestHelpers.setup_host_mocks(self)
+        with FakeElectionSource(self._read(filenames.MULTI_SCRAPE)) as source:
+            scraper = MultiScraper.objects.create(scrapableURL=source.url('/multi.xml'),
+                                                  sourceURL='mock://source')
+            self.assertTrue(ScrapeWorker.multi_scrape(scraper, self.user))
+            configs = list(scraper.listOfElections.all())
+            self.assertEqual(len({config.slug for config in configs}), 25)
+            self.assertTrue(all(config.standardizedJsonFile and config.graphArtifact
+                                for config in configs))
+            response = self.client.get(reverse('visualize', args=(configs[0].slug,)))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            # Every contest is out of date once the scraper's settings change
+            MultiScraper.objects.filter(pk=scraper.pk).update(areResultsCertified=True)
+            with patch('common.cloudflare.CloudflareAPI.purge_paths_cache') as mockPurge:
+                self.assertTrue(ScrapeWorker.multi_scrape(
+                    MultiScraper.objects.get(pk=scraper.pk), self.user))
+            mockPurge.assert_called_once()
+            self.assertEqual(len(mockPurge.call_args[0][0]), 25 * 8)
+
+        updatedConfigs = list(scraper.listOfElections.all())
+        self.assertEqual([config.pk for config in updatedConfigs],
+                         [config.pk for config in configs])
+        for config, updatedConfig in zip(configs, updatedConfigs):
+            self.assertTrue(updatedConfig.areResultsCertified)
+            self.assertNotEqual(updatedConfig.cacheVersion, config.cacheVersion)
+            self.assertFalse(default_storage.exists(config.graphArtifact.name))
+            self.assertTrue(default_storage.exists(updatedConfig.graphArtifact.name))
+
+
+@override_settings(SCRAPE_MIN_SECONDS_BETWEEN_HOST_REQUESTS=0)
+class ScrapeSchedulerTests(TestCase):
+    """ Polling scrapers on their own schedules, from local stand-ins for their sources """
+
+    def setUp(self):
+        self.user = TestHelpers.login_with_scrape_permissions(self.client)
+        self.scheduler = ScrapeScheduler(self.user)
+
+    @classmethod
+    def _read(cls, filename):
+        with open(filename, 'rb') as f:
+            return f.read()
+
+    @classmethod
+    def _make_due(cls):
+        Scraper.objects.update(nextScrapeAt=None)
+        MultiScraper.objects.update(nextScrapeAt=None)
+
+    def test_adaptive_backoff(self):
+        """ Polls less often while nothing changes, and at the minimum again once it does """
+        with FakeElectionSource(self._read(filenames.ONE_ROUND)) as source:
+            scraper = Scraper.objects.create(scrapableURL=source.url(), sourceURL='mock://source',
+                                             isPolling=True, minPollSeconds=60,
+                                             maxPollSeconds=240)
+            Scraper.objects.create(scrapableURL=source.url(), sourceURL='mock://other')
+
+            outcomes = []
+            pollSeconds = []
+            for _ in range(4):
+                self._make_due()
+                outcomes.extend(run.outcome for run in self.scheduler.tick())
+                pollSeconds.append(Scraper.objects.get(pk=scraper.pk).pollSeconds)
+            self.assertEqual(outcomes, [ScrapeOutcomes.UPDATED] + [ScrapeOutcomes.UNCHANGED] * 3)
+            self.assertEqual(pollSeconds, [60, 120, 240, 240])
+            self.assertEqual([statusCode for statusCode, _, _ in source.requests],
+                             [200, 304, 304, 304])
+
+            # Not due yet
+            self.assertEqual(self.scheduler.tick(), [])
+            self.assertEqual(len(source.requests), 4)
+
+            source.set_content(self._read(filenames.THREE_ROUND))
+            self._make_due()
+            run, = self.scheduler.tick()
+            self.assertEqual(run.outcome, ScrapeOutcomes.UPDATED)
+            self.assertEqual(run.scraper, scraper)
+            self.assertGreater(run.latencySeconds, 0)
+            scraper = Scraper.objects.get(pk=scraper.pk)
+            self.assertEqual(scraper.pollSeconds, 60)
+            self.assertEqual(scraper.jsonConfig.numRounds, 3)
+            self.assertGreater(scraper.nextScrapeAt, run.startedAt)
+
+    def test_failures_back_off(self):
+        """ A failing source is recorded, and polled less often too """
+        with FakeElectionSource(b'not json') as source:
+            Scraper.objects.create(scrapableURL=source.url(), sourceURL='mock://source',
+                                   isPolling=True, minPollSeconds=60)
+            for expectedPollSeconds in (120, 240):
+                self._make_due()
+                run, = self.scheduler.tick()
+                self.assertEqual(run.outcome, ScrapeOutcomes.FAILED)
+                self.assertTrue(run.error)
+                self.assertEqual(Scraper.objects.get().pollSeconds, expectedPollSeconds)
+
+    def test_never_scraped_twice_at_once(self):
+        """ While a scraper is being scraped, it can't be scraped again, nor is it due """
+        with FakeElectionSource(self._read(filenames.ONE_ROUND)) as source:
+            scraper = Scraper.objects.create(scrapableURL=source.url(), sourceURL='mock://source',
+                                             isPolling=True)
+            with ScrapeWorker._lease(Scraper.objects.get(pk=scraper.pk)):  # pylint: disable=protected-access
+                with self.assertRaises(ScrapeInProgressException):
+                    ScrapeWorker.scrape(Scraper.objects.get(pk=scraper.pk), self.user)
+                self.assertEqual(self.scheduler.tick(), [])
+            self.assertEqual(source.requests, [])
+            self.assertIsNone(Scraper.objects.get(pk=scraper.pk).scrapeLeaseExpiresAt)
+
+            run, = self.scheduler.tick()
+            self.assertEqual(run.outcome, ScrapeOutcomes.UPDATED)
+            self.assertIsNone(Scraper.objects.get(pk=scraper.pk).scrapeLeaseExpiresAt)
+
+    def test_download_fails_to_start(self):
+        """ If a download can't even start, the scraper fails and is released, and the rest run """
+        with FakeElectionSource(self._read(filenames.ONE_ROUND)) as source:
+            for _ in range(2):
+                Scraper.objects.create(scrapableURL=source.url(), sourceURL='mock://source',
+                                       isPolling=True)
+            submit = Downloader.submit
+            with patch('scraper.scheduler.Downloader.submit',
+                       side_effect=[RuntimeError("No threads left"),
+                                    submit(source.url(), {})]):
+                runs = self.scheduler.tick()
+        self.assertEqual(sorted((run.outcome, run.error) for run in runs),
+                         [(ScrapeOutcomes.UPDATED, ''),
+                          (ScrapeOutcomes.FAILED, "No threads left")])
+        self.assertFalse(Scraper.objects.filter(scrapeLeaseExpiresAt__isnull=False).exists())
+        self.assertFalse(Scraper.objects.filter(nextScrapeAt__isnull=True).exists())
+
+    @override_settings(SCRAPE_MIN_SECONDS_BETWEEN_HOST_REQUESTS=0.2)
+    def test_host_rate_limit(self):
+        """ Requests to the same host are spaced out """
+        requestTimes = []
+        download = ScrapeWorker.download_limited_size
+
+        def timed_download(*args, **kwargs):
+            requestTimes.append(time.monotonic())
+            return download(*args, **kwargs)
+
+        with FakeElectionSource(self._read(filenames.ONE_ROUND)) as source:
+            for i in range(3):
+                Scraper.objects.create(scrapableURL=source.url(f'/{i}.json'),
+                                       sourceURL='mock://source', isPolling=True)
+            with patch('scraper.scrapeWorker.ScrapeWorker.download_limited_size',
+                       side_effect=timed_download):
+                runs = self.scheduler.tick()
+
+        self.assertEqual([run.outcome for run in runs], [ScrapeOutcomes.UPDATED] * 3)
+        requestTimes.sort()
+        for before, after in zip(requestTimes, requestTimes[1:]):
+            self.assertGreaterEqual(after - before, 0.19)
+
+    def test_command(self):
+        """ The command scrapes whatever is due, including multi-scrapers """
+        with FakeElectionSource(self._read(filenames.ONE_ROUND)) as source, \
+                FakeElectionSource(self._read(filenames.MULTI_SCRAPE)) as multiSource:
+            Scraper.objects.create(scrapableURL=source.url(), sourceURL='mock://source',
+                                   isPolling=True)
+            multiScraper = MultiScraper.objects.create(scrapableURL=multiSource.url('/multi.xml'),
+                                                       sourceURL='mock://source',
+                                                       isPolling=True)
+            out = StringIO()
+            call_command('runScrapeScheduler', username=self.user.username, once=True,
+                         stdout=out)
+
+        self.assertEqual(out.getvalue().count('The visualizations were updated'), 2)
+        self.assertEqual(multiScraper.listOfElections.count(), 25)
+        self.assertEqual(ScrapeRun.objects.filter(multiScraper=multiScraper).count(), 1)
+
+        with self.assertRaises(CommandError):
+            call_command('runScrapeScheduler', username='nobody', once=True)
@@ -42,15 +42,25 @@ elif [ "$CI_NODE_TOTAL" -eq 3 ]; then
 
     echo "Starting tests"
     $RUN test visualizer/tests/testBallotpediaRestApi.py\
+              visualizer/tests/testCacheVersions.py\
+              visualizer/tests/testCloudflarePurge.py\
+              visualizer/tests/testCompressedFiles.py\
+              visualizer/tests/testConditionalGet.py\
               visualizer/tests/testDataTables.py\
               visualizer/tests/testDataTablesHeadlessBrowser.py\
               visualizer/tests/testFaq.py\
+              visualizer/tests/testGraphArtifact.py\
+              visualizer/tests/testMigrationEngine.py\
               visualizer/tests/testModelDeletion.py\
               visualizer/tests/testRawData.py\
               visualizer/tests/testRestApi.py\
               visualizer/tests/testRestApiExampleCode.py\
               visualizer/tests/testSidecar.py\
-              visualizer/tests/testSimple.py
+              visualizer/tests/testSimple.py\
+              visualizer/tests/testStorageCache.py\
+              visualizer/tests/testSvg.py\
+              visualizer/tests/testVisualizationData.py\
+              visualizer/tests/testVoteMatrix.py
   else
     # Should never happen
     exit -1
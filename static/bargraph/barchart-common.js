@@ -9,3 +9,30 @@ function fixMaxWidthFor(elementId, numCandidates) {
     document.getElementById(elementId).style.minWidth = "300px"; // smallest supported screen size
     document.getElementById(elementId).style.maxWidth = currPixelRatio*maxWidth + "px";
 }
+
+// Expands the columnar data from D3Bargraph into a fresh copy of the arguments makeBarGraph
+// expects: candidateVoteCounts is a list of dicts, one per candidate, mapping
+// .candidate to the name and each humanFriendlyRoundName to the votes added that round.
+// A fresh copy is returned each time because makeBarGraph modifies it.
+function expandBargraphData(data) {
+    const candidateVoteCounts = data.candidates.map(function(name) {
+        return {candidate: name};
+    });
+    data.votesAddedPerRound.forEach(function(votesAdded, round_i) {
+        const roundName = data.humanFriendlyRoundNames[round_i];
+        votesAdded.forEach(function(votes, candidate_i) {
+            if (votes !== null) {
+                candidateVoteCounts[candidate_i][roundName] = votes;
+            }
+        });
+    });
+
+    return {
+        candidateVoteCounts: candidateVoteCounts,
+        humanFriendlyRoundNames: data.humanFriendlyRoundNames.slice(),
+        threshold: data.threshold,
+        longestLabelApxWidth: data.longestLabelApxWidth,
+        totalVotesPerRound: data.totalVotesPerRound.slice(),
+        numRoundsTilWin: Object.assign({}, data.numRoundsTilWin)
+    };
+}
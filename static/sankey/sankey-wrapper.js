@@ -1,4 +1,33 @@
-function makeSankey(graph, numRounds, numCandidates, longestLabelApxWidth, totalVotesPerRound, colorThemeIndex) {
+// Expands the columnar data from D3Sankey into the graph of nodes and links
+// that makeSankey expects. Links refer to nodes by their index in the graph.
+function expandSankeyData(data) {
+  const graph = {"nodes": [], "links": []};
+  const nodes = data.nodes;
+  for (let i = 0; i < nodes.candidate.length; ++i) {
+    graph.nodes.push({
+      "name": data.candidates[nodes.candidate[i]],
+      "round": nodes.round[i],
+      "value": nodes.value[i],
+      "isWinner": nodes.isWinner[i],
+      "isEliminated": nodes.isEliminated[i],
+      "index": String(nodes.candidate[i])
+    });
+  }
+
+  const links = data.links;
+  for (let i = 0; i < links.source.length; ++i) {
+    graph.links.push({
+      "source": links.source[i],
+      "target": links.target[i],
+      "candidateIndex": links.candidate[i],
+      "value": links.value[i]
+    });
+  }
+  return graph;
+}
+
+// The layout is computed on the server: see sankeyLayout.py
+function makeSankey(graph, layout, numRounds, numCandidates, longestLabelApxWidth, totalVotesPerRound, colorThemeIndex) {
   // Below are crazy heuristics to try to get the graph to look good
   // on a variety of sizes.
   const units = "Votes";
@@ -163,7 +192,7 @@ function makeSankey(graph, numRounds, numCandidates, longestLabelApxWidth, total
       sankey
         .nodes(graph.nodes)
         .links(graph.links)
-        .layout(32);
+        .applyLayout(layout);
 
       // the function for moving the nodes
       function dragmove(d) {
@@ -47,6 +47,26 @@ d3.sankey = function(totalSize0) {
     return sankey;
   };
 
+  // Places the nodes and links where SankeyLayout (sankeyLayout.py) computed they go,
+  // instead of computing the layout here
+  sankey.applyLayout = function(layout) {
+    computeNodeLinks();
+    nodes.forEach(function(node, i) {
+      set_dim0(node, layout.nodes.dim0[i]);
+      set_ddim0(node, nodeSize0);
+      set_dim1(node, layout.nodes.dim1[i]);
+      set_ddim1(node, layout.nodes.size1[i]);
+    });
+    links.forEach(function(link, i) {
+      set_ddim1(link, layout.links.size1[i]);
+      link.source_ddim1scalar = layout.links.sourceScalar[i];
+      link.target_ddim1scalar = layout.links.targetScalar[i];
+      link.sdim1 = layout.links.sourceOffset[i];
+      link.tdim1 = layout.links.targetOffset[i];
+    });
+    return sankey;
+  };
+
   sankey.relayout = function() {
     computeLinkDepths();
     return sankey;
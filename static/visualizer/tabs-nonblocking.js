@@ -97,6 +97,9 @@ document.getElementById("make-interactive").addEventListener("click", function(e
   return false;
 });
 
-loadTabFromTag();
-hideTabsBasedOnConfig()
+// The visualizations are drawn once their data is loaded
+visualizationDataReady.then(function() {
+  loadTabFromTag();
+  hideTabsBasedOnConfig()
+});
 window.addEventListener("hashchange", loadTabFromTag, false);
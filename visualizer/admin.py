@@ -3,7 +3,7 @@ from admin_cursor_paginator import CursorPaginatorAdmin
 from django.contrib.auth.models import Permission
 from django.contrib import admin
 
-from common.viewUtils import request_to_domain
+from common.viewUtils import refresh_precomputed_files, request_to_domain
 from visualizer import models
 from movie.tasks import launch_big_dynos, create_movie_task
 
@@ -49,6 +49,10 @@ class JsonAdmin(CursorPaginatorAdmin):
         'uploadedAt',
         'movieGenerationStatus')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        refresh_precomputed_files(obj)
+
 
 @admin.register(models.HomepageFeaturedElection)
 class HomepageFeaturedElectionAdmin(admin.ModelAdmin):
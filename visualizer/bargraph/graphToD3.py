@@ -1,10 +1,12 @@
-import json
-
-from visualizer.jsUtils import approx_length
+from visualizer.jsUtils import approx_length, compact_numbers
 
 
 class D3Bargraph:
-    js: str  # We just...throw all the javascript into here
+    """
+    The data for the bar graphs, in columns: candidate names are listed once, then the votes
+    added to each candidate in each round. expandBargraphData (barchart-common.js) turns it
+    back into the list of dicts, keyed by round name, that d3.stack expects.
+    """
 
     def __init__(self, graph):
         numRounds = len(graph.nodesPerRound)
@@ -15,17 +17,14 @@ class D3Bargraph:
         rounds = summary.rounds
         assert (len(rounds) == numRounds)
 
-        # Convert the candidates structure to one for the javascript:
-        # A list of dictionaries, each dict mapping a label to a vote count
-        candidatesJs = []
+        # One list per round, with the votes added to each candidate in that round,
+        # or None for candidates with no votes that round
+        votesAddedPerRound = [[] for _ in range(numRounds)]
         for candidate in candidates.values():
-            candidateJs = {'candidate': candidate.name}
-            for i, votes in enumerate(candidate.votesAddedPerRound):
-                candidateJs[get_label_for(rounds, i)] = votes
-            candidatesJs.append(candidateJs)
-
-        # Get the total votes per round
-        totalVotesPerRound = [r.totalActiveVotes for r in rounds]
+            candidateVotes = compact_numbers(candidate.votesAddedPerRound)
+            for i in range(numRounds):
+                votesAddedPerRound[i].append(candidateVotes[i] if i < len(candidateVotes)
+                                             else None)
 
         # Make round labels
         roundLabels = [get_label_for(rounds, i) for i in range(numRounds)]
@@ -39,13 +38,15 @@ class D3Bargraph:
         longestLabelApxWidth = max([approx_length(n.label)
                                     for n in graph.nodesPerRound[0].values()])
 
-        js = f'var candidateVoteCounts = {candidatesJs};'
-        js += f'\nvar humanFriendlyRoundNames = {json.dumps(list(roundLabels))};'
-        js += f'\nvar threshold = {json.dumps(graph.threshold)};'
-        js += f'\nvar longestLabelApxWidth = {json.dumps(longestLabelApxWidth)};'
-        js += f'\nvar totalVotesPerRound = {json.dumps(totalVotesPerRound)};'
-        js += f'\nvar numRoundsTilWin = {json.dumps(numRoundsTilWin)};'
-        self.js = js
+        self.data = {
+            'candidates': [candidate.name for candidate in candidates.values()],
+            'votesAddedPerRound': votesAddedPerRound,
+            'humanFriendlyRoundNames': roundLabels,
+            'threshold': graph.threshold,
+            'longestLabelApxWidth': longestLabelApxWidth,
+            'totalVotesPerRound': [r.totalActiveVotes for r in rounds],
+            'numRoundsTilWin': numRoundsTilWin,
+        }
 
 
 def get_label_for(rounds, i):
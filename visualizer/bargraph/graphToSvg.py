@@ -0,0 +1,185 @@
+"""
+The fixed bar chart as a static SVG, drawn on the server from the data of D3Bargraph: for
+embeds without javascript, crawlers and link previews, and to show the chart before
+barchart.js has drawn it. Follows the non-interactive layout of barchart.js.
+"""
+
+from visualizer.colors import get_colors
+from visualizer.common import INACTIVE_TEXT, RESIDUAL_SURPLUS_TEXT, intify, percentify
+from visualizer.svgUtils import document, element, truncate
+
+# Of the viewbox, as in barchart.js
+WIDTH = 500
+MIN_CHART_HEIGHT = 350
+MIN_BAR_SIZE = 20
+MAX_BAR_SIZE = 70
+BAND_PADDING = 0.01
+LEGEND_LINE_HEIGHT = 18
+
+# The candidate names of the vertical chart are rotated by 45 degrees
+ROTATED_NAME_FACTOR = 0.7071
+APPROX_CHAR_WIDTH = 6.5
+MAX_NAME_LENGTH = 40
+
+SURPLUS_PATTERN_ID = 'svgSurplusHatch'
+
+
+def votes_and_percent_text(name, votes, totalVotes):
+    """ As votesAndPctToText in visualize-common.js """
+    if name == INACTIVE_TEXT:
+        return f'{intify(votes)} with no choices left'
+    percent = percentify(votes, totalVotes)
+    return f'{intify(votes)} ({percent})' if percent else intify(votes)
+
+
+class SvgBargraph:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """ The fixed bar chart of the bargraphData, drawn with the colors and layout of the config """
+
+    def __init__(self, bargraphData, config, title):
+        # Residual surplus isn't shown: see hideResidualSurplus in barchart.js
+        candidateIndices = [i for i, name in enumerate(bargraphData['candidates'])
+                            if name != RESIDUAL_SURPLUS_TEXT]
+        self.names = [bargraphData['candidates'][i] for i in candidateIndices]
+        self.votesAddedPerRound = [[votesAdded[i] for i in candidateIndices]
+                                   for votesAdded in bargraphData['votesAddedPerRound']]
+        self.roundNames = bargraphData['humanFriendlyRoundNames']
+        self.totalVotesPerRound = bargraphData['totalVotesPerRound']
+        self.winners = set(bargraphData['numRoundsTilWin'])
+        self.threshold = bargraphData['threshold']
+        self.isVertical = not config.doUseHorizontalBarGraph
+        self.colors = get_colors(config.colorTheme, len(self.roundNames))
+
+        numCandidates = len(self.names)
+        if self.isVertical:
+            longestName = max((len(truncate(name, MAX_NAME_LENGTH)) for name in self.names),
+                              default=0)
+            self.namesSize = longestName * APPROX_CHAR_WIDTH * ROTATED_NAME_FACTOR + 10
+            self.chartSize = MIN_CHART_HEIGHT
+            self.votesStart, self.votesEnd = self.chartSize, 30
+            self.bandsStart, self.bandsEnd = 20 + self.namesSize * ROTATED_NAME_FACTOR, WIDTH
+        else:
+            self.namesSize = 0
+            self.chartSize = min(max(MIN_CHART_HEIGHT, numCandidates * MIN_BAR_SIZE),
+                                 numCandidates * MAX_BAR_SIZE)
+            self.votesStart, self.votesEnd = 5, WIDTH - 10
+            self.bandsStart, self.bandsEnd = 10, self.chartSize
+
+        # As d3.scaleBand().padding(BAND_PADDING)
+        self.step = (self.bandsEnd - self.bandsStart) / max(1, numCandidates + BAND_PADDING)
+        self.bandwidth = self.step * (1 - BAND_PADDING)
+
+        self.maxVotes = max([self._get_total(i) for i in range(numCandidates)] +
+                            [self.threshold or 0, 1])
+
+        children = [self._make_defs()]
+        for i in range(numCandidates):
+            children.extend(self._make_bar(i))
+        if self.threshold is not None:
+            children.append(self._make_threshold())
+        legendTop = self.chartSize + self.namesSize + 20
+        children.extend(self._make_legend(legendTop))
+
+        height = legendTop + len(self.roundNames) * LEGEND_LINE_HEIGHT
+        self.svg = document(WIDTH, height, title, children)
+
+    def _get_votes_added(self, candidateIndex):
+        """ The votes added each round, until the candidate was eliminated """
+        votesAdded = []
+        for votesAddedThisRound in self.votesAddedPerRound:
+            votes = votesAddedThisRound[candidateIndex]
+            if votes is None:
+                break
+            votesAdded.append(votes)
+        return votesAdded
+
+    def _get_total(self, candidateIndex):
+        return sum(self._get_votes_added(candidateIndex))
+
+    def _votes_position(self, votes):
+        return self.votesStart + (self.votesEnd - self.votesStart) * votes / self.maxVotes
+
+    def _band_start(self, candidateIndex):
+        return self.bandsStart + self.step * (BAND_PADDING + candidateIndex)
+
+    def _make_rect(self, candidateIndex, fromVotes, toVotes, fill):
+        """ The segment of the candidate's bar between the two vote totals """
+        votesStart = self._votes_position(min(fromVotes, toVotes))
+        votesEnd = self._votes_position(max(fromVotes, toVotes))
+        bandStart = self._band_start(candidateIndex)
+        bandSize = self.bandwidth * 0.9
+        if self.isVertical:
+            return element('rect', x=bandStart, y=votesEnd, width=bandSize,
+                           height=votesStart - votesEnd, fill=fill)
+        return element('rect', x=votesStart, y=bandStart, width=votesEnd - votesStart,
+                       height=bandSize, fill=fill)
+
+    def _make_bar(self, candidateIndex):
+        """ The candidate's bar, one segment per round, and its labels """
+        name = self.names[candidateIndex]
+        votesAdded = self._get_votes_added(candidateIndex)
+        elements = []
+        total = 0
+        for roundIndex, votes in enumerate(votesAdded):
+            if votes < 0:
+                # A surplus transferred away
+                fill = f'url(#{SURPLUS_PATTERN_ID})'
+            elif name == INACTIVE_TEXT:
+                fill = '#FFFFFF'
+            else:
+                fill = self.colors[roundIndex]
+            if votes:
+                elements.append(self._make_rect(candidateIndex, total, total + votes, fill))
+            total += votes
+
+        isEliminated = len(votesAdded) < len(self.roundNames)
+        bandCenter = self._band_start(candidateIndex) + self.bandwidth * 0.45
+        if self.isVertical:
+            if isEliminated:
+                label = '❌'
+            else:
+                label = ('✔️ ' if name in self.winners else '') + intify(total)
+            elements.append(element('text', label, x=bandCenter,
+                                    y=self._votes_position(total) - 5,
+                                    text_anchor='middle', font_size=10))
+            namePosition = self.votesStart + 12
+            elements.append(element('text', truncate(name, MAX_NAME_LENGTH), x=bandCenter,
+                                    y=namePosition, text_anchor='end',
+                                    transform=f'rotate(-45 {bandCenter:.2f} {namePosition})'))
+        else:
+            if isEliminated:
+                label = 'eliminated'
+            else:
+                label = ('✔️ ' if name in self.winners else '') + \
+                    votes_and_percent_text(name, total, self.totalVotesPerRound[-1])
+            elements.append(element('text', truncate(name, MAX_NAME_LENGTH),
+                                    x=self.votesStart + 4, y=bandCenter,
+                                    dominant_baseline='central'))
+            elements.append(element('text', label, x=WIDTH - 20, y=bandCenter,
+                                    text_anchor='end', dominant_baseline='central'))
+        return elements
+
+    def _make_threshold(self):
+        position = self._votes_position(self.threshold)
+        tooltip = element('title', f'Threshold: {intify(self.threshold)}')
+        if self.isVertical:
+            return element('line', [tooltip], x1=self.bandsStart, x2=self.bandsEnd,
+                           y1=position, y2=position, stroke='#555', stroke_dasharray='4 2')
+        return element('line', [tooltip], x1=position, x2=position, y1=self.bandsStart,
+                       y2=self.bandsEnd, stroke='#555', stroke_dasharray='4 2')
+
+    @classmethod
+    def _make_defs(cls):
+        """ The hatching of transferred surpluses, as in barchart.js """
+        path = element('path', d='M-1,1 l2,-2 M0,4 l4,-4 M3,5 l2,-2', stroke='#888',
+                       stroke_width=1)
+        pattern = element('pattern', [path], id=SURPLUS_PATTERN_ID,
+                          patternUnits='userSpaceOnUse', width=4, height=4)
+        return element('defs', [pattern])
+
+    def _make_legend(self, top):
+        elements = []
+        for i, roundName in enumerate(self.roundNames):
+            y = top + i * LEGEND_LINE_HEIGHT
+            elements.append(element('rect', x=5, y=y, width=12, height=12, fill=self.colors[i]))
+            elements.append(element('text', roundName, x=22, y=y + 10, font_size=11))
+        return elements
@@ -0,0 +1,91 @@
+"""
+The color themes of static/visualizer/colors.js, for drawing on the server.
+Must be kept in sync with colors.js, so server- and client-drawn visualizations match.
+"""
+
+import math
+
+from visualizer.models import ColorTheme
+
+
+def _round_like_js(value):
+    """ Math.round: halves round up, rather than to even """
+    return math.floor(value + 0.5)
+
+
+def hex_to_rgb(hexColor):
+    """ Converts a #ffffff hex string into an [r, g, b] list """
+    return [int(hexColor[i:i + 2], 16) for i in (1, 3, 5)]
+
+
+def rgb_to_hex(rgb):
+    """ Inverse of the above """
+    return '#%02x%02x%02x' % tuple(rgb)
+
+
+def interpolate_color(color1, color2, factor):
+    """ Interpolates each channel of the colors, rounding as colors.js does """
+    return [_round_like_js(c1 + factor * (c2 - c1)) for c1, c2 in zip(color1, color2)]
+
+
+def lab_to_rgb(lab):
+    """ c/o https://github.com/antimatter15/rgb-lab/blob/master/color.js """
+    y = (lab[0] + 16) / 116
+    x = lab[1] / 500 + y
+    z = y - lab[2] / 200
+
+    x = 0.95047 * (x ** 3 if x ** 3 > 0.008856 else (x - 16 / 116) / 7.787)
+    y = 1.00000 * (y ** 3 if y ** 3 > 0.008856 else (y - 16 / 116) / 7.787)
+    z = 1.08883 * (z ** 3 if z ** 3 > 0.008856 else (z - 16 / 116) / 7.787)
+
+    r = x * 3.2406 + y * -1.5372 + z * -0.4986
+    g = x * -0.9689 + y * 1.8758 + z * 0.0415
+    b = x * 0.0557 + y * -0.2040 + z * 1.0570
+
+    def gamma(channel):
+        if channel > 0.0031308:
+            channel = 1.055 * channel ** (1 / 2.4) - 0.055
+        else:
+            channel = 12.92 * channel
+        return _round_like_js(max(0, min(1, channel)) * 255)
+
+    return [gamma(r), gamma(g), gamma(b)]
+
+
+def lab_to_hex(lab):
+    """ Converts an [L, a, b] list into a #ffffff hex string """
+    return rgb_to_hex(lab_to_rgb(lab))
+
+
+def _perceptually_linear_rainbow(total):
+    for i in range(total):
+        # c/o https://stackoverflow.com/a/30296361/1057105
+        alpha = i / total
+        radius = 60
+        yield lab_to_hex([80,
+                          radius * math.sin(2 * math.pi * alpha),
+                          radius * math.cos(2 * math.pi * alpha)])
+
+
+def _perceptually_linear_purple_to_orange(total):
+    start = [85, 14, -38]
+    end = [85, 13.5, 40]
+    for i in range(total):
+        yield lab_to_hex(interpolate_color(start, end, i / total))
+
+
+def _alternating_purple_orange(total):
+    for i in range(total):
+        yield lab_to_hex([85, 14, -40] if i % 2 == 0 else [85, 14, 40])
+
+
+COLOR_GENERATORS = {
+    ColorTheme.RAINBOW: _perceptually_linear_rainbow,
+    ColorTheme.PURPLE_TO_ORANGE: _perceptually_linear_purple_to_orange,
+    ColorTheme.ALTERNATING: _alternating_purple_orange,
+}
+
+
+def get_colors(colorTheme, total):
+    """ The list of total colors of the theme, as getColorGenerator(colorTheme) generates """
+    return list(COLOR_GENERATORS[colorTheme](total))
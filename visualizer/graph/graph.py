@@ -1,35 +1,96 @@
 """ Data that holds the entire Graph, as well as utilities for parsers to interactively
     build the graph. You probably don't want to use this directly, but instead,
     want to use the GraphSummary which is more user-friendly.
-    To get the summary, use graph.summarize(). """
+    To get the summary, use graph.summarize().
+
+    The votes are stored in a VoteMatrix: nodes, links and nodesPerRound are views over it. """
 
 import datetime
+from collections.abc import Mapping
+
+import numpy as np
 
 from visualizer.graph import rcvResult
 from visualizer.graph.graphSummary import GraphSummary
+from visualizer.graph.voteMatrix import VoteMatrix
 
 
-#pylint: disable=too-few-public-methods
 class LinkData:
     """ Data about a single "link": a transfer from the source to target """
+    __slots__ = ('graph', 'index')
+
+    def __init__(self, graph, index):
+        self.graph = graph
+        self.index = index
+
+    @property
+    def source(self):
+        """ The node votes are transferred from """
+        matrix = self.graph.matrix
+        return NodeData(self.graph, matrix.linkSources[self.index], matrix.linkRounds[self.index])
+
+    @property
+    def target(self):
+        """ The node votes are transferred to """
+        matrix = self.graph.matrix
+        return NodeData(self.graph,
+                        matrix.linkTargets[self.index],
+                        matrix.linkRounds[self.index] + 1)
 
-    def __init__(self, source, target, value):
-        self.source = source
-        self.target = target
-        self.value = value
+    @property
+    def value(self):
+        """ The number of votes transferred """
+        return self.graph.matrix.linkValues[self.index].item()
 
 
 class NodeData:
     """ Data about a single "node": a candidate in a single round """
-    #pylint: disable=too-many-arguments
+    __slots__ = ('graph', 'row', 'roundNum')
+
+    def __init__(self, graph, row, roundNum):
+        self.graph = graph
+        self.row = int(row)
+        self.roundNum = int(roundNum)
 
-    def __init__(self, item, label, count, roundNum):
-        self.item = item
-        self.label = label
-        self.count = count
-        self.roundNum = roundNum
-        self.isWinner = False
-        self.isEliminated = False
+    def __eq__(self, other):
+        return isinstance(other, NodeData) and self.graph is other.graph and \
+            self.row == other.row and self.roundNum == other.roundNum
+
+    def __hash__(self):
+        return hash((self.row, self.roundNum))
+
+    @property
+    def item(self):
+        """ The candidate this node belongs to """
+        return self.graph.matrix.items[self.row]
+
+    @property
+    def label(self):
+        """ The name to display """
+        return str(self.item.name)
+
+    @property
+    def count(self):
+        """ The number of votes for this candidate in this round """
+        return self.graph.matrix.get_count(self.row, self.roundNum)
+
+    @property
+    def isWinner(self):
+        """ Has this candidate won, in this round or a previous one? """
+        return bool(self.graph.matrix.isWinner[self.row, self.roundNum])
+
+    @isWinner.setter
+    def isWinner(self, isWinner):
+        self.graph.matrix.isWinner[self.row, self.roundNum] = isWinner
+
+    @property
+    def isEliminated(self):
+        """ Was this candidate eliminated in this round? """
+        return bool(self.graph.matrix.isEliminated[self.row, self.roundNum])
+
+    @isEliminated.setter
+    def isEliminated(self, isEliminated):
+        self.graph.matrix.isEliminated[self.row, self.roundNum] = isEliminated
 
     def mark_eliminated(self):
         """ Marks the given node as the node in which this candidate was eliminated """
@@ -40,14 +101,38 @@ class NodeData:
         self.isWinner = True
 
 
+class RoundNodes(Mapping):
+    """ The nodes in a single round, keyed by Item, in the order they were added """
+
+    def __init__(self, graph, round_i):
+        self.graph = graph
+        self.round_i = round_i
+
+    def __getitem__(self, item):
+        matrix = self.graph.matrix
+        row = matrix.rowOf.get(item)
+        if row is None or not matrix.present[row, self.round_i]:
+            raise KeyError(item)
+        return NodeData(self.graph, row, self.round_i)
+
+    def __iter__(self):
+        matrix = self.graph.matrix
+        return (matrix.items[row] for row in matrix.roundOrders[self.round_i].tolist())
+
+    def __len__(self):
+        return len(self.graph.matrix.roundOrders[self.round_i])
+
+
 #pylint: disable=too-many-instance-attributes
 class Graph:
     """ Data about the entire graph, including nodes and links between thhem """
 
     def __init__(self, title):
         self.title = title.strip()
-        self.nodes = []
-        self.links = []
+        self._matrix = VoteMatrix([], 0)
+        self._nodes = None
+        self._links = None
+        self._nodesPerRound = None
 
         # optional
         self.dateString = ""
@@ -57,17 +142,56 @@ class Graph:
         self.eliminationOrder = None
 
         # Used while building the graph only
-        self.nodesPerRound = []
         self.transfersPerRound = []
         self.winnersSoFar = set()
 
         # This is reset if set_elimination_order is changed
         self.summary = None
 
+    @property
+    def matrix(self):
+        """ The VoteMatrix which stores the nodes and links """
+        return self._matrix
+
+    @matrix.setter
+    def matrix(self, matrix):
+        self._matrix = matrix
+        self._reset_views()
+
+    def _reset_views(self):
+        """ Call whenever the order or number of nodes or links changes """
+        self._nodes = None
+        self._links = None
+        self._nodesPerRound = None
+        self.summary = None
+
+    @property
+    def nodes(self):
+        """ All nodes, sorted by the elimination order once it is set """
+        if self._nodes is None:
+            matrix = self.matrix
+            self._nodes = [NodeData(self, row, roundNum) for row, roundNum in
+                           zip(matrix.nodeRows.tolist(), matrix.nodeRounds.tolist())]
+        return self._nodes
+
+    @property
+    def links(self):
+        """ All links, in the order they were created """
+        if self._links is None:
+            self._links = [LinkData(self, i) for i in range(len(self.matrix.linkValues))]
+        return self._links
+
+    @property
+    def nodesPerRound(self):
+        """ For each round, a mapping of Item to the NodeData for that round """
+        if self._nodesPerRound is None:
+            self._nodesPerRound = [RoundNodes(self, i) for i in range(self.numRounds)]
+        return self._nodesPerRound
+
     @property
     def numRounds(self):
         """ Returns the number of rounds """
-        return len(self.nodesPerRound)
+        return self.matrix.numRounds
 
     @property
     def items(self):
@@ -81,9 +205,15 @@ class Graph:
         return self.summary
 
     def get_items_for_names(self, listOfNames):
-        """ Given a list of all names, returns the corresponding Item for each naem """
-        allItems = list(set(n.item for n in self.nodes))
-        return sorted(allItems, key=lambda item: -listOfNames.index(item.name))
+        """ Given a list of all names, returns the corresponding Item for each naem,
+            sorted in reverse order of the list of names """
+        ranks = {}
+        for rank, name in enumerate(listOfNames):
+            ranks.setdefault(name, rank)
+        try:
+            return sorted(self.matrix.items, key=lambda item: -ranks[item.name])
+        except KeyError as exc:
+            raise ValueError(f"{exc} is not in the list of names") from exc
 
     def set_elimination_order(self, orderedItems):
         """
@@ -92,10 +222,16 @@ class Graph:
         several errors here or elsewhere if you pass bad data.
         """
         self.eliminationOrder = orderedItems
-        self.nodes = sorted(self.nodes, key=lambda x: -orderedItems.index(x.item))
 
-        # Reset summary: it's no longer accurate
-        self.summary = None
+        ranks = {item: i for i, item in enumerate(orderedItems)}
+        try:
+            rowRanks = [ranks[item] for item in self.matrix.items]
+        except KeyError as exc:
+            raise ValueError(f"{exc} is not in the elimination order") from exc
+        self.matrix.sort_nodes([-rank for rank in rowRanks])
+
+        # Reset views and summary: they're no longer accurate
+        self._reset_views()
 
     def set_date(self, date):
         """ Sets the date of this election """
@@ -109,80 +245,110 @@ class Graph:
 
         self.threshold = threshold
 
-    def _add_connection(self, sourceNode, targetNode, value):
-        """ Adds a Link between the source and target.
-            Only meaningful while graph creation is in progress. """
-        link = LinkData(sourceNode, targetNode, value)
-        self.links.append(link)
-
     def create_node(self, item, count, round_i):
         """ Creates a node with the given count.
-            Only meaningful while graph creation is in progress. """
-        label = str(item.name)
-        node = NodeData(item, label, count, round_i)
-        self.nodes.append(node)
-
-        return node
+            Only meaningful while graph creation is in progress.
+            This is slow: prefer create_graph_from_rounds. """
+        row = self.matrix.add_node(item, count, round_i)
+        self._reset_views()
+        return NodeData(self, row, round_i)
 
     def _ensure_no_last_round_transfers(self):
         for transfer in self.transfersPerRound[-1]:
             assert len(transfer.transfersByItem) == 0
 
+    #pylint: disable=too-many-locals
     def _compute_transfers(self):
         """ Second pass: after all nodes are created, compute the edges """
         # No transfers allowed on last round
         self._ensure_no_last_round_transfers()
 
+        matrix = self.matrix
+        linkRounds = []
+        linkSources = []
+        linkTargets = []
+        linkValues = []
+
         # For every other round:
         for i in range(self.numRounds - 1):
-            nodesThisRound = self.nodesPerRound[i]
-            nodesNextRound = self.nodesPerRound[i + 1]
-            transfers = self.transfersPerRound[i]
-
             # Compute transfers to other candidates on each round
-            totalVotesTransferredFrom = {}
-            for transfer in transfers:
-                sourceNode = nodesThisRound[transfer.item]
-                totalVotesTransferredFrom[transfer.item] = 0
+            totalVotesTransferredFrom = np.zeros(len(matrix.items))
+            numLinksThisRound = 0
+            for transfer in self.transfersPerRound[i]:
+                sourceRow = matrix.rowOf.get(transfer.item)
+                if sourceRow is None or not matrix.present[sourceRow, i]:
+                    raise KeyError(transfer.item)
+                totalVotesTransferred = 0
 
                 # All of the transfers from sourceNode to other nodes
+                targetRows = []
+                counts = []
                 for targetItem, count in transfer.transfersByItem.items():
-                    assert targetItem in nodesNextRound
-                    targetNode = nodesNextRound[targetItem]
-                    self._add_connection(sourceNode=sourceNode,
-                                         targetNode=targetNode,
-                                         value=count)
-                    totalVotesTransferredFrom[transfer.item] += count
+                    targetRow = matrix.rowOf.get(targetItem)
+                    assert targetRow is not None and matrix.present[targetRow, i + 1]
+                    targetRows.append(targetRow)
+                    counts.append(count)
+                    totalVotesTransferred += count
+                totalVotesTransferredFrom[sourceRow] = totalVotesTransferred
+
+                linkSources.append(np.full(len(targetRows), sourceRow, dtype=np.intp))
+                linkTargets.append(np.array(targetRows, dtype=np.intp))
+                linkValues.append(np.array(counts, dtype=float))
+                numLinksThisRound += len(targetRows)
 
             # Compute transfers to same candidate by computing untransferred votes
-            for item, node in nodesThisRound.items():
-                if item not in nodesNextRound:
-                    continue
-                votesTransferredToOthers = totalVotesTransferredFrom.get(item, 0)
-                votesTransferredToSelf = node.count - votesTransferredToOthers
-                self._add_connection(sourceNode=node,
-                                     targetNode=nodesNextRound[item],
-                                     value=votesTransferredToSelf)
-
+            rowsThisRound = matrix.roundOrders[i]
+            rowsThisRound = rowsThisRound[matrix.present[rowsThisRound, i + 1]]
+            linkSources.append(rowsThisRound)
+            linkTargets.append(rowsThisRound)
+            linkValues.append(matrix.votes[rowsThisRound, i] -
+                              totalVotesTransferredFrom[rowsThisRound])
+            numLinksThisRound += len(rowsThisRound)
+
+            linkRounds.append(np.full(numLinksThisRound, i, dtype=np.intp))
+
+        if linkValues:
+            matrix.set_links(np.concatenate(linkRounds), np.concatenate(linkSources),
+                             np.concatenate(linkTargets), np.concatenate(linkValues))
+        self._reset_views()
+
+    #pylint: disable=too-many-locals
     def create_graph_from_rounds(self, rounds):
         """ Generates a graph with nodes and edges, where the nodes are
             a single Item at a specific Round, and the edges are Transfers """
+        items = {}  # Item to row
+        rows = []
+        roundNums = []
+        counts = []
+        firstRoundWon = {}
+        eliminatedNodes = []
         for round_i, rnd in enumerate(rounds):
             self.winnersSoFar.update(rnd.winners)
+            for item in rnd.winners:
+                firstRoundWon.setdefault(item, round_i)
 
             eliminatedThisRound = {e.item for e in rnd.transfers
                                    if isinstance(e, rcvResult.Elimination)}
 
-            nodesThisRound = {}
             for item, votes in rnd.itemsToVotes.items():
-                node = self.create_node(item, votes, round_i)
-                if item in self.winnersSoFar:
-                    node.mark_winner()
+                row = items.setdefault(item, len(items))
+                rows.append(row)
+                roundNums.append(round_i)
+                counts.append(votes)
                 if item in eliminatedThisRound:
-                    node.mark_eliminated()
-                nodesThisRound[item] = node
+                    eliminatedNodes.append((row, round_i))
 
-            self.nodesPerRound.append(nodesThisRound)
             self.transfersPerRound.append(rnd.transfers)
 
+        matrix = VoteMatrix.from_nodes(items.keys(), len(rounds), rows, roundNums, counts)
+
+        # Winners are marked on every round from the one they won in
+        for item, firstRound in firstRoundWon.items():
+            if item in items:
+                row = items[item]
+                matrix.isWinner[row, firstRound:] = matrix.present[row, firstRound:]
+        for row, round_i in eliminatedNodes:
+            matrix.isEliminated[row, round_i] = True
+
+        self.matrix = matrix
         self._compute_transfers()
@@ -0,0 +1,106 @@
+"""
+Serializes a fully-initialized Graph into a compact, JSON-friendly artifact and back again.
+
+Parsing a file means running every migration task in readRCVRCJSON, building the Graph,
+ordering it (including any sidecar ordering) and summarizing it. The artifact stores the
+result of all that work, so loading a visualization only needs to rebuild the vote matrix.
+Nodes and links are stored column by column, mirroring the arrays of the VoteMatrix.
+
+Bump ARTIFACT_VERSION whenever the parsing pipeline changes in a way that affects the Graph:
+older artifacts are then considered stale and callers should fall back to a full parse.
+"""
+
+import numpy as np
+
+from visualizer.graph import rcvResult
+from visualizer.graph.graph import Graph
+from visualizer.graph.voteMatrix import VoteMatrix
+
+ARTIFACT_VERSION = 2
+
+# Bit flags for each node
+_IS_WINNER = 1
+_IS_ELIMINATED = 2
+
+
+class StaleArtifactError(Exception):
+    """ The artifact was created by an older pipeline or from a different source file """
+
+
+def graph_to_artifact(graph, sourceKey, sidecarData):
+    """
+    Converts the graph into a dict which can be passed to json.dumps.
+    The graph must have its elimination order set.
+
+    :param graph: The graph to serialize
+    :param sourceKey: Anything JSON-serializable describing the inputs used to create the graph.
+        The same sourceKey must be passed to artifact_to_graph or it will be considered stale.
+    :param sidecarData: The loaded candidate sidecar data, or None
+    """
+    matrix = graph.matrix
+    rows = matrix.nodeRows
+    rounds = matrix.nodeRounds
+    flags = np.where(matrix.isWinner[rows, rounds], _IS_WINNER, 0) | \
+        np.where(matrix.isEliminated[rows, rounds], _IS_ELIMINATED, 0)
+
+    return {
+        'version': ARTIFACT_VERSION,
+        'sourceKey': sourceKey,
+        'title': graph.title,
+        'dateString': graph.dateString,
+        'threshold': graph.threshold,
+        'items': [item.name for item in matrix.items],
+        'eliminationOrder': [matrix.rowOf[item] for item in graph.eliminationOrder],
+        'winnersSoFar': sorted(matrix.rowOf[item] for item in graph.winnersSoFar),
+        'numRounds': matrix.numRounds,
+        'roundOrders': [order.tolist() for order in matrix.roundOrders],
+        'nodes': {
+            'rows': rows.tolist(),
+            'rounds': rounds.tolist(),
+            'counts': matrix.get_counts(rows, rounds),
+            'flags': flags.tolist()
+        },
+        'links': {
+            'rounds': matrix.linkRounds.tolist(),
+            'sources': matrix.linkSources.tolist(),
+            'targets': matrix.linkTargets.tolist(),
+            'values': matrix.linkValues.tolist()
+        },
+        'sidecar': sidecarData
+    }
+
+
+def artifact_to_graph(artifact, sourceKey):
+    """
+    Rebuilds the graph from an artifact created by graph_to_artifact.
+    Returns a tuple of (graph, sidecarData).
+    Raises StaleArtifactError if the artifact cannot be used for the given sourceKey.
+    """
+    if artifact.get('version') != ARTIFACT_VERSION:
+        raise StaleArtifactError(f"Artifact version {artifact.get('version')} is outdated")
+    if artifact.get('sourceKey') != sourceKey:
+        raise StaleArtifactError("Artifact was created from a different source")
+
+    graph = Graph(artifact['title'])
+    graph.dateString = artifact['dateString']
+    graph.threshold = artifact['threshold']
+
+    items = [rcvResult.Item(name) for name in artifact['items']]
+
+    # Nodes are already stored in elimination order - don't re-sort them
+    nodes = artifact['nodes']
+    matrix = VoteMatrix.from_nodes(items, artifact['numRounds'],
+                                   nodes['rows'], nodes['rounds'], nodes['counts'],
+                                   artifact['roundOrders'])
+    flags = np.asarray(nodes['flags'], dtype=int)
+    matrix.isWinner[matrix.nodeRows, matrix.nodeRounds] = flags & _IS_WINNER
+    matrix.isEliminated[matrix.nodeRows, matrix.nodeRounds] = flags & _IS_ELIMINATED
+
+    links = artifact['links']
+    matrix.set_links(links['rounds'], links['sources'], links['targets'], links['values'])
+
+    graph.matrix = matrix
+    graph.winnersSoFar = {items[i] for i in artifact['winnersSoFar']}
+    graph.eliminationOrder = [items[i] for i in artifact['eliminationOrder']]
+
+    return graph, artifact['sidecar']
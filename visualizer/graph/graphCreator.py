@@ -1,13 +1,16 @@
 """ Helper functions to load a graph from a file """
 
+import copy
 import logging
 import json
 
+import numpy as np
 from rcvformats.schemas.universaltabulator import SchemaV0
 from rcvformats.conversions.automatic import AutomaticConverter
 from rcvformats.conversions.base import CouldNotConvertException
 
 import visualizer.graph.readRCVRCJSON as rcvrcJson
+from common.compressedFiles import open_decompressed
 
 logger = logging.getLogger(__name__)
 
@@ -32,29 +35,27 @@ def remove_last_winner_and_eliminated(graph, rounds):
     """ Some tabulators don't mark the penultimate candidate as eliminated-
         they just mark a winner. Figure out if that's happening, and don't
         remove an extra candidate. """
+    matrix = graph.matrix
+    masksToRemove = [matrix.isWinner]
+    if len(rounds[-1].transfers) != 0:
+        masksToRemove.append(matrix.isEliminated)
 
-    haveRemovedWinner = False
-    haveRemovedEliminated = False
+    # Only the first marked node, in the order of graph.nodes, is unmarked
+    for mask in masksToRemove:
+        markedNodes = np.flatnonzero(mask[matrix.nodeRows, matrix.nodeRounds])
+        if len(markedNodes) > 0:
+            firstNode = markedNodes[0]
+            mask[matrix.nodeRows[firstNode], matrix.nodeRounds[firstNode]] = False
 
-    if len(rounds[-1].transfers) == 0:
-        haveRemovedEliminated = True
 
-    for node in graph.nodes:
-        if not haveRemovedWinner and node.isWinner:
-            node.isWinner = False
-            haveRemovedWinner = True
-        if not haveRemovedEliminated and node.isEliminated:
-            node.isEliminated = False
-            haveRemovedEliminated = True
-        if haveRemovedEliminated and haveRemovedWinner:
-            break
-
-
-def initialize_graph(jsonReader, excludeFinalWinnerAndEliminatedCandidate):
+def initialize_graph(jsonReader, excludeFinalWinnerAndEliminatedCandidate, candidateOrder=None):
     """
     Uses the reader to create the graph, set its elimination order,
     and summarize it. If this function succeeds, the jsonReader is good
     and it's very very likely that the page will render correctly.
+
+    If candidateOrder is given (a list of candidate names, e.g. from the candidate sidecar
+    file), it replaces the elimination order before the graph is summarized.
     """
     graph = jsonReader.get_graph()
     rounds = jsonReader.get_rounds()
@@ -63,17 +64,50 @@ def initialize_graph(jsonReader, excludeFinalWinnerAndEliminatedCandidate):
     if excludeFinalWinnerAndEliminatedCandidate:
         remove_last_winner_and_eliminated(graph, rounds)
 
+    if candidateOrder is not None:
+        graph.set_elimination_order(graph.get_items_for_names(candidateOrder))
+
     graph.summarize()
 
     return graph
 
 
-def make_graph_with_file(fileObject, excludeFinalWinnerAndEliminatedCandidate):
-    """ Load the given fileObject, create and return a graph """
+def serialize_universal_tabulator(jsonData):
+    """ The compact JSON of data in the Universal Tabulator format, as stored after upload """
+    return json.dumps(jsonData, separators=(',', ':')).encode('utf-8')
+
+
+def load_as_universal_tabulator(fileObject):
+    """
+    Returns the data in fileObject in the Universal Tabulator format.
+    Files which we can already read are returned as-is, without schema validation,
+    and anything else is converted.
+    """
+    fileObject = open_decompressed(fileObject)
+    try:
+        jsonData = json.load(fileObject)
+
+        # The reader modifies the data: don't let it modify what we return
+        rcvrcJson.JSONReader(copy.deepcopy(jsonData))
+        return jsonData
+    except Exception:  # pylint: disable=broad-except
+        fileObject.seek(0)
+        return convert_to_standardized_format(fileObject)
+
+
+def _make_graph(fileObject, excludeFinalWinnerAndEliminatedCandidate, candidateOrder,
+                isStandardizing):
+    """ The graph, and if isStandardizing, the file as serialize_universal_tabulator would
+        store what load_as_universal_tabulator returns, or else None """
+    fileObject = open_decompressed(fileObject)
+    standardizedContent = None
     try:
         # First, try to load it directly, assuming it is a valid format
         # This circumvents jsonschema validation needlessly
         jsonData = json.load(fileObject)
+        if isStandardizing:
+            # Before the reader modifies the data
+            standardizedContent = serialize_universal_tabulator(jsonData)
         jsonReader = rcvrcJson.JSONReader(jsonData)
     except Exception:  # pylint: disable=broad-except
         # If the loading failed, then attempt to convert it
@@ -81,6 +115,8 @@ def make_graph_with_file(fileObject, excludeFinalWinnerAndEliminatedCandidate):
 
         # First, try to convert
         jsonData = convert_to_standardized_format(fileObject)
+        if isStandardizing:
+            standardizedContent = serialize_universal_tabulator(jsonData)
 
         # Then, try to load
         try:
@@ -89,7 +125,8 @@ def make_graph_with_file(fileObject, excludeFinalWinnerAndEliminatedCandidate):
             raise BadJSONError("File schema was valid, but we could not interpret it") from exc
 
     try:
-        graph = initialize_graph(jsonReader, excludeFinalWinnerAndEliminatedCandidate)
+        graph = initialize_graph(jsonReader, excludeFinalWinnerAndEliminatedCandidate,
+                                 candidateOrder)
     except Exception as exc:
         schema = SchemaV0()
         if not schema.is_data_valid(jsonData):
@@ -99,4 +136,23 @@ def make_graph_with_file(fileObject, excludeFinalWinnerAndEliminatedCandidate):
         # We don't know why the data was invalid
         raise exc
 
+    return graph, standardizedContent
+
+
+def make_graph_with_file(fileObject, excludeFinalWinnerAndEliminatedCandidate,
+                         candidateOrder=None):
+    """ Load the given fileObject, create and return a graph.
+        See initialize_graph for the candidateOrder. """
+    graph, _ = _make_graph(fileObject, excludeFinalWinnerAndEliminatedCandidate, candidateOrder,
+                           isStandardizing=False)
     return graph
+
+
+def make_graph_and_standardized_json(fileObject, excludeFinalWinnerAndEliminatedCandidate):
+    """
+    Parses the fileObject once for both make_graph_with_file and load_as_universal_tabulator.
+    Returns a tuple of (graph, standardizedContent): the content is serialized with
+    serialize_universal_tabulator.
+    """
+    return _make_graph(fileObject, excludeFinalWinnerAndEliminatedCandidate, None,
+                       isStandardizing=True)
@@ -1,6 +1,9 @@
 """ Summarize the graph to provide helper functions to different visualizers """
 
+import numpy as np
+
 from visualizer.graph import rcvResult
+from visualizer.graph.voteMatrix import as_python_numbers
 
 
 #pylint: disable=too-few-public-methods
@@ -9,55 +12,115 @@ class GraphSummary:
 
     rounds: list  # List of RoundInfo
     candidates: dict  # Map: Graph.Item to CandidateInfo
-    # Map: Graph.NodeData to list of graph.LinkData where link.target == node
-    linksByTargetNode: dict
     winners: list
     numWinners: int
     numEliminated: int
 
     def __init__(self, graph):
-        numRounds = len(graph.nodesPerRound)
-
-        rounds = [RoundInfo(i) for i in range(numRounds)]
-
-        # Accumulate the votes gained by each candidate in each node (into candidates dict)
-        # and what happened in each round (into rounds list)
-        candidates = {}
-        alreadyWonInPreviousRound = []
-        for node in graph.nodes:
-            item = node.item
-            if item not in candidates:
-                candidates[item] = CandidateInfo(item.name)
-
-            currRound = len(candidates[item].votesAddedPerRound)
-            candidates[item].add_votes(node.count)
-            rounds[currRound].add_votes(item, node.count)
-
-            if node.isWinner:
-                # Only count winner the first time they win
-                if item not in alreadyWonInPreviousRound:
-                    rounds[currRound].add_winner(item.name)
-                    alreadyWonInPreviousRound.append(item)
-            if node.isEliminated:
-                # Eliminate the next round: in the sankey representation,
-                # eliminated candidates are shown on the previous round
-                # so they don't ever show zero-vote bars. Account for that.
-                rounds[currRound + 1].add_eliminated(item.name)
-
-        # Create linksByNode
-        linksByTargetNode = {}
-        for link in graph.links:
-            if link.target not in linksByTargetNode:
-                linksByTargetNode[link.target] = []
-            linksByTargetNode[link.target].append(link)
+        self._graph = graph
+        self._linksByTargetNode = None
+
+        matrix = graph.matrix
+        rounds = [RoundInfo(i) for i in range(matrix.numRounds)]
+
+        # Everything is computed on the nodes in the order of graph.nodes.
+        # The position of a node within its candidate is the round it's summarized in.
+        candidates, positions = self._summarize_candidates(matrix)
+        self._sum_active_votes(matrix, rounds, positions)
+
+        # Only count winners the first time they win
+        rows = matrix.nodeRows
+        winnerNames = []
+        wonAlready = set()
+        for i in np.flatnonzero(matrix.isWinner[rows, matrix.nodeRounds]).tolist():
+            row = rows[i]
+            if row not in wonAlready:
+                wonAlready.add(row)
+                name = matrix.items[row].name
+                rounds[positions[i]].add_winner(name)
+                winnerNames.append(name)
+
+        # Eliminate the next round: in the sankey representation,
+        # eliminated candidates are shown on the previous round
+        # so they don't ever show zero-vote bars. Account for that.
+        for i in np.flatnonzero(matrix.isEliminated[rows, matrix.nodeRounds]).tolist():
+            rounds[positions[i] + 1].add_eliminated(matrix.items[rows[i]].name)
 
         self.rounds = rounds
         self.candidates = candidates
-        self.linksByTargetNode = linksByTargetNode
-        self.winnerNames = [i.name for i in alreadyWonInPreviousRound]
+        self.winnerNames = winnerNames
         self.numWinners = len(self.winnerNames)
         self.numEliminated = sum([len(r.eliminatedNames) for r in rounds])
 
+    #pylint: disable=too-many-locals
+    @classmethod
+    def _summarize_candidates(cls, matrix):
+        """ Returns the CandidateInfo for each item, ordered by when they first appear in the
+            nodes, along with the position of each node within its candidate """
+        # Group the nodes by candidate, keeping their order within each candidate
+        rows = matrix.nodeRows
+        byCandidate = np.argsort(rows, kind='stable')
+        groupedRows = rows[byCandidate]
+        groupedCounts = matrix.votes[groupedRows, matrix.nodeRounds[byCandidate]]
+        groupedIsInteger = matrix.isInteger[groupedRows, matrix.nodeRounds[byCandidate]]
+        isGroupStart = np.ones(len(groupedRows), dtype=bool)
+        isGroupStart[1:] = groupedRows[1:] != groupedRows[:-1]
+        groupStarts = np.flatnonzero(isGroupStart)
+        groupEnds = np.append(groupStarts[1:], len(groupedRows))
+
+        positions = np.empty(len(rows), dtype=np.intp)
+        positions[byCandidate] = np.arange(len(rows)) - \
+            np.repeat(groupStarts, groupEnds - groupStarts)
+
+        # The votes added each round is the difference from the previous round
+        previousCounts = np.zeros(len(groupedCounts))
+        previousCounts[1:] = groupedCounts[:-1]
+        previousCounts[isGroupStart] = 0
+        previousIsInteger = np.ones(len(groupedCounts), dtype=bool)
+        previousIsInteger[1:] = groupedIsInteger[:-1]
+        previousIsInteger[isGroupStart] = True
+        totalVotes = as_python_numbers(groupedCounts, groupedIsInteger)
+        votesAdded = as_python_numbers(groupedCounts - previousCounts,
+                                       groupedIsInteger & previousIsInteger)
+
+        candidates = {}
+        for start, end in sorted(zip(groupStarts.tolist(), groupEnds.tolist()),
+                                 key=lambda group: byCandidate[group[0]]):
+            item = matrix.items[groupedRows[start]]
+            candidateInfo = CandidateInfo(item.name)
+            candidateInfo.totalVotesPerRound = totalVotes[start:end]
+            candidateInfo.votesAddedPerRound = votesAdded[start:end]
+            candidateInfo.numRounds = end - start
+            candidates[item] = candidateInfo
+        return candidates, positions
+
+    @classmethod
+    def _sum_active_votes(cls, matrix, rounds, positions):
+        """ Sums the active votes in each round, in the same order as the nodes """
+        isActiveNode = matrix.isActive[matrix.nodeRows]
+        activeRows = matrix.nodeRows[isActiveNode]
+        activeRounds = matrix.nodeRounds[isActiveNode]
+        activePositions = positions[isActiveNode]
+
+        totalActiveVotes = np.zeros(len(rounds))
+        np.add.at(totalActiveVotes, activePositions, matrix.votes[activeRows, activeRounds])
+        hasNonInteger = np.zeros(len(rounds), dtype=bool)
+        np.logical_or.at(hasNonInteger, activePositions,
+                         ~matrix.isInteger[activeRows, activeRounds])
+        for rnd, total in zip(rounds, as_python_numbers(totalActiveVotes, ~hasNonInteger)):
+            rnd.totalActiveVotes = total
+
+    @property
+    def linksByTargetNode(self):
+        """ Map: Graph.NodeData to list of graph.LinkData where link.target == node.
+            Only created when first requested. """
+        if self._linksByTargetNode is None:
+            linksByTargetNode = {}
+            for link in self._graph.links:
+                linksByTargetNode.setdefault(link.target, []).append(link)
+            self._linksByTargetNode = linksByTargetNode
+        return self._linksByTargetNode
+
 
 class RoundInfo:
     """ Summarizes a single round, with functions to build the round """
@@ -1,5 +1,4 @@
 """ Class which reads an RCVRC-formatted JSON file """
-import abc
 import datetime
 
 from visualizer import common
@@ -8,46 +7,67 @@ from .graph import Graph
 
 
 class JSONMigrateTask():
-    """ An abstract base class to "fix" JSONs. Each migration "task" should override this."""
+    """
+    An abstract base class to "fix" JSONs. Each migration "task" should override one or more
+    of the rules below, which a MigrationEngine applies to every round in a single pass.
+
+    The engine visits each round in order, then "completes" it once no task will look at it
+    again. Rules for a task may only touch the round they are given, plus the previous round
+    while visiting: that is what lets many tasks share one traversal. Anything which needs to
+    see every round first should collect what it needs and act on it in finish().
+
+    The first round defines the list of candidates, and some tasks add candidates to it based
+    on later rounds, so the first round is completed last.
+    """
 
     def __init__(self, jsonData):
         self.data = jsonData
 
-    def _enumerate_tally_results(self):
-        results = self.data['results']
-        for result in results:
-            for tallyResult in result['tallyResults']:
-                yield tallyResult
-
     def is_rankit_data(self):
         """ Is the jsonData from RankIt? """
         if 'jurisdiction' not in self.data['config']:
             return False
         return self.data['config']['jurisdiction'] == 'RankIt Export'
 
-    def rename(self, fromStr, toStr):
-        """ A helper function to rename a candidate s/fromStr/toStr throughout the JSON """
-        results = self.data['results']
-        for result in results:
-            if fromStr in result['tally']:
-                result['tally'][toStr] = result['tally'][fromStr]
-                del result['tally'][fromStr]
+    def rename(self, round_i, fromStr, toStr):
+        """ A helper function to rename a candidate s/fromStr/toStr throughout a round """
+        result = self.data['results'][round_i]
+        if fromStr in result['tally']:
+            result['tally'][toStr] = result['tally'].pop(fromStr)
 
-            for tallyResult in result['tallyResults']:
-                if fromStr in tallyResult['transfers']:
-                    tallyResult['transfers'][toStr] = tallyResult['transfers'][fromStr]
-                    del tallyResult['transfers'][fromStr]
+        for tallyResult in result['tallyResults']:
+            if fromStr in tallyResult['transfers']:
+                tallyResult['transfers'][toStr] = tallyResult['transfers'].pop(fromStr)
+
+    def fix_tally_result(self, tallyResult, round_i):
+        """ Rule for each tallyResult when its round is visited """
+
+    # Rule for each tally and transfer count when its round is visited: a function which
+    # takes the count and returns the new count. Use a builtin or a staticmethod.
+    convert_number = None
+
+    def visit_round(self, round_i):
+        """ Rule for each round, after the tallyResult and number rules have been applied """
+
+    def complete_round(self, round_i):
+        """ Rule for each round, once all rounds after it have been visited """
+
+    def finish(self):
+        """ Called after every round has been completed """
 
-    @abc.abstractmethod
     def do(self):
-        """ Run the migration. Put your subclass' logic here. """
+        """ Run only this migration """
+        MigrationEngine(self.data, [self]).run()
 
 
 class FixUndeclaredUWITask(JSONMigrateTask):
     """ Undeclared votes are sometimes marked as 'UWI' instead of 'Undeclared' """
 
-    def do(self):
-        """ Run the migration """
+    def visit_round(self, round_i):
+        """ Only the first round needs fixing """
+        if round_i != 0:
+            return
+
         results = self.data['results']
 
         firstEliminated = []
@@ -67,106 +87,96 @@ class FixUndeclaredUWITask(JSONMigrateTask):
 class FixNoTransfersTask(JSONMigrateTask):
     """ The JSON prefers no key named "transfers" instead of an empty list. We do not. """
 
-    def do(self):
-        """ Run the migration """
-        for tallyResult in self._enumerate_tally_results():
-            if 'transfers' not in tallyResult:
-                tallyResult['transfers'] = {}
+    def fix_tally_result(self, tallyResult, round_i):
+        if 'transfers' not in tallyResult:
+            tallyResult['transfers'] = {}
 
 
 class FixIgnoreResidualSurplus(JSONMigrateTask):
     """ Creates a "residual surplus" candidate in the first round if we find it in other rounds,
-        since we look to the first round for all candidates (or places votes can be transferred) """
+        since we look to the first round for all candidates (or places votes can be transferred).
+        It is only added once every round has been seen, so the RankIt fixes never mistake it
+        for a candidate who was dropped without being eliminated. """
 
-    def do(self):
-        """ Run the migration """
-        for tallyResult in self._enumerate_tally_results():
-            if 'residual surplus' in tallyResult['transfers']:
-                self.data['results'][0]['tally']['residual surplus'] = 0
+    def __init__(self, jsonData):
+        super().__init__(jsonData)
+        self.foundResidualSurplus = False
+
+    def fix_tally_result(self, tallyResult, round_i):
+        if 'residual surplus' in tallyResult['transfers']:
+            self.foundResidualSurplus = True
+
+    def complete_round(self, round_i):
+        if round_i == 0 and self.foundResidualSurplus:
+            self.data['results'][0]['tally']['residual surplus'] = 0
 
 
 class MakeTalliesANumber(JSONMigrateTask):
     """ Converts tally strings to numbers """
 
-    def do(self):
-        """ Run the migration """
-        results = self.data['results']
-        for result in results:
-            tally = result['tally']
-            for name in tally:
-                tally[name] = float(tally[name])
-
-        for tallyResult in self._enumerate_tally_results():
-            xfers = tallyResult['transfers']
-            for name in xfers:
-                xfers[name] = float(xfers[name])
+    convert_number = float
 
 
 class HideDecimalsTask(JSONMigrateTask):
     """ If the config desired it - remove all decimal places """
 
-    def do(self):
-        """ Run the migration """
-        results = self.data['results']
-        for result in results:
-            tally = result['tally']
-            for name in tally:
-                tally[name] = round(tally[name])
-
-        for tallyResult in self._enumerate_tally_results():
-            xfers = tallyResult['transfers']
-            for name in xfers:
-                xfers[name] = round(xfers[name])
+    convert_number = round
 
 
 class MakeExhaustedAndSurplusACandidate(JSONMigrateTask):
     """ If there are "exhausted" ballots, make them a first-class citizen candidate """
 
+    def __init__(self, jsonData):
+        super().__init__(jsonData)
+        searchTexts = (common.INACTIVE_TEXT, common.RESIDUAL_SURPLUS_TEXT)
+        numRounds = len(jsonData['results'])
+
+        # For each searchText: was it found anywhere, and what was transferred to it each round
+        self.found = {searchText: False for searchText in searchTexts}
+        self.transfersPerRound = {searchText: [[] for _ in range(numRounds)]
+                                  for searchText in searchTexts}
+
+    def complete_round(self, round_i):
+        result = self.data['results'][round_i]
+        for searchText, transfersPerRound in self.transfersPerRound.items():
+            if searchText in result['tally']:
+                self.found[searchText] = True
+            for tallyResult in result['tallyResults']:
+                if searchText in tallyResult['transfers']:
+                    self.found[searchText] = True
+                    transfersPerRound[round_i].append(tallyResult['transfers'][searchText])
+
     def _make_it_a_candidate(self, searchText):
         """ Call this if exhausted was found. """
         numExhausted = 0
         results = self.data['results']
-        for result in results:
+        for result, transfers in zip(results, self.transfersPerRound[searchText]):
             result['tally'][searchText] = numExhausted
-            for tallyResult in result['tallyResults']:
-                if searchText in tallyResult['transfers']:
-                    numExhausted += tallyResult['transfers'][searchText]
+            for numTransferred in transfers:
+                numExhausted += numTransferred
 
-    def _make_it_a_candidate_if_in_transfers(self, searchText):
-        """ Looks for searchText in transfers OR in list of names.
-            If it exists, makes it a candidate. """
-        for result in self.data['results']:
-            if searchText in result['tally']:
-                self._make_it_a_candidate(searchText)
-                return
-
-        for tallyResult in self._enumerate_tally_results():
-            if searchText in tallyResult['transfers']:
-                self._make_it_a_candidate(searchText)
-                return
-
-    def do(self):
+    def finish(self):
         """ Run the migration, ensuring they are not already marked as candidates """
         if common.INACTIVE_TEXT not in self.data['results'][0]['tally']:
-            self._make_it_a_candidate_if_in_transfers(common.INACTIVE_TEXT)
+            if self.found[common.INACTIVE_TEXT]:
+                self._make_it_a_candidate(common.INACTIVE_TEXT)
         if common.RESIDUAL_SURPLUS_TEXT not in self.data['results'][0]:
-            self._make_it_a_candidate_if_in_transfers(common.RESIDUAL_SURPLUS_TEXT)
+            if self.found[common.RESIDUAL_SURPLUS_TEXT]:
+                self._make_it_a_candidate(common.RESIDUAL_SURPLUS_TEXT)
 
 
 class RenameCapitalizeResidualSurplus(JSONMigrateTask):
     """ s/residual surplus/Residual Surplus """
 
-    def do(self):
-        """ Run the migration """
-        self.rename('residual surplus', common.RESIDUAL_SURPLUS_TEXT)
+    def complete_round(self, round_i):
+        self.rename(round_i, 'residual surplus', common.RESIDUAL_SURPLUS_TEXT)
 
 
 class RenameExhaustedToInactive(JSONMigrateTask):
     """ s/exhausted/Inactive Ballots """
 
-    def do(self):
-        """ Run the migration """
-        self.rename('exhausted', common.INACTIVE_TEXT)
+    def complete_round(self, round_i):
+        self.rename(round_i, 'exhausted', common.INACTIVE_TEXT)
 
 
 class FixRankitMissingTransfers(JSONMigrateTask):
@@ -179,32 +189,30 @@ class FixRankitMissingTransfers(JSONMigrateTask):
                 eliminatedNames.add(result['eliminated'])
         return eliminatedNames
 
-    def do(self):
-        """ Run the migration """
-        if not self.is_rankit_data():
+    def visit_round(self, round_i):
+        """ Compares this round to the previous one """
+        if round_i == 0 or not self.is_rankit_data():
             return
 
         results = self.data['results']
-        for round_i in range(1, len(results)):
-            prevRound = results[round_i - 1]['tally']
-            thisRound = results[round_i]['tally']
-            eliminations = self._get_eliminations(round_i - 1)
+        prevRound = results[round_i - 1]['tally']
+        thisRound = results[round_i]['tally']
+        eliminations = self._get_eliminations(round_i - 1)
 
-            for name in prevRound:
-                if name not in thisRound and name not in eliminations:
-                    newElimination = {'eliminated': name, 'transfers': {}}
-                    results[round_i - 1]['tallyResults'].append(newElimination)
+        for name in prevRound:
+            if name not in thisRound and name not in eliminations:
+                newElimination = {'eliminated': name, 'transfers': {}}
+                results[round_i - 1]['tallyResults'].append(newElimination)
 
 
 class FixRankitNoElimOnLastRound(JSONMigrateTask):
     """ Rankit incorrectly eliminates on the last round """
 
-    def do(self):
-        """ Run the migration """
-        if not self.is_rankit_data():
+    def complete_round(self, round_i):
+        results = self.data['results']
+        if round_i != len(results) - 1 or not self.is_rankit_data():
             return
 
-        results = self.data['results']
         lastRoundTally = results[-1]['tallyResults']
         lastRoundTally = [r for r in lastRoundTally if 'eliminated' not in r]
         results[-1]['tallyResults'] = lastRoundTally
@@ -213,42 +221,116 @@ class FixRankitNoElimOnLastRound(JSONMigrateTask):
 class FixRankitCombinedTallyResults(JSONMigrateTask):
     """ Rankit includes eliminations and elected on the same tallyResult """
 
-    def do(self):
-        """ Run the migration """
+    def complete_round(self, round_i):
         if not self.is_rankit_data():
             return
 
-        results = self.data['results']
-        for result in results:
-            toAppendAtEnd = []
-            for tallyResult in result['tallyResults']:
-                if 'elected' not in tallyResult or 'eliminated' not in tallyResult:
-                    continue
-                toSplit = tallyResult['elected']
-                del tallyResult['elected']
-                toAppendAtEnd.append({'elected': toSplit, 'transfers': {}})
-            result['tallyResults'].extend(toAppendAtEnd)
+        result = self.data['results'][round_i]
+        toAppendAtEnd = []
+        for tallyResult in result['tallyResults']:
+            if 'elected' not in tallyResult or 'eliminated' not in tallyResult:
+                continue
+            toSplit = tallyResult['elected']
+            del tallyResult['elected']
+            toAppendAtEnd.append({'elected': toSplit, 'transfers': {}})
+        result['tallyResults'].extend(toAppendAtEnd)
 
 
 class FixRankitMissingWinners(JSONMigrateTask):
     """ Rankit stops including Winner in tally after they win """
 
-    def do(self):
-        """ Run the migration """
+    def __init__(self, jsonData):
+        super().__init__(jsonData)
+        self.winnerNamesToLastNumVotes = {}
+
+    def visit_round(self, round_i):
         if not self.is_rankit_data():
             return
 
-        winnerNamesToLastNumVotes = {}
-        for result in self.data['results']:
-            for tallyResult in result['tallyResults']:
-                if 'elected' not in tallyResult:
-                    continue
-                name = tallyResult['elected']
-                winnerNamesToLastNumVotes[name] = result['tally'][name]
+        result = self.data['results'][round_i]
+        for tallyResult in result['tallyResults']:
+            if 'elected' not in tallyResult:
+                continue
+            name = tallyResult['elected']
+            self.winnerNamesToLastNumVotes[name] = result['tally'][name]
 
-            for name in winnerNamesToLastNumVotes:
-                if name not in result['tally']:
-                    result['tally'][name] = winnerNamesToLastNumVotes[name]
+        for name, numVotes in self.winnerNamesToLastNumVotes.items():
+            if name not in result['tally']:
+                result['tally'][name] = numVotes
+
+
+#pylint: disable=too-few-public-methods
+class MigrationEngine:
+    """
+    Applies a list of JSONMigrateTasks in a single pass over the rounds.
+
+    The result is the same as running each task's do() in turn, but each round is only
+    traversed once rather than once per task. Within each step, the rules are applied in the
+    order the tasks are given in, so the ordering constraints between tasks still hold.
+    """
+
+    def __init__(self, data, tasks):
+        self.data = data
+        self.tasks = tasks
+
+        def overrides(task, method):
+            return getattr(type(task), method) is not getattr(JSONMigrateTask, method)
+
+        self.tallyResultRules = [t.fix_tally_result for t in tasks
+                                 if overrides(t, 'fix_tally_result')]
+        self.convertNumber = self._compose([t.convert_number for t in tasks
+                                            if t.convert_number is not None])
+
+    @classmethod
+    def _compose(cls, converters):
+        """ Combines the number conversions into one function, or None if there are none """
+        if len(converters) <= 1:
+            return converters[0] if converters else None
+
+        def convert_number(number):
+            for converter in converters:
+                number = converter(number)
+            return number
+        return convert_number
+
+    @classmethod
+    def _convert_numbers(cls, numbersByName, convert):
+        for name, number in numbersByName.items():
+            numbersByName[name] = convert(number)
+
+    def _visit_round(self, round_i):
+        result = self.data['results'][round_i]
+        convert = self.convertNumber
+        for tallyResult in result['tallyResults']:
+            for rule in self.tallyResultRules:
+                rule(tallyResult, round_i)
+            if convert and 'transfers' in tallyResult:
+                self._convert_numbers(tallyResult['transfers'], convert)
+        if convert:
+            self._convert_numbers(result['tally'], convert)
+
+        for task in self.tasks:
+            task.visit_round(round_i)
+
+    def _complete_round(self, round_i):
+        for task in self.tasks:
+            task.complete_round(round_i)
+
+    def run(self):
+        """ Runs every migration """
+        numRounds = len(self.data['results'])
+
+        # Rules may modify the previous round while visiting, so complete one round behind
+        for round_i in range(numRounds):
+            self._visit_round(round_i)
+            if round_i >= 2:
+                self._complete_round(round_i - 1)
+        if numRounds >= 2:
+            self._complete_round(numRounds - 1)
+        self._complete_round(0)
+
+        for task in self.tasks:
+            task.finish()
 
 
 class JSONReader:
@@ -269,21 +351,23 @@ class JSONReader:
         self.graph.create_graph_from_rounds(self.rounds)
         self.set_elimination_order(self.rounds, self.graph.items)
 
+    @classmethod
+    def get_migration_tasks(cls):
+        """ The JSONMigrateTasks to run, in order """
+        return [FixNoTransfersTask,
+                FixUndeclaredUWITask,
+                FixIgnoreResidualSurplus,
+                MakeTalliesANumber,
+                FixRankitMissingWinners,  # Must come before FixRankitMissingTransfers
+                FixRankitMissingTransfers,  # must come after MakeTalliesANumber
+                FixRankitCombinedTallyResults,
+                FixRankitNoElimOnLastRound,  # must come after FixRankitCombinedTallyResults
+                RenameCapitalizeResidualSurplus,
+                RenameExhaustedToInactive,
+                MakeExhaustedAndSurplusACandidate]
+
     def parse_data(self, data):
         """ Parses the JSON data, or raises an exception on failure """
-        def get_migration_tasks():
-            return [FixNoTransfersTask,
-                    FixUndeclaredUWITask,
-                    FixIgnoreResidualSurplus,
-                    MakeTalliesANumber,
-                    FixRankitMissingWinners,  # Must come before FixRankitMissingTransfers
-                    FixRankitMissingTransfers,  # must come after MakeTalliesANumber
-                    FixRankitCombinedTallyResults,
-                    FixRankitNoElimOnLastRound,  # must come after FixRankitCombinedTallyResults
-                    RenameCapitalizeResidualSurplus,
-                    RenameExhaustedToInactive,
-                    MakeExhaustedAndSurplusACandidate]
-
         def parse_date(date):
             if not date:
                 return None
@@ -346,9 +430,8 @@ class JSONReader:
             return rounds
 
         # Apply migrations and configuration adjustments
-        self.tasks = get_migration_tasks()
-        for task in self.tasks:
-            task(data).do()
+        self.tasks = self.get_migration_tasks()
+        MigrationEngine(data, [task(data) for task in self.tasks]).run()
 
         graph = load_graph(data)
         items = initialize_items(data)
@@ -398,20 +481,15 @@ class JSONReader:
         eliminationOrder.extend(itemsRemaining)
         eliminationOrder.extend(winners)
 
-        # Place "residual surplus" and "inactive ballots" at the end
-        def move_to_front(candidateName):
-            try:
-                moveToFrontIndex = [
-                    e.name for e in eliminationOrder].index(candidateName)
-                if moveToFrontIndex:
-                    eliminationOrder.insert(
-                        0, eliminationOrder.pop(moveToFrontIndex))
-            except ValueError:
-                # not every election has these two
-                pass
-
-        move_to_front(common.RESIDUAL_SURPLUS_TEXT)
-        move_to_front(common.INACTIVE_TEXT)
+        # Place "residual surplus" and "inactive ballots" at the end,
+        # which is the front of the elimination order, with "inactive ballots" last
+        frontNames = [common.INACTIVE_TEXT, common.RESIDUAL_SURPLUS_TEXT]
+        frontItems = {}
+        for item in eliminationOrder:
+            if item.name in frontNames:
+                frontItems.setdefault(item.name, item)
+        eliminationOrder = [frontItems[name] for name in frontNames if name in frontItems] + \
+            [item for item in eliminationOrder if frontItems.get(item.name) is not item]
 
         self.eliminationOrder = eliminationOrder
 
@@ -0,0 +1,69 @@
+"""
+Generates large, valid RCVRC-formatted elections for benchmarks and scaling tests.
+"""
+
+import json
+import tempfile
+
+
+def _as_strings(numbersByName):
+    return {name: f"{number:.4f}" for name, number in numbersByName.items()}
+
+
+def generate_election(numCandidates, numRounds):
+    """
+    Returns the JSON data for an election with numCandidates, one of which is eliminated each
+    round. Eliminated votes are split between every remaining candidate, with some exhausted.
+    The candidate with the most votes is elected in the last round.
+    """
+    assert 1 <= numRounds <= numCandidates
+
+    votes = {f"Candidate {i}": float(1000 + 7 * (numCandidates - i))
+             for i in range(numCandidates)}
+    numExhausted = 0.0
+
+    results = []
+    for round_i in range(numRounds):
+        tally = dict(votes)
+        if numExhausted:
+            tally['exhausted'] = numExhausted
+
+        if round_i == numRounds - 1:
+            winner = max(votes, key=votes.get)
+            tallyResults = [{'elected': winner}]
+        else:
+            # Eliminate the last-place candidate, splitting their votes among everyone else
+            eliminated = min(votes, key=votes.get)
+            eliminatedVotes = votes.pop(eliminated)
+            exhaustedVotes = eliminatedVotes / 10
+            perCandidate = (eliminatedVotes - exhaustedVotes) / len(votes)
+
+            transfers = {name: perCandidate for name in votes}
+            transfers['exhausted'] = exhaustedVotes
+            for name in votes:
+                votes[name] += perCandidate
+            numExhausted += exhaustedVotes
+            tallyResults = [{'eliminated': eliminated, 'transfers': _as_strings(transfers)}]
+
+        results.append({
+            'round': round_i + 1,
+            'tally': _as_strings(tally),
+            'tallyResults': tallyResults
+        })
+
+    return {
+        'config': {
+            'contest': f"Synthetic election: {numCandidates} candidates, {numRounds} rounds",
+            'date': '2020-11-03',
+            'threshold': str(sum(votes.values()) / 2)
+        },
+        'results': results
+    }
+
+
+def generate_election_file(numCandidates, numRounds):
+    """ Like generate_election, but writes it to a temporary file and returns the filename """
+    data = generate_election(numCandidates, numRounds)
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(data, f)
+        return f.name
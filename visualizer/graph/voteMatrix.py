@@ -0,0 +1,136 @@
+"""
+Array-backed storage for the nodes and links of a Graph.
+
+Each candidate (Item) has a row and each round has a column, so the votes for every node
+live in a single candidates x rounds matrix, alongside boolean masks for which nodes exist
+and which are winners or eliminated. Links are stored in coordinate form - a sparse transfer
+matrix per round - since most candidates never transfer votes to most other candidates.
+
+The Graph exposes its nodes and links as thin views over these arrays, so summarizing the
+graph never needs to create an object per node.
+"""
+
+import numpy as np
+
+
+def as_python_numbers(values, isInteger):
+    """
+    Converts an array of values to a list of python numbers. Values which were ints when
+    they were added are converted back to ints, so they are formatted the same as before.
+    """
+    values = values.tolist()
+    if not isInteger.any():
+        return values
+    return [int(value) if isInt else value for value, isInt in zip(values, isInteger.tolist())]
+
+
+#pylint: disable=too-many-instance-attributes
+class VoteMatrix:
+    """
+    The nodes and links of a graph. Nodes are kept in an order (see nodeRows and nodeRounds)
+    which is the order of Graph.nodes. Use from_nodes to create one.
+    """
+
+    def __init__(self, items, numRounds):
+        self.items = list(items)
+        self.rowOf = {item: row for row, item in enumerate(self.items)}
+        self.isActive = np.array([item.isActive for item in self.items], dtype=bool)
+        self.numRounds = numRounds
+
+        shape = (len(self.items), numRounds)
+        self.votes = np.zeros(shape)
+        self.isInteger = np.zeros(shape, dtype=bool)
+        self.present = np.zeros(shape, dtype=bool)
+        self.isWinner = np.zeros(shape, dtype=bool)
+        self.isEliminated = np.zeros(shape, dtype=bool)
+
+        # The rows present in each round, in the order they were added
+        self.roundOrders = [np.zeros(0, dtype=np.intp) for _ in range(numRounds)]
+
+        # The order of the nodes, as pairs of (row, round)
+        self.nodeRows = np.zeros(0, dtype=np.intp)
+        self.nodeRounds = np.zeros(0, dtype=np.intp)
+
+        # Link i moves linkValues[i] votes from the node at (linkSources[i], linkRounds[i])
+        # to the node at (linkTargets[i], linkRounds[i] + 1)
+        self.linkRounds = np.zeros(0, dtype=np.intp)
+        self.linkSources = np.zeros(0, dtype=np.intp)
+        self.linkTargets = np.zeros(0, dtype=np.intp)
+        self.linkValues = np.zeros(0)
+
+    #pylint: disable=too-many-arguments
+    @classmethod
+    def from_nodes(cls, items, numRounds, rows, rounds, counts, roundOrders=None):
+        """
+        Creates the matrix from lists of nodes, given in order.
+        If roundOrders is not given, the rows in each round are ordered as in the nodes.
+        """
+        matrix = cls(items, numRounds)
+        rows = np.asarray(rows, dtype=np.intp)
+        rounds = np.asarray(rounds, dtype=np.intp)
+
+        matrix.votes[rows, rounds] = counts
+        matrix.isInteger[rows, rounds] = [isinstance(count, int) for count in counts]
+        matrix.present[rows, rounds] = True
+        matrix.nodeRows = rows
+        matrix.nodeRounds = rounds
+
+        if roundOrders is None and numRounds == 0:
+            roundOrders = []
+        elif roundOrders is None:
+            byRound = np.argsort(rounds, kind='stable')
+            splitAt = np.cumsum(np.bincount(rounds, minlength=numRounds))[:-1]
+            roundOrders = np.split(rows[byRound], splitAt)
+        matrix.roundOrders = [np.asarray(order, dtype=np.intp) for order in roundOrders]
+
+        return matrix
+
+    def set_links(self, rounds, sources, targets, values):
+        """ Replaces all links. Each argument has one entry per link. """
+        self.linkRounds = np.asarray(rounds, dtype=np.intp)
+        self.linkSources = np.asarray(sources, dtype=np.intp)
+        self.linkTargets = np.asarray(targets, dtype=np.intp)
+        self.linkValues = np.asarray(values, dtype=float)
+
+    def add_node(self, item, count, round_i):
+        """
+        Adds a single node after all others, growing the matrix as needed.
+        This copies every array: when creating many nodes, use from_nodes instead.
+        """
+        if item not in self.rowOf:
+            self.rowOf[item] = len(self.items)
+            self.items.append(item)
+            self.isActive = np.append(self.isActive, item.isActive)
+
+        numRows = len(self.items)
+        numRounds = max(self.numRounds, round_i + 1)
+        padding = ((0, numRows - self.votes.shape[0]), (0, numRounds - self.numRounds))
+        self.votes = np.pad(self.votes, padding)
+        for name in ('isInteger', 'present', 'isWinner', 'isEliminated'):
+            setattr(self, name, np.pad(getattr(self, name), padding))
+        self.roundOrders += [np.zeros(0, dtype=np.intp)] * (numRounds - self.numRounds)
+        self.numRounds = numRounds
+
+        row = self.rowOf[item]
+        self.votes[row, round_i] = count
+        self.isInteger[row, round_i] = isinstance(count, int)
+        self.present[row, round_i] = True
+        self.roundOrders[round_i] = np.append(self.roundOrders[round_i], row)
+        self.nodeRows = np.append(self.nodeRows, row)
+        self.nodeRounds = np.append(self.nodeRounds, round_i)
+        return row
+
+    def get_count(self, row, round_i):
+        """ The number of votes for the node """
+        count = self.votes[row, round_i].item()
+        return int(count) if self.isInteger[row, round_i] else count
+
+    def get_counts(self, rows, rounds):
+        """ The number of votes for each node, as a list """
+        return as_python_numbers(self.votes[rows, rounds], self.isInteger[rows, rounds])
+
+    def sort_nodes(self, rowKeys):
+        """ Stable-sorts the nodes by the key of their row """
+        order = np.argsort(np.asarray(rowKeys)[self.nodeRows], kind='stable')
+        self.nodeRows = self.nodeRows[order]
+        self.nodeRounds = self.nodeRounds[order]
@@ -1,7 +1,9 @@
-""" A helper function for javascript-generating python """
+""" Helper functions for javascript-generating python """
 
 import string
 
+import numpy as np
+
 
 def approx_length(stringToMeasure):
     """ c/o https://stackoverflow.com/a/16008023/1057105 -
@@ -25,3 +27,16 @@ def approx_length(stringToMeasure):
         else:
             size += 50
     return size * 6 / 1000.0  # Convert to picas
+
+
+def compact_numbers(values, decimals=None):
+    """
+    Returns the values as a list of python numbers, optionally rounded, with whole numbers
+    as ints: 350 is shorter than 350.0 in JSON, and the same number in javascript.
+    """
+    values = np.asarray(values, dtype=float)
+    if decimals is not None:
+        values = np.round(values, decimals)
+    isWhole = np.equal(np.mod(values, 1), 0)
+    return [int(value) if whole else value
+            for value, whole in zip(values.tolist(), isWhole.tolist())]
@@ -0,0 +1,42 @@
+"""
+Management script to create the standardizedJsonFile and graph artifact of
+uploads made before they existed. Safe to run repeatedly: by default, only
+configs which do not have a standardizedJsonFile are processed.
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from common.viewUtils import refresh_precomputed_files
+from visualizer.models import JsonConfig
+
+
+class Command(BaseCommand):
+    """
+    Runs the management script
+    """
+    help = 'Converts each uploaded jsonFile to the Universal Tabulator format, once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Recreate the files even if they already exist')
+
+    def handle(self, *args, **options):
+        jsonConfigs = JsonConfig.objects.all().order_by('-id')  # pylint: disable=no-member
+        if not options['all']:
+            jsonConfigs = jsonConfigs.filter(Q(standardizedJsonFile='') |
+                                             Q(standardizedJsonFile__isnull=True))
+
+        numFailed = 0
+        for jsonConfig in jsonConfigs.iterator():
+            try:
+                refresh_precomputed_files(jsonConfig)
+                self.stdout.write(f"Converted {jsonConfig.slug}")
+            except Exception as exc:  # pylint: disable=broad-except
+                # Keep going: one bad upload shouldn't stop the backfill
+                numFailed += 1
+                self.stdout.write(self.style.ERROR(f"Could not convert {jsonConfig.slug}: {exc}"))
+
+        if numFailed:
+            self.stdout.write(self.style.WARNING(f"Done, but {numFailed} configs failed"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Successfully converted all configs"))
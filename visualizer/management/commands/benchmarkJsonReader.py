@@ -0,0 +1,74 @@
+"""
+Management script to benchmark parsing: compares the single-pass MigrationEngine
+against running each migration task on its own, then times the full JSONReader.
+Runs on the multiwinner test file and on larger synthetic elections.
+"""
+import copy
+import gc
+import json
+import time
+from django.core.management.base import BaseCommand
+
+from visualizer.graph import syntheticData
+from visualizer.graph.readRCVRCJSON import JSONReader, MigrationEngine
+from visualizer.tests import filenames
+
+
+class Command(BaseCommand):
+    """
+    Runs the management script
+    """
+    help = 'Benchmarks parsing of RCVRC-formatted JSON files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=str, default='100x50,500x250,1000x500',
+                            help='Comma-separated list of synthetic CANDIDATESxROUNDS')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Number of times to run each benchmark. The best is reported.')
+
+    @classmethod
+    def _time_best_of(cls, func, data, repeat):
+        """ Runs func on a fresh copy of data each time, and returns the fastest time.
+            Like timeit, garbage collection is disabled while timing. """
+        best = None
+        for _ in range(repeat):
+            dataCopy = copy.deepcopy(data)
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                func(dataCopy)
+                elapsed = time.perf_counter() - start
+            finally:
+                gc.enable()
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    @classmethod
+    def _migrate_one_task_at_a_time(cls, data):
+        for taskClass in JSONReader.get_migration_tasks():
+            taskClass(data).do()
+
+    @classmethod
+    def _migrate_all_at_once(cls, data):
+        MigrationEngine(data, [task(data) for task in JSONReader.get_migration_tasks()]).run()
+
+    def _benchmark(self, name, data, repeat):
+        perTask = self._time_best_of(self._migrate_one_task_at_a_time, data, repeat)
+        fused = self._time_best_of(self._migrate_all_at_once, data, repeat)
+        fullParse = self._time_best_of(JSONReader, data, repeat)
+        self.stdout.write(f"{name}: migrations {perTask * 1000:.1f}ms one task at a time, "
+                          f"{fused * 1000:.1f}ms fused ({perTask / fused:.1f}x). "
+                          f"Full parse: {fullParse * 1000:.1f}ms")
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+
+        with open(filenames.MULTIWINNER, 'r') as f:
+            self._benchmark(filenames.MULTIWINNER, json.load(f), repeat)
+
+        for size in options['sizes'].split(','):
+            numCandidates, numRounds = [int(n) for n in size.split('x')]
+            data = syntheticData.generate_election(numCandidates, numRounds)
+            self._benchmark(f"Synthetic {size}", data, repeat)
+
+        self.stdout.write(self.style.SUCCESS("Benchmark complete"))
@@ -0,0 +1,69 @@
+"""
+Management script to benchmark the data passed to the sankey and bar graph javascript:
+for every election in testData/, plus larger synthetic elections, reports the size of
+each payload as it is written into the page, and how long it takes to generate.
+"""
+import glob
+import gzip
+import io
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from visualizer.bargraph.graphToD3 import D3Bargraph
+from visualizer.graph import syntheticData
+from visualizer.graph.graphCreator import make_graph_with_file
+from visualizer.sankey.graphToD3 import D3Sankey
+
+
+class Command(BaseCommand):
+    """
+    Runs the management script
+    """
+    help = 'Benchmarks the size and generation time of the sankey and bar graph payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', type=str, default='testData',
+                            help='Directory of election files to benchmark')
+        parser.add_argument('--sizes', type=str, default='100x50,500x250,1000x500',
+                            help='Comma-separated list of synthetic CANDIDATESxROUNDS')
+
+    @classmethod
+    def _measure(cls, graph):
+        """ Returns the total payload size, its gzipped size, and the time to generate it """
+        start = time.perf_counter()
+        payloads = [json.dumps(D3Sankey(graph).data, cls=DjangoJSONEncoder),
+                    json.dumps(D3Bargraph(graph).data, cls=DjangoJSONEncoder)]
+        elapsed = time.perf_counter() - start
+
+        content = ''.join(payloads).encode('utf-8')
+        return len(content), len(gzip.compress(content)), elapsed
+
+    def _benchmark(self, name, graph):
+        size, gzippedSize, elapsed = self._measure(graph)
+        self.stdout.write(f"{name}: {len(graph.nodes)} nodes, {len(graph.links)} links. "
+                          f"{size / 1024:.1f}KB ({gzippedSize / 1024:.1f}KB gzipped) "
+                          f"in {elapsed * 1000:.1f}ms")
+        return size
+
+    def handle(self, *args, **options):
+        totalSize = 0
+        for filename in sorted(glob.glob(f"{options['directory']}/*.json")):
+            try:
+                with open(filename, 'r') as f:
+                    graph = make_graph_with_file(f, False)
+            except Exception:  # pylint: disable=broad-except
+                # Not every test file is a valid election
+                continue
+            totalSize += self._benchmark(filename, graph)
+        self.stdout.write(f"Total for {options['directory']}: {totalSize / 1024:.1f}KB")
+
+        for size in options['sizes'].split(','):
+            numCandidates, numRounds = [int(n) for n in size.split('x')]
+            data = syntheticData.generate_election(numCandidates, numRounds)
+            graph = make_graph_with_file(io.StringIO(json.dumps(data)), False)
+            self._benchmark(f"Synthetic {size}", graph)
+
+        self.stdout.write(self.style.SUCCESS("Benchmark complete"))
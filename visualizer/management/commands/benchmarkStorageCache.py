@@ -0,0 +1,63 @@
+"""
+Management script to benchmark the local disk cache of uploaded files: reads the test
+files from a storage which simulates the latency of S3, with and without LocalCacheStorage.
+"""
+import os
+import tempfile
+import time
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from common.cachedStorage import LocalCacheStorage
+from common.testUtils import SimulatedLatencyStorage
+from visualizer.tests import filenames
+
+
+class Command(BaseCommand):
+    """
+    Runs the management script
+    """
+    help = 'Benchmarks reading uploaded files through the local disk cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latency', type=float, default=30,
+                            help='Simulated milliseconds per request to the storage')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Number of times to read each file')
+
+    @classmethod
+    def _time_reads(cls, storage, names, repeat):
+        """ Reads every file repeat times, returning the mean time per read """
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for name in names:
+                with storage.open(name, 'rb') as f:
+                    f.read()
+        return (time.perf_counter() - start) / (repeat * len(names))
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        with tempfile.TemporaryDirectory() as mediaDir, \
+                tempfile.TemporaryDirectory() as cacheDir:
+            backend = SimulatedLatencyStorage(latencySeconds=options['latency'] / 1000,
+                                              location=mediaDir)
+            names = []
+            for filename in (filenames.MULTIWINNER, filenames.THREE_ROUND,
+                             filenames.THREE_ROUND_SIDECAR):
+                with open(filename, 'rb') as f:
+                    names.append(backend.save(os.path.basename(filename), File(f)))
+
+            backend.numRequests = 0
+            uncached = self._time_reads(backend, names, repeat)
+            uncachedRequests = backend.numRequests
+
+            backend.numRequests = 0
+            cachedStorage = LocalCacheStorage(backend=backend, cacheDir=cacheDir)
+            cached = self._time_reads(cachedStorage, names, repeat)
+
+        self.stdout.write(f"Uncached: {uncached * 1000:.1f}ms per read, "
+                          f"{uncachedRequests} requests")
+        self.stdout.write(f"Cached: {cached * 1000:.1f}ms per read, "
+                          f"{backend.numRequests} requests, {dict(cachedStorage.stats)} "
+                          f"({uncached / cached:.1f}x)")
+        self.stdout.write(self.style.SUCCESS("Benchmark complete"))
@@ -3,10 +3,11 @@ Managament script to ensure the last N uploads can still be loaded.
 If you need something more heavy-handed than the unit tests, check this
 against the production database.
 """
+from django.core.files.storage import default_storage
 from django.core.management.base import BaseCommand, CommandError
 
 from visualizer.models import JsonConfig
-from common.viewUtils import get_data_for_view
+from common.viewUtils import get_data_for_view, resolve_lazy_data
 
 
 class Command(BaseCommand):
@@ -28,10 +29,15 @@ class Command(BaseCommand):
         for i, jsonConfig in enumerate(allJsonConfigs):
             index = start + i
             try:
-                get_data_for_view(jsonConfig)
+                resolve_lazy_data(get_data_for_view(jsonConfig))
                 self.stdout.write(self.style.SUCCESS(
                     f"{index}: Successfully loaded {jsonConfig.slug}"))
             except Exception as exc:  # pylint: disable=broad-except
                 raise CommandError(f'Could not load {jsonConfig.slug}: ' + str(exc)) from exc
 
+        # With LocalCacheStorage, how many of the files were read from the local cache
+        storageStats = getattr(default_storage, 'stats', None)
+        if storageStats is not None:
+            self.stdout.write(f"Storage cache: {dict(storageStats)}")
+
         self.stdout.write(self.style.SUCCESS("Successfully loaded configs"))
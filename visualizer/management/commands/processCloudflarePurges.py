@@ -0,0 +1,32 @@
+"""
+Management command to purge every path queued for the Cloudflare cache.
+Normally a background thread does this after each save, but if the process
+restarts first, the paths stay queued until this runs.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from common.cloudflare import CloudflareAPI
+
+
+class Command(BaseCommand):
+    """ The command itself """
+    help = 'Purges all paths queued for the Cloudflare cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wait', action='store_true',
+                            help='Wait for failed purges to be retried until the queue is empty')
+
+    def handle(self, *args, **options):
+        numPurged = CloudflareAPI.process_purge_queue()
+
+        while options['wait']:
+            nextAttemptAt = CloudflareAPI.get_next_attempt_time()
+            if nextAttemptAt is None:
+                break
+            time.sleep(max((nextAttemptAt - timezone.now()).total_seconds(), 0))
+            numPurged += CloudflareAPI.process_purge_queue()
+
+        self.stdout.write(f'Purged {numPurged} paths\n')
@@ -0,0 +1,112 @@
+"""
+Management script to compress the files of uploads made before files were compressed at
+rest. Safe to run repeatedly: files which are already compressed are skipped, as are
+files which don't compress well, e.g. spreadsheets.
+"""
+from django.core.management.base import BaseCommand
+
+from common.compressedFiles import compress_file, delete_unless_referenced, is_compressed_name
+from common.viewUtils import PRECOMPUTED_FIELDS, refresh_precomputed_files
+from visualizer.models import JsonConfig
+
+UPLOADED_FIELDS = ('jsonFile', 'candidateSidecarFile')
+HASH_FIELDS = ('jsonFileHash', 'candidateSidecarFileHash')
+
+
+class Command(BaseCommand):
+    """
+    Runs the management script
+    """
+    help = 'Compresses the uploaded files which are stored uncompressed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of configs to update in each database query')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only list the configs which would be compressed')
+
+    @classmethod
+    def _is_uncompressed(cls, fieldFile):
+        return bool(fieldFile) and not is_compressed_name(fieldFile.name)
+
+    @classmethod
+    def _compress_field(cls, fieldFile):
+        """
+        Saves a compressed copy of the file in its place, but doesn't save the config.
+        Returns the name of the uncompressed file, or None if it isn't worth compressing.
+        """
+        with fieldFile.open('rb'):
+            compressed = compress_file(fieldFile)
+        if compressed is None:
+            return None
+        oldName = fieldFile.name
+        fieldFile.save(compressed.name, compressed, save=False)
+        return oldName
+
+    def _compress_batch(self, configs):
+        """ Compresses the uploaded files of the configs, in a single update """
+        changedConfigs = []
+        oldFiles = []
+        for config in configs:
+            for fieldName in UPLOADED_FIELDS:
+                fieldFile = getattr(config, fieldName)
+                if not self._is_uncompressed(fieldFile):
+                    continue
+                oldName = self._compress_field(fieldFile)
+                if oldName is not None:
+                    oldFiles.append((fieldName, fieldFile.storage, oldName))
+                    if config not in changedConfigs:
+                        changedConfigs.append(config)
+
+        # Nothing visible has changed, so there's nothing to purge: don't call save()
+        JsonConfig.objects.bulk_update(changedConfigs, UPLOADED_FIELDS + HASH_FIELDS)
+
+        # Only now that nothing refers to them
+        for fieldName, storage, oldName in oldFiles:
+            delete_unless_referenced(JsonConfig, fieldName, storage, oldName)
+
+        # The precomputed files depend on the names of the uploaded files, so recreate
+        # them - compressed - rather than compress them
+        numFailed = 0
+        for config in configs:
+            if config in changedConfigs or \
+                    any(self._is_uncompressed(getattr(config, f)) for f in PRECOMPUTED_FIELDS):
+                try:
+                    refresh_precomputed_files(config)
+                except Exception as exc:  # pylint: disable=broad-except
+                    # Keep going: renders will rebuild the artifact, or fail like before
+                    numFailed += 1
+                    self.stdout.write(self.style.ERROR(f"Could not refresh {config.slug}: {exc}"))
+        return len(changedConfigs), numFailed
+
+    def handle(self, *args, **options):
+        batchSize = options['batch_size']
+        jsonConfigs = JsonConfig.objects.all().order_by('id')  # pylint: disable=no-member
+
+        batch = []
+        numCompressed = 0
+        numFailed = 0
+        for jsonConfig in jsonConfigs.iterator():
+            fieldNames = UPLOADED_FIELDS + PRECOMPUTED_FIELDS
+            if not any(self._is_uncompressed(getattr(jsonConfig, f)) for f in fieldNames):
+                continue
+            if options['dry_run']:
+                self.stdout.write(f"Would compress {jsonConfig.slug}")
+                continue
+
+            batch.append(jsonConfig)
+            if len(batch) >= batchSize:
+                numBatchCompressed, numBatchFailed = self._compress_batch(batch)
+                numCompressed += numBatchCompressed
+                numFailed += numBatchFailed
+                batch = []
+        if batch:
+            numBatchCompressed, numBatchFailed = self._compress_batch(batch)
+            numCompressed += numBatchCompressed
+            numFailed += numBatchFailed
+
+        if numFailed:
+            self.stdout.write(self.style.WARNING(
+                f"Compressed {numCompressed} configs, but {numFailed} could not be refreshed"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Compressed {numCompressed} configs"))
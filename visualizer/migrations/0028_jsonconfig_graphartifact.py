@@ -0,0 +1,22 @@
+# Generated by Django 3.2.16 on 2026-10-18 17:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visualizer', '0027_alter_jsonconfig_textforwinner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jsonconfig',
+            name='graphArtifact',
+            field=models.FileField(
+                blank=True,
+                editable=False,
+                null=True,
+                upload_to='graph-artifacts'),
+        ),
+    ]
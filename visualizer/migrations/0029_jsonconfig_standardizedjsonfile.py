@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visualizer', '0028_jsonconfig_graphartifact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jsonconfig',
+            name='standardizedJsonFile',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='standardized'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:24
+
+import common.cacheVersions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visualizer', '0029_jsonconfig_standardizedjsonfile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jsonconfig',
+            name='cacheVersion',
+            field=models.CharField(
+                default=common.cacheVersions.new_cache_version,
+                editable=False,
+                max_length=32),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:29
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visualizer', '0030_jsonconfig_cacheversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingCloudflarePurge',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=512)),
+                ('queuedAt', models.DateTimeField(auto_now_add=True)),
+                ('numFailedAttempts', models.IntegerField(default=0)),
+                ('nextAttemptAt', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
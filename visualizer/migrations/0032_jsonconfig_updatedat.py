@@ -0,0 +1,30 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:48
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def set_updated_at_from_uploaded_at(apps, schema_editor):
+    """ Until now, configs have been as old as their upload """
+    JsonConfig = apps.get_model('visualizer', 'JsonConfig')
+    JsonConfig.objects.update(updatedAt=models.F('uploadedAt'))
+
+
+def reverse_func(apps, schema_editor):
+    """ Not needed: code to reverse the migration """
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visualizer', '0031_pendingcloudflarepurge'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jsonconfig',
+            name='updatedAt',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.RunPython(set_updated_at_from_uploaded_at, reverse_func),
+    ]
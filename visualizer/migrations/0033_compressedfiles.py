@@ -0,0 +1,24 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:59
+
+import common.compressedFiles
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visualizer', '0032_jsonconfig_updatedat'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='jsonconfig',
+            name='candidateSidecarFile',
+            field=common.compressedFiles.CompressedFileField(blank=True, null=True, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='jsonconfig',
+            name='jsonFile',
+            field=common.compressedFiles.CompressedFileField(upload_to=''),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:09
+
+import common.compressedFiles
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visualizer', '0033_compressedfiles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jsonconfig',
+            name='candidateSidecarFileHash',
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                max_length=64),
+        ),
+        migrations.AddField(
+            model_name='jsonconfig',
+            name='jsonFileHash',
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='jsonconfig',
+            name='candidateSidecarFile',
+            field=common.compressedFiles.CompressedFileField(
+                blank=True,
+                hashField='candidateSidecarFileHash',
+                null=True,
+                upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='jsonconfig',
+            name='graphArtifact',
+            field=common.compressedFiles.CompressedFileField(
+                blank=True,
+                editable=False,
+                null=True,
+                upload_to='graph-artifacts'),
+        ),
+        migrations.AlterField(
+            model_name='jsonconfig',
+            name='jsonFile',
+            field=common.compressedFiles.CompressedFileField(
+                hashField='jsonFileHash',
+                upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='jsonconfig',
+            name='standardizedJsonFile',
+            field=common.compressedFiles.CompressedFileField(
+                blank=True,
+                editable=False,
+                null=True,
+                upload_to='standardized'),
+        ),
+    ]
@@ -4,10 +4,13 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
 from django.utils.translation import ugettext as _
 
+from common.cacheVersions import new_cache_version
 from common.cloudflare import CloudflareAPI
+from common.compressedFiles import CompressedFileField
 
 
 class ColorTheme(models.IntegerChoices):
@@ -46,8 +49,37 @@ class JsonConfig(models.Model):
     """ A Json file representing a single election, and its configuration """
     detail_views = ('visualizer.views.Visualize',)
 
-    jsonFile = models.FileField()
-    candidateSidecarFile = models.FileField(null=True, blank=True)
+    # Stored gzipped. Read them with common.compressedFiles.open_decompressed.
+    # Identical uploads share a file, found by the hash of its original content.
+    # Every file below may be shared with other configs.
+    # (pylint-django mistakes subclasses of FileField for FieldFiles)
+    # pylint: disable=no-value-for-parameter,unexpected-keyword-arg
+    jsonFile = CompressedFileField(hashField='jsonFileHash')
+    candidateSidecarFile = CompressedFileField(null=True, blank=True,
+                                               hashField='candidateSidecarFileHash')
+
+    # jsonFile, converted to the Universal Tabulator format. The original jsonFile
+    # is kept for downloading, but this is what is used to render.
+    standardizedJsonFile = CompressedFileField(null=True, blank=True, editable=False,
+                                               upload_to='standardized')
+
+    # The parsed, ordered graph, precomputed from the files above so views
+    # need not re-parse them. See visualizer.graph.graphArtifact.
+    graphArtifact = CompressedFileField(null=True, blank=True, editable=False,
+                                        upload_to='graph-artifacts')
+    # pylint: enable=no-value-for-parameter,unexpected-keyword-arg
+
+    # The sha256 of the original content of the uploaded files. Blank for files
+    # uploaded before they were hashed, until they're next saved.
+    jsonFileHash = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    candidateSidecarFileHash = models.CharField(max_length=64, blank=True, db_index=True,
+                                                editable=False)
+
+    # Part of the key of everything cached for this config. See common.cacheVersions.
+    cacheVersion = models.CharField(max_length=32, default=new_cache_version, editable=False)
+    # When the cacheVersion last changed, i.e. when anything shown for this config did
+    updatedAt = models.DateTimeField(default=timezone.now, editable=False)
+
     slug = models.SlugField(unique=True, max_length=255)
     uploadedAt = models.DateTimeField(auto_now_add=True)
     owner = models.ForeignKey(
@@ -130,7 +162,7 @@ class JsonConfig(models.Model):
         privateUsers = userModel.objects.filter(userprofile__isPrivate=True)
         return JsonConfig.objects.all().exclude(owner__in=privateUsers)
 
-    def _get_unique_slug(self):
+    def _get_unique_slug(self, taken=frozenset()):
         # loop until the name is unique
         slug = slugify(self.title)
         if slug.endswith('json'):
@@ -142,12 +174,28 @@ class JsonConfig(models.Model):
         # loop until the name is unique
         num = 1
         uniqueSlug = slug
-        while JsonConfig.objects.filter(slug=uniqueSlug).exists():
+        while uniqueSlug in taken or JsonConfig.objects.filter(slug=uniqueSlug).exists():
             uniqueSlug = '{}-{}'.format(slug, num)
             num += 1
 
         return uniqueSlug
 
+    @classmethod
+    def assign_unique_slugs(cls, configs):
+        """ Gives each of the unsaved configs a slug, unique among them too, for bulk_create """
+        taken = set()
+        for config in configs:
+            config.slug = config._get_unique_slug(taken)  # pylint: disable=protected-access
+            taken.add(config.slug)
+
+    def mark_updated(self):
+        """
+        Changes the cacheVersion, invalidating everything cached for this config.
+        save() does this for updates: call it before a bulk_update, then purge the Cloudflare cache.
+        """
+        self.cacheVersion = new_cache_version()
+        self.updatedAt = timezone.now()
+
     def __str__(self):
         return '%s: %s' % (self.slug, self.title)
 
@@ -160,12 +208,30 @@ class JsonConfig(models.Model):
         if not self.slug:
             self.slug = self._get_unique_slug()
 
-        if not self._state.adding:
-            # Model is being updated, not created. Clear the cache.
-            CloudflareAPI.purge_vis_cache(self.slug)
+        isUpdate = not self._state.adding
+        if isUpdate:
+            # Model is being updated, not created. Invalidate the cache.
+            self.mark_updated()
 
         super().save(*args, **kwargs)
 
+        if isUpdate:
+            CloudflareAPI.purge_vis_cache(self.slug)
+
+    @classmethod
+    def get_cache_validators(cls, **lookup):
+        """
+        A tuple of (cacheVersion, updatedAt) of the config matching the lookup,
+        or None if there is none
+        """
+        return cls.objects.filter(**lookup).values_list('cacheVersion', 'updatedAt').first()
+
+    @classmethod
+    def get_cache_stamp(cls, **lookup):
+        """ The cacheVersion of the config matching the lookup, or None if there is none """
+        validators = cls.get_cache_validators(**lookup)
+        return None if validators is None else validators[0]
+
 
 class HomepageFeaturedElectionColumn(models.Model):
     """ Represents a column of links on the homepage. """
@@ -208,3 +274,19 @@ class HomepageFeaturedElection(models.Model):
 
     def __str__(self):
         return str(self.title)
+
+
+class PendingCloudflarePurge(models.Model):
+    """
+    A path waiting to be purged from the Cloudflare cache: the outbox of common.cloudflare.
+    A path may be queued many times - the purge worker dedupes them.
+    """
+    path = models.CharField(max_length=512)
+    queuedAt = models.DateTimeField(auto_now_add=True)
+
+    # Purging is retried with exponential backoff
+    numFailedAttempts = models.IntegerField(default=0)
+    nextAttemptAt = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return str(self.path)
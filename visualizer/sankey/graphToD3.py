@@ -1,47 +1,57 @@
-import json
+import numpy as np
 
-from visualizer.jsUtils import approx_length
+from visualizer.jsUtils import approx_length, compact_numbers
 
 
 class D3Sankey:
+    """
+    The data for the sankey diagram, in columns: each field of the nodes and links is a
+    list, so names and keys are never repeated. expandSankeyData (sankey-wrapper.js)
+    turns it back into the graph of nodes and links that d3-sankey expects.
+    """
+
     def __init__(self, graph):
         longestLabelApxWidth = max([approx_length(n.label)
                                     for n in graph.nodesPerRound[0].values()])
-        totalVotesPerRound = [r.totalActiveVotes for r in graph.summary.rounds]
-        js = ''
-        js += 'numRounds = %d;\n' % graph.numRounds
-        js += 'numCandidates = %d;\n' % len(graph.nodesPerRound[0])
-        js += 'longestLabelApxWidth = %f;\n' % longestLabelApxWidth
-        js += f'totalVotesPerRound = {totalVotesPerRound};\n'
-        js += 'graph = {"nodes" : [], "links" : []};\n'
-
-        # Maps Items to a unique index. Used for color indexing.
+        totalVotesPerRound = [r.totalActiveVotes for r in graph.summarize().rounds]
+        matrix = graph.matrix
+
+        # Maps each row to a unique index into the candidates. Used for color indexing.
         indices = {item: i for i, item in enumerate(graph.eliminationOrder)}
+        candidateOfRow = np.array([indices[item] for item in matrix.items], dtype=np.intp)
+
+        # Links refer to nodes by their position in graph.nodes
+        rows = matrix.nodeRows
+        rounds = matrix.nodeRounds
+        positionOfNode = np.zeros((len(matrix.items), graph.numRounds), dtype=np.intp)
+        positionOfNode[rows, rounds] = np.arange(len(rows))
+
+        # Skip inactive (exhausted) nodes, and links to and from them
+        isNodeActive = matrix.isActive[rows]
+        rows = rows[isNodeActive]
+        rounds = rounds[isNodeActive]
+        isLinkActive = matrix.isActive[matrix.linkSources] & matrix.isActive[matrix.linkTargets]
+        linkRounds = matrix.linkRounds[isLinkActive]
+        linkSources = matrix.linkSources[isLinkActive]
+        linkTargets = matrix.linkTargets[isLinkActive]
 
-        nodeIndices = {}
-        for i, node in enumerate(graph.nodes):
-            # Skip inactive (exhausted) nodes
-            if not node.item.isActive:
-                continue
-
-            nodeIndices[node] = i
-            js += 'graph.nodes.push({ "name": %s,\n' % json.dumps(node.label)
-            js += '                   "round": %d,\n' % node.roundNum
-            js += '                   "value": %f,\n' % node.count
-            js += '                   "isWinner": %d,\n' % node.isWinner
-            js += '                   "isEliminated": %d,\n' % node.isEliminated
-            js += '                   "index": "%s"});\n' % indices[node.item]
-        for link in graph.links:
-            # Skip inactive (exhausted) nodes
-            if not link.source.item.isActive:
-                continue
-            if not link.target.item.isActive:
-                continue
-
-            sourceIndex = nodeIndices[link.source]
-            targetIndex = nodeIndices[link.target]
-            js += 'graph.links.push({ "source": %d,\n' % sourceIndex
-            js += '                   "target": %d,\n' % targetIndex
-            js += '           "candidateIndex": %d,\n' % indices[link.source.item]
-            js += '                    "value": %0.3f });\n' % link.value
-        self.js = js
+        self.data = {
+            'numRounds': graph.numRounds,
+            'numCandidates': len(graph.nodesPerRound[0]),
+            'longestLabelApxWidth': longestLabelApxWidth,
+            'totalVotesPerRound': totalVotesPerRound,
+            'candidates': [str(item.name) for item in graph.eliminationOrder],
+            'nodes': {
+                'candidate': candidateOfRow[rows].tolist(),
+                'round': rounds.tolist(),
+                'value': compact_numbers(matrix.votes[rows, rounds], decimals=6),
+                'isWinner': matrix.isWinner[rows, rounds].astype(int).tolist(),
+                'isEliminated': matrix.isEliminated[rows, rounds].astype(int).tolist(),
+            },
+            'links': {
+                'source': positionOfNode[linkSources, linkRounds].tolist(),
+                'target': positionOfNode[linkTargets, linkRounds + 1].tolist(),
+                'candidate': candidateOfRow[linkSources].tolist(),
+                'value': compact_numbers(matrix.linkValues[isLinkActive], decimals=3),
+            },
+        }
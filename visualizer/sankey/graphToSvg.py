@@ -0,0 +1,152 @@
+"""
+The sankey diagram as a static SVG, drawn on the server from the data of D3Sankey: for
+embeds without javascript, crawlers and link previews, and to show the diagram before
+sankey.js has drawn it.
+
+The nodes and links are where SankeyLayout puts them, as they are in the browser, offset
+to leave room for the names and round labels.
+"""
+
+from visualizer.colors import get_colors
+from visualizer.common import intify
+from visualizer.sankey.sankeyLayout import SankeyLayout
+from visualizer.svgUtils import document, element, truncate
+
+LINK_OPACITY = 0.5
+CURVATURE = 0.5
+APPROX_CHAR_WIDTH = 6.5
+MAX_NAME_LENGTH = 30
+MARGIN = 10
+
+SINGLE_ROUND_MESSAGE = 'Sankey diagrams show a flow from one round to the next. ' \
+    'This single-round election cannot be displayed as a Sankey diagram.'
+
+
+class SvgSankey:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """ The sankey diagram of the sankeyData, with the colors and orientation of the config """
+
+    def __init__(self, sankeyData, config, title):  # pylint: disable=too-many-locals
+        self.isHorizontal = config.horizontalSankey
+        self.candidates = sankeyData['candidates']
+        self.colors = get_colors(config.colorTheme, len(self.candidates))
+
+        if sankeyData['numRounds'] <= 1:
+            self.svg = document(500, 40, title, [element('text', SINGLE_ROUND_MESSAGE, x=MARGIN,
+                                                         y=25, font_size=10)])
+            return
+
+        longestName = max(len(truncate(name, MAX_NAME_LENGTH)) for name in self.candidates)
+        namesSize = longestName * APPROX_CHAR_WIDTH + MARGIN
+        if self.isHorizontal:
+            # Names to the left of the first round, round labels above
+            offset0, offset1 = namesSize, 30
+            textSize0 = 70
+        else:
+            # Round labels to the left, names above the first round
+            offset0, offset1 = 30, 60
+            textSize0 = 20
+
+        layout = SankeyLayout(sankeyData, self.isHorizontal).data
+        self.nodeSize0 = layout['nodeSize0']
+        self.nodes = self._place_nodes(sankeyData['nodes'], layout['nodes'], offset0, offset1)
+        links = self._place_links(sankeyData['links'], layout['links'])
+
+        children = [self._make_link(link) for link in links]
+        for node in self.nodes:
+            children.extend(self._make_node(node))
+        roundDim0s = {node['round']: node['dim0'] for node in self.nodes}
+        children.extend(self._make_round_label(roundIndex, dim0, offset1)
+                        for roundIndex, dim0 in sorted(roundDim0s.items()))
+
+        size0 = max(roundDim0s.values()) + self.nodeSize0 + textSize0
+        size1 = max(node['dim1'] + node['size1'] for node in self.nodes) + MARGIN
+        width, height = (size0, size1) if self.isHorizontal else (size1, size0)
+        self.svg = document(width, height, title, children)
+
+    def _point(self, dim0, dim1):
+        """ The (x, y) of a position along the two dimensions """
+        return (dim0, dim1) if self.isHorizontal else (dim1, dim0)
+
+    @classmethod
+    def _place_nodes(cls, nodeData, nodeLayout, offset0, offset1):
+        """ Each node, as a dict, at its position in the layout """
+        return [{'candidate': candidate, 'round': roundIndex, 'value': value,
+                 'isWinner': isWinner, 'isEliminated': isEliminated,
+                 'dim0': offset0 + dim0, 'dim1': offset1 + dim1, 'size1': size1}
+                for candidate, roundIndex, value, isWinner, isEliminated, dim0, dim1, size1
+                in zip(nodeData['candidate'], nodeData['round'], nodeData['value'],
+                       nodeData['isWinner'], nodeData['isEliminated'], nodeLayout['dim0'],
+                       nodeLayout['dim1'], nodeLayout['size1'])]
+
+    def _place_links(self, linkData, linkLayout):
+        """ Each link, as a dict, where it meets its source and target nodes """
+        links = []
+        for source, target, candidate, size1, sourceScalar, targetScalar, sourceOffset, \
+                targetOffset in zip(linkData['source'], linkData['target'],
+                                    linkData['candidate'], linkLayout['size1'],
+                                    linkLayout['sourceScalar'], linkLayout['targetScalar'],
+                                    linkLayout['sourceOffset'], linkLayout['targetOffset']):
+            links.append({'candidate': candidate,
+                          'start0': self.nodes[source]['dim0'] + self.nodeSize0,
+                          'end0': self.nodes[target]['dim0'],
+                          'source1': self.nodes[source]['dim1'] + sourceOffset,
+                          'target1': self.nodes[target]['dim1'] + targetOffset,
+                          'sourceSize1': size1 * sourceScalar,
+                          'targetSize1': size1 * targetScalar})
+        return links
+
+    def _path_point(self, dim0, dim1):
+        return '%.2f,%.2f' % self._point(dim0, dim1)
+
+    def _make_link(self, link):
+        """ A band from the source to the target, curved as sankey.link in sankey.js """
+        start0, end0 = link['start0'], link['end0']
+        control0 = start0 + (end0 - start0) * CURVATURE
+        control1 = end0 - (end0 - start0) * CURVATURE
+        source1, sourceEnd1 = link['source1'], link['source1'] + link['sourceSize1']
+        target1, targetEnd1 = link['target1'], link['target1'] + link['targetSize1']
+        point = self._path_point
+        path = f'M{point(start0, source1)}' \
+            f'C{point(control0, source1)} {point(control1, target1)} {point(end0, target1)}' \
+            f'L{point(end0, targetEnd1)}' \
+            f'C{point(control1, targetEnd1)} {point(control0, sourceEnd1)} ' \
+            f'{point(start0, sourceEnd1)}Z'
+        return element('path', d=path, fill=self.colors[link['candidate']],
+                       fill_opacity=LINK_OPACITY)
+
+    def _make_node(self, node):
+        """ The node, its votes, and for the first round, the candidate's name """
+        x, y = self._point(node['dim0'], node['dim1'])
+        width, height = self._point(self.nodeSize0, node['size1'])
+        elements = [element('rect', x=x, y=y, width=width, height=height,
+                            fill=self.colors[node['candidate']])]
+
+        # As textForNode in sankey-wrapper.js
+        text = ('❌ ' if node['isEliminated'] else '') + ('✅ ' if node['isWinner'] else '') + \
+            intify(node['value'])
+        center1 = node['dim1'] + node['size1'] / 2
+        if self.isHorizontal:
+            elements.append(element('text', text, x=x + self.nodeSize0 + 3, y=center1,
+                                    dominant_baseline='central', font_size=10))
+        else:
+            elements.append(element('text', text, x=x + 3, y=y + self.nodeSize0 + 12,
+                                    font_size=10))
+
+        if node['round'] == 0:
+            name = truncate(self.candidates[node['candidate']], MAX_NAME_LENGTH)
+            if self.isHorizontal:
+                elements.append(element('text', name, x=x - 5, y=center1, text_anchor='end',
+                                        dominant_baseline='central'))
+            else:
+                elements.append(element('text', name, x=center1, y=y - 8,
+                                        text_anchor='middle'))
+        return elements
+
+    def _make_round_label(self, roundIndex, dim0, offset1):
+        dim0 += self.nodeSize0 / 2
+        if self.isHorizontal:
+            return element('text', f'Round {roundIndex + 1}', x=dim0, y=offset1 - 12,
+                           text_anchor='middle', font_weight='bold')
+        return element('text', f'Round {roundIndex + 1}', x=MARGIN, y=dim0,
+                       dominant_baseline='central', font_weight='bold',
+                       transform=f'rotate(-90 {MARGIN} {dim0:.2f})', text_anchor='middle')
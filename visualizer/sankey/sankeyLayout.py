@@ -0,0 +1,133 @@
+"""
+The layout of the sankey diagram, computed on the server so the browser only has to draw it.
+
+This is what sankey.layout in sankey.js computes: each round is a column, and its nodes are
+stacked in order, each at least MIN_NODE_SIZE1 long, then squeezed back into the diagram if they
+overflow it. Links are stacked along their source and target nodes, sorted by the position of
+the node at the other end. (sankey.js also relaxes the nodes towards their neighbors, but then
+restacks them in order, so that has no effect on the layout.)
+
+Like setup-by-orientation.js, positions are along two dimensions - dim0, from round to round,
+and dim1, across the nodes of a round - which are x and y for a horizontal sankey, and y and x
+for a vertical one. The nodes and links are in the order of D3Sankey's.
+"""
+
+import numpy as np
+
+from visualizer.jsUtils import compact_numbers
+
+# As sankey.js and makeSankey in sankey-wrapper.js
+MIN_NODE_SIZE1 = 30
+LINK_PADDING = 60
+
+
+def _exclusive_cumsum_by_group(values, groups):
+    """ For each value, the sum of the values before it in its group. Groups must be sorted. """
+    cumsum = np.cumsum(values) - values
+    return cumsum - cumsum[np.searchsorted(groups, groups)]
+
+
+class SankeyLayout:  # pylint: disable=too-few-public-methods
+    """ The positions and sizes of the nodes and links of the sankeyData from D3Sankey """
+
+    def __init__(self, sankeyData, isHorizontal):  # pylint: disable=too-many-locals
+        numRounds = sankeyData['numRounds']
+        numCandidates = sankeyData['numCandidates']
+
+        # As setup-by-orientation.js and makeSankey
+        nodeSize0 = 10 if isHorizontal else 5
+        avgNodeSize1 = 70 if isHorizontal else 150
+        nodePadding = 20 + 0.5 * min(numCandidates, 10)
+        totalSize0 = numRounds * (nodeSize0 + nodePadding + LINK_PADDING)
+        totalSize1 = numCandidates * avgNodeSize1
+
+        nodeValues = np.asarray(sankeyData['nodes']['value'], dtype=float)
+        nodeRounds = np.asarray(sankeyData['nodes']['round'], dtype=np.intp)
+        linkValues = np.asarray(sankeyData['links']['value'], dtype=float)
+        linkSources = np.asarray(sankeyData['links']['source'], dtype=np.intp)
+        linkTargets = np.asarray(sankeyData['links']['target'], dtype=np.intp)
+
+        lastRound = max(nodeRounds.max(initial=0), 1)
+        nodeDim0 = nodeRounds * ((totalSize0 - nodeSize0) / lastRound)
+
+        # One scale for every round, so that the most crowded one fits
+        nodesPerRound = np.bincount(nodeRounds, minlength=numRounds)
+        votesPerRound = np.bincount(nodeRounds, weights=nodeValues, minlength=numRounds)
+        hasNodes = nodesPerRound > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scales = (totalSize1 - (nodesPerRound[hasNodes] - 1) * nodePadding) / \
+                votesPerRound[hasNodes]
+        scale = scales.min() if len(scales) else 0
+        if not np.isfinite(scale):
+            scale = 0
+        nodeSize1 = nodeValues * scale
+        linkSize1 = linkValues * scale
+
+        nodeDim1 = self._stack_nodes(nodeRounds, nodeSize1, numRounds, nodePadding, totalSize1)
+
+        # Small nodes are drawn larger, and so are their links where they meet them
+        isSmall = (nodeSize1 > 0) & (nodeSize1 < MIN_NODE_SIZE1)
+        nodeScalar = np.ones(len(nodeSize1))
+        nodeScalar[isSmall] = MIN_NODE_SIZE1 / nodeSize1[isSmall]
+        nodeSize1[isSmall] = MIN_NODE_SIZE1
+        sourceScalar = nodeScalar[linkSources]
+        targetScalar = nodeScalar[linkTargets]
+
+        sourceOffsets = self._stack_links(linkSources, nodeDim1[linkTargets],
+                                          linkSize1 * sourceScalar)
+        targetOffsets = self._stack_links(linkTargets, nodeDim1[linkSources],
+                                          linkSize1 * targetScalar)
+
+        self.data = {
+            'isHorizontal': isHorizontal,
+            'nodeSize0': nodeSize0,
+            'nodes': {
+                'dim0': compact_numbers(nodeDim0, decimals=3),
+                'dim1': compact_numbers(nodeDim1, decimals=3),
+                'size1': compact_numbers(nodeSize1, decimals=3),
+            },
+            'links': {
+                # Not rounded: small links of small nodes are scaled up a lot
+                'size1': compact_numbers(linkSize1),
+                'sourceScalar': compact_numbers(sourceScalar),
+                'targetScalar': compact_numbers(targetScalar),
+                'sourceOffset': compact_numbers(sourceOffsets, decimals=3),
+                'targetOffset': compact_numbers(targetOffsets, decimals=3),
+            },
+        }
+
+    @classmethod
+    def _stack_nodes(cls, nodeRounds, nodeSize1, numRounds, nodePadding, totalSize1):
+        # pylint: disable=too-many-arguments,too-many-locals
+        """ The dim1 of each node: as resolveCollisions in sankey.js """
+        order = np.argsort(nodeRounds, kind='stable')
+        rounds = nodeRounds[order]
+        extents = np.maximum(nodeSize1[order], MIN_NODE_SIZE1) + nodePadding
+        dim1 = _exclusive_cumsum_by_group(extents, rounds)
+
+        # Squeeze the nodes of rounds which overflow, more so further along the round
+        nodesPerRound = np.bincount(rounds, minlength=numRounds)
+        overflows = np.bincount(rounds, weights=extents, minlength=numRounds) - \
+            nodePadding - totalSize1
+        indexInRound = np.arange(len(rounds)) - np.searchsorted(rounds, rounds)
+        numInRound = nodesPerRound[rounds]
+        overflow = overflows[rounds]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shifts = np.where((overflow > 0) & (numInRound > 1),
+                              overflow / (numInRound - 1) / numInRound * indexInRound, 0)
+        dim1 -= shifts
+
+        nodeDim1 = np.empty(len(order))
+        nodeDim1[order] = dim1
+        return nodeDim1
+
+    @classmethod
+    def _stack_links(cls, linkNodes, otherEndDim1, linkSize1):
+        """
+        Where each link meets its node, from the start of the node: as computeLinkDepths in
+        sankey.js, the links of each node are stacked in order of the node at the other end.
+        """
+        order = np.lexsort((otherEndDim1, linkNodes))
+        offsets = np.empty(len(order))
+        offsets[order] = _exclusive_cumsum_by_group(linkSize1[order], linkNodes[order])
+        return offsets
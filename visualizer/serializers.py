@@ -7,11 +7,12 @@ from django.urls import reverse
 from rest_framework import serializers
 from rest_framework.settings import api_settings
 
+from common import viewUtils
 from visualizer.graph.graphCreator import BadJSONError
 from visualizer.models import TextForWinner
 from visualizer.sidecar.reader import BadSidecarError
 from .models import JsonConfig
-from .validators import try_to_load_jsons
+from .validators import parse_upload
 
 
 class BaseVisualizationSerializer(serializers.HyperlinkedModelSerializer):
@@ -20,6 +21,8 @@ class BaseVisualizationSerializer(serializers.HyperlinkedModelSerializer):
     DRF expects a fixed set of options, so this uses the model defaults
     and nothing more.
     """
+    # The validated upload, so save() needn't parse the files again. See to_internal_value.
+    parsedUpload = None
 
     class Meta:
         """ The meta class to simplify construction of the serializer """
@@ -77,11 +80,11 @@ class BaseVisualizationSerializer(serializers.HyperlinkedModelSerializer):
             # Creating: if the field is not provided, it does not exist. Treat it as None.
             jsonFile = data.get('jsonFile')
             candidateSidecarFile = data.get('candidateSidecarFile')
-        graph = self.load_graph_or_errors(jsonFile, candidateSidecarFile)
+        self.parsedUpload = self.load_upload_or_errors(jsonFile, candidateSidecarFile)
 
         if 'jsonFile' in data:
             # Only update these fields if the jsonFile changed
-            self.populate_dict_with_json_data(data, graph)
+            self.populate_dict_with_json_data(data, self.parsedUpload.graph)
 
         # Now run all other validations
         data = super().to_internal_value(data)
@@ -90,11 +93,17 @@ class BaseVisualizationSerializer(serializers.HyperlinkedModelSerializer):
 
         # validations happen after this point...
 
+    def save(self, **kwargs):
+        """ After saving, precompute the graph so the visualization can be loaded quickly """
+        instance = super().save(**kwargs)
+        viewUtils.refresh_precomputed_files(instance, self.parsedUpload)
+        return instance
+
     @classmethod
-    def load_graph_or_errors(cls, jsonFile, candidateSidecarFile):
-        """ Returns the graph, or raises an error if it cannot. """
+    def load_upload_or_errors(cls, jsonFile, candidateSidecarFile):
+        """ Returns the validators.ParsedUpload, or raises an error if it cannot. """
         try:
-            return try_to_load_jsons(jsonFile, candidateSidecarFile)
+            return parse_upload(jsonFile, candidateSidecarFile)
         except BadJSONError as exception:
             errorMessage = traceback.format_exc()
             raise serializers.ValidationError({'jsonFile': ["JSON is not valid: " + errorMessage]})
@@ -6,6 +6,8 @@ and is used by Ballotpedia to generate Ballotpedia-style visualizations.
 
 import json
 
+from common.compressedFiles import open_decompressed
+
 
 class BadSidecarError(Exception):
     """
@@ -20,7 +22,7 @@ class SidecarReader:
     """
 
     def __init__(self, fileObject):
-        self.data = json.load(fileObject)
+        self.data = json.load(open_decompressed(fileObject))
 
     def assert_valid(self, graph):
         """
@@ -0,0 +1,46 @@
+""" Helper functions for SVG-generating python """
+
+from xml.sax.saxutils import escape, quoteattr
+
+# Matches the visualizations' CSS
+FONT_FAMILY = '-apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Arial, sans-serif'
+
+
+def format_number(value):
+    """ Short enough for coordinates: at most two decimal places, and no trailing zeros """
+    if isinstance(value, float):
+        return f'{value:.2f}'.rstrip('0').rstrip('.')
+    return str(value)
+
+
+def element(tag, text=None, **attrs):
+    """
+    One SVG element, as a string. Underscores in attribute names become hyphens,
+    so stroke_width is stroke-width, and attributes which are None are left out.
+    The text is escaped: pass children already rendered as a list instead.
+    """
+    attrString = ''.join(
+        f' {name.rstrip("_").replace("_", "-")}='
+        f'{quoteattr(format_number(value) if isinstance(value, (int, float)) else value)}'
+        for name, value in attrs.items() if value is not None)
+    if text is None:
+        return f'<{tag}{attrString}/>'
+    if isinstance(text, list):
+        return f'<{tag}{attrString}>{"".join(text)}</{tag}>'
+    return f'<{tag}{attrString}>{escape(text)}</{tag}>'
+
+
+def document(width, height, title, children):
+    """ A standalone SVG document, with the title for accessibility """
+    return '<?xml version="1.0" encoding="UTF-8"?>' + element(
+        'svg', [element('title', title), *children],
+        xmlns='http://www.w3.org/2000/svg', viewBox=f'0 0 {format_number(width)} '
+        f'{format_number(height)}', width=width, height=height, role='img',
+        font_family=FONT_FAMILY, font_size=12)
+
+
+def truncate(text, maxLength):
+    """ The text, cut short with an ellipsis if it's longer than maxLength characters """
+    if len(text) <= maxLength:
+        return text
+    return text[:maxLength - 1] + '…'
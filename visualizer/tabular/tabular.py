@@ -181,8 +181,6 @@ class CandidateTabulation:
 
             if node in summary.linksByTargetNode:
                 linksForThisNode = summary.linksByTargetNode[node]
-                for l in linksForThisNode:
-                    l.value = intify(l.value)
             else:
                 # No incoming nodes this round (always true on first round)
                 linksForThisNode = []
@@ -222,9 +220,10 @@ class RoundTabulation:
             if link.source.item.name == link.target.item.name:
                 # Don't account for links to self
                 continue
-            voteTxt = pluralize('vote', link.value)
+            numVotes = intify(link.value)
+            voteTxt = pluralize('vote', numVotes)
             transfers.append(
-                f"{link.value} {voteTxt} from {link.source.item.name}. ")
+                f"{numVotes} {voteTxt} from {link.source.item.name}. ")
 
         transferText = andify("Gained ", transfers, "")
 
@@ -177,6 +177,12 @@ class LiveServerTestBaseClass(StaticLiveServerTestCase):
         if prependServer:
             url = self._make_url(url)
         self.browser.get(url)
+
+        # Visualizations are drawn once their data is fetched
+        isLoaded = "return typeof isVisualizationDataLoaded === 'undefined' || "\
+                   "isVisualizationDataLoaded;"
+        self._ensure_eventually_asserts(
+            lambda: self.assertTrue(self.browser.execute_script(isLoaded)))
         self._assert_log_len(expectedErrorCount)
 
     @classmethod
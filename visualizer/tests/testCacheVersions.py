@@ -0,0 +1,184 @@
+"""
+Tests for the versioned cache: saving a model invalidates only what was cached for it,
+and only one process renders each version
+"""
+
+import multiprocessing
+import os
+from mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.urls import reverse
+
+from common import viewUtils
+from common.cacheMiddleware import get_render_lock, get_versioned_key_prefix
+from common.singleFlight import SingleFlight
+from common.testUtils import TestHelpers
+from electionpage.models import ElectionPage
+from movie.models import Movie
+from visualizer.models import JsonConfig
+
+TestHelpers.silence_logging_spam()
+
+
+class CacheVersionTests(TestCase):
+    """ Tests for the cacheVersion of JsonConfigs and election pages """
+
+    def setUp(self):
+        cache.clear()
+        TestHelpers.setup_host_mocks(self)
+
+        # Two uploads, viewed while logged out
+        TestHelpers.login(self.client)
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        TestHelpers.logout(self.client)
+        self.config, self.otherConfig = JsonConfig.objects.order_by('id')
+
+    def _count_renders(self, urls):
+        """ Visits each url and returns the number of times a visualization was computed """
+        with patch('common.viewUtils.get_data_for_view',
+                   wraps=viewUtils.get_data_for_view) as mockGetData:
+            for url in urls:
+                self.assertEqual(self.client.get(url).status_code, 200)
+        return mockGetData.call_count
+
+    def test_save_invalidates_only_that_config(self):
+        """ Saving a config re-renders its pages, and only its pages, without clearing the cache """
+        urls = [reverse('visualize', args=(self.config.slug,)),
+                reverse('visualize', args=(self.otherConfig.slug,))]
+        self.assertEqual(self._count_renders(urls), 2)
+        self.assertEqual(self._count_renders(urls), 0)
+
+        oldVersion = self.config.cacheVersion
+        with patch('django.core.cache.cache.clear') as mockClear:
+            self.config.title = "New Title"
+            self.config.save()
+            mockClear.assert_not_called()
+        self.assertNotEqual(JsonConfig.get_cache_stamp(slug=self.config.slug), oldVersion)
+
+        self.assertEqual(self._count_renders(urls), 1)
+        self.assertEqual(self._count_renders(urls), 0)
+
+    def test_creation_keeps_version(self):
+        """ Only updates change the version: a new config is not saved twice """
+        config = JsonConfig.objects.get(pk=self.config.pk)
+        self.assertEqual(config.cacheVersion, self.config.cacheVersion)
+        self.assertNotEqual(self.config.cacheVersion, self.otherConfig.cacheVersion)
+
+    def test_movie_save_invalidates_its_configs(self):
+        """ Saving a movie bumps the version of the configs showing it, and no others """
+        movie = Movie.objects.create(resolutionWidth=1, resolutionHeight=1)
+        self.config.movieHorizontal = movie
+        self.config.save()
+        self.config.refresh_from_db()
+
+        versions = (self.config.cacheVersion, self.otherConfig.cacheVersion)
+        movie.save()
+        self.assertNotEqual(JsonConfig.get_cache_stamp(pk=self.config.pk), versions[0])
+        self.assertEqual(JsonConfig.get_cache_stamp(pk=self.otherConfig.pk), versions[1])
+
+    def test_graph_artifact_is_cached(self):
+        """ The graph artifact is read from storage once per cacheVersion """
+        config = JsonConfig.objects.get(pk=self.config.pk)
+        viewUtils.load_graph_for_config(config)
+        with patch.object(type(config.graphArtifact), 'open') as mockOpen:
+            viewUtils.load_graph_for_config(config)
+            mockOpen.assert_not_called()
+
+    def test_election_page_stamp(self):
+        """ An election page is invalidated when it, or any config on it, changes """
+        page = TestHelpers.make_election_page()
+        stamps = [ElectionPage.get_cache_stamp(slug=page.slug)]
+
+        page.listOfElections.add(self.config)
+        stamps.append(ElectionPage.get_cache_stamp(slug=page.slug))
+
+        self.config.save()
+        stamps.append(ElectionPage.get_cache_stamp(slug=page.slug))
+
+        page.save()
+        stamps.append(ElectionPage.get_cache_stamp(slug=page.slug))
+
+        # Configs not on the page don't matter
+        self.otherConfig.save()
+        stamps.append(ElectionPage.get_cache_stamp(slug=page.slug))
+
+        self.assertEqual(len(set(stamps)), 4)
+        self.assertEqual(stamps[-1], stamps[-2])
+        self.assertIsNone(ElectionPage.get_cache_stamp(slug="no-such-page"))
+
+    def test_stale_while_revalidate(self):
+        """ While another process renders the new version, the old version is served """
+        url = reverse('visualize', args=(self.config.slug,))
+        self.assertEqual(self._count_renders([url]), 1)
+        oldContent = self.client.get(url).content
+
+        self.config.save()
+        request = RequestFactory().get(url)
+        request._cache_key_prefix = get_versioned_key_prefix(  # pylint: disable=protected-access
+            request, '')
+        with get_render_lock(request) as otherRender:
+            self.assertTrue(otherRender.isHeld)
+            self.assertEqual(self._count_renders([url]), 0)
+            self.assertEqual(self.client.get(url).content, oldContent)
+
+        self.assertEqual(self._count_renders([url, url]), 1)
+
+    def test_graph_is_built_once(self):
+        """ A process which waited for another to build the graph artifact uses that one """
+        config = JsonConfig.objects.get(pk=self.config.pk)
+        config.graphArtifact = None
+
+        with patch('common.viewUtils.SingleFlight.acquire', autospec=True) as mockAcquire, \
+                patch('common.viewUtils.make_graph_for_config') as mockMakeGraph:
+            mockAcquire.side_effect = lambda flight: setattr(flight, 'waited', True)
+            graph, _ = viewUtils.load_graph_for_config(config)
+            mockMakeGraph.assert_not_called()
+
+        self.assertTrue(config.graphArtifact)
+        self.assertGreater(len(graph.nodes), 0)
+
+
+def _hold_lock(key, locked, done):
+    """ Run in another process: holds the lock until done is set """
+    with SingleFlight(key):
+        locked.set()
+        done.wait(10)
+
+
+class SingleFlightTests(TestCase):
+    """ Tests for the host-wide locks """
+
+    def test_lock(self):
+        """ Only one holder at a time, and the lock file is cleaned up """
+        first = SingleFlight('key')
+        second = SingleFlight('key')
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire(blocking=False))
+        self.assertFalse(second.acquire(timeout=0.1))
+        self.assertTrue(second.waited)
+        self.assertTrue(SingleFlight('otherKey').acquire(blocking=False))
+
+        first.release()
+        self.assertFalse(os.path.exists(first.path))
+        self.assertTrue(second.acquire(blocking=False))
+        second.release()
+
+    def test_across_processes(self):
+        """ A lock held by another process is respected, and released when it ends """
+        locked = multiprocessing.Event()
+        done = multiprocessing.Event()
+        process = multiprocessing.Process(target=_hold_lock, args=('key', locked, done))
+        process.start()
+        try:
+            self.assertTrue(locked.wait(10))
+            self.assertFalse(SingleFlight('key').acquire(blocking=False))
+        finally:
+            done.set()
+            process.join(10)
+
+        with SingleFlight('key', timeout=1) as flight:
+            self.assertTrue(flight.isHeld)
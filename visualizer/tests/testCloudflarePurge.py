@@ -0,0 +1,108 @@
+"""
+Tests for the queue of paths to purge from the Cloudflare cache
+"""
+
+from io import StringIO
+from urllib.parse import urlparse
+from mock import patch
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from common.cloudflare import BackgroundPurger, CloudflareAPI, PURGE_BATCH_SIZE
+from common.testUtils import TestHelpers
+from visualizer.models import JsonConfig, PendingCloudflarePurge
+
+TestHelpers.silence_logging_spam()
+
+
+class CloudflarePurgeTests(TestCase):
+    """ Saving queues purges, which are deduped, batched and retried """
+
+    def setUp(self):
+        TestHelpers.setup_host_mocks(self)
+        TestHelpers.login(self.client)
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        self.config = TestHelpers.get_latest_upload()
+
+        enableApi = self.settings(CLOUDFLARE_AUTH_TOKEN='mytoken',
+                                  CLOUDFLARE_ZONE_ID='zoneid',
+                                  CLOUDFLARE_API_URL='http://testserver/fakeCloudflare')
+        enableApi.enable()
+        self.addCleanup(enableApi.disable)
+
+    def _post_to_fake_endpoint(self, url, headers, data, timeout):  # pylint: disable=unused-argument
+        """ Sends requests.post to the fake Cloudflare endpoint instead """
+        return self.client.post(urlparse(url).path, data=data, content_type='application/json',
+                                HTTP_AUTHORIZATION=headers['Authorization'])
+
+    @patch('requests.post')
+    def test_save_only_queues(self, requestPostResponse):
+        """ Saving doesn't wait on Cloudflare: the purge is queued until after the commit """
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.config.save()
+        requestPostResponse.assert_not_called()
+        self.assertEqual(PendingCloudflarePurge.objects.count(), 8)
+        self.assertIn(BackgroundPurger.wake, callbacks)
+
+        # Nothing is queued if the save is rolled back
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.config.save()
+                raise RuntimeError()
+        self.assertEqual(PendingCloudflarePurge.objects.count(), 8)
+
+    @patch('requests.post')
+    def test_dedupes_and_batches(self, requestPostResponse):
+        """ Each path is purged once, in as few calls as Cloudflare allows """
+        requestPostResponse.side_effect = self._post_to_fake_endpoint
+        paths = [f'/p/{i}' for i in range(PURGE_BATCH_SIZE + 5)]
+        CloudflareAPI.purge_paths_cache(paths)
+        CloudflareAPI.purge_paths_cache(paths[:10])
+
+        with self.assertLogs("common.cloudflare") as logger:
+            self.assertEqual(CloudflareAPI.process_purge_queue(), len(paths))
+        self.assertEqual(requestPostResponse.call_count, 2)
+        self.assertIn("Fake cloudflare purged 30 files in zone zoneid", logger.output[0])
+        self.assertFalse(PendingCloudflarePurge.objects.exists())
+
+    @patch('requests.post')
+    def test_retries_with_backoff(self, requestPostResponse):
+        """ Failed purges stay queued, and are retried later """
+        requestPostResponse.side_effect = TestHelpers.create_request_mock({'success': False}, 500)
+        CloudflareAPI.purge_paths_cache(['/a', '/b'])
+        CloudflareAPI.process_purge_queue()
+
+        queued = PendingCloudflarePurge.objects.all()
+        self.assertEqual([p.numFailedAttempts for p in queued], [1, 1])
+        self.assertGreater(CloudflareAPI.get_next_attempt_time(), timezone.now())
+
+        # Not retried until it's due
+        CloudflareAPI.process_purge_queue()
+        self.assertEqual(requestPostResponse.call_count, 1)
+
+        requestPostResponse.side_effect = self._post_to_fake_endpoint
+        queued.update(nextAttemptAt=timezone.now())
+        out = StringIO()
+        call_command('processCloudflarePurges', stdout=out)
+        self.assertEqual(out.getvalue(), 'Purged 2 paths\n')
+        self.assertIsNone(CloudflareAPI.get_next_attempt_time())
+
+    def test_fake_endpoint(self):
+        """ The fake endpoint rejects what Cloudflare would reject """
+        url = '/fakeCloudflare/zones/zoneid/purge_cache'
+        tooMany = {'files': ['https://example.com/'] * (PURGE_BATCH_SIZE + 1)}
+        response = self.client.post(url, data=tooMany, content_type='application/json',
+                                    HTTP_AUTHORIZATION='Bearer mytoken')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(url, data={'files': []}, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_disabled_api_queues_nothing(self):
+        """ Without Cloudflare credentials, there is nothing to purge """
+        with self.settings(CLOUDFLARE_AUTH_TOKEN=None):
+            JsonConfig.objects.get(pk=self.config.pk).save()
+        self.assertFalse(PendingCloudflarePurge.objects.exists())
@@ -0,0 +1,152 @@
+"""
+Tests for compressing uploaded files at rest
+"""
+
+import gzip
+import io
+import os
+from io import StringIO
+from mock import Mock
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from common import compressedFiles, viewUtils
+from common.compressedFiles import compress_file, get_download_url, hash_content, \
+    open_decompressed
+from common.testUtils import TestHelpers
+from visualizer.models import JsonConfig
+from visualizer.tests import filenames
+
+TestHelpers.silence_logging_spam()
+
+
+class CompressedFilesTests(TestCase):
+    """ Files are compressed when they're saved, and decompressed as they're read """
+
+    def setUp(self):
+        TestHelpers.setup_host_mocks(self)
+
+    @classmethod
+    def _read(cls, filename):
+        with open(filename, 'rb') as f:
+            return f.read()
+
+    def test_compress_file(self):
+        """ Compressed files are named .gz, and only compressed if that's worthwhile """
+        original = self._read(filenames.MULTIWINNER)
+        compressed = compress_file(ContentFile(original, 'results.json'))
+        self.assertEqual(compressed.name, 'results.json.gz')
+        self.assertLess(compressed.size * 3, len(original))
+        self.assertEqual(gzip.decompress(compressed.read()), original)
+
+        # Already compressed, or incompressible
+        self.assertIsNone(compress_file(compressed))
+        self.assertIsNone(compress_file(ContentFile(os.urandom(1000), 'random.bin')))
+
+    def test_open_decompressed(self):
+        """ Reads the original content from the current position, compressed or not """
+        original = self._read(filenames.ONE_ROUND)
+        compressedFile = io.BytesIO(gzip.compress(original))
+        self.assertEqual(open_decompressed(compressedFile).read(), original)
+
+        uncompressedFile = io.BytesIO(original)
+        uncompressedFile.read(10)
+        self.assertEqual(open_decompressed(uncompressedFile).read(), original[10:])
+
+    def test_uploads_are_compressed(self):
+        """ The uploaded files are stored compressed, and still render """
+        with open(filenames.THREE_ROUND, 'rb') as jsonFile, \
+                open(filenames.THREE_ROUND_SIDECAR, 'rb') as sidecarFile:
+            config = JsonConfig.objects.create(jsonFile=File(jsonFile),
+                                               candidateSidecarFile=File(sidecarFile),
+                                               title='x', numRounds=3, numCandidates=4)
+
+        for fieldFile, filename in ((config.jsonFile, filenames.THREE_ROUND),
+                                    (config.candidateSidecarFile, filenames.THREE_ROUND_SIDECAR)):
+            self.assertTrue(fieldFile.name.endswith('.gz'))
+            self.assertLess(fieldFile.size, len(self._read(filename)))
+            self.assertEqual(open_decompressed(fieldFile.open('rb')).read(), self._read(filename))
+
+        response = self.client.get(reverse('visualizeBallotpedia', args=(config.slug,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(JsonConfig.objects.get(pk=config.pk).graphArtifact.name.endswith('.gz'))
+
+        # Saving the file directly, as the DataTables upload does
+        config.jsonFile.save('datatablesfile.json', ContentFile(self._read(filenames.ONE_ROUND)))
+        self.assertTrue(config.jsonFile.name.endswith('.gz'))
+
+    def test_identical_uploads_share_files(self):
+        """ Identical uploads share their files, which are deleted along with the last of them """
+        for _ in range(2):
+            with open(filenames.THREE_ROUND, 'rb') as jsonFile:
+                config = JsonConfig.objects.create(jsonFile=File(jsonFile),
+                                                   title='x', numRounds=3, numCandidates=4)
+            viewUtils.refresh_precomputed_files(config)
+        first, second = JsonConfig.objects.order_by('id')
+
+        self.assertEqual(first.jsonFileHash, hash_content(self._read(filenames.THREE_ROUND)))
+        fieldNames = ('jsonFile', 'standardizedJsonFile', 'graphArtifact')
+        names = [getattr(first, fieldName).name for fieldName in fieldNames]
+        self.assertEqual([getattr(second, fieldName).name for fieldName in fieldNames], names)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        for name in names:
+            self.assertTrue(default_storage.exists(name))
+        response = self.client.get(reverse('visualize', args=(second.slug,)))
+        self.assertEqual(response.status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        for name in names:
+            self.assertFalse(default_storage.exists(name))
+
+    def test_download_url(self):
+        """ On S3, the download is named after the original file """
+        TestHelpers.login(self.client)
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        config = TestHelpers.get_latest_upload()
+        response = self.client.get(reverse('downloadRawData', args=(config.slug,)))
+        self.assertContains(response, f'<a href="{config.jsonFile.url}">')
+
+        fieldFile = Mock(storage=Mock(spec=['bucket', 'url']))
+        fieldFile.name = 'results_AbC1234.json.gz'
+        get_download_url(fieldFile)
+        fieldFile.storage.url.assert_called_once_with(
+            'results_AbC1234.json.gz',
+            parameters={'ResponseContentDisposition':
+                        'attachment; filename="results_AbC1234.json"'})
+
+    def test_recompress_command(self):
+        """ The command compresses older uploads in place, and only once """
+        TestHelpers.login(self.client)
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        config = TestHelpers.get_latest_upload()
+        with open(filenames.MULTIWINNER, 'rb') as f:
+            oldName = default_storage.save('old-upload.json', File(f))
+        JsonConfig.objects.filter(pk=config.pk).update(jsonFile=oldName)
+
+        out = StringIO()
+        call_command('recompressUploads', dry_run=True, stdout=out)
+        self.assertIn(f"Would compress {config.slug}", out.getvalue())
+        self.assertEqual(JsonConfig.objects.get(pk=config.pk).jsonFile.name, oldName)
+
+        out = StringIO()
+        call_command('recompressUploads', batch_size=1, stdout=out)
+        self.assertIn("Compressed 1 configs", out.getvalue())
+        self.assertFalse(default_storage.exists(oldName))
+        config = JsonConfig.objects.get(pk=config.pk)
+        self.assertTrue(compressedFiles.is_compressed_name(config.jsonFile.name))
+        self.assertEqual(open_decompressed(config.jsonFile.open('rb')).read(),
+                         self._read(filenames.MULTIWINNER))
+        response = self.client.get(reverse('visualize', args=(config.slug,)))
+        self.assertEqual(response.status_code, 200)
+
+        out = StringIO()
+        call_command('recompressUploads', stdout=out)
+        self.assertIn("Compressed 0 configs", out.getvalue())
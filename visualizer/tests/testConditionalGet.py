@@ -0,0 +1,135 @@
+"""
+Tests for conditional GETs: pages have ETags and Last-Modified headers,
+and revalidating an unchanged page doesn't render it
+"""
+
+import datetime
+from mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.http import http_date
+
+from common import viewUtils
+from common.testUtils import TestHelpers
+from visualizer.models import JsonConfig
+
+TestHelpers.silence_logging_spam()
+
+
+class ConditionalGetTests(TestCase):
+    """ ETags come from the cache stamps, and Last-Modified from when they changed """
+
+    def setUp(self):
+        self.config = TestHelpers.setup_multiwinner_upload(self)
+        self.url = reverse('visualize', args=(self.config.slug,))
+
+    def _get(self, url, **headers):
+        """ Requests the url, returning the response and the number of times it was rendered """
+        with patch('common.viewUtils.get_data_for_view',
+                   wraps=viewUtils.get_data_for_view) as mockGetData:
+            response = self.client.get(url, **headers)
+        return response, mockGetData.call_count
+
+    def test_revalidation_does_not_render(self):
+        """ A matching ETag gets a 304, whether or not the page is in the page cache """
+        response, numRenders = self._get(self.url)
+        self.assertEqual(numRenders, 1)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(response['Last-Modified'], http_date(self.config.updatedAt.timestamp()))
+
+        # From the page cache
+        response, numRenders = self._get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(numRenders, 0)
+
+        # And without it
+        cache.clear()
+        response, numRenders = self._get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(numRenders, 0)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('stale-while-revalidate=', response['Cache-Control'])
+
+        response, numRenders = self._get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(numRenders, 0)
+
+    def test_save_changes_validators(self):
+        """ Saving the config changes the ETag and Last-Modified of its pages """
+        urls = [self.url,
+                reverse('visualizeEmbedded', args=(self.config.slug,)),
+                reverse('visualizeEmbedded', args=(self.config.slug,)) + '?vistype=sankey',
+                reverse('visualizeBallotpedia', args=(self.config.slug,))]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        self.assertEqual(len(set(etags)), len(urls))
+
+        self.config.updatedAt -= datetime.timedelta(days=1)
+        JsonConfig.objects.filter(pk=self.config.pk).update(updatedAt=self.config.updatedAt)
+        lastModified = http_date(self.config.updatedAt.timestamp())
+        self.config.save()
+
+        for url, etag in zip(urls, etags):
+            response, numRenders = self._get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(numRenders, 1)
+
+            response, _ = self._get(url, HTTP_IF_MODIFIED_SINCE=lastModified)
+            self.assertEqual(response.status_code, 200)
+
+    def test_release_changes_etag(self):
+        """ A new release may change any page """
+        etag = self.client.get(self.url)['ETag']
+        cache.clear()
+        with self.settings(RELEASE_VERSION='v2'):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_cache_control_is_configurable(self):
+        """ The Cache-Control of the pages comes from PAGE_CACHE_CONTROL """
+        with self.settings(PAGE_CACHE_CONTROL={'public': True, 'max_age': 30,
+                                               'stale_while_revalidate': 90}):
+            response = self.client.get(self.url)
+        self.assertEqual(response['Cache-Control'],
+                         'public, max-age=30, stale-while-revalidate=90')
+
+    def test_oembed_revalidates_without_database(self):
+        """ Crawlers revalidating oembed get a 304 without it resolving or reading anything """
+        url = reverse('oembed') + '?url=https://www.rcvis.com' + self.url
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('stale-while-revalidate=', response['Cache-Control'])
+
+        cache.clear()
+        with patch('visualizer.views.resolve') as mockResolve, self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            mockResolve.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+
+        # A different URL is a different response
+        response = self.client.get(url + '&maxwidth=500', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_election_page(self):
+        """ The election page changes when any config on it does """
+        page = TestHelpers.make_election_page(self.config)
+        url = reverse('electionPage', args=(page.slug,))
+
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.config.save()
+        self.config.refresh_from_db()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Last-Modified'], http_date(self.config.updatedAt.timestamp()))
+
+    def test_missing_page(self):
+        """ There is nothing to validate for a page which doesn't exist """
+        response = self.client.get(reverse('visualize', args=('no-such-slug',)))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertNotIn('stale-while-revalidate', response.get('Cache-Control', ''))
@@ -0,0 +1,174 @@
+"""
+Tests for the files precomputed at upload time: the standardized json and the graph artifact
+"""
+
+from io import StringIO
+import json
+from mock import patch
+
+from django.core.files import File
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from common import viewUtils
+from common.compressedFiles import open_decompressed
+from common.testUtils import TestHelpers
+from visualizer.graph import graphArtifact
+from visualizer.models import JsonConfig
+from visualizer.tests import filenames
+
+TestHelpers.silence_logging_spam()
+
+
+class GraphArtifactTests(TestCase):
+    """ Tests that the graph artifact is created, used, and invalidated """
+
+    def setUp(self):
+        TestHelpers.setup_host_mocks(self)
+
+    @classmethod
+    def _get_js_data(cls, graph, config):
+        """ The data which is passed on to JS, which must not change when using the artifact """
+        data = viewUtils.resolve_lazy_data(viewUtils.get_data_for_graph(graph, config))
+        keys = ['title', 'date', 'bargraphData', 'sankeyData', 'sankeyLayout',
+                'humanFriendlyEventsPerRound', 'humanFriendlySummary', 'faqsPerRound']
+        return {key: data[key] for key in keys}
+
+    def _assert_roundtrip_matches(self, filename, sidecarFilename=None):
+        """ The graph from the artifact should produce the same data as the parsed graph """
+        with open(filename, 'rb') as f:
+            config = JsonConfig(jsonFile=File(f))
+            if sidecarFilename:
+                config.candidateSidecarFile = File(open(sidecarFilename, 'rb'))
+            parsedGraph, sidecar = viewUtils.make_graph_for_config(config)
+            sourceKey = viewUtils.get_artifact_source_key(config)
+
+            artifact = graphArtifact.graph_to_artifact(parsedGraph, sourceKey, sidecar)
+            artifact = json.loads(json.dumps(artifact))
+            loadedGraph, loadedSidecar = graphArtifact.artifact_to_graph(artifact, sourceKey)
+
+            self.assertEqual(sidecar, loadedSidecar)
+            self.assertEqual(self._get_js_data(parsedGraph, config),
+                             self._get_js_data(loadedGraph, config))
+
+    def test_roundtrip(self):
+        """ Tests a variety of files, including sidecar ordering """
+        self._assert_roundtrip_matches(filenames.MULTIWINNER)
+        self._assert_roundtrip_matches(filenames.OPAVOTE)
+        self._assert_roundtrip_matches(filenames.BROKEN_RANKIT_1)
+        self._assert_roundtrip_matches(filenames.RESIDUAL_SURPLUS_MAIN)
+        self._assert_roundtrip_matches(filenames.THREE_ROUND, filenames.THREE_ROUND_SIDECAR)
+
+    def test_stale_artifacts_raise(self):
+        """ Old versions and different source files cannot be used """
+        with open(filenames.ONE_ROUND, 'rb') as f:
+            config = JsonConfig(jsonFile=File(f))
+            graph, sidecar = viewUtils.make_graph_for_config(config)
+        artifact = graphArtifact.graph_to_artifact(graph, {'jsonFile': 'a'}, sidecar)
+
+        with self.assertRaises(graphArtifact.StaleArtifactError):
+            graphArtifact.artifact_to_graph(artifact, {'jsonFile': 'b'})
+
+        artifact['version'] = graphArtifact.ARTIFACT_VERSION - 1
+        with self.assertRaises(graphArtifact.StaleArtifactError):
+            graphArtifact.artifact_to_graph(artifact, {'jsonFile': 'a'})
+
+    def test_upload_creates_artifact_and_views_use_it(self):
+        """ Uploading creates the artifact, and views do not need to re-parse the file """
+        TestHelpers.login(self.client)
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        config = TestHelpers.get_latest_upload()
+        self.assertTrue(config.graphArtifact)
+
+        with patch('common.viewUtils.make_graph_with_file') as mockMakeGraph:
+            response = self.client.get(reverse('visualize', args=(config.slug,)))
+            self.assertEqual(response.status_code, 200)
+            mockMakeGraph.assert_not_called()
+
+    def test_upload_parses_files_once(self):
+        """ Validating, standardizing and building the artifact share one parse of each file """
+        TestHelpers.login(self.client)
+        with patch('visualizer.graph.graphCreator.open_decompressed',
+                   wraps=open_decompressed) as mockOpenJson, \
+                patch('visualizer.sidecar.reader.open_decompressed',
+                      wraps=open_decompressed) as mockOpenSidecar, \
+                open(filenames.THREE_ROUND) as jsonFile, \
+                open(filenames.THREE_ROUND_SIDECAR) as sidecarFile:
+            response = self.client.post('/upload.html', {
+                'jsonFile': jsonFile,
+                'candidateSidecarFile': sidecarFile,
+                'excludeFinalWinnerAndEliminatedCandidate': True})
+            self.assertEqual(response.status_code, 302)
+            mockOpenJson.assert_called_once()
+            mockOpenSidecar.assert_called_once()
+
+        config = TestHelpers.get_latest_upload()
+        self.assertTrue(config.excludeFinalWinnerAndEliminatedCandidate)
+        loadedGraph, loadedSidecar = viewUtils.load_graph_artifact(config)
+        parsedGraph, sidecar = viewUtils.make_graph_for_config(config)
+        self.assertEqual(loadedSidecar, sidecar)
+        self.assertEqual(self._get_js_data(loadedGraph, config),
+                         self._get_js_data(parsedGraph, config))
+        with config.standardizedJsonFile.open('rb') as f:
+            self.assertEqual(open_decompressed(f).read(),
+                             viewUtils.standardize_json(config.jsonFile))
+
+    def test_outdated_artifact_is_rebuilt(self):
+        """ An outdated artifact falls back to parsing, then is replaced """
+        TestHelpers.login(self.client)
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        config = TestHelpers.get_latest_upload()
+
+        with patch('visualizer.graph.graphArtifact.ARTIFACT_VERSION', -1):
+            viewUtils.load_graph_for_config(config)
+        outdatedName = JsonConfig.objects.get(pk=config.pk).graphArtifact.name
+
+        with patch('common.viewUtils.make_graph_with_file',
+                   wraps=viewUtils.make_graph_with_file) as mockMakeGraph:
+            viewUtils.load_graph_for_config(config)
+            mockMakeGraph.assert_called_once()
+            viewUtils.load_graph_for_config(config)
+            mockMakeGraph.assert_called_once()
+
+        self.assertNotEqual(JsonConfig.objects.get(pk=config.pk).graphArtifact.name, outdatedName)
+
+    def test_upload_stores_standardized_json(self):
+        """ Non-UT uploads are converted once, and the original is kept for download """
+        TestHelpers.login(self.client)
+        with open(filenames.ELECTIONBUDDY, 'rb') as f:
+            self.client.post('/upload.html', {'jsonFile': f})
+        config = TestHelpers.get_latest_upload()
+        self.assertTrue(config.standardizedJsonFile)
+        self.assertTrue(config.jsonFile.name.startswith('electionbuddy.csv'))
+        self.assertTrue(config.jsonFile.name.endswith('.gz'))
+        with open(filenames.ELECTIONBUDDY, 'rb') as f:
+            self.assertEqual(open_decompressed(config.jsonFile).read(), f.read())
+
+        # The standardized file is valid UT, and renders need not convert again
+        JsonConfig.objects.filter(pk=config.pk).update(graphArtifact=None)
+        with patch('visualizer.graph.graphCreator.convert_to_standardized_format') as mockConvert:
+            response = self.client.get(reverse('visualize', args=(config.slug,)))
+            self.assertEqual(response.status_code, 200)
+            mockConvert.assert_not_called()
+
+    def test_backfill_command(self):
+        """ The backfill command creates files for older uploads, skipping newer ones """
+        TestHelpers.login(self.client)
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        config = TestHelpers.get_latest_upload()
+        JsonConfig.objects.filter(pk=config.pk).update(standardizedJsonFile=None,
+                                                       graphArtifact=None)
+
+        out = StringIO()
+        call_command('backfillStandardizedFiles', stdout=out)
+        self.assertIn(f"Converted {config.slug}", out.getvalue())
+
+        config = JsonConfig.objects.get(pk=config.pk)
+        self.assertTrue(config.standardizedJsonFile)
+        self.assertTrue(config.graphArtifact)
+
+        # Running it again is a no-op
+        out = StringIO()
+        call_command('backfillStandardizedFiles', stdout=out)
+        self.assertNotIn("Converted", out.getvalue())
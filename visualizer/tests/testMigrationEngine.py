@@ -0,0 +1,89 @@
+"""
+Tests for the single-pass migration engine in readRCVRCJSON
+"""
+
+import copy
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from common.testUtils import TestHelpers
+from visualizer.graph import syntheticData
+from visualizer.graph.graphCreator import convert_to_standardized_format
+from visualizer.graph.readRCVRCJSON import JSONReader, MigrationEngine, \
+    MakeTalliesANumber, HideDecimalsTask
+from visualizer.tests import filenames
+
+TestHelpers.silence_logging_spam()
+
+
+# What each file migrated to before the migrations were fused, when each task walked the
+# whole file on its own
+FILENAME_EXPECTED_MIGRATIONS = 'testData/expected-migrations.json'
+
+
+class MigrationEngineTests(TestCase):
+    """ Tests that the migrations give the same result as they did before they were fused """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(FILENAME_EXPECTED_MIGRATIONS, 'r') as f:
+            cls.expectedMigrations = json.load(f)
+
+    @classmethod
+    def _migrate_all_at_once(cls, data):
+        data = copy.deepcopy(data)
+        MigrationEngine(data, [task(data) for task in JSONReader.get_migration_tasks()]).run()
+        return data
+
+    @classmethod
+    def _migrate_one_task_at_a_time(cls, data):
+        data = copy.deepcopy(data)
+        for taskClass in JSONReader.get_migration_tasks():
+            taskClass(data).do()
+        return data
+
+    def _assert_migrates_as_before(self, name, data):
+        """ Compares the serialized json, so the order of candidates must also match """
+        expected = json.dumps(self.expectedMigrations[name])
+        self.assertEqual(json.dumps(self._migrate_all_at_once(data)), expected, name)
+        self.assertEqual(json.dumps(self._migrate_one_task_at_a_time(data)), expected, name)
+
+    def test_test_files_migrate_as_before(self):
+        """ Tests every format and every fix: rankit, residual surplus, inactive ballots... """
+        for filename in (filenames.MULTIWINNER, filenames.OPAVOTE, filenames.ELECTIONBUDDY,
+                         filenames.DOMINION, filenames.ONE_ROUND, filenames.THREE_ROUND,
+                         filenames.ZERO_VOTE_ELECTION, filenames.SOME_MISSING_TRANSFERS,
+                         filenames.INACTIVE_BALLOT_APPEARS_LATER,
+                         filenames.RESIDUAL_SURPLUS_MAIN, filenames.BATCH_ELIMINATION):
+            with open(filename, 'rb') as f:
+                self._assert_migrates_as_before(filename, convert_to_standardized_format(f))
+
+        # RankIt files are not valid Universal Tabulator files: load them directly
+        for filename in (filenames.BROKEN_RANKIT_1, filenames.BROKEN_RANKIT_2):
+            with open(filename, 'r') as f:
+                self._assert_migrates_as_before(filename, json.load(f))
+
+    def test_synthetic_files_migrate_as_before(self):
+        """ Tests edge cases and larger elections """
+        for numCandidates, numRounds in ((1, 1), (2, 1), (2, 2), (12, 10)):
+            data = syntheticData.generate_election(numCandidates, numRounds)
+            self._assert_migrates_as_before(f'synthetic {numCandidates}x{numRounds}', data)
+
+    def test_number_conversions_are_composed(self):
+        """ Number conversions are applied in order, in a single pass """
+        data = syntheticData.generate_election(3, 2)
+        MigrationEngine(data, [MakeTalliesANumber(data), HideDecimalsTask(data)]).run()
+        for result in data['results']:
+            for count in result['tally'].values():
+                self.assertIsInstance(count, int)
+
+    def test_benchmark_command(self):
+        """ Runs a tiny benchmark """
+        out = StringIO()
+        call_command('benchmarkJsonReader', sizes='10x5', repeat=1, stdout=out)
+        self.assertIn("Synthetic 10x5", out.getvalue())
+        self.assertIn("Benchmark complete", out.getvalue())
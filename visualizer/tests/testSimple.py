@@ -6,6 +6,7 @@ from io import StringIO
 import json
 from mock import patch
 
+from django.core.cache import cache
 from django.core.files import File
 from django.core.management import call_command
 from django.test import TestCase
@@ -14,7 +15,8 @@ from django.urls import reverse
 from rcvformats.schemas.universaltabulator import SchemaV0 as UTSchema
 
 from common.testUtils import TestHelpers
-from common.viewUtils import get_data_for_view
+from common import viewUtils
+from common.viewUtils import get_data_for_view, resolve_lazy_data
 from common.cloudflare import CloudflareAPI
 from visualizer.graph.graphCreator import BadJSONError
 from visualizer.graph.graphCreator import make_graph_with_file
@@ -31,6 +33,8 @@ class SimpleTests(TestCase):
     """ Simple tests that do not require a live browser """
 
     def setUp(self):
+        # Pages cached by other tests may have the same cache keys: the database is reset
+        cache.clear()
         TestHelpers.login(self.client)
         TestHelpers.setup_host_mocks(self)
 
@@ -42,7 +46,7 @@ class SimpleTests(TestCase):
         """ Opens the given file and creates a graph with it """
         with open(fn, 'rb+') as f:
             config = JsonConfig(jsonFile=File(f))
-            return get_data_for_view(config)
+            return resolve_lazy_data(get_data_for_view(config))
 
     def test_inactive_ballots_appears_later(self):
         """
@@ -146,7 +150,7 @@ class SimpleTests(TestCase):
             with open(fn, 'r+') as f:
                 config = JsonConfig(jsonFile=File(f))
                 config.__dict__[configBoolToToggle] = not config.__dict__[configBoolToToggle]
-                get_data_for_view(config)
+                resolve_lazy_data(get_data_for_view(config))
 
     def test_home_page(self):
         """ Tests that the home page loads """
@@ -251,6 +255,33 @@ class SimpleTests(TestCase):
 
         assert 'sankey' in response.context_data['oembed_url']
 
+    def test_embedded_only_computes_its_vistype(self):
+        """ The embedded view only computes the visualization it shows """
+        TestHelpers.get_multiwinner_upload_response(self.client)
+        slug = TestHelpers.get_latest_upload().slug
+        embeddedUrl = reverse('visualizeEmbedded', args=(slug,)) + "?vistype=tabular-by-round"
+
+        tabulateByRound = viewUtils.TabulateByRound
+        with patch('common.viewUtils.TabulateByRound', wraps=tabulateByRound) as mockTab, \
+                patch('common.viewUtils.D3Sankey') as mockSankey, \
+                patch('common.viewUtils.D3Bargraph') as mockBargraph, \
+                patch('common.viewUtils.TabulateByCandidate') as mockTabular, \
+                patch('common.viewUtils.Describer') as mockDescriber, \
+                patch('common.viewUtils.FAQGenerator') as mockFaq:
+            response = self.client.get(embeddedUrl)
+            self.assertEqual(response.status_code, 200)
+            mockTab.assert_called_once()
+            mockSankey.assert_not_called()
+            mockBargraph.assert_not_called()
+            mockTabular.assert_not_called()
+            mockDescriber.assert_not_called()
+            mockFaq.assert_not_called()
+
+        # The data for the javascript is fetched separately
+        dataUrl = reverse('visualizationData', args=(slug,))
+        self.assertContains(response, f'fetch("{dataUrl}")')
+        self.assertNotContains(response, 'id="visualization-data"')
+
     def test_embedly_translation(self):
         """
         The embedly URLs are are prettier than the ?vistype= URLs.
@@ -316,6 +347,34 @@ class SimpleTests(TestCase):
         assert summary.rounds[0].winnerNames[0] == 'Strawberry'
         assert summary.rounds[2].winnerNames[0] == 'Vanilla'
 
+    def test_electionbuddy_payload_is_sane(self):
+        """ Validates the columnar data passed on to the sankey and bar graph javascript """
+        with open(filenames.ELECTIONBUDDY, 'r+') as f:
+            graph = make_graph_with_file(f, excludeFinalWinnerAndEliminatedCandidate=False)
+        data = resolve_lazy_data(viewUtils.get_data_for_graph(graph, JsonConfig()))
+        sankey = data['sankeyData']
+        bargraph = data['bargraphData']
+
+        # Every column has one entry per node or link
+        numNodes = len(sankey['nodes']['candidate'])
+        numLinks = len(sankey['links']['candidate'])
+        self.assertTrue(all(len(c) == numNodes for c in sankey['nodes'].values()))
+        self.assertTrue(all(len(c) == numLinks for c in sankey['links'].values()))
+        self.assertEqual(len(sankey['candidates']), sankey['numCandidates'])
+
+        # Bar graph: one entry per candidate per round
+        self.assertEqual(len(bargraph['votesAddedPerRound']), 3)
+        self.assertTrue(all(len(r) == len(bargraph['candidates'])
+                            for r in bargraph['votesAddedPerRound']))
+
+        # Whole numbers of votes are written as integers
+        self.assertEqual(json.dumps(sankey['links']['value']), '[1, 2, 3, 1, 2, 3]')
+
+        out = StringIO()
+        call_command('benchmarkPayloadSize', directory='testData', sizes='10x5', stdout=out)
+        self.assertIn("Synthetic 10x5", out.getvalue())
+        self.assertIn("Benchmark complete", out.getvalue())
+
     def test_uniqueness(self):
         """ Ensures filenames are not overwritten """
         slug0 = "city-of-eastpointe-macomb-county-mi"
@@ -332,7 +391,9 @@ class SimpleTests(TestCase):
         model0 = JsonConfig.objects.get(slug=slug0)
         model1 = JsonConfig.objects.get(slug=slug1)
 
-        assert model0.jsonFile.name != model1.jsonFile.name
+        # Identical uploads share a file rather than overwrite each other's
+        self.assertEqual(model0.jsonFile.name, model1.jsonFile.name)
+        self.assertEqual(model0.jsonFileHash, model1.jsonFileHash)
 
     def test_management_commands(self):
         """ Test that the management tests work """
@@ -371,8 +432,11 @@ class SimpleTests(TestCase):
         with self.settings(
                 CLOUDFLARE_AUTH_TOKEN='mytoken',
                 CLOUDFLARE_ZONE_ID='zoneid'):
+            # Purging is queued, then processed in the background
+            CloudflareAPI.purge_vis_cache(slug)
+            requestPostResponse.assert_not_called()
             with self.assertLogs("common.cloudflare") as logger:
-                CloudflareAPI.purge_vis_cache(slug)
+                CloudflareAPI.process_purge_queue()
                 self.assertListEqual(logger.output, [expectedLogString])
 
         expectedUrl = 'https://api.cloudflare.com/client/v4/zones/zoneid/purge_cache'
@@ -393,7 +457,8 @@ class SimpleTests(TestCase):
                 "https://example.com/vb/city-of-eastpointe-macomb-county-mi"]}
         requestPostResponse.assert_called_with(expectedUrl,
                                                headers=expectedHeaders,
-                                               data=json.dumps(expectedData))
+                                               data=json.dumps(expectedData),
+                                               timeout=30)
 
     def test_homepage_real_world_examples(self):
         """
@@ -476,8 +541,9 @@ class SimpleTests(TestCase):
         def get_response_content_for_enum(textForWinnerVal):
             with open(filenames.MULTIWINNER) as f:
                 data = {'jsonFile': f, 'textForWinner': textForWinnerVal}
-                response = self.client.post('/upload.html', data)
-            response = self.client.get('/' + response['location'])
+                self.client.post('/upload.html', data)
+            slug = TestHelpers.get_latest_upload().slug
+            response = self.client.get(reverse('visualizationData', args=(slug,)))
             return response.content
 
         content = get_response_content_for_enum(0)
@@ -0,0 +1,181 @@
+"""
+Tests for LocalCacheStorage, the local disk cache of uploaded files
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from common.cachedStorage import LocalCacheStorage
+from common.testUtils import SimulatedLatencyStorage, TestHelpers
+
+TestHelpers.silence_logging_spam()
+
+
+class LocalCacheStorageTests(SimpleTestCase):
+    """ Reads through a storage which counts its requests, like S3 would bill them """
+
+    def setUp(self):
+        self.mediaDir = tempfile.mkdtemp()
+        self.cacheDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.mediaDir)
+        self.addCleanup(shutil.rmtree, self.cacheDir)
+        self.backend = SimulatedLatencyStorage(latencySeconds=0, location=self.mediaDir)
+        self.storage = self._make_storage()
+
+    def _make_storage(self, **kwargs):
+        return LocalCacheStorage(backend=self.backend, cacheDir=self.cacheDir, **kwargs)
+
+    def _read(self, name, storage=None):
+        """ Reads the file, returning its content and how many requests that took """
+        numRequests = self.backend.numRequests
+        with (storage or self.storage).open(name) as f:
+            content = f.read()
+        return content, self.backend.numRequests - numRequests
+
+    def _num_cached_objects(self):
+        return sum(len(files) for _, _, files in os.walk(os.path.join(self.cacheDir, 'objects')))
+
+    def test_hits_make_no_requests(self):
+        """ Once read, a file is read from disk, by this process or any other """
+        name = self.storage.save('election.json', ContentFile(b'{"results": []}'))
+        self.assertEqual(self._read(name), (b'{"results": []}', 2))
+        self.assertEqual(self._read(name), (b'{"results": []}', 0))
+        self.assertEqual(self._read(name, self._make_storage()), (b'{"results": []}', 0))
+        self.assertEqual(self.storage.stats['misses'], 1)
+        self.assertEqual(self.storage.stats['hits'], 1)
+
+    def test_identical_files_stored_once(self):
+        """ Entries are content-addressed """
+        for name in ('a.json', 'b.json', 'c.json'):
+            name = self.storage.save(name, ContentFile(b'same'))
+            self._read(name)
+        name = self.storage.save('d.json', ContentFile(b'different'))
+        self._read(name)
+        self.assertEqual(self._num_cached_objects(), 2)
+
+    def test_names_never_reused(self):
+        """ A name always refers to the same content, even after it's deleted """
+        name = self.storage.save('election.json', ContentFile(b'old'))
+        self._read(name)
+        self.storage.delete(name)
+        self.assertFalse(self.backend.exists(name))
+
+        newName = self.storage.save(name, ContentFile(b'new'))
+        self.assertNotEqual(newName, name)
+        self.assertEqual(self._read(newName)[0], b'new')
+
+        # Compound extensions stay together
+        newName = self.storage.save('election.json.gz', ContentFile(b''))
+        self.assertTrue(newName.endswith('.json.gz'))
+
+    def test_revalidates_old_entries(self):
+        """ Entries older than revalidateSeconds are checked against the backend's version """
+        storage = self._make_storage(revalidateSeconds=0)
+        name = storage.save('election.json', ContentFile(b'old'))
+        self._read(name, storage)
+        self.assertEqual(self._read(name, storage), (b'old', 1))
+        self.assertEqual(storage.stats['hits'], 1)
+
+        # Changed behind the storage's back
+        with open(self.backend.path(name), 'wb') as f:
+            f.write(b'new')
+        os.utime(self.backend.path(name), (0, 0))
+        self.assertEqual(self._read(name, storage)[0], b'new')
+        self.assertEqual(storage.stats['misses'], 2)
+        self.assertEqual(storage.stats['revalidations'], 2)
+
+    def test_evicts_least_recently_used(self):
+        """ Past maxBytes, the files read longest ago are evicted """
+        storage = self._make_storage(maxBytes=25)
+        names = [storage.save(f'{i}.json', ContentFile(str(i).encode() * 10)) for i in range(3)]
+        for name in names[:2]:
+            self._read(name, storage)
+        for i, name in enumerate(names[:2]):
+            # pylint: disable=protected-access
+            os.utime(storage._object_path(storage._read_index(name)['hash']), (i, i))
+
+        # Reading the first makes it the most recently used, so the second is evicted
+        self.assertEqual(self._read(names[0], storage)[1], 0)
+        self._read(names[2], storage)
+        self.assertEqual(storage.stats['evictions'], 1)
+        self.assertEqual(self._read(names[0], storage)[1], 0)
+        self.assertEqual(self._read(names[1], storage), (b'1' * 10, 2))
+
+    def test_missing_file(self):
+        """ Missing files raise the backend's usual error """
+        with self.assertRaises(FileNotFoundError):
+            self.storage.open('missing.json')
+        self.assertEqual(self.storage.stats['uncacheable'], 1)
+
+    def test_benchmark_is_sane(self):
+        """ The benchmark runs """
+        out = StringIO()
+        call_command('benchmarkStorageCache', latency=0, repeat=2, stdout=out)
+        self.assertIn("Benchmark complete", out.getvalue())
+
+
+class DefaultStorageTests(TestCase):
+    """ Uploads are read through the cache when it's the DEFAULT_FILE_STORAGE """
+
+    def setUp(self):
+        cache.clear()
+        self.cacheDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cacheDir)
+        TestHelpers.setup_host_mocks(self)
+
+    def test_renders_through_cache(self):
+        """ A page rendered again after the page cache is cleared doesn't fetch the files """
+        with self.settings(DEFAULT_FILE_STORAGE='common.cachedStorage.LocalCacheStorage',
+                           STORAGE_CACHE_BACKEND='django.core.files.storage.FileSystemStorage',
+                           STORAGE_CACHE_DIR=self.cacheDir):
+            TestHelpers.login(self.client)
+            TestHelpers.get_multiwinner_upload_response(self.client)
+            TestHelpers.logout(self.client)
+            config = TestHelpers.get_latest_upload()
+
+            response = self.client.get(f'/v/{config.slug}')
+            self.assertEqual(response.status_code, 200)
+            self.assertGreater(default_storage.stats['misses'], 0)
+
+            cache.clear()
+            misses = default_storage.stats['misses']
+            response = self.client.get(f'/v/{config.slug}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(default_storage.stats['misses'], misses)
+            self.assertGreater(default_storage.stats['hits'], 0)
+
+
+class SpeechSynthStorageTests(SimpleTestCase):
+    """ The speech synth bucket works with the production storage settings """
+
+    def test_models_load_with_s3(self):
+        """
+        Outside of OFFLINE_MODE, the speech synth storage is an S3 storage of its own bucket,
+        even though DEFAULT_FILE_STORAGE is the cache in front of S3. The models are loaded
+        by django.setup(), so that's done in a fresh process.
+        """
+        script = "\n".join([
+            "import django",
+            "from django.conf import settings",
+            "settings.OFFLINE_MODE = False",
+            "settings.DEFAULT_FILE_STORAGE = 'common.cachedStorage.LocalCacheStorage'",
+            "settings.STORAGE_CACHE_BACKEND = 'storages.backends.s3boto3.S3Boto3Storage'",
+            "settings.AWS_POLLY_STORAGE_BUCKET_NAME = 'polly-bucket'",
+            "django.setup()",
+            "from movie.models import TextToSpeechCachedFile",
+            "storage = TextToSpeechCachedFile._meta.get_field('audioFile').storage",
+            "print(type(storage).__mro__[1].__name__, storage.bucket_name)"])
+        output = subprocess.run([sys.executable, '-c', script], check=True,
+                                capture_output=True, text=True, cwd=settings.BASE_DIR).stdout
+        self.assertEqual(output.split(), ['S3Boto3Storage', 'polly-bucket'])
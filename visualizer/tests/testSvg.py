@@ -0,0 +1,100 @@
+"""
+Tests for the static SVGs drawn on the server
+"""
+
+from xml.etree import ElementTree
+from mock import patch
+
+from django.test import TestCase
+from django.urls import reverse
+
+from common import viewUtils
+from common.testUtils import TestHelpers
+from visualizer.colors import get_colors
+from visualizer.common import INACTIVE_TEXT, RESIDUAL_SURPLUS_TEXT
+from visualizer.models import ColorTheme
+from visualizer.tests import filenames
+
+TestHelpers.silence_logging_spam()
+
+SVG_NAMESPACE = '{http://www.w3.org/2000/svg}'
+
+
+class SvgTests(TestCase):
+    """ The bar chart and sankey are drawn as SVGs once per version, and revalidated with ETags """
+
+    def setUp(self):
+        self.config = TestHelpers.setup_multiwinner_upload(self)
+
+    def _get(self, vistype, **headers):
+        """ Requests the SVG, counting how many times it was drawn """
+        with patch('common.viewUtils.load_graph_for_config',
+                   wraps=viewUtils.load_graph_for_config) as mockLoadGraph:
+            response = self.client.get(
+                reverse('visualizationSvg', args=(self.config.slug, vistype)), **headers)
+        return response, mockLoadGraph.call_count
+
+    def _get_texts(self, vistype):
+        response, _ = self._get(vistype)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        root = ElementTree.fromstring(response.content)
+        self.assertEqual(root.tag, SVG_NAMESPACE + 'svg')
+        return [element.text for element in root.iter(SVG_NAMESPACE + 'text')]
+
+    def test_colors_match_javascript(self):
+        """ The colors are exactly those colors.js generates """
+        self.assertEqual(get_colors(ColorTheme.RAINBOW, 3), ['#e6c352', '#ffa2ff', '#00e1fd'])
+        self.assertEqual(get_colors(ColorTheme.PURPLE_TO_ORANGE, 3),
+                         ['#c7cfff', '#e5cceb', '#f8cabb'])
+        self.assertEqual(get_colors(ColorTheme.ALTERNATING, 3), ['#c4cfff', '#ffc989', '#c4cfff'])
+
+    def test_draws_candidates(self):
+        """ Both vistypes are valid SVGs with every candidate's name """
+        graph, _ = viewUtils.load_graph_for_config(self.config)
+        names = [item.name for item in graph.nodesPerRound[0]
+                 if item.name not in (INACTIVE_TEXT, RESIDUAL_SURPLUS_TEXT)]
+        for vistype in viewUtils.SVG_RENDERERS:
+            texts = self._get_texts(vistype)
+            for name in names:
+                self.assertIn(name, texts)
+
+        response, _ = self._get('tabular-by-round')
+        self.assertEqual(response.status_code, 404)
+
+    def test_drawn_once_and_revalidated(self):
+        """ Each SVG is drawn once per version, a matching ETag gets a 304, saving redraws """
+        response, numDrawn = self._get('sankey')
+        self.assertEqual(numDrawn, 1)
+        etag = response['ETag']
+
+        response, numDrawn = self._get('sankey', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(numDrawn, 0)
+        self.assertEqual(response.status_code, 304)
+
+        self.config.horizontalSankey = not self.config.horizontalSankey
+        self.config.save()
+        response, numDrawn = self._get('sankey', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(numDrawn, 1)
+        self.assertEqual(response.status_code, 200)
+
+    def test_one_round(self):
+        """ A single-round election has no sankey to draw, but still has a bar chart """
+        TestHelpers.login(self.client)
+        with open(filenames.ONE_ROUND) as f:
+            self.client.post('/upload.html', {'jsonFile': f})
+        self.config = TestHelpers.get_latest_upload()
+        self.assertEqual(len(self._get_texts('sankey')), 1)
+        self.assertGreater(len(self._get_texts('barchart-fixed')), 1)
+
+    def test_pages_show_svg_first(self):
+        """ The pages show the SVGs until the javascript draws over them """
+        svgUrl = reverse('visualizationSvg', args=(self.config.slug, 'barchart-fixed'))
+        response = self.client.get(reverse('visualizeEmbedded', args=(self.config.slug,)),
+                                   {'vistype': 'barchart-fixed'})
+        self.assertContains(response, f'src="{svgUrl}"')
+
+        response = self.client.get(reverse('visualize', args=(self.config.slug,)))
+        self.assertContains(response, 'class="svg-first-paint"', count=2)
+        # Link previews don't show SVGs
+        self.assertNotContains(response, 'og:image')
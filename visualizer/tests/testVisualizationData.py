@@ -0,0 +1,148 @@
+"""
+Tests for the visualizationData endpoint, which serves the data for the javascript
+separately from the pages
+"""
+
+import gzip
+import json
+from mock import patch
+
+import brotli
+from django.test import TestCase
+from django.urls import reverse
+
+from common import viewUtils
+from common.precompressed import parse_accept_encoding
+from common.testUtils import TestHelpers
+from visualizer.models import TextForWinner
+
+TestHelpers.silence_logging_spam()
+
+
+class VisualizationDataTests(TestCase):
+    """ The data is computed and compressed once per version, then revalidated with ETags """
+
+    def setUp(self):
+        self.config = TestHelpers.setup_multiwinner_upload(self)
+        self.url = reverse('visualizationData', args=(self.config.slug,))
+
+    def _get(self, **headers):
+        """ Requests the data, counting how many times it was computed """
+        with patch('common.viewUtils.get_chart_data',
+                   wraps=viewUtils.get_chart_data) as mockGetChartData:
+            response = self.client.get(self.url, **headers)
+        return response, mockGetChartData.call_count
+
+    def test_matches_chart_data(self):
+        """ Every encoding holds the same data, which is what the pages used to embed """
+        response, _ = self._get()
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        data = json.loads(response.content)
+
+        expected = viewUtils.get_chart_data(viewUtils.get_data_for_view(self.config))
+        self.assertEqual(data, json.loads(json.dumps(expected)))
+        self.assertEqual(set(data.keys()),
+                         set(viewUtils.CHART_DATA_KEYS) | {'candidateSidecarData'})
+
+        response, _ = self._get(HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content)), data)
+
+        response, _ = self._get(HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(json.loads(brotli.decompress(response.content)), data)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_computed_once_and_revalidated(self):
+        """ The data is only computed once per version, and a matching ETag gets a 304 """
+        response, numComputed = self._get(HTTP_ACCEPT_ENCODING='br')
+        self.assertEqual(numComputed, 1)
+        etag = response['ETag']
+
+        response, numComputed = self._get(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(numComputed, 0)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        response, numComputed = self._get(HTTP_ACCEPT_ENCODING='br', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(numComputed, 0)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_etag_follows_content(self):
+        """ Saving recomputes the data, but the ETag only changes if the data did """
+        response, _ = self._get()
+        etag = response['ETag']
+
+        self.config.save()
+        response, numComputed = self._get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(numComputed, 1)
+        self.assertEqual(response.status_code, 304)
+
+        self.config.textForWinner = TextForWinner.LEAD
+        self.config.save()
+        response, numComputed = self._get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(numComputed, 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_not_in_page_cache(self):
+        """ It caches its own responses: the page cache would ignore the ETag """
+        self._get()
+        response, _ = self._get(HTTP_IF_NONE_MATCH=self._get()[0]['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(reverse('visualizationData', args=('no-such-slug',)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_pages_fetch_data(self):
+        """ The visualize page fetches the data, other pages which show charts embed it """
+        response = self.client.get(reverse('visualize', args=(self.config.slug,)))
+        self.assertContains(response, f'fetch("{self.url}")')
+        self.assertNotContains(response, 'id="visualization-data"')
+
+        response = self.client.get(reverse('visualizeBallotpedia', args=(self.config.slug,)))
+        self.assertContains(response, 'id="visualization-data"')
+        self.assertNotContains(response, f'fetch("{self.url}")')
+
+    def test_sankey_layout(self):
+        """ The sankey is laid out on the server for its orientation, without overlaps """
+        data = json.loads(self._get()[0].content)
+        layout = data['sankeyLayout']
+        self.assertEqual(layout['isHorizontal'], self.config.horizontalSankey)
+        nodes = data['sankeyData']['nodes']
+        links = data['sankeyData']['links']
+        self.assertEqual(len(layout['nodes']['dim1']), len(nodes['round']))
+        self.assertEqual(len(layout['links']['size1']), len(links['source']))
+
+        # Each round is a column, with its nodes stacked in order
+        for roundIndex in range(data['sankeyData']['numRounds']):
+            inRound = [i for i, r in enumerate(nodes['round']) if r == roundIndex]
+            self.assertEqual(len({layout['nodes']['dim0'][i] for i in inRound}), 1)
+            for before, after in zip(inRound, inRound[1:]):
+                self.assertGreaterEqual(layout['nodes']['dim1'][after],
+                                        layout['nodes']['dim1'][before] +
+                                        layout['nodes']['size1'][before])
+
+        # Links are stacked within the nodes they leave
+        for i, source in enumerate(links['source']):
+            self.assertLessEqual(layout['links']['sourceOffset'][i] +
+                                 layout['links']['size1'][i] *
+                                 layout['links']['sourceScalar'][i],
+                                 layout['nodes']['size1'][source] + 1e-3)
+
+        self.config.horizontalSankey = not self.config.horizontalSankey
+        self.config.save()
+        otherLayout = json.loads(self._get()[0].content)['sankeyLayout']
+        self.assertEqual(otherLayout['isHorizontal'], self.config.horizontalSankey)
+        self.assertNotEqual(otherLayout['nodes'], layout['nodes'])
+
+    def test_parse_accept_encoding(self):
+        """ Encodings with q=0 are refused """
+        self.assertEqual(parse_accept_encoding(''), set())
+        self.assertEqual(parse_accept_encoding('gzip;q=1.0, br; q=0, identity'),
+                         {'gzip', 'identity'})
+        self.assertEqual(parse_accept_encoding('GZIP;q=0.5, br;q=nonsense'), {'gzip'})
@@ -0,0 +1,199 @@
+"""
+Tests for the VoteMatrix behind the Graph, and the node and link views over it
+"""
+
+import io
+import json
+import sys
+from mock import patch
+
+from django.test import TestCase
+
+from common.testUtils import TestHelpers
+from visualizer.graph import rcvResult, syntheticData
+from visualizer.graph.graph import Graph
+from visualizer.graph.graphSummary import GraphSummary
+from visualizer.graph.graphCreator import make_graph_with_file
+from visualizer import common
+from visualizer.tests import filenames
+
+TestHelpers.silence_logging_spam()
+
+
+class VoteMatrixTests(TestCase):
+    """ Tests for the VoteMatrix and the views the Graph exposes over it """
+
+    @classmethod
+    def _load_graph(cls, filename):
+        with open(filename, 'r') as f:
+            return make_graph_with_file(f, False)
+
+    def test_summary_matches_nodes(self):
+        """ The vectorized summary gives the same totals as walking the nodes one by one """
+        for filename in (filenames.MULTIWINNER, filenames.THREE_ROUND, filenames.OPAVOTE,
+                         filenames.RESIDUAL_SURPLUS_MAIN):
+            graph = self._load_graph(filename)
+            summary = graph.summarize()
+
+            totalVotesPerRound = {}
+            totalActiveVotes = [0] * graph.numRounds
+            for node in graph.nodes:
+                totalVotesPerRound.setdefault(node.item, []).append(node.count)
+                if node.item.isActive:
+                    totalActiveVotes[node.roundNum] += node.count
+
+            self.assertEqual(list(summary.candidates.keys()), list(totalVotesPerRound.keys()))
+            for item, candidateInfo in summary.candidates.items():
+                self.assertEqual(candidateInfo.totalVotesPerRound, totalVotesPerRound[item])
+                self.assertEqual(sum(candidateInfo.votesAddedPerRound),
+                                 candidateInfo.totalVotesPerRound[-1])
+            for roundInfo, total in zip(summary.rounds, totalActiveVotes):
+                self.assertAlmostEqual(roundInfo.totalActiveVotes, total)
+
+    def test_links_by_target_node(self):
+        """ Every link is keyed by its target, and links only go forward one round """
+        graph = self._load_graph(filenames.MULTIWINNER)
+        linksByTargetNode = graph.summarize().linksByTargetNode
+
+        self.assertEqual(sum(len(links) for links in linksByTargetNode.values()),
+                         len(graph.links))
+        for target, links in linksByTargetNode.items():
+            for link in links:
+                self.assertEqual(link.target, target)
+                self.assertEqual(link.source.roundNum + 1, target.roundNum)
+                self.assertIn(link.source.item, graph.nodesPerRound[link.source.roundNum])
+
+    def test_node_views(self):
+        """ Nodes are views into the matrix: equal nodes are interchangeable """
+        graph = self._load_graph(filenames.THREE_ROUND)
+        item = graph.nodes[0].item
+        node = graph.nodesPerRound[0][item]
+
+        self.assertEqual(node, graph.nodes[0])
+        self.assertEqual(hash(node), hash(graph.nodes[0]))
+        self.assertNotEqual(node, graph.nodesPerRound[1][item])
+        self.assertEqual(node.label, str(item.name))
+
+        # Writing to one view is seen by every other view of the same node
+        node.isWinner = True
+        self.assertTrue(graph.nodes[0].isWinner)
+        node.isWinner = False
+        self.assertFalse(graph.nodes[0].isWinner)
+        node.mark_eliminated()
+        self.assertTrue(graph.nodes[0].isEliminated)
+
+        # Each round is a mapping that only contains the candidates present that round
+        lastRound = graph.nodesPerRound[-1]
+        eliminated = [i for i in graph.nodesPerRound[0] if i not in lastRound][0]
+        with self.assertRaises(KeyError):
+            lastRound[eliminated]  # pylint: disable=pointless-statement
+        self.assertEqual(len(lastRound), len(list(lastRound.values())))
+
+    def test_create_node(self):
+        """ Nodes can still be added one at a time, keeping ints and floats apart """
+        graph = Graph("One at a time")
+        alice = rcvResult.Item("Alice")
+        bob = rcvResult.Item("Bob")
+        graph.create_node(alice, 10, 0)
+        graph.create_node(bob, 4.5, 0)
+        aliceNextRound = graph.create_node(alice, 14.5, 1)
+        aliceNextRound.mark_winner()
+
+        self.assertEqual(graph.numRounds, 2)
+        self.assertEqual(list(graph.items), [alice, bob])
+        self.assertEqual([n.count for n in graph.nodes], [10, 4.5, 14.5])
+        self.assertIsInstance(graph.nodes[0].count, int)
+        self.assertEqual(list(graph.nodesPerRound[1].keys()), [alice])
+        self.assertTrue(graph.nodes[2].isWinner)
+        self.assertFalse(graph.nodes[0].isWinner)
+
+    def test_elimination_order_must_be_complete(self):
+        """ Sorting by an elimination order which misses a candidate fails loudly """
+        graph = self._load_graph(filenames.THREE_ROUND)
+        with self.assertRaises(ValueError):
+            graph.set_elimination_order(list(graph.items)[1:])
+
+
+class _CountedName(str):
+    """ A candidate name whose comparisons are function calls, so that _count_calls counts
+        them even when they are made by builtins, e.g. list.index """
+
+    def __eq__(self, other):
+        return str.__eq__(self, other)
+
+    __hash__ = str.__hash__
+
+
+class OrderingTests(TestCase):
+    """ Tests for ordering the graph, including by the candidate sidecar file """
+
+    @classmethod
+    def _make_graph_in_reverse_order(cls, numCandidates, numRounds):
+        """ Returns the graph of a synthetic election, ordered by reverse candidate number """
+        data = json.dumps(syntheticData.generate_election(numCandidates, numRounds))
+        order = [_CountedName(common.INACTIVE_TEXT)] + \
+            [_CountedName(f"Candidate {i}") for i in range(numCandidates)]
+        return make_graph_with_file(io.StringIO(data), True, order)
+
+    @classmethod
+    def _count_calls(cls, func, *args):
+        """
+        The number of function calls, including builtins, func makes: a measure of its work
+        which, unlike its time, doesn't depend on how loaded the machine is
+        """
+        numCalls = 0
+
+        def profile(_frame, event, _arg):
+            nonlocal numCalls
+            if event in ('call', 'c_call'):
+                numCalls += 1
+
+        sys.setprofile(profile)
+        try:
+            func(*args)
+        finally:
+            sys.setprofile(None)
+        return numCalls
+
+    def test_candidate_order_summarizes_once(self):
+        """ Setting the sidecar order while loading the graph doesn't summarize it twice """
+        with patch('visualizer.graph.graph.GraphSummary', wraps=GraphSummary) as mockSummary:
+            graph = self._make_graph_in_reverse_order(5, 3)
+            self.assertEqual(mockSummary.call_count, 1)
+
+        names = [item.name for item in graph.eliminationOrder]
+        self.assertEqual(names, [f"Candidate {i}" for i in reversed(range(5))] +
+                         [common.INACTIVE_TEXT])
+        self.assertEqual(graph.nodes[0].item.name, common.INACTIVE_TEXT)
+        self.assertEqual(graph.nodes[-1].item.name, "Candidate 4")
+
+    def test_unknown_names(self):
+        """ Every candidate must be in the list of names """
+        graph = self._make_graph_in_reverse_order(5, 3)
+        with self.assertRaises(ValueError):
+            graph.get_items_for_names(["Candidate 0", "Candidate 1"])
+
+    def test_inactive_ballots_are_ordered_last(self):
+        """ Inactive ballots come first in the elimination order, so they're displayed last """
+        with open(filenames.MULTIWINNER, 'r') as f:
+            graph = make_graph_with_file(f, False)
+        names = [item.name for item in graph.eliminationOrder]
+        self.assertEqual(names[0], common.INACTIVE_TEXT)
+        self.assertEqual(len(names), len(set(names)))
+
+    def test_scaling(self):
+        """
+        Ordering and summarizing scales with the number of nodes. 8x as many candidates is
+        8x as many nodes: the work must not come near the 64x a quadratic dependence on the
+        number of candidates would take. 8x as many rounds is about 5x as many nodes here.
+        """
+        smallWork = self._count_calls(self._make_graph_in_reverse_order, 50, 10)
+        manyCandidatesWork = self._count_calls(self._make_graph_in_reverse_order, 400, 10)
+        self.assertLess(manyCandidatesWork, 12 * smallWork)
+
+        smallWork = self._count_calls(self._make_graph_in_reverse_order, 100, 10)
+        manyRoundsWork = self._count_calls(self._make_graph_in_reverse_order, 100, 80)
+        self.assertLess(manyRoundsWork, 8 * smallWork)
+
+        largeGraph = self._make_graph_in_reverse_order(400, 10)
+        self.assertEqual(len(largeGraph.summarize().candidates), 401)
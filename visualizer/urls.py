@@ -37,6 +37,8 @@ urlpatterns = [
     path('validateDataEntry', views.ValidateDataEntry.as_view(), name='validateDataEntry'),
 
     # REST API
+    path('api/data/<slug>', views.VisualizationData.as_view(), name='visualizationData'),
+    path('api/svg/<slug>/<vistype>', views.VisualizationSvg.as_view(), name='visualizationSvg'),
     path('api/', include(router.urls)),
     # This is used by the rest_framework to create a login button
     path('api/auth/', include('rest_framework.urls')),
@@ -1,10 +1,13 @@
 """ Data validation - to be used across REST and HTTP access """
 
+import copy
+from collections import namedtuple
+
 from django.core.files.uploadedfile import UploadedFile
 import rest_framework.serializers as serializers
 
 from common import viewUtils
-from visualizer.graph.graphCreator import make_graph_with_file
+from visualizer.graph.graphCreator import make_graph_and_standardized_json
 from visualizer.sidecar.reader import SidecarReader
 
 
@@ -24,6 +27,12 @@ def ensure_title_is_under_256_chars(graph):
                                           format(maxTitleSize, len(graph.title)))
 
 
+# The result of parse_upload: the validated graph, and what the precomputed files are made of
+ParsedUpload = namedtuple('ParsedUpload', ['graph', 'standardizedContent', 'artifactGraph',
+                                           'candidateSidecarDataPyObj',
+                                           'excludeFinalWinnerAndEliminatedCandidate'])
+
+
 def try_to_load_jsons(jsonFileObj, sidecarJsonFileObj):
     """ Checks that the JSON can be loaded and is under 2mb.
         Raises:
@@ -34,6 +43,15 @@ def try_to_load_jsons(jsonFileObj, sidecarJsonFileObj):
         Returns:
          - Loaded graph
     """
+    return parse_upload(jsonFileObj, sidecarJsonFileObj).graph
+
+
+def parse_upload(jsonFileObj, sidecarJsonFileObj, excludeFinalWinnerAndEliminatedCandidate=False):
+    """
+    Validates the files as try_to_load_jsons does, parsing them only once for everything
+    viewUtils.refresh_precomputed_files needs too. Raises as try_to_load_jsons does.
+    Returns a ParsedUpload.
+    """
     # Check filesize before opening a massive file
     if isinstance(jsonFileObj, UploadedFile):
         ensure_file_is_under_2_mb(jsonFileObj)
@@ -41,18 +59,26 @@ def try_to_load_jsons(jsonFileObj, sidecarJsonFileObj):
         ensure_file_is_under_2_mb(sidecarJsonFileObj)
 
     # Try to make the graph
-    graph = make_graph_with_file(jsonFileObj, False)
+    graph, standardizedContent = make_graph_and_standardized_json(
+        jsonFileObj, excludeFinalWinnerAndEliminatedCandidate)
+
+    # check sidecar file, and order the graph by it, as viewUtils.make_graph_for_config does
+    candidateSidecarDataPyObj = None
+    if sidecarJsonFileObj is not None:
+        reader = SidecarReader(sidecarJsonFileObj)
+        reader.assert_valid(graph)
+        candidateSidecarDataPyObj = reader.data
+        graph.set_elimination_order(graph.get_items_for_names(reader.data['order']))
+
+    # Stored as it is now: views may change the graph they are given
+    artifactGraph = copy.deepcopy(graph)
 
     # Sanity check that the entire pipeline works
     # (If not, this could be the source of 500 errors)
-    viewUtils.get_data_for_graph(graph, config=viewUtils.DefaultConfig())
+    viewUtils.resolve_lazy_data(viewUtils.get_data_for_graph(graph, viewUtils.DefaultConfig()))
 
     # Check title length
     ensure_title_is_under_256_chars(graph)
 
-    # check sidecar file:
-    if sidecarJsonFileObj is not None:
-        reader = SidecarReader(sidecarJsonFileObj)
-        reader.assert_valid(graph)
-
-    return graph
+    return ParsedUpload(graph, standardizedContent, artifactGraph, candidateSidecarDataPyObj,
+                        excludeFinalWinnerAndEliminatedCandidate)
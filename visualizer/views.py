@@ -12,8 +12,8 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.cache import cache
-from django.http import JsonResponse, HttpResponse
-from django.shortcuts import render
+from django.http import Http404, JsonResponse, HttpResponse
+from django.shortcuts import get_object_or_404, render
 from django.templatetags.static import static
 from django.urls import resolve
 from django.urls import reverse
@@ -30,6 +30,8 @@ from rest_framework_tracking.mixins import LoggingMixin
 # rcvis helpers
 from accounts.permissions import IsOwnerOrReadOnly, HasAPIAccess
 from common import viewUtils
+from common.compressedFiles import get_download_url
+from common.conditional import conditional_page
 from visualizer import validators
 from visualizer.common import make_complete_url, intify
 from visualizer.forms import UploadForm, UploadByDataTableForm
@@ -96,15 +98,18 @@ class Upload(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         try:
-            graph = validators.try_to_load_jsons(
+            parsedUpload = validators.parse_upload(
                 form.cleaned_data['jsonFile'],
-                form.cleaned_data['candidateSidecarFile'])
+                form.cleaned_data['candidateSidecarFile'],
+                form.instance.excludeFinalWinnerAndEliminatedCandidate)
 
             self.model = form.save(commit=False)
             self.model.owner = self.request.user
-            BaseVisualizationSerializer.populate_model_with_json_data(self.model, graph)
+            BaseVisualizationSerializer.populate_model_with_json_data(self.model,
+                                                                      parsedUpload.graph)
             self._actions_before_save(form)
             self.model.save()
+            viewUtils.refresh_precomputed_files(self.model, parsedUpload)
         except BadJSONError as exception:
             form.add_error('jsonFile', str(exception))
             tbText = traceback.format_exc()
@@ -147,6 +152,7 @@ class UploadByDataTable(Upload):
         self.model.jsonFile.save('datatablesfile.json', form.cleaned_data['jsonFile'])
 
 
+@method_decorator(conditional_page(JsonConfig), name='dispatch')
 class Visualize(DetailView):
     """ Visualizing a single JsonConfig """
     model = JsonConfig
@@ -177,15 +183,19 @@ class Visualize(DetailView):
         # wikipedia embedding
         referenceUrl = make_complete_url(self.request, reverse("visualize", args=(slug,)))
         referenceUrl += "#tabular-candidate-by-round"
-        data['wikicodeExport'] = WikipediaExport(data['graph'], referenceUrl).create_wikicode()
+        data['wikicodeExport'] = viewUtils.LazyValue(
+            lambda: WikipediaExport(data['graph'], referenceUrl).create_wikicode())
 
         # iframe height
         data['iframeHeight'] = viewUtils.default_iframe_height(config['jsonconfig'].numCandidates)
 
+        data['visualizationDataUrl'] = reverse('visualizationData', args=(slug,))
+
         return data
 
 
 @method_decorator(xframe_options_exempt, name='dispatch')
+@method_decorator(conditional_page(JsonConfig), name='dispatch')
 class VisualizeEmbedded(DetailView):
     """
     The embedded visualization, to be used in an iframe.
@@ -196,14 +206,50 @@ class VisualizeEmbedded(DetailView):
     def get_context_data(self, **kwargs):
         config = super().get_context_data(**kwargs)
 
-        data = viewUtils.get_data_for_view(config['jsonconfig'])
-
-        # oembed href
-        data['vistype'] = self.request.GET.get('vistype', 'barchart-interactive')
+        # Only the requested vistype is rendered: don't compute the others
+        vistype = self.request.GET.get('vistype', 'barchart-interactive')
+        data = viewUtils.get_data_for_view(config['jsonconfig'], vistype)
+        data['vistype'] = vistype
+        data['visualizationDataUrl'] = reverse('visualizationData',
+                                               args=(config['jsonconfig'].slug,))
 
         return data
 
 
+class VisualizationData(View):
+    """
+    The data the javascript of every visualization of a JsonConfig needs. Pages fetch it
+    separately, so the page and its data are cached separately, and revisits can
+    revalidate the data with its ETag.
+    """
+    # It caches its own, precompressed responses
+    usePageCache = False
+
+    @staticmethod
+    def get(request, slug):
+        """ The precompressed JSON, or a 304 if the client has it already """
+        config = get_object_or_404(JsonConfig, slug=slug)
+        return viewUtils.get_visualization_data_body(config).make_response(request)
+
+
+class VisualizationSvg(View):
+    """
+    A vistype of the visualization drawn as a static SVG, for embeds without javascript,
+    crawlers and link previews, and to show until the javascript has drawn it.
+    See viewUtils.SVG_RENDERERS for the vistypes.
+    """
+    # It caches its own, precompressed responses
+    usePageCache = False
+
+    @staticmethod
+    def get(request, slug, vistype):
+        """ The precompressed SVG, or a 304 if the client has it already """
+        if vistype not in viewUtils.SVG_RENDERERS:
+            raise Http404(f"{vistype} can't be drawn as an SVG")
+        config = get_object_or_404(JsonConfig, slug=slug)
+        return viewUtils.get_svg_body(config, vistype).make_response(request)
+
+
 class VisualizeEmbedly(RedirectView):
     """
     VisualizeEmbedded, but without any custom arguments so it can be supported by embedly.
@@ -245,6 +291,7 @@ class VisualizeEmbedly(RedirectView):
 
 
 @method_decorator(xframe_options_exempt, name='dispatch')
+@method_decorator(conditional_page(JsonConfig), name='dispatch')
 class VisualizeBallotpedia(DetailView):
     """ The embedded ballotpedia visualization """
     model = JsonConfig
@@ -280,12 +327,16 @@ class DownloadRawData(LoginRequiredMixin, DetailView):
         self.request.user.userprofile.save()
 
         return {'title': config['jsonconfig'].title,
-                'jsonfile': config['jsonconfig'].jsonFile}
+                'downloadUrl': get_download_url(config['jsonconfig'].jsonFile)}
 
 
 @method_decorator(xframe_options_exempt, name='dispatch')
+@method_decorator(conditional_page(), name='dispatch')
 class Oembed(View):
-    """ The oembed protocol, pointing to VisualizeEmbedded """
+    """
+    The oembed protocol, pointing to VisualizeEmbedded.
+    The response only depends on the URL, so revalidating it doesn't touch the database.
+    """
 
     @classmethod
     def _get_visualize_embedded_url_from(cls, url):
@@ -330,7 +381,7 @@ class Oembed(View):
         jsonData = {
             "version": "1.0",
             "title": "Ranked Choice Voting Visualization",
-            "cache_age": "300",  # five minutes
+            "cache_age": str(settings.PAGE_CACHE_CONTROL['max_age']),
             "author_name": "rcvis.com",
             "author_url": "https://www.rcvis.com/",
             "provider_name": "rcvis.com",